@@ -2,12 +2,14 @@
 FREE11 Admin V2 Routes
 Full admin control: kill match, void contests/predictions, freeze wallet, feature flags, test mode
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from pydantic import BaseModel
 from typing import Optional, Dict
 from datetime import datetime, timezone
 import uuid
 
+from pymongo import UpdateOne
+
 from server import db, get_current_user, User
 
 from ledger_engine import LedgerEngine
@@ -24,7 +26,7 @@ predict_engine = PredictEngine(db)
 matchstate_engine = MatchStateEngine(db)
 voucher_provider = MockVoucherProvider(db)
 entitysport_svc = EntitySportService(db)
-fantasy_engine = FantasyEngine(db)
+fantasy_engine = FantasyEngine(db, entitysport_svc)
 
 admin_v2_router = APIRouter(prefix="/admin/v2", tags=["Admin V2"])
 
@@ -160,34 +162,53 @@ async def resolve_over(req: ResolveOverReq, user: User = Depends(get_current_use
         {"runs": req.runs, "wickets": req.wickets, "boundaries": req.boundaries}
     )
 
-    # Feature 2: Streak Multiplier — real-time per prediction, coins only
+    # Feature 2: Streak Multiplier — real-time per prediction, coins only.
+    # Streaks are read once, advanced in result order, written back and paid in one batch.
+    user_ids = list({r["user_id"] for r in results})
+    streaks = {
+        u["id"]: u.get("prediction_streak", 0)
+        for u in await db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "prediction_streak": 1}).to_list(None)
+    }
+    increments, resets, credits = {}, set(), []
     total_correct = 0
     for r in results:
+        uid = r["user_id"]
         if r["is_correct"] and r["coins_earned"] > 0:
-            # Fetch current streak before incrementing
-            u_doc = await db.users.find_one({"id": r["user_id"]}, {"_id": 0, "prediction_streak": 1})
-            current_streak = (u_doc or {}).get("prediction_streak", 0)
+            current_streak = streaks.get(uid, 0)
             multiplier = _streak_multiplier(current_streak)
             final_coins = r["coins_earned"] * multiplier
-
-            # Increment streak atomically
-            await db.users.update_one({"id": r["user_id"]}, {"$inc": {"prediction_streak": 1}})
+            streaks[uid] = current_streak + 1
+            increments[uid] = increments.get(uid, 0) + 1
 
             streak_note = f" (Hot Hand {multiplier}x!)" if multiplier > 1 else ""
-            await ledger.credit(
-                r["user_id"], final_coins,
-                "prediction_reward", r["prediction_id"],
-                f"Correct prediction! Over {req.over_number}{streak_note}"
-            )
+            credits.append({
+                "user_id": uid, "amount": final_coins, "tx_type": "prediction_reward",
+                "reference_id": r["prediction_id"],
+                "description": f"Correct prediction! Over {req.over_number}{streak_note}",
+            })
             r["multiplier"] = multiplier
             r["final_coins"] = final_coins
             total_correct += 1
         elif not r["is_correct"]:
             # Reset streak on incorrect prediction
-            await db.users.update_one({"id": r["user_id"]}, {"$set": {"prediction_streak": 0}})
+            streaks[uid] = 0
+            increments[uid] = 0
+            resets.add(uid)
             r["multiplier"] = 1
             r["final_coins"] = 0
 
+    streak_ops = [
+        UpdateOne({"id": uid}, {"$set": {"prediction_streak": streaks[uid]}}) if uid in resets
+        else UpdateOne({"id": uid}, {"$inc": {"prediction_streak": n}})
+        for uid, n in increments.items() if n or uid in resets
+    ]
+    if streak_ops:
+        await db.users.bulk_write(streak_ops, ordered=False)
+    await ledger.credit_many(credits)
+
+    from v2_engines import skill_leaderboards
+    await skill_leaderboards.update_streaks(list({r["user_id"] for r in results}))
+
     await _log_admin_action(user.id, "resolve_over", {
         "match_id": req.match_id, "over": req.over_number,
         "total": len(results), "correct": total_correct,
@@ -279,11 +300,62 @@ async def toggle_test_mode(user: User = Depends(get_current_user)):
 # ── Ledger Reconciliation ──
 
 @admin_v2_router.post("/ledger/reconcile-all")
-async def reconcile_all_ledgers(user: User = Depends(get_current_user)):
-    await require_admin(user)
-    mismatches = await ledger.reconcile_all()
-    await _log_admin_action(user.id, "ledger_reconcile_all", {"mismatches": len(mismatches)})
-    return {"mismatches": mismatches, "count": len(mismatches)}
+async def reconcile_all_ledgers(background_tasks: BackgroundTasks, full: bool = False, background: bool = False,
+                                user: User = Depends(get_current_user)):
+    """Incremental by default (entries since the last completed run); full=true rescans
+    every wallet. background=true returns at once — poll /ledger/reconcile-runs/latest."""
+    await require_admin(user)
+    if background:
+        background_tasks.add_task(ledger.reconcile_all, full)
+        await _log_admin_action(user.id, "ledger_reconcile_all", {"full": full, "background": True})
+        return {"started": True, "full": full}
+    run = await ledger.reconcile_all(full)
+    mismatches = await ledger.get_mismatches(run["id"])
+    await _log_admin_action(user.id, "ledger_reconcile_all", {"mismatches": run["mismatches"], "mode": run["mode"]})
+    return {"mismatches": mismatches, "count": run["mismatches"], "run": run}
+
+@admin_v2_router.get("/ledger/reconcile-runs/latest")
+async def latest_reconcile_run(user: User = Depends(get_current_user)):
+    await require_admin(user)
+    return await ledger.last_reconcile_run() or {"status": "not_started"}
+
+@admin_v2_router.get("/ledger/mismatches")
+async def ledger_mismatches(run_id: Optional[str] = None, limit: int = 100, user: User = Depends(get_current_user)):
+    await require_admin(user)
+    return {"mismatches": await ledger.get_mismatches(run_id, min(limit, 1000))}
+
+# ── Coin Expiry ──
+
+@admin_v2_router.post("/coins/expire")
+async def run_coin_expiry(day: Optional[str] = None, user: User = Depends(get_current_user)):
+    """Run bonus-coin expiry now for buckets due on or before `day` (default today)."""
+    await require_admin(user)
+    from v2_engines import coin_expiry
+    stats = await coin_expiry.run_expiry(day)
+    await _log_admin_action(user.id, "coin_expiry_run", stats)
+    return stats
+
+# ── Weekly Reports ──
+
+@admin_v2_router.post("/reports/weekly/run")
+async def run_weekly_reports(background_tasks: BackgroundTasks, restart: bool = False,
+                             user: User = Depends(get_current_user)):
+    """Start (or resume) this week's batch report run in the background.
+    Shares the scheduler's batch lease, so only one run is ever generating."""
+    await require_admin(user)
+    from server import auto_scorer
+    from v2_engines import report_engine
+    if not await auto_scorer.claim_weekly_reports():
+        raise HTTPException(status_code=409, detail="A weekly report run is already in progress")
+    background_tasks.add_task(auto_scorer.run_weekly_reports, restart)
+    await _log_admin_action(user.id, "weekly_reports_run", {"restart": restart})
+    return {"started": True, "restart": restart, "week_start": report_engine._week_start()}
+
+@admin_v2_router.get("/reports/weekly/progress")
+async def weekly_reports_progress(week_start: Optional[str] = None, user: User = Depends(get_current_user)):
+    await require_admin(user)
+    from v2_engines import report_engine
+    return await report_engine.get_run(week_start) or {"status": "not_started"}
 
 # ── Admin Action Log ──
 
@@ -6,8 +6,11 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from datetime import datetime, timezone
 import re
+import uuid
 
 from server import db, get_current_user, User
+from economy_metrics import record_flow
+from earnings_rollup import record_credit
 
 airtime_router = APIRouter(prefix="/api/airtime", tags=["airtime"])
 
@@ -62,13 +65,19 @@ async def send_recharge(req: RechargeRequest, current_user: User = Depends(get_c
     )
 
     # Record transaction
-    await db.coin_transactions.insert_one({
+    spend = {
+        "id":          str(uuid.uuid4()),
         "user_id":     str(current_user.id),
         "amount":      -coins_needed,
         "type":        "spend",
         "description": f"Mobile Recharge: {plan['carrier_name']} ₹{plan['inr']} — {phone}",
         "created_at":  datetime.now(timezone.utc),
-    })
+    }
+    await db.coin_transactions.insert_one(spend)
+    await record_credit(db, spend)
+    await record_flow(db, "spend", -coins_needed)
+    from v2_engines import coin_expiry
+    await coin_expiry.consume(str(current_user.id), coins_needed)
 
     # Send recharge via Reloadly
     result = await airtime.send_recharge(req.plan_id, phone, str(current_user.id))
@@ -93,6 +102,17 @@ async def send_recharge(req: RechargeRequest, current_user: User = Depends(get_c
     if result.get("status") == "failed":
         # Refund coins on hard failure
         await db.users.update_one({"_id": current_user.id}, {"$inc": {"coins_balance": coins_needed}})
+        refund = {
+            "id":          str(uuid.uuid4()),
+            "user_id":     str(current_user.id),
+            "amount":      coins_needed,
+            "type":        "voucher_refund",
+            "description": f"Refund: mobile recharge failed ({phone})",
+            "created_at":  datetime.now(timezone.utc),
+        }
+        await db.coin_transactions.insert_one(refund)
+        await record_credit(db, refund)
+        await record_flow(db, "voucher_refund", coins_needed)
         raise HTTPException(status_code=500, detail="Recharge failed. Coins refunded.")
 
     return {
@@ -0,0 +1,423 @@
+"""
+Analytics 360° Snapshot Engine for FREE11
+Builds the admin 360° dashboard with Mongo aggregation and stores it as a snapshot.
+
+`refresh()` walks real users in PROFILE_BATCH chunks. For each chunk, one grouped
+pipeline per collection (predictions, coin_transactions, logins, events, ...) runs
+concurrently and is scoped to the chunk's user ids, so the API process only ever
+holds one chunk of per-user rows. Profiles go to `analytics_360_profiles` under a
+run id. Totals, funnel, DAU and top lists are folded across chunks and written to
+one `analytics_snapshots` doc, which is switched to the new run at the end. Readers
+always see a complete run; the switch also drops the previous run and any run a
+crashed build left behind for longer than STALE_RUN. The endpoint serves the latest
+snapshot; the AutoScorer refreshes it every SNAPSHOT_INTERVAL, and admins can force
+a refresh. Profiles are searched, sorted and paged server-side (`profiles_page`).
+"""
+import asyncio
+import base64
+import heapq
+import json
+import logging
+import re
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ID = "analytics_360"
+SNAPSHOT_INTERVAL = 900     # seconds between scheduled refreshes
+PROFILE_BATCH = 500         # real users per aggregation chunk
+PROFILE_PAGE = 100          # profiles served with the dashboard / per page
+STALE_RUN = timedelta(hours=1)  # an unfinished run older than this was abandoned by a crash
+# Profile columns the users table can sort on; last_active pages through the a360_run_active index
+PROFILE_SORTS = {
+    "last_active": "sort_key", "email": "email", "name": "name",
+    "registration_timestamp": "registration_timestamp", "coins_balance": "coins_balance",
+    "predictions_count": "predictions_count", "prediction_accuracy_pct": "prediction_accuracy_pct",
+    "redemptions_count": "redemptions_count", "revenue_contributed_inr": "revenue_contributed_inr",
+    "login_count": "login_count", "streak_days": "streak_days", "level": "level",
+    "total_events": "total_events",
+}
+PROFILE_TEXT_SORTS = {"sort_key", "email", "name", "registration_timestamp"}
+EVENT_WEIGHT = {"$divide": [1, {"$ifNull": ["$sample_rate", 1]}]}  # a sampled event stands for 1 / rate
+
+# ── Real-user filter — excludes all test/seed/admin accounts ───────────────
+EXCLUDED_EMAIL_PATTERN = re.compile(
+    r"test\.com$|free11test\.com$|^flood_|^lb_seed_|^otp_fix_test_|^prodtest|^adult_test|^test_",
+    re.IGNORECASE,
+)
+
+REAL_USER_MONGO_FILTER = {
+    "is_admin": {"$ne": True},
+    "is_seed": {"$ne": True},
+    "email": {"$not": EXCLUDED_EMAIL_PATTERN, "$nin": [None, ""]},
+}
+
+USER_FIELDS = {
+    "_id": 0, "id": 1, "email": 1, "phone": 1, "name": 1, "created_at": 1, "last_activity": 1,
+    "last_checkin": 1, "referral_code": 1, "referred_by": 1, "coins_balance": 1, "streak_days": 1,
+    "level": 1, "xp": 1, "free_bucks": 1, "email_verified": 1,
+}
+
+
+def _encode_page_cursor(sort: str, order: str, value, user_id: str) -> str:
+    """Opaque keyset cursor for a profiles page; keeps the sort value's JSON type."""
+    raw = json.dumps([sort, order, value, user_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_page_cursor(cursor: str, sort: str, order: str) -> Tuple:
+    try:
+        c_sort, c_order, value, user_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if (c_sort, c_order) != (sort, order):
+        raise ValueError("Cursor belongs to a different sort")
+    return value, str(user_id)
+
+
+def _safe_pct(num, denom) -> float:
+    return round(num / denom * 100, 1) if denom else 0.0
+
+
+def _days_ago(n: int) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=n)).isoformat()
+
+
+def _recent(ts, fields: Dict, limit: int) -> Tuple[List[Dict], Dict]:
+    """Pipeline pieces for "latest `limit` rows per user": the sort-key stage and a
+    $topN accumulator, which only ever holds `limit` rows per group."""
+    return ([{"$addFields": {"_ts": ts}}],
+            {"recent": {"$topN": {"n": limit, "sortBy": {"_ts": -1}, "output": fields}}})
+
+
+class Analytics360Engine:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self._lock = asyncio.Lock()
+
+    async def ensure_indexes(self):
+        await self.db.analytics_360_profiles.create_index(
+            [("run_id", 1), ("sort_key", -1), ("user_id", -1)], name="a360_run_active")
+        await self.db.analytics_360_profiles.create_index("run_started_at", name="a360_run_started")
+        # Per-chunk pipelines match user_id $in [...]; predictions, coin_transactions,
+        # redemptions and router_orders already have user_id indexes (server startup)
+        await self.db.login_events.create_index([("user_id", 1), ("timestamp", -1)], name="login_user_time")
+        await self.db.analytics_events.create_index([("user_id", 1), ("timestamp", 1)], name="aevt_user_time")
+        await self.db.freebucks_purchases.create_index("user_id", name="fbp_user_id")
+        await self.db.quest_sessions.create_index("user_id", name="quest_user_id")
+
+    # ── Read side ──────────────────────────────────────────────────────────
+
+    async def latest(self) -> Optional[Dict]:
+        return await self.db.analytics_snapshots.find_one({"_id": SNAPSHOT_ID}, {"_id": 0})
+
+    async def profiles_page(self, run_id: str, limit: int = PROFILE_PAGE, cursor: Optional[str] = None,
+                            q: Optional[str] = None, sort: str = "last_active",
+                            order: str = "desc") -> Tuple[List[Dict], Optional[str]]:
+        """One page of a run's profiles, sorted by a PROFILE_SORTS column (keyset on column, user_id).
+        `q` matches email, name or user_id case-insensitively."""
+        if sort not in PROFILE_SORTS or order not in ("asc", "desc"):
+            raise ValueError("Invalid sort")
+        field, direction = PROFILE_SORTS[sort], (1 if order == "asc" else -1)
+        query: Dict = self._profiles_query(run_id, q)
+        if cursor:
+            key, uid = _decode_page_cursor(cursor, sort, order)
+            op = "$gt" if direction == 1 else "$lt"
+            query = {"$and": [query, {"$or": [{field: {op: key}}, {field: key, "user_id": {op: uid}}]}]}
+        rows = await self.db.analytics_360_profiles.find(
+            query, {"_id": 0, "run_id": 0, "run_started_at": 0},
+            allow_disk_use=True).sort([(field, direction), ("user_id", direction)]).to_list(limit + 1)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = _encode_page_cursor(sort, order, rows[-1][field], rows[-1]["user_id"]) if more else None
+        for row in rows:
+            row.pop("sort_key", None)
+        return rows, next_cursor
+
+    async def count_profiles(self, run_id: str, q: Optional[str] = None) -> int:
+        return await self.db.analytics_360_profiles.count_documents(self._profiles_query(run_id, q))
+
+    @staticmethod
+    def _profiles_query(run_id: str, q: Optional[str]) -> Dict:
+        query: Dict = {"run_id": run_id}
+        if q and q.strip():
+            pattern = {"$regex": re.escape(q.strip()), "$options": "i"}
+            query["$or"] = [{"email": pattern}, {"name": pattern}, {"user_id": pattern}]
+        return query
+
+    # ── Build side ─────────────────────────────────────────────────────────
+
+    async def refresh(self) -> Dict:
+        """Rebuild the snapshot; concurrent calls in one process share a single build."""
+        if self._lock.locked():
+            async with self._lock:
+                return await self.latest()
+        async with self._lock:
+            return await self._build()
+
+    async def _build(self) -> Dict:
+        started = time.monotonic()
+        run_id = str(uuid.uuid4())
+        now = datetime.now(timezone.utc)
+        days = [(now - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
+
+        total_registered, total_coins, anon_events, top_referrers = await asyncio.gather(
+            self.db.users.count_documents({}),
+            self._sum(self.db.users, {}, "$coins_balance"),
+            self._count_by(self.db.analytics_events, {"user_id": "anon"}, "$event", EVENT_WEIGHT),
+            self.db.referral_bindings.aggregate([
+                {"$group": {"_id": "$referrer_id", "referrals": {"$sum": 1}}},
+                {"$sort": {"referrals": -1}}, {"$limit": 10},
+                {"$project": {"_id": 0, "user_id": {"$ifNull": ["$_id", ""]}, "referrals": 1}},
+            ]).to_list(10),
+        )
+
+        t = Counter()                               # funnel / high-level counters
+        event_counts, earn_by_source, dau = Counter(anon_events), Counter(), Counter()
+        top_revenue: List[Tuple] = []
+        cursor = self.db.users.find(REAL_USER_MONGO_FILTER, USER_FIELDS)
+        while True:
+            users = [u for u in await cursor.to_list(PROFILE_BATCH) if u.get("id")]
+            if not users:
+                break
+            profiles = await self._chunk(users, days, t, event_counts, earn_by_source, dau)
+            for p in profiles:
+                if p["payments_count"]:
+                    top_revenue.append((p["revenue_contributed_inr"], p["user_id"], p["email"], p["payments_count"]))
+            top_revenue = heapq.nlargest(20, top_revenue)
+            for p in profiles:
+                p.update(run_id=run_id, run_started_at=now, sort_key=p["last_active"] or "")
+                for f in PROFILE_SORTS.values():  # no nulls, so keyset comparisons never skip a row
+                    if p.get(f) is None:
+                        p[f] = "" if f in PROFILE_TEXT_SORTS else 0
+            await self.db.analytics_360_profiles.insert_many(profiles, ordered=False)
+
+        n_real = t["real"]
+        high_level = {
+            "total_registered": total_registered,
+            "real_users_count": n_real,
+            "test_seed_admin_count": total_registered - n_real,
+            "active_7d": t["active_7d"],
+            "activation_rate_pct": _safe_pct(t["activated"], n_real),
+            "total_predictions": t["predictions"],
+            "total_redemptions": t["redemptions"],
+            "total_revenue_inr": t["revenue"],
+            "coins_in_circulation": total_coins,
+            "real_user_coins": t["coins"],
+            "admin_seed_coins": total_coins - t["coins"],
+            "real_coins_pct": _safe_pct(t["coins"], total_coins),
+            "paying_users": t["paid_users"],
+            "users_with_predictions": t["with_preds"],
+            "users_with_redemptions": t["with_redemps"],
+        }
+        stages = [("Registered", n_real), ("Email Verified", t["verified"]),
+                  ("First Action (any event)", t["with_events"]), ("First Prediction", t["with_preds"]),
+                  ("First Redemption", t["with_redemps"]), ("Paying User", t["with_payments"])]
+        funnel = [{"stage": stage, "count": count, "pct": _safe_pct(count, n_real) if i else 100.0,
+                   "drop_pct": _safe_pct(stages[i - 1][1] - count, n_real) if i else 0}
+                  for i, (stage, count) in enumerate(stages)]
+
+        previous = await self.latest()
+        snapshot = {
+            "run_id": run_id,
+            "generated_at": now.isoformat(),
+            "build_seconds": round(time.monotonic() - started, 2),
+            "high_level": high_level,
+            "funnel": funnel,
+            "dau_7d": [{"date": day, "dau": dau[day]} for day in days],
+            "top_actions": [{"event": k, "count": round(v)} for k, v in event_counts.most_common(20)],
+            "monetization": {
+                "revenue_by_user": [{"user_id": uid, "email": email, "revenue_inr": rev, "purchases": n}
+                                    for rev, uid, email, n in top_revenue],
+                "total_revenue_inr": t["revenue"],
+                "coins_earned_by_source": dict(earn_by_source),
+                "top_referrers": top_referrers,
+            },
+            "tracking_gaps": {
+                "users_with_no_events": n_real - t["with_events"],
+                "users_with_no_logins_tracked": n_real - t["with_logins"],
+                "note": "Tracking gaps indicate pre-tracking registrations or users who haven't returned since tracking was enabled.",
+            },
+        }
+        await self.db.analytics_snapshots.replace_one({"_id": SNAPSHOT_ID}, snapshot, upsert=True)
+        # Previous run, plus runs a crashed build never switched to (a build still in
+        # progress elsewhere started less than STALE_RUN ago and is left alone)
+        stale = [{"run_started_at": {"$lt": now - STALE_RUN}}]
+        if previous and previous.get("run_id"):
+            stale.append({"run_id": previous["run_id"]})
+        await self.db.analytics_360_profiles.delete_many({"run_id": {"$ne": run_id}, "$or": stale})
+        logger.info(f"ANALYTICS 360 SNAPSHOT: run={run_id} users={n_real} seconds={snapshot['build_seconds']}")
+        return snapshot
+
+    async def _chunk(self, users: List[Dict], days: List[str], t: Counter, event_counts: Counter,
+                     earn_by_source: Counter, dau: Counter) -> List[Dict]:
+        """Aggregate one chunk of real users; folds chunk totals into the counters."""
+        ids = [u["id"] for u in users]
+        in_ids = {"user_id": {"$in": ids}}
+        (preds, txns, redemps, pays, logins, events, quests, routers,
+         by_source, by_event, logins_by_day) = await asyncio.gather(
+            self._per_user(self.db.predictions, in_ids,
+                           {"correct": {"$sum": {"$cond": [{"$eq": ["$is_correct", True]}, 1, 0]}}},
+                           _recent({"$ifNull": ["$created_at", "$timestamp"]},
+                                   {"match_id": "$match_id", "choice": "$choice", "is_correct": "$is_correct",
+                                    "ts": {"$ifNull": ["$created_at", {"$ifNull": ["$timestamp", ""]}]}}, 10)),
+            self._per_user(self.db.coin_transactions, in_ids,
+                           {"earned": {"$sum": {"$cond": [{"$gt": ["$amount", 0]}, "$amount", 0]}},
+                            "spent": {"$sum": {"$cond": [{"$lt": ["$amount", 0]}, "$amount", 0]}}},
+                           _recent("$timestamp", {"amount": "$amount", "type": "$type",
+                                                  "desc": {"$ifNull": ["$description", ""]},
+                                                  "ts": {"$ifNull": ["$timestamp", ""]}}, 10)),
+            self._per_user(self.db.redemptions, in_ids, {},
+                           _recent("$order_date", {"product": "$product_name", "coins": "$coins_spent",
+                                                   "status": "$status", "ts": {"$ifNull": ["$order_date", ""]}}, 10)),
+            self._per_user(self.db.freebucks_purchases, in_ids,
+                           {"revenue": {"$sum": {"$cond": [{"$eq": ["$payment_status", "paid"]},
+                                                           {"$ifNull": ["$amount", 0]}, 0]}},
+                            "paid": {"$sum": {"$cond": [{"$eq": ["$payment_status", "paid"]}, 1, 0]}}},
+                           _recent("$created_at", {"package": "$package_id", "amount": "$amount", "bucks": "$bucks",
+                                                   "status": "$payment_status",
+                                                   "ts": {"$ifNull": ["$created_at", ""]}}, 5)),
+            self._per_user(self.db.login_events, in_ids, {},
+                           _recent("$timestamp", {"ts": "$timestamp",
+                                                  "ua": {"$ifNull": ["$user_agent", {"$ifNull": ["$ua", ""]}]}}, 5)),
+            self._events(users, in_ids),
+            self._per_user(self.db.quest_sessions, in_ids,
+                           {"completed": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}}}),
+            self._per_user(self.db.router_orders, in_ids, {},
+                           _recent("$created_at", {"sku": "$sku", "coins": "$coins_used", "status": "$status",
+                                                   "ts": {"$ifNull": ["$created_at", ""]}}, 5)),
+            self._count_by(self.db.coin_transactions, {**in_ids, "amount": {"$gt": 0}},
+                           {"$ifNull": ["$source", "$type"]}, "$amount"),
+            self._count_by(self.db.analytics_events, in_ids, "$event", EVENT_WEIGHT),
+            self._count_by(self.db.analytics_events,
+                           {**in_ids, "event": "login", "timestamp": {"$gte": days[0]}},
+                           {"$substrBytes": ["$timestamp", 0, 10]}),
+        )
+        earn_by_source.update({k if k is not None else "unknown": v for k, v in by_source.items()})
+        event_counts.update({k if k is not None else "unknown": v for k, v in by_event.items()})
+        dau.update({day: n for day, n in logins_by_day.items() if day in days})
+
+        seven_days_ago = _days_ago(7)
+        profiles = []
+        for u in users:
+            uid = u["id"]
+            p, x, r = preds.get(uid, {}), txns.get(uid, {}), redemps.get(uid, {})
+            pay, lg, ev = pays.get(uid, {}), logins.get(uid, {}), events.get(uid, {})
+            q, ro = quests.get(uid, {}), routers.get(uid, {})
+            login_list = lg.get("recent", [])
+            last_login_ua = login_list[0].get("ua", "") if login_list else ""
+            t["real"] += 1
+            t["coins"] += u.get("coins_balance", 0) or 0
+            t["verified"] += bool(u.get("email_verified"))
+            t["active_7d"] += (u.get("last_activity") or u.get("last_checkin") or "") >= seven_days_ago
+            t["activated"] += bool(p or r or pay)
+            t["predictions"] += p.get("n", 0)
+            t["redemptions"] += r.get("n", 0)
+            t["revenue"] += pay.get("revenue", 0)
+            t["paid_users"] += pay.get("paid", 0) > 0
+            t["with_preds"] += bool(p)
+            t["with_redemps"] += bool(r)
+            t["with_payments"] += bool(pay)
+            t["with_events"] += bool(ev)
+            t["with_logins"] += bool(lg)
+            profiles.append({
+                "user_id": uid,
+                "email": u.get("email", ""),
+                "phone": u.get("phone", ""),
+                "name": u.get("name", ""),
+                "registration_timestamp": u.get("created_at", ""),
+                "last_active": u.get("last_activity", u.get("last_checkin", "")),
+                "last_login_timestamps": [l["ts"] for l in login_list if l.get("ts")],
+                "login_count": lg.get("n", 0),
+                "platform_ua": last_login_ua[:200] if last_login_ua else "Data not available",
+                "referral_code": u.get("referral_code", ""),
+                "referred_by": u.get("referred_by", ""),
+                "predictions_count": p.get("n", 0),
+                "predictions_correct": p.get("correct", 0),
+                "prediction_accuracy_pct": _safe_pct(p.get("correct", 0), p.get("n", 0)),
+                "prediction_list": [{"match_id": e.get("match_id"), "choice": e.get("choice"),
+                                     "is_correct": e.get("is_correct"), "ts": e.get("ts", "")}
+                                    for e in p.get("recent", [])],
+                "coins_balance": u.get("coins_balance", 0),
+                "coins_earned_total": x.get("earned", 0),
+                "coins_spent_total": abs(x.get("spent", 0)),
+                "coins_history": [{"amount": e.get("amount"), "type": e.get("type"), "desc": e.get("desc", ""),
+                                   "ts": e.get("ts", "")} for e in x.get("recent", [])],
+                "redemptions_count": r.get("n", 0),
+                "redemptions_list": [{"product": e.get("product"), "coins": e.get("coins"),
+                                      "status": e.get("status"), "ts": e.get("ts", "")} for e in r.get("recent", [])],
+                "payments_count": pay.get("n", 0),
+                "revenue_contributed_inr": pay.get("revenue", 0),
+                "payment_list": [{"package": e.get("package"), "amount": e.get("amount"), "bucks": e.get("bucks"),
+                                  "status": e.get("status"), "ts": e.get("ts", "")} for e in pay.get("recent", [])],
+                "quests_offered": q.get("n", 0),
+                "quests_completed": q.get("completed", 0),
+                "router_orders_count": ro.get("n", 0),
+                "router_orders_list": [{"sku": e.get("sku"), "coins": e.get("coins"), "status": e.get("status"),
+                                        "ts": e.get("ts", "")} for e in ro.get("recent", [])],
+                "streak_days": u.get("streak_days", 0),
+                "level": u.get("level", 1),
+                "xp": u.get("xp", 0),
+                "total_events": ev.get("n", 0),
+                "first_action_after_reg": ev.get("first_action"),
+                "first_action_time": ev.get("first_action_time"),
+                "event_types": ev.get("types", []),
+                "free_bucks": u.get("free_bucks", 0),
+            })
+        return profiles
+
+    async def _per_user(self, coll, match: Dict, group: Dict,
+                        recent: Optional[Tuple[List[Dict], Dict]] = None,
+                        order: Optional[Dict] = None) -> Dict[str, Dict]:
+        """{user_id: {n, **group}} for rows matching `match` (fed in `order`), plus the
+        latest rows when asked."""
+        pipeline: List[Dict] = [{"$match": match}]
+        if order:
+            pipeline.append({"$sort": order})
+        group = {"_id": "$user_id", "n": {"$sum": 1}, **group}
+        if recent:
+            stages, top = recent
+            pipeline += stages
+            group.update(top)
+        pipeline.append({"$group": group})
+        return {row.pop("_id"): row async for row in coll.aggregate(pipeline, allowDiskUse=True)}
+
+    async def _events(self, users: List[Dict], match: Dict) -> Dict[str, Dict]:
+        """{user_id: {n, types, first_action, first_action_time}}; the first action is the
+        earliest event after registration (a per-user lookup only when the earliest is older)."""
+        rows = await self._per_user(self.db.analytics_events, match, {
+            "types": {"$addToSet": {"$ifNull": ["$event", ""]}},
+            "first": {"$first": {"ts": {"$ifNull": ["$timestamp", ""]}, "event": {"$ifNull": ["$event", ""]}}},
+        }, order={"user_id": 1, "timestamp": 1})
+        registered = {u["id"]: u.get("created_at") or "" for u in users}
+
+        async def after_registration(uid: str):
+            doc = await self.db.analytics_events.find_one(
+                {"user_id": uid, "timestamp": {"$gt": registered[uid]}}, {"_id": 0, "timestamp": 1, "event": 1},
+                sort=[("timestamp", 1)])
+            return {"ts": doc.get("timestamp", ""), "event": doc.get("event", "")} if doc else None
+
+        late = [uid for uid, row in rows.items() if row["first"]["ts"] <= registered.get(uid, "")]
+        firsts = dict(zip(late, await asyncio.gather(*(after_registration(uid) for uid in late))))
+        for uid, row in rows.items():
+            first = firsts[uid] if uid in firsts else row["first"]
+            row["first_action"] = first["event"] if first else None
+            row["first_action_time"] = first["ts"] if first else None
+            del row["first"]
+        return rows
+
+    @staticmethod
+    async def _count_by(coll, match: Dict, key, value=1) -> Dict:
+        return {row["_id"]: row["n"] async for row in coll.aggregate([
+            {"$match": match}, {"$group": {"_id": key, "n": {"$sum": value}}}], allowDiskUse=True)}
+
+    @staticmethod
+    async def _sum(coll, match: Dict, value) -> int:
+        rows = await coll.aggregate([{"$match": match}, {"$group": {"_id": None, "n": {"$sum": value}}}]).to_list(1)
+        return rows[0]["n"] if rows else 0
@@ -1,37 +1,45 @@
 """
 Analytics Engine for FREE11
 Internal event tracking for DAU, contest rates, retention, funnels.
+
+Events go through the process-wide EventPipeline (buffered, sampled, batched);
+DAU / WAU read its HyperLogLog sketches instead of counting events; retention keeps
+exact cohort membership (sketches can't be intersected without drowning small
+cohorts in estimator noise).
 """
 import logging
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from event_pipeline import EventPipeline
+
 logger = logging.getLogger(__name__)
 
 
+RETENTION_CHUNK = 1000
+
+
+def _day(days_ago: int = 0) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days_ago)).strftime("%Y-%m-%d")
+
+
 class AnalyticsEngine:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
+        self.pipeline = EventPipeline(db)
 
     async def track(self, event: str, user_id: str = "", properties: Optional[Dict] = None):
-        await self.db.analytics_events.insert_one({
-            "event": event,
-            "user_id": user_id,
-            "properties": properties or {},
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-        })
+        self.pipeline.submit(event, user_id, properties)
 
     async def get_dau(self, days: int = 7) -> List[Dict]:
-        results = []
-        for i in range(days):
-            day = (datetime.now(timezone.utc) - timedelta(days=i)).strftime("%Y-%m-%d")
-            count = await self.db.analytics_events.count_documents({
-                "event": "login",
-                "timestamp": {"$gte": f"{day}T00:00:00", "$lt": f"{day}T23:59:59"},
-            })
-            results.append({"date": day, "dau": count})
-        return results
+        dates = [_day(i) for i in range(days)]
+        by_day = await self.pipeline.unique_users_by_day("active", dates)
+        return [{"date": day, "dau": by_day[day]} for day in dates]
+
+    async def get_wau(self) -> Dict:
+        dates = [_day(i) for i in range(7)]
+        return {"start": dates[-1], "end": dates[0], "wau": await self.pipeline.unique_users("active", dates)}
 
     async def get_contest_join_rate(self) -> Dict:
         total_users = await self.db.users.count_documents({})
@@ -61,25 +69,29 @@ class AnalyticsEngine:
         }
 
     async def get_retention(self, days: int = 7) -> Dict:
-        now = datetime.now(timezone.utc)
-        d1 = (now - timedelta(days=days)).isoformat()
-        d0 = (now - timedelta(days=days + 1)).isoformat()
-        cohort = await self.db.users.count_documents({"created_at": {"$gte": d0, "$lt": d1}})
-        if cohort == 0:
+        """Day-N retention: users who registered N days ago and were active today.
+        The cohort comes from users.created_at; a member counts as retained if any of their
+        events was stored today (login is never sampled, so signed-in users are not missed)."""
+        start, end = _day(days), _day(days - 1)
+        today = f"{_day(0)}T00:00:00"
+        cohort = [u["id"] async for u in self.db.users.find(
+            {"created_at": {"$gte": start, "$lt": end}}, {"_id": 0, "id": 1}) if u.get("id")]
+        if not cohort:
             return {"cohort_size": 0, "retained": 0, "retention_rate": 0}
-        retained = await self.db.analytics_events.count_documents({
-            "event": "login",
-            "timestamp": {"$gte": (now - timedelta(days=1)).isoformat()},
-        })
+        retained = 0
+        for i in range(0, len(cohort), RETENTION_CHUNK):
+            retained += len(await self.db.analytics_events.distinct(
+                "user_id", {"user_id": {"$in": cohort[i:i + RETENTION_CHUNK]}, "timestamp": {"$gte": today}}))
         return {
-            "cohort_size": cohort,
-            "retained": min(retained, cohort),
-            "retention_rate": round(min(retained, cohort) / cohort * 100, 1),
+            "cohort_size": len(cohort),
+            "retained": retained,
+            "retention_rate": round(retained / len(cohort) * 100, 1),
         }
 
     async def get_dashboard(self) -> Dict:
         return {
             "dau": await self.get_dau(7),
+            "wau": await self.get_wau(),
             "contest_join_rate": await self.get_contest_join_rate(),
             "freebucks_conversion": await self.get_freebucks_conversion(),
             "redemption_rate": await self.get_redemption_rate(),
@@ -88,4 +100,5 @@ class AnalyticsEngine:
             "total_matches_synced": await self.db.matches.count_documents({}),
             "total_fantasy_teams": await self.db.fantasy_teams.count_documents({}),
             "total_predictions": await self.db.predictions.count_documents({}),
+            "ingestion": self.pipeline.stats(),
         }
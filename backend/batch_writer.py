@@ -0,0 +1,66 @@
+"""
+Batch Writer for FREE11
+Group-commit inserts for hot, append-only collections (coin_transactions).
+
+Concurrent callers hand their documents to one BatchWriter; the first write opens
+a short window (MAX_DELAY_S) and everything queued in it goes out as one unordered
+insert_many. Callers still await their own write, so a returned insert is durable
+and read-your-writes holds — only the round trips are shared.
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 500
+MAX_DELAY_S = 0.005
+
+
+class BatchWriter:
+    def __init__(self, collection, max_batch: int = MAX_BATCH, max_delay: float = MAX_DELAY_S):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: List[Tuple[List[Dict], asyncio.Future]] = []
+        self._queued = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def insert(self, doc: Dict) -> None:
+        await self.insert_many([doc])
+
+    async def insert_many(self, docs: List[Dict]) -> None:
+        if not docs:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((docs, future))
+        self._queued += len(docs)
+        if self._queued >= self.max_batch:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, lambda: asyncio.ensure_future(self.flush()))
+        await future
+
+    async def flush(self) -> None:
+        """Write everything queued so far (also called on shutdown)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._queued = self._pending, [], 0
+        if not batch:
+            return
+        docs = [doc for chunk, _ in batch for doc in chunk]
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except Exception as e:
+            logger.error(f"BatchWriter: insert_many of {len(docs)} into {self.collection.name} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for chunk, future in batch:
+            for doc in chunk:
+                doc.pop("_id", None)
+            if not future.done():
+                future.set_result(None)
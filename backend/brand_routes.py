@@ -16,6 +16,7 @@ import os
 
 # Import from server.py
 from server import db
+from streaming_export import export_response, find_batches, since_query
 
 brand_router = APIRouter(prefix="/brand", tags=["Brand Portal"])
 
@@ -744,9 +745,15 @@ async def get_redemptions(
 async def export_redemptions(
     brand: BrandAccount = Depends(get_current_brand),
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    format: str = "json",
+    gzip: bool = False,
+    since: Optional[str] = None,
+    since_id: Optional[str] = None,
 ):
-    """Export redemptions data (CSV-ready JSON)"""
+    """Export redemptions data, streamed oldest delivery first.
+    format=json keeps the CSV-ready JSON envelope; csv / ndjson download as files.
+    since / since_id (delivered_at / id of the last row received) resume an export."""
     query = {"brand_id": brand.id, "status": "delivered"}
     
     if start_date:
@@ -757,14 +764,14 @@ async def export_redemptions(
         else:
             query["delivered_at"] = {"$lte": end_date}
     
-    redemptions = await db.fulfillments.find(
-        query,
-        {"_id": 0, "voucher_code": 0, "voucher_pin": 0, "provider_response": 0}
-    ).to_list(10000)
-    
-    return {
-        "export_date": datetime.now(timezone.utc).isoformat(),
-        "brand": brand.brand_name,
-        "total_records": len(redemptions),
-        "data": redemptions
-    }
+    batches = find_batches(
+        db.fulfillments,
+        since_query(query, "delivered_at", since, since_id),
+        {"_id": 0, "voucher_code": 0, "voucher_pin": 0, "provider_response": 0},
+        [("delivered_at", 1), ("id", 1)],
+    )
+    return export_response(
+        batches, format, "redemptions",
+        gzip=gzip,
+        envelope={"export_date": datetime.now(timezone.utc).isoformat(), "brand": brand.brand_name},
+    )
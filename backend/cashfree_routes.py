@@ -20,6 +20,7 @@ from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel
 
 from server import db, get_current_user, User
+from earnings_rollup import record_credit
 
 logger = logging.getLogger(__name__)
 
@@ -206,14 +207,16 @@ async def verify_payment(req: VerifyPaymentReq, current_user: User = Depends(get
     )
 
     # Coin transaction ledger
-    await db.coin_transactions.insert_one({
+    purchase = {
         "id":          str(uuid.uuid4()),
         "user_id":     current_user.id,
         "amount":      bucks,
         "type":        "purchase",
         "description": f"Cashfree: {order_rec['package_id']} — {bucks} FREE Bucks",
         "created_at":  now,
-    })
+    }
+    await db.coin_transactions.insert_one(purchase)
+    await record_credit(db, purchase)      # purchases are not earnings; filtered here
 
     logger.info("Cashfree payment credited: user=%s bucks=%s order=%s", current_user.id, bucks, req.order_id)
 
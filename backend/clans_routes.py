@@ -13,6 +13,8 @@ import uuid
 
 # Import from server.py
 from server import db, get_current_user, User
+from group_leaderboards import clan_member_accuracy
+from v2_engines import group_leaderboards
 
 clans_router = APIRouter(prefix="/clans", tags=["Clans"])
 
@@ -49,6 +51,8 @@ class ClanMember(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     clan_id: str
     user_id: str
+    name: Optional[str] = None  # Denormalised from users, refreshed on profile change
+    level: int = 1
     role: str = "member"  # leader, co-leader, elder, member
     predictions_in_clan: int = 0
     correct_in_clan: int = 0
@@ -129,9 +133,13 @@ async def create_clan(
     membership = ClanMember(
         clan_id=clan.id,
         user_id=current_user.id,
+        name=current_user.name,
+        level=current_user.level,
         role="leader"
     )
     await db.clan_members.insert_one(membership.model_dump())
+    await group_leaderboards.clan_changed(clan.id)
+    await group_leaderboards.clan_member_changed(clan.id, current_user.id)
     
     return {"message": f"Clan [{clan.tag}] {clan.name} created!", "clan": clan.model_dump()}
 
@@ -176,20 +184,16 @@ async def get_my_clan(current_user: User = Depends(get_current_user)):
         {"_id": 0}
     ).to_list(100)
     
-    # Enrich with user data
-    enriched_members = []
-    for member in members:
-        user = await db.users.find_one(
-            {"id": member["user_id"]},
-            {"_id": 0, "name": 1, "level": 1}
-        )
-        if user:
-            enriched_members.append({
-                **member,
-                "name": user.get("name", "Unknown"),
-                "level": user.get("level", 1),
-                "accuracy": round((member["correct_in_clan"] / member["predictions_in_clan"] * 100), 1) if member["predictions_in_clan"] > 0 else 0
-            })
+    # Names / levels are denormalised onto memberships
+    enriched_members = [
+        {
+            **member,
+            "name": member.get("name") or "Unknown",
+            "level": member.get("level", 1),
+            "accuracy": clan_member_accuracy(member)
+        }
+        for member in await group_leaderboards.with_profiles(members, {"clan_id": membership["clan_id"]})
+    ]
     
     # Sort members by accuracy
     enriched_members.sort(key=lambda x: x.get("accuracy", 0), reverse=True)
@@ -214,19 +218,15 @@ async def get_clan(clan_id: str):
         {"_id": 0}
     ).to_list(50)
     
-    enriched_members = []
-    for member in members:
-        user = await db.users.find_one(
-            {"id": member["user_id"]},
-            {"_id": 0, "name": 1, "level": 1}
-        )
-        if user:
-            enriched_members.append({
-                **member,
-                "name": user.get("name", "Unknown"),
-                "level": user.get("level", 1),
-                "accuracy": round((member["correct_in_clan"] / member["predictions_in_clan"] * 100), 1) if member["predictions_in_clan"] > 0 else 0
-            })
+    enriched_members = [
+        {
+            **member,
+            "name": member.get("name") or "Unknown",
+            "level": member.get("level", 1),
+            "accuracy": clan_member_accuracy(member)
+        }
+        for member in await group_leaderboards.with_profiles(members, {"clan_id": clan_id})
+    ]
     
     enriched_members.sort(key=lambda x: x.get("accuracy", 0), reverse=True)
     
@@ -261,6 +261,8 @@ async def join_clan(
     membership = ClanMember(
         clan_id=clan["id"],
         user_id=current_user.id,
+        name=current_user.name,
+        level=current_user.level,
         role="member"
     )
     await db.clan_members.insert_one(membership.model_dump())
@@ -270,6 +272,8 @@ async def join_clan(
         {"id": clan["id"]},
         {"$inc": {"member_count": 1}}
     )
+    await group_leaderboards.clan_changed(clan["id"])
+    await group_leaderboards.clan_member_changed(clan["id"], current_user.id)
     
     return {"message": f"Joined [{clan['tag']}] {clan['name']}!"}
 
@@ -292,79 +296,46 @@ async def leave_clan(current_user: User = Depends(get_current_user)):
         {"id": membership["clan_id"]},
         {"$inc": {"member_count": -1}}
     )
+    group_leaderboards.clan_member_removed(membership["clan_id"], current_user.id)
+    await group_leaderboards.clan_changed(membership["clan_id"])
     
     return {"message": "Left the clan"}
 
 # ==================== LEADERBOARDS (SKILL-BASED) ====================
 
 @clans_router.get("/leaderboard/clans")
-async def get_clan_leaderboard():
+async def get_clan_leaderboard(offset: int = 0, limit: int = 20):
     """
     Get clan leaderboard ranked by SKILL metrics
     Primary: Accuracy | Secondary: Best Streak
     NOT ranked by coins
     """
-    clans = await db.clans.find(
-        {"member_count": {"$gt": 0}},
-        {"_id": 0}
-    ).to_list(100)
-    
-    # Sort by accuracy (primary), then streak (secondary)
-    clans.sort(key=lambda x: (x.get("clan_accuracy", 0), x.get("best_streak", 0)), reverse=True)
-    
-    result = []
-    for i, clan in enumerate(clans[:20]):
-        result.append({
-            "rank": i + 1,
-            "id": clan["id"],
-            "name": clan["name"],
-            "tag": clan["tag"],
-            "logo_emoji": clan.get("logo_emoji", "🏏"),
-            "accuracy": round(clan.get("clan_accuracy", 0), 1),
-            "best_streak": clan.get("best_streak", 0),
-            "member_count": clan.get("member_count", 0),
-            "total_predictions": clan.get("total_predictions", 0)
-        })
-    
-    return result
+    return await group_leaderboards.get_clan_board(max(offset, 0), min(max(limit, 1), 100))
+
+@clans_router.get("/leaderboard/clans/me")
+async def get_my_clan_rank(radius: int = 5, current_user: User = Depends(get_current_user)):
+    """Current user's clan rank with the clans around it"""
+    membership = await db.clan_members.find_one({"user_id": current_user.id}, {"_id": 0, "clan_id": 1})
+    if not membership:
+        raise HTTPException(status_code=400, detail="Not in a clan")
+    return await group_leaderboards.get_clan_rank(membership["clan_id"], min(max(radius, 0), 25))
 
 @clans_router.get("/leaderboard/members/{clan_id}")
-async def get_clan_member_leaderboard(clan_id: str):
+async def get_clan_member_leaderboard(clan_id: str, offset: int = 0, limit: int = 50):
     """
     Get members within a clan ranked by SKILL
     Primary: Accuracy | Secondary: Personal Streak
     """
-    members = await db.clan_members.find(
-        {"clan_id": clan_id},
-        {"_id": 0}
-    ).to_list(50)
-    
-    result = []
-    for member in members:
-        user = await db.users.find_one(
-            {"id": member["user_id"]},
-            {"_id": 0, "name": 1, "level": 1}
-        )
-        if user:
-            accuracy = round((member["correct_in_clan"] / member["predictions_in_clan"] * 100), 1) if member["predictions_in_clan"] > 0 else 0
-            result.append({
-                "user_id": member["user_id"],
-                "name": user.get("name", "Unknown"),
-                "level": user.get("level", 1),
-                "role": member.get("role", "member"),
-                "accuracy": accuracy,
-                "predictions": member.get("predictions_in_clan", 0),
-                "correct": member.get("correct_in_clan", 0),
-                "streak": member.get("personal_streak", 0)
-            })
-    
-    # Sort by accuracy
-    result.sort(key=lambda x: (x["accuracy"], x["streak"]), reverse=True)
-    
-    for i, member in enumerate(result):
-        member["rank"] = i + 1
-    
-    return result
+    return await group_leaderboards.get_clan_member_board(clan_id, max(offset, 0), min(max(limit, 1), 100))
+
+@clans_router.get("/leaderboard/members/{clan_id}/me")
+async def get_my_clan_member_rank(
+    clan_id: str,
+    radius: int = 5,
+    current_user: User = Depends(get_current_user)
+):
+    """Current user's rank inside a clan with the members around them"""
+    return await group_leaderboards.get_clan_member_rank(clan_id, current_user.id, min(max(radius, 0), 25))
 
 # ==================== CHALLENGES ====================
 
@@ -466,3 +437,5 @@ async def update_clan_stats_on_prediction(user_id: str, is_correct: bool):
         }
         
         await db.clans.update_one({"id": clan["id"]}, update_clan)
+        await group_leaderboards.clan_changed(clan["id"])
+    await group_leaderboards.clan_member_changed(membership["clan_id"], user_id)
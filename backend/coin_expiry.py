@@ -0,0 +1,225 @@
+"""
+Coin Expiry Engine for FREE11
+Bonus coins expire BONUS_EXPIRY_DAYS after they are granted.
+
+Grants are bucketed per user per expiry day in coin_expiry_buckets (one upsert, so
+a million grants stay a few hundred thousand small docs). The daily run walks due
+buckets with an indexed range query in EXPIRY_BATCH chunks: one conditional
+bulk_write on users and one insert_many on ledger per chunk. Warning campaigns read
+the same buckets by expiry day.
+
+Every debit drains the spender's active buckets, soonest expiry first (`consume`),
+so `remaining` is the bonus still unspent and expiry never takes earned coins.
+Before debiting, a run writes each bucket's amount onto it (status "expiring");
+a rerun after a crash debits and logs those stored amounts instead of recomputing
+them from a balance the first attempt may already have reduced.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from economy_engine import BONUS_EXPIRY_DAYS
+from economy_metrics import record_flows
+from ledger_engine import LedgerEngine
+
+logger = logging.getLogger(__name__)
+
+EXPIRING_TYPES = {"bonus", "surprise"}
+EXPIRY_BATCH = 1000
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def expiry_day(granted_at: Optional[datetime] = None) -> str:
+    granted_at = granted_at or datetime.now(timezone.utc)
+    return (granted_at + timedelta(days=BONUS_EXPIRY_DAYS)).strftime("%Y-%m-%d")
+
+
+class CoinExpiryEngine:
+    def __init__(self, db: AsyncIOMotorDatabase, ledger: LedgerEngine):
+        self.db = db
+        self.ledger = ledger
+
+    async def ensure_indexes(self):
+        await self.db.coin_expiry_buckets.create_index(
+            [("user_id", 1), ("expires_on", 1)], unique=True, name="expiry_user_day")
+        # Daily run and warning campaigns: range over expires_on within a status
+        await self.db.coin_expiry_buckets.create_index(
+            [("status", 1), ("expires_on", 1), ("user_id", 1)], name="expiry_status_day")
+
+    async def grant(self, user_id: str, amount: int) -> None:
+        await self.grant_many([(user_id, amount)])
+
+    async def grant_many(self, grants: List[Tuple[str, int]]) -> None:
+        """Record expiring grants [(user_id, amount)] — one upsert per user per expiry day."""
+        totals: Dict[str, int] = defaultdict(int)
+        for user_id, amount in grants:
+            if amount > 0:
+                totals[user_id] += amount
+        if not totals:
+            return
+        day, now = expiry_day(), datetime.now(timezone.utc).isoformat()
+        await self.db.coin_expiry_buckets.bulk_write([
+            UpdateOne({"user_id": uid, "expires_on": day},
+                      {"$inc": {"amount": amt, "remaining": amt},
+                       "$set": {"status": "active", "updated_at": now},
+                       "$setOnInsert": {"created_at": now}}, upsert=True)
+            for uid, amt in totals.items()], ordered=False)
+
+    async def consume(self, user_id: str, amount: int) -> None:
+        await self.consume_many([(user_id, amount)])
+
+    async def consume_many(self, debits: List[Tuple[str, int]]) -> None:
+        """Drain spent coins [(user_id, amount)] from active buckets, soonest expiry first."""
+        left: Dict[str, int] = defaultdict(int)
+        for user_id, amount in debits:
+            if amount > 0:
+                left[user_id] += amount
+        if not left:
+            return
+        now, ops = datetime.now(timezone.utc).isoformat(), []
+        async for b in self.db.coin_expiry_buckets.find(
+            {"user_id": {"$in": list(left)}, "status": "active", "remaining": {"$gt": 0}},
+            {"_id": 0, "user_id": 1, "expires_on": 1, "remaining": 1},
+        ).sort([("user_id", 1), ("expires_on", 1)]):
+            take = min(int(b["remaining"]), left[b["user_id"]])
+            if take <= 0:
+                continue
+            left[b["user_id"]] -= take
+            ops.append(UpdateOne(
+                {"user_id": b["user_id"], "expires_on": b["expires_on"], "status": "active",
+                 "remaining": {"$gte": take}},
+                {"$inc": {"remaining": -take}, "$set": {"updated_at": now}}))
+        if ops:
+            await self.db.coin_expiry_buckets.bulk_write(ops, ordered=False)
+
+    async def get_user_expiring(self, user_id: str) -> List[Dict]:
+        """Upcoming expiries for one user, soonest first."""
+        return await self.db.coin_expiry_buckets.find(
+            {"user_id": user_id, "status": "active"},
+            {"_id": 0, "expires_on": 1, "remaining": 1}).sort("expires_on", 1).to_list(BONUS_EXPIRY_DAYS + 1)
+
+    async def expiring_on(self, day: str, batch: int = EXPIRY_BATCH) -> AsyncIterator[List[Dict]]:
+        """Chunks of [{user_id, remaining}] whose coins expire on `day` (warning campaigns)."""
+        cursor = self.db.coin_expiry_buckets.find(
+            {"status": "active", "expires_on": day}, {"_id": 0, "user_id": 1, "remaining": 1})
+        while True:
+            chunk = await cursor.to_list(batch)
+            if not chunk:
+                return
+            yield chunk
+
+    async def run_expiry(self, day: Optional[str] = None) -> Dict:
+        """Expire every active bucket due on or before `day` (default today). Idempotent.
+
+        Per chunk: each user's amount — unspent bonus, capped at the balance — is first
+        stored on their buckets with expiry_run = day, then debited with one conditional
+        bulk_write stamped with coin_expiry_run so the same run can't debit twice; ledger
+        entries (reference coin_expiry:<run>) go out in one insert_many. Buckets an
+        interrupted run left "expiring" are finished under that run's day first, so a
+        recovery on a later day neither re-debits nor re-logs them. Users a racing spend
+        left short get their buckets back to active and are retried on the next run.
+        """
+        day = day or _today()
+        stats = {"day": day, "buckets": 0, "users": 0, "coins": 0, "retry": 0}
+        after: Tuple[str, str] = ("", "")
+        while True:
+            buckets = await self.db.coin_expiry_buckets.find(
+                {"status": {"$in": ["active", "expiring"]}, "expires_on": {"$lte": day},
+                 "$or": [{"expires_on": {"$gt": after[0]}},
+                         {"expires_on": after[0], "user_id": {"$gt": after[1]}}]},
+                {"_id": 0, "user_id": 1, "expires_on": 1},
+            ).sort([("expires_on", 1), ("user_id", 1)]).to_list(EXPIRY_BATCH)
+            if not buckets:
+                break
+            after = (buckets[-1]["expires_on"], buckets[-1]["user_id"])
+            # Take each user's other due buckets along, so one run settles a user in one chunk
+            buckets = await self.db.coin_expiry_buckets.find(
+                {"user_id": {"$in": list({b["user_id"] for b in buckets})},
+                 "status": {"$in": ["active", "expiring"]}, "expires_on": {"$lte": day}},
+                {"_id": 0, "user_id": 1, "expires_on": 1, "remaining": 1, "status": 1, "expired": 1,
+                 "expiry_run": 1},
+            ).sort("expires_on", 1).to_list(None)
+            await self._expire_chunk(buckets, day, stats)
+        logger.info(f"COIN EXPIRY: {stats}")
+        return stats
+
+    async def _expire_chunk(self, buckets: List[Dict], day: str, stats: Dict) -> None:
+        # Plans an interrupted run left behind keep their amounts and that run's stamp
+        leftover: Dict[str, List[Dict]] = defaultdict(list)
+        for b in buckets:
+            if b.get("status") == "expiring":
+                leftover[b.get("expiry_run") or day].append(b)
+        for run in sorted(leftover):
+            await self._settle(leftover[run], run, stats)
+
+        # 1. Plan: store each active bucket's share of the user's amount before touching
+        #    balances (read after the leftovers above were debited)
+        fresh = [b for b in buckets if b.get("status") == "active"]
+        if not fresh:
+            return
+        balances = {u["id"]: int(u.get("coins_balance") or 0) async for u in self.db.users.find(
+            {"id": {"$in": list({b["user_id"] for b in fresh})}}, {"_id": 0, "id": 1, "coins_balance": 1})}
+        now, ops = datetime.now(timezone.utc).isoformat(), []
+        for b in fresh:  # oldest first; what the balance covers is split across them
+            taken = min(int(b.get("remaining") or 0), balances.get(b["user_id"], 0))
+            balances[b["user_id"]] = balances.get(b["user_id"], 0) - taken
+            b["expired"] = taken
+            ops.append(UpdateOne({"user_id": b["user_id"], "expires_on": b["expires_on"], "status": "active"},
+                                 {"$set": {"status": "expiring", "expired": taken, "expiry_run": day,
+                                           "updated_at": now}}))
+        await self.db.coin_expiry_buckets.bulk_write(ops, ordered=False)
+        await self._settle(fresh, day, stats)
+
+    async def _settle(self, buckets: List[Dict], run: str, stats: Dict) -> None:
+        """Debit, log and settle planned ("expiring") buckets of one run."""
+        reference_id = f"coin_expiry:{run}"
+        amounts: Dict[str, int] = defaultdict(int)
+        for b in buckets:
+            amounts[b["user_id"]] += int(b.get("expired") or 0)
+
+        # 2. Debit the stored amounts; the run stamp makes each run's debit happen at most once
+        ops = [UpdateOne({"id": uid, "coins_balance": {"$gte": amt}, "coin_expiry_run": {"$ne": run}},
+                         {"$inc": {"coins_balance": -amt, "total_expired": amt},
+                          "$set": {"coin_expiry_run": run}})
+               for uid, amt in amounts.items() if amt > 0]
+        if ops:
+            await self.db.users.bulk_write(ops, ordered=False)
+        stamped = set(await self.db.users.distinct("id", {"id": {"$in": list(amounts)}, "coin_expiry_run": run}))
+        done = {uid for uid, amt in amounts.items() if amt == 0 or uid in stamped}
+
+        # 3. Ledger entries; a rerun after a crash finds some users already logged
+        logged = set(await self.db.ledger.distinct(
+            "user_id", {"user_id": {"$in": list(stamped)}, "reference_id": reference_id})) if stamped else set()
+        entries = [self.ledger._entry(uid, "coin_expiry", 0, amounts[uid], reference_id,
+                                      f"{amounts[uid]} bonus coins expired")
+                   for uid in stamped if uid not in logged and amounts.get(uid, 0) > 0]
+        if entries:
+            await self.db.ledger.insert_many(entries, ordered=False)
+            await record_flows(self.db, [("coin_expiry", -e["debit"]) for e in entries], entries[0]["timestamp"])
+
+        # 4. Settle this run's buckets: expired for debited users, back to active for the rest
+        now = datetime.now(timezone.utc).isoformat()
+        settled = [uid for uid in amounts if uid in done]
+        retry = [uid for uid in amounts if uid not in done]
+        due_days = list({b["expires_on"] for b in buckets})
+        if settled:
+            await self.db.coin_expiry_buckets.update_many(
+                {"user_id": {"$in": settled}, "expires_on": {"$in": due_days}, "status": "expiring",
+                 "expiry_run": run},
+                {"$set": {"status": "expired", "remaining": 0, "expired_at": now}})
+        if retry:
+            await self.db.coin_expiry_buckets.update_many(
+                {"user_id": {"$in": retry}, "expires_on": {"$in": due_days}, "status": "expiring",
+                 "expiry_run": run},
+                {"$set": {"status": "active", "updated_at": now}, "$unset": {"expired": "", "expiry_run": ""}})
+        stats["buckets"] += sum(1 for b in buckets if b["user_id"] in done)
+        stats["users"] += len(entries)
+        stats["coins"] += sum(e["debit"] for e in entries)
+        stats["retry"] += len(retry)
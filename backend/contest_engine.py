@@ -4,10 +4,17 @@ Handles: public/private contests, join/create, lock at match start, fill limits,
 Platform contests: auto-seeded per match with FREE COIN prize pools
 """
 import uuid
+import random
 import logging
 from datetime import datetime, timezone
 from typing import Optional, Dict, List
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from leaderboard_store import leaderboard_store, prize_for_rank
+from earnings_rollup import record_credits
+from economy_metrics import record_flows
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +25,12 @@ CONTEST_DEFAULTS = {
     "min_participants": 2,
 }
 
+BULK_CHUNK = 1000  # ops per bulk_write batch
+SEAT_SYNC_EVERY = 10  # sharded contests: refresh contests.current_participants every N seats per shard
+
+# Participant projection — membership lives in contest_members; legacy arrays are never shipped
+CONTEST_PROJECTION = {"_id": 0, "participants": 0}
+
 # ── Platform Contest Tier Definitions ──────────────────────────────────────────
 # All prizes in FREE COINS. prize_distribution maps rank → coins awarded.
 CONTEST_TIERS = {
@@ -32,6 +45,7 @@ CONTEST_TIERS = {
             "4": 200, "5": 200, "6": 100, "7": 100, "8": 100, "9": 100, "10": 100,
         },
         "winners_count": 10,
+        "seat_shards": 8,  # hot contest: spread seat claims over 8 counter docs
         "badge_color": "yellow",
         "description": "Top 10 win FREE Coins",
     },
@@ -88,6 +102,7 @@ def _detect_match_tier(series: str) -> List[str]:
 class ContestEngine:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
+        self.lb = leaderboard_store
 
     # ── Seed Platform Contests ─────────────────────────────────────────────────
 
@@ -128,13 +143,15 @@ class ContestEngine:
             "badge_color": tier["badge_color"],
             "description": tier["description"],
             "invite_code": None,
-            "participants": [],
+            "seat_shards": tier.get("seat_shards", 0),
             "locked": False,
             "finalized": False,
             "created_at": now,
             "updated_at": now,
         }
         await self.db.contests.insert_one(contest)
+        if contest["seat_shards"]:
+            await self._create_seat_shards(contest["id"], contest["max_participants"], contest["seat_shards"])
         return {k: v for k, v in contest.items() if k != "_id"}
 
     # ── Scoring Engine ────────────────────────────────────────────────────────
@@ -200,81 +217,186 @@ class ContestEngine:
             {"$set": {"points": points, "last_scored_at": datetime.now(timezone.utc).isoformat()}},
             upsert=True
         )
+        self._sync_points(contest_id, user_id, points)
         return points
 
+    async def score_match_contests(self, match_id: str, contests: List[Dict],
+                                   members: Dict[str, List[str]]) -> Dict[str, Dict[str, float]]:
+        """Score every participant of every given contest of a match in one pass.
+
+        One aggregation streams the match's resolved predictions sorted by (user, time);
+        each user's run is scored with calculate_user_points and the results are written
+        to contest_entries with a single unordered bulk_write.
+        `members` maps contest_id → participant user_ids. Returns {contest_id: {user_id: points}}.
+        """
+        user_ids = sorted({uid for c in contests for uid in members.get(c["id"], [])})
+        if not user_ids:
+            return {c["id"]: {} for c in contests}
+
+        points_by_user: Dict[str, float] = {}
+        current_uid, run = None, []
+        cursor = self.db.predictions_v2.aggregate([
+            {"$match": {"match_id": match_id, "status": "resolved", "user_id": {"$in": user_ids}}},
+            {"$sort": {"user_id": 1, "submitted_at": 1}},
+            {"$project": {"_id": 0, "user_id": 1, "submitted_at": 1, "status": 1,
+                          "is_correct": 1, "prediction_type": 1}},
+        ], allowDiskUse=True)
+        async for pred in cursor:
+            if pred["user_id"] != current_uid:
+                if current_uid is not None:
+                    points_by_user[current_uid] = self.calculate_user_points(run)
+                current_uid, run = pred["user_id"], []
+            run.append(pred)
+        if current_uid is not None:
+            points_by_user[current_uid] = self.calculate_user_points(run)
+
+        now = datetime.now(timezone.utc).isoformat()
+        scores: Dict[str, Dict[str, float]] = {}
+        ops = []
+        for c in contests:
+            scores[c["id"]] = {}
+            for uid in members.get(c["id"], []):
+                pts = points_by_user.get(uid, 0.0)
+                scores[c["id"]][uid] = pts
+                ops.append(UpdateOne(
+                    {"contest_id": c["id"], "user_id": uid},
+                    {"$set": {"points": pts, "last_scored_at": now}},
+                    upsert=True,
+                ))
+        for i in range(0, len(ops), BULK_CHUNK):
+            await self.db.contest_entries.bulk_write(ops[i:i + BULK_CHUNK], ordered=False)
+        for c in contests:
+            self.lb.invalidate(self._board(c["id"]))
+        logger.info(f"CONTEST SCORING: match={match_id} contests={len(contests)} "
+                    f"users={len(user_ids)} entries={len(ops)}")
+        return scores
+
     # ── Finalize Contest & Pay Out Coins ──────────────────────────────────────
 
     async def finalize_contest(self, contest_id: str) -> Dict:
         """Distribute coin prizes to top-ranked participants after match ends.
         Idempotent: unique_payout_id prevents double payout even if called twice.
         """
-        contest = await self.db.contests.find_one({"id": contest_id}, {"_id": 0})
+        contest = await self.db.contests.find_one({"id": contest_id}, CONTEST_PROJECTION)
         if not contest:
             raise ValueError("Contest not found")
         if contest.get("finalized"):
             return {"already_finalized": True, "contest_id": contest_id}
-        if contest.get("current_participants", 0) < 2:
-            await self.db.contests.update_one(
-                {"id": contest_id},
+        results = await self._finalize_batch(contest.get("match_id", ""), [contest])
+        return results[contest_id]
+
+    async def finalize_match(self, match_id: str) -> Dict[str, Dict]:
+        """Finalize every unfinalized contest of a match: one scoring pass, one payout batch.
+        Returns {contest_id: result} with the same result shape as finalize_contest."""
+        contests = await self.db.contests.find(
+            {"match_id": match_id, "finalized": {"$ne": True}, "status": {"$in": ["open", "full", "locked"]}},
+            CONTEST_PROJECTION
+        ).to_list(None)
+        if not contests:
+            return {}
+        return await self._finalize_batch(match_id, contests)
+
+    async def _finalize_batch(self, match_id: str, contests: List[Dict]) -> Dict[str, Dict]:
+        now = datetime.now(timezone.utc).isoformat()
+        results: Dict[str, Dict] = {}
+
+        # Membership from the indexed collection (authoritative even when seat counters are sharded)
+        members: Dict[str, List[str]] = {c["id"]: [] for c in contests}
+        async for m in self.db.contest_members.find(
+            {"contest_id": {"$in": list(members)}}, {"_id": 0, "contest_id": 1, "user_id": 1}
+        ):
+            members[m["contest_id"]].append(m["user_id"])
+
+        # Void contests that never filled
+        voided = [c for c in contests if len(members[c["id"]]) < 2]
+        if voided:
+            await self.db.contests.update_many(
+                {"id": {"$in": [c["id"] for c in voided]}, "finalized": {"$ne": True}},
                 {"$set": {"status": "voided", "void_reason": "insufficient_participants",
-                          "finalized": True, "updated_at": datetime.now(timezone.utc).isoformat()}}
+                          "finalized": True, "updated_at": now}}
             )
-            return {"voided": True, "reason": "insufficient_participants"}
+            sharded = [c["id"] for c in voided if c.get("seat_shards")]
+            if sharded:
+                await self._close_seat_shards({"contest_id": {"$in": sharded}})
+            for c in voided:
+                results[c["id"]] = {"voided": True, "reason": "insufficient_participants"}
+        live = [c for c in contests if len(members[c["id"]]) >= 2]
+        if not live:
+            return results
 
         # Recalculate points from resolved predictions before ranking
-        match_id = contest.get("match_id", "")
-        for uid in contest.get("participants", []):
-            try:
-                await self.calculate_and_store_points(contest_id, uid, match_id)
-            except Exception as e:
-                logger.warning(f"finalize: scoring failed user={uid}: {e}")
-
-        leaderboard = await self.get_leaderboard(contest_id)
-        dist = contest.get("prize_distribution", {})
-        payouts = []
-
-        for entry in leaderboard:
-            rank = entry["rank"]
-            reward = dist.get(str(rank), 0)
-            if reward <= 0:
-                continue
-
-            # ── IDEMPOTENCY GUARD ──────────────────────────────────────────
-            unique_payout_id = f"payout_{contest_id}_{entry['user_id']}"
-            try:
-                await self.db.coin_transactions.insert_one({
-                    "unique_payout_id": unique_payout_id,
-                    "user_id": entry["user_id"],
+        scores = await self.score_match_contests(match_id, live, members)
+
+        # Rank with the leaderboard tie-break: points desc, submitted_at asc, user_id
+        submitted = {}
+        async for e in self.db.contest_entries.find(
+            {"contest_id": {"$in": [c["id"] for c in live]}},
+            {"_id": 0, "contest_id": 1, "user_id": 1, "submitted_at": 1}
+        ):
+            submitted[(e["contest_id"], e["user_id"])] = e.get("submitted_at") or ""
+
+        # ── Build the payout batch ─────────────────────────────────────────
+        txns, winners = [], []
+        for c in live:
+            dist = c.get("prize_distribution", {})
+            ranked = sorted(
+                scores[c["id"]].items(),
+                key=lambda kv: (-kv[1], submitted.get((c["id"], kv[0]), ""), kv[0])
+            )
+            for rank, (uid, _) in enumerate(ranked, 1):
+                reward = prize_for_rank(dist, rank)
+                if reward <= 0:
+                    continue
+                txns.append({
+                    "id": str(uuid.uuid4()),
+                    "unique_payout_id": f"payout_{c['id']}_{uid}",
+                    "user_id": uid,
                     "amount": reward,
                     "type": "contest_prize",
-                    "description": f"Contest prize: Rank #{rank} in '{contest['name']}' (Match {match_id})",
-                    "contest_id": contest_id,
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "description": f"Contest prize: Rank #{rank} in '{c['name']}' (Match {match_id})",
+                    "contest_id": c["id"],
+                    "timestamp": now,
                 })
-            except Exception:
-                # DuplicateKeyError → already paid; skip silently
-                logger.info(f"finalize: payout already issued for {unique_payout_id}, skipping")
-                continue
-
-            # ── ATOMIC BALANCE CREDIT ──────────────────────────────────────
-            updated = await self.db.users.find_one_and_update(
-                {"id": entry["user_id"]},
-                {"$inc": {"coins_balance": reward, "total_earned": reward}},
-                return_document=True,
-                projection={"_id": 0, "coins_balance": 1}
-            )
-            if updated:
-                payouts.append({"user_id": entry["user_id"], "rank": rank, "coins": reward,
-                                 "new_balance": updated.get("coins_balance", 0)})
+                winners.append({"contest_id": c["id"], "user_id": uid, "rank": rank, "coins": reward})
 
-        await self.db.contests.update_one(
-            {"id": contest_id},
-            {"$set": {"status": "completed", "finalized": True,
-                      "payout_count": len(payouts),
-                      "updated_at": datetime.now(timezone.utc).isoformat()}}
-        )
-        logger.info(f"CONTEST FINALIZED: {contest_id} payouts={len(payouts)}")
-        return {"finalized": True, "payouts": payouts, "total_paid": sum(p["coins"] for p in payouts)}
+        # ── IDEMPOTENCY GUARD: unique_payout_id index rejects re-issued payouts ──
+        already_paid = set()
+        if txns:
+            try:
+                await self.db.coin_transactions.insert_many(txns, ordered=False)
+            except BulkWriteError as bwe:
+                for err in bwe.details.get("writeErrors", []):
+                    if err.get("code") != 11000:
+                        raise
+                    already_paid.add(err["index"])
+                logger.info(f"finalize: {len(already_paid)} payouts already issued for match={match_id}, skipping")
+
+        # ── ATOMIC BALANCE CREDITS (one bulk_write) ────────────────────────
+        paid = [w for i, w in enumerate(winners) if i not in already_paid]
+        if paid:
+            await self.db.users.bulk_write([
+                UpdateOne({"id": w["user_id"]}, {"$inc": {"coins_balance": w["coins"], "total_earned": w["coins"]}})
+                for w in paid
+            ], ordered=False)
+            await record_credits(self.db, [t for i, t in enumerate(txns) if i not in already_paid])
+            await record_flows(self.db, [("contest_prize", w["coins"]) for w in paid], now)
+
+        payouts_by_contest: Dict[str, List[Dict]] = {c["id"]: [] for c in live}
+        for w in paid:
+            payouts_by_contest[w["contest_id"]].append({"user_id": w["user_id"], "rank": w["rank"], "coins": w["coins"]})
+
+        await self.db.contests.bulk_write([
+            UpdateOne({"id": c["id"]},
+                      {"$set": {"status": "completed", "finalized": True,
+                                "payout_count": len(payouts_by_contest[c["id"]]), "updated_at": now}})
+            for c in live
+        ], ordered=False)
+
+        for c in live:
+            payouts = payouts_by_contest[c["id"]]
+            results[c["id"]] = {"finalized": True, "payouts": payouts, "total_paid": sum(p["coins"] for p in payouts)}
+            logger.info(f"CONTEST FINALIZED: {c['id']} payouts={len(payouts)}")
+        return results
 
     # ── Create (user-created contests) ────────────────────────────────────────
 
@@ -305,7 +427,7 @@ class ContestEngine:
             "prize_pool": 0,
             "prize_distribution": {},
             "invite_code": invite_code,
-            "participants": [],
+            "seat_shards": 0,
             "locked": False,
             "finalized": False,
             "created_at": now,
@@ -318,8 +440,12 @@ class ContestEngine:
     # ── Join (atomic) ──────────────────────────────────────────────────────────
 
     async def join_contest(self, contest_id: str, user_id: str, entry: Optional[Dict] = None) -> Dict:
-        """Atomic join: prevents duplicate, overfill, late join"""
-        contest = await self.db.contests.find_one({"id": contest_id}, {"_id": 0})
+        """Atomic join: prevents duplicate, overfill, late join.
+
+        Membership row first (unique (contest_id, user_id) index rejects duplicates), then one
+        conditional seat claim; a failed claim removes the membership row again.
+        """
+        contest = await self.db.contests.find_one({"id": contest_id}, CONTEST_PROJECTION)
         if not contest:
             raise ValueError("Contest not found")
 
@@ -327,27 +453,24 @@ class ContestEngine:
             raise ValueError("Contest is locked (match has started)")
         if contest["status"] not in ("open",):
             raise ValueError(f"Contest is {contest['status']}, cannot join")
-        if user_id in contest["participants"]:
-            raise ValueError("Already joined this contest")
-        if contest["current_participants"] >= contest["max_participants"]:
-            raise ValueError("Contest is full")
 
-        result = await self.db.contests.update_one(
-            {
-                "id": contest_id,
-                "locked": False,
-                "status": "open",
-                "participants": {"$ne": user_id},
-                "current_participants": {"$lt": contest["max_participants"]},
-            },
-            {
-                "$push": {"participants": user_id},
-                "$inc": {"current_participants": 1},
-                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()},
-            }
-        )
+        now = datetime.now(timezone.utc).isoformat()
+        try:
+            await self.db.contest_members.insert_one({
+                "contest_id": contest_id,
+                "user_id": user_id,
+                "match_id": contest.get("match_id"),
+                "joined_at": now,
+            })
+        except DuplicateKeyError:
+            raise ValueError("Already joined this contest")
 
-        if result.modified_count == 0:
+        if contest.get("seat_shards"):
+            participants = await self._claim_sharded_seat(contest, now)
+        else:
+            participants = await self._claim_seat(contest_id, now)
+        if participants is None:
+            await self.db.contest_members.delete_one({"contest_id": contest_id, "user_id": user_id})
             raise ValueError("Failed to join: contest may be full, locked, or already joined")
 
         if entry:
@@ -359,20 +482,132 @@ class ContestEngine:
                     "entry": entry,
                     "points": 0,
                     "rank": 0,
-                    "submitted_at": datetime.now(timezone.utc).isoformat(),
+                    "submitted_at": now,
                 }},
                 upsert=True
             )
-
-        updated = await self.db.contests.find_one({"id": contest_id}, {"_id": 0})
-        if updated and updated["current_participants"] >= updated["max_participants"]:
-            await self.db.contests.update_one(
-                {"id": contest_id},
-                {"$set": {"status": "full"}}
-            )
+            board = self._board(contest_id)
+            if self.lb.is_loaded(board):
+                u = await self.db.users.find_one({"id": user_id}, {"_id": 0, "name": 1})
+                self.lb.upsert(board, user_id, 0, now, (u or {}).get("name", "Unknown"))
 
         logger.info(f"CONTEST JOIN: user={user_id} contest={contest_id}")
-        return {"success": True, "participants": contest["current_participants"] + 1}
+        return {"success": True, "participants": participants}
+
+    async def _claim_seat(self, contest_id: str, now: str) -> Optional[int]:
+        """One round trip: increment the seat counter if open and not full, flipping to 'full' on the last seat."""
+        next_count = {"$add": ["$current_participants", 1]}
+        updated = await self.db.contests.find_one_and_update(
+            {
+                "id": contest_id,
+                "locked": False,
+                "status": "open",
+                "$expr": {"$lt": ["$current_participants", "$max_participants"]},
+            },
+            [{"$set": {
+                "current_participants": next_count,
+                "status": {"$cond": [{"$gte": [next_count, "$max_participants"]}, "full", "$status"]},
+                "updated_at": now,
+            }}],
+            projection={"_id": 0, "current_participants": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return updated["current_participants"] if updated else None
+
+    # ── Sharded seat counters (hot mega contests) ────────────────────────────
+    # Seats are split across `seat_shards` counter docs so concurrent joins don't all
+    # serialise on the contest document. contests.current_participants is refreshed
+    # from the shards every SEAT_SYNC_EVERY claims per shard and when a shard fills.
+
+    async def _create_seat_shards(self, contest_id: str, max_participants: int, shards: int):
+        base, extra = divmod(max_participants, shards)
+        await self.db.contest_seat_shards.insert_many([
+            {"contest_id": contest_id, "shard": i, "seats": base + (1 if i < extra else 0), "taken": 0}
+            for i in range(shards)
+        ])
+
+    async def _claim_sharded_seat(self, contest: Dict, now: str) -> Optional[int]:
+        contest_id = contest["id"]
+        n = contest["seat_shards"]
+        for shard in random.sample(range(n), n):
+            doc = await self.db.contest_seat_shards.find_one_and_update(
+                {"contest_id": contest_id, "shard": shard, "$expr": {"$lt": ["$taken", "$seats"]}},
+                {"$inc": {"taken": 1}},
+                projection={"_id": 0, "taken": 1, "seats": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if doc:
+                # A void/lock that landed between our status check and the claim wins
+                state = await self.db.contests.find_one({"id": contest_id}, {"_id": 0, "status": 1, "locked": 1})
+                if not state or state.get("locked") or state.get("status") not in ("open", "full"):
+                    return None
+                if doc["taken"] % SEAT_SYNC_EVERY == 0 or doc["taken"] >= doc["seats"]:
+                    return await self._sync_seat_count(contest_id, now)
+                return contest.get("current_participants", 0) + 1
+        await self._sync_seat_count(contest_id, now)  # every shard full → flip status
+        return None
+
+    async def _sync_seat_count(self, contest_id: str, now: str) -> int:
+        agg = await self.db.contest_seat_shards.aggregate([
+            {"$match": {"contest_id": contest_id}},
+            {"$group": {"_id": None, "taken": {"$sum": "$taken"}}},
+        ]).to_list(1)
+        taken = agg[0]["taken"] if agg else 0
+        await self.db.contests.update_one(
+            {"id": contest_id},
+            [{"$set": {
+                "current_participants": taken,
+                "status": {"$cond": [
+                    {"$and": [{"$eq": ["$status", "open"]}, {"$gte": [taken, "$max_participants"]}]},
+                    "full", "$status",
+                ]},
+                "updated_at": now,
+            }}]
+        )
+        return taken
+
+    async def _close_seat_shards(self, query: Dict):
+        """Lock/void: cap every shard at its current count so in-flight sharded joins fail."""
+        await self.db.contest_seat_shards.update_many(query, [{"$set": {"seats": "$taken"}}])
+
+    # ── Membership ────────────────────────────────────────────────────────────
+
+    async def ensure_indexes(self):
+        await self.db.contest_members.create_index(
+            [("contest_id", 1), ("user_id", 1)], unique=True, name="cmember_contest_user")
+        await self.db.contest_members.create_index([("user_id", 1), ("joined_at", -1)], name="cmember_user_time")
+        await self.db.contest_seat_shards.create_index(
+            [("contest_id", 1), ("shard", 1)], unique=True, name="cseat_contest_shard")
+
+    async def migrate_participant_arrays(self) -> int:
+        """One-off/idempotent: move legacy contests.participants arrays into contest_members."""
+        moved = 0
+        async for c in self.db.contests.find(
+            {"participants.0": {"$exists": True}},
+            {"_id": 0, "id": 1, "match_id": 1, "participants": 1, "created_at": 1}
+        ):
+            ops = [
+                UpdateOne(
+                    {"contest_id": c["id"], "user_id": uid},
+                    {"$setOnInsert": {"match_id": c.get("match_id"), "joined_at": c.get("created_at")}},
+                    upsert=True,
+                )
+                for uid in c["participants"]
+            ]
+            await self.db.contest_members.bulk_write(ops, ordered=False)
+            await self.db.contests.update_one({"id": c["id"]}, {"$unset": {"participants": ""}})
+            moved += len(ops)
+        await self.db.contests.update_many({"participants": {"$exists": True}}, {"$unset": {"participants": ""}})
+        if moved:
+            logger.info(f"CONTEST MEMBERS MIGRATED: {moved} memberships")
+        return moved
+
+    async def get_joined_ids(self, user_id: str, contest_ids: List[str]) -> set:
+        """Which of `contest_ids` the user has joined (one indexed query)."""
+        rows = await self.db.contest_members.find(
+            {"user_id": user_id, "contest_id": {"$in": contest_ids}}, {"_id": 0, "contest_id": 1}
+        ).to_list(len(contest_ids))
+        return {r["contest_id"] for r in rows}
 
     # ── Lock at match start ────────────────────────────────────────────────────
 
@@ -381,6 +616,7 @@ class ContestEngine:
             {"id": contest_id, "locked": False},
             {"$set": {"locked": True, "status": "locked", "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
+        await self._close_seat_shards({"contest_id": contest_id})
         return {"locked": result.modified_count > 0}
 
     async def lock_all_for_match(self, match_id: str) -> int:
@@ -388,6 +624,9 @@ class ContestEngine:
             {"match_id": match_id, "locked": False},
             {"$set": {"locked": True, "status": "locked", "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
+        sharded = await self.db.contests.distinct("id", {"match_id": match_id, "seat_shards": {"$gt": 0}})
+        if sharded:
+            await self._close_seat_shards({"contest_id": {"$in": sharded}})
         logger.info(f"CONTESTS LOCKED: match={match_id} count={result.modified_count}")
         return result.modified_count
 
@@ -398,16 +637,24 @@ class ContestEngine:
             {"contest_id": contest_id, "user_id": user_id},
             {"$set": {"points": points}}
         )
+        self._sync_points(contest_id, user_id, points)
+
+    @staticmethod
+    def _board(contest_id: str) -> str:
+        return f"contest:{contest_id}"
 
-    async def get_leaderboard(self, contest_id: str) -> List[Dict]:
-        """Get contest leaderboard with prize info per rank."""
-        contest = await self.db.contests.find_one({"id": contest_id}, {"_id": 0})
-        dist = contest.get("prize_distribution", {}) if contest else {}
+    def _sync_points(self, contest_id: str, user_id: str, points: float):
+        """Mirror a points change into the rank index; unknown member → rebuild on next read."""
+        board = self._board(contest_id)
+        if not self.lb.upsert(board, user_id, points) and self.lb.is_loaded(board):
+            self.lb.invalidate(board)
 
+    async def _load_leaderboard(self, contest_id: str):
+        contest = await self.db.contests.find_one({"id": contest_id}, {"_id": 0, "prize_distribution": 1})
         entries = await self.db.contest_entries.find(
             {"contest_id": contest_id},
-            {"_id": 0}
-        ).sort([("points", -1), ("submitted_at", 1)]).to_list(1000)
+            {"_id": 0, "user_id": 1, "points": 1, "submitted_at": 1}
+        ).to_list(None)
 
         user_ids = [e["user_id"] for e in entries]
         users = await self.db.users.find(
@@ -415,19 +662,59 @@ class ContestEngine:
         ).to_list(len(user_ids))
         user_map = {u["id"]: u["name"] for u in users}
 
-        for i, entry in enumerate(entries):
-            rank = i + 1
-            entry["rank"] = rank
-            entry["user_name"] = user_map.get(entry["user_id"], "Unknown")
-            prize = dist.get(str(rank), 0)
-            entry["prize_coins"] = prize
-
-        return entries
+        rows = [
+            {"member": e["user_id"], "points": e.get("points", 0), "tiebreak": e.get("submitted_at") or "",
+             "name": user_map.get(e["user_id"], "Unknown")}
+            for e in entries
+        ]
+        return rows, {"prize_distribution": (contest or {}).get("prize_distribution", {})}
+
+    async def rebuild_leaderboard(self, contest_id: str) -> int:
+        """Rebuild the rank index for a contest from contest_entries (system of record)."""
+        rows, meta = await self._load_leaderboard(contest_id)
+        self.lb.load(self._board(contest_id), rows, meta)
+        return len(rows)
+
+    def _format_rows(self, contest_id: str, rows: List[Dict], dist: Dict) -> List[Dict]:
+        return [
+            {
+                "contest_id": contest_id,
+                "user_id": row["member"],
+                "points": row["points"],
+                "submitted_at": row["tiebreak"],
+                "rank": row["rank"],
+                "user_name": row["name"] or "Unknown",
+                "prize_coins": prize_for_rank(dist, row["rank"]),
+            }
+            for row in rows
+        ]
+
+    async def get_leaderboard(self, contest_id: str, offset: int = 0, limit: int = 100) -> List[Dict]:
+        """Get a page of the contest leaderboard with prize info per rank."""
+        board = self._board(contest_id)
+        await self.lb.ensure(board, lambda: self._load_leaderboard(contest_id))
+        dist = self.lb.meta(board).get("prize_distribution", {})
+        return self._format_rows(contest_id, self.lb.window(board, offset, limit), dist)
+
+    async def get_leaderboard_around(self, contest_id: str, user_id: str, radius: int = 5) -> Dict:
+        """User's rank, prize at that rank and the entries immediately above/below."""
+        board = self._board(contest_id)
+        await self.lb.ensure(board, lambda: self._load_leaderboard(contest_id))
+        dist = self.lb.meta(board).get("prize_distribution", {})
+        rank, rows = self.lb.around(board, user_id, radius)
+        return {
+            "contest_id": contest_id,
+            "rank": rank,
+            "total": self.lb.size(board),
+            "prize_coins": prize_for_rank(dist, rank) if rank else 0,
+            "entries": self._format_rows(contest_id, rows, dist),
+        }
 
     # ── Void ──────────────────────────────────────────────────────────────────
 
     async def void_contest(self, contest_id: str, reason: str) -> Dict:
         now = datetime.now(timezone.utc).isoformat()
+        await self._close_seat_shards({"contest_id": contest_id})
         await self.db.contests.update_one(
             {"id": contest_id},
             {"$set": {"status": "voided", "void_reason": reason, "updated_at": now}}
@@ -437,28 +724,39 @@ class ContestEngine:
 
     # ── Query ─────────────────────────────────────────────────────────────────
 
-    async def get_contests_for_match(self, match_id: str, contest_type: Optional[str] = None) -> List[Dict]:
+    async def get_contests_for_match(self, match_id: str, contest_type: Optional[str] = None,
+                                     user_id: Optional[str] = None) -> List[Dict]:
         query = {"match_id": match_id}
         if contest_type:
             query["type"] = contest_type
         # Platform contests first, then user contests
-        contests = await self.db.contests.find(query, {"_id": 0}).sort(
+        contests = await self.db.contests.find(query, CONTEST_PROJECTION).sort(
             [("is_platform_contest", -1), ("prize_pool", -1), ("created_at", -1)]
         ).to_list(100)
+        if user_id and contests:
+            joined = await self.get_joined_ids(user_id, [c["id"] for c in contests])
+            for c in contests:
+                c["joined"] = c["id"] in joined
         return contests
 
     async def get_contest(self, contest_id: str) -> Optional[Dict]:
-        return await self.db.contests.find_one({"id": contest_id}, {"_id": 0})
+        return await self.db.contests.find_one({"id": contest_id}, CONTEST_PROJECTION)
 
     async def get_user_contests(self, user_id: str) -> List[Dict]:
-        return await self.db.contests.find(
-            {"participants": user_id},
-            {"_id": 0}
+        memberships = await self.db.contest_members.find(
+            {"user_id": user_id}, {"_id": 0, "contest_id": 1}
+        ).sort("joined_at", -1).to_list(100)
+        if not memberships:
+            return []
+        contests = await self.db.contests.find(
+            {"id": {"$in": [m["contest_id"] for m in memberships]}}, CONTEST_PROJECTION
         ).sort("created_at", -1).to_list(100)
+        for c in contests:
+            c["joined"] = True
+        return contests
 
     async def join_by_invite_code(self, invite_code: str, user_id: str, entry: Optional[Dict] = None) -> Dict:
-        contest = await self.db.contests.find_one({"invite_code": invite_code.upper()}, {"_id": 0})
+        contest = await self.db.contests.find_one({"invite_code": invite_code.upper()}, {"_id": 0, "id": 1})
         if not contest:
             raise ValueError("Invalid invite code")
         return await self.join_contest(contest["id"], user_id, entry)
-
@@ -0,0 +1,300 @@
+"""
+Monte Carlo Contest Projector for FREE11
+Projected rank distribution, win probability and expected coins for fantasy teams.
+
+Per simulation every player draws a points outcome — bootstrapped from their recent
+per-match points (fantasy_player_points) or, with too little history, from a gamma
+around the squad projection. All teams are then scored in one pass:
+    scores = team_weights (teams × players, C=2 / VC=1.5) @ sampled_points (players × sims)
+Live matches add the points already scored and only simulate the remaining share of
+the match. Simulations run in a process pool under a fixed time budget, and results
+are cached per contest for a few minutes.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from fantasy_engine import POINTS
+from leaderboard_store import prize_for_rank
+from lineup_validator import get_compiled_squad
+from lineup_optimizer import PROJECTION_PER_RATING
+from redis_cache import cache_get, cache_set
+
+logger = logging.getLogger(__name__)
+
+SIMULATIONS = 5000
+SIM_BATCH = 250
+BATCH_CELLS = 1_000_000         # teams × sims per batch, so big fields still check the budget often
+TIME_BUDGET_S = 2.0             # worker stops after this, whatever the sim count
+TTL_PROJECTION = 180
+HISTORY_MATCHES = 50            # recent scored matches scanned for player history
+HISTORY_PER_PLAYER = 30
+MIN_HISTORY = 5                 # below this a player uses the parametric model
+GAMMA_SHAPE = 1.2
+DEFAULT_MEAN = 25.0
+FULL_RANK_MIN_FOCUS = 16        # fewer focus teams → binary-search each one in the sorted column
+WORKERS = int(os.environ.get("PROJECTOR_WORKERS", "2"))
+FORMAT_OVERS = {"t20": 20, "t10": 10, "odi": 50, "test": 90}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKERS)
+    return _pool
+
+
+# ── Worker (runs in the process pool; numpy only) ─────────────────────────────
+
+def simulate_field(weights, focus, hist, hist_len, mean, offset, remaining,
+                   prizes, n_sims, budget_s, seed) -> Dict:
+    """weights: teams × players; focus: team rows to report; hist: players × L history
+    (hist_len[p] valid values); mean: parametric mean; offset: points already scored;
+    prizes[r]: coins for rank r (index 0 unused). Returns per-focus-team stats."""
+    rng = np.random.default_rng(seed)
+    n_teams, n_players = weights.shape
+    n_focus = len(focus)
+    deadline = time.perf_counter() + budget_s
+    has_hist = hist_len >= MIN_HISTORY
+    safe_len = np.maximum(hist_len, 1)[:, None]
+    scale = (np.maximum(mean, 0.1) / GAMMA_SHAPE)[:, None]
+    full_rank = n_focus >= FULL_RANK_MIN_FOCUS
+    rank_hist = np.zeros((n_focus, n_teams + 2), dtype=np.int64)
+    coins = np.zeros(n_focus, dtype=np.float64)
+    batch = max(8, min(SIM_BATCH, BATCH_CELLS // max(n_teams, 1)))
+    cols_all = None
+    done = 0
+
+    while done < n_sims and (done == 0 or time.perf_counter() < deadline):
+        b = min(batch, n_sims - done)
+        if remaining > 0:
+            idx = (rng.random((n_players, b)) * safe_len).astype(np.int64)
+            empirical = np.take_along_axis(hist, idx, axis=1)
+            parametric = rng.gamma(GAMMA_SHAPE, scale, (n_players, b))
+            sampled = np.where(has_hist[:, None], empirical, parametric)
+            pts = (offset[:, None] + remaining * sampled).astype(np.float32)
+        else:
+            pts = np.repeat(offset[:, None], b, axis=1).astype(np.float32)
+        scores = weights @ pts                                   # teams × b
+
+        if full_rank:
+            order = np.argsort(-scores, axis=0, kind="stable")
+            ranks = np.empty_like(order)
+            if cols_all is None or cols_all.shape[1] != b:
+                cols_all = np.broadcast_to(np.arange(b), (n_teams, b))
+            ranks[order, cols_all] = np.arange(1, n_teams + 1)[:, None]
+            focus_ranks = ranks[focus]
+        else:
+            # rank = 1 + teams scoring strictly more, found by bisecting each sorted column
+            ordered = np.sort(scores, axis=0)
+            fs = scores[focus]
+            focus_ranks = np.stack([
+                n_teams - np.searchsorted(ordered[:, j], fs[:, j], side="right") + 1 for j in range(b)
+            ], axis=1)
+
+        np.add.at(rank_hist, (np.repeat(np.arange(n_focus), b), focus_ranks.ravel()), 1)
+        coins += prizes[np.minimum(focus_ranks, len(prizes) - 1)].sum(axis=1)
+        done += b
+
+    out = []
+    cum = np.cumsum(rank_hist, axis=1)
+    ranks_axis = np.arange(n_teams + 2)
+    for i in range(n_focus):
+        h = rank_hist[i]
+        p10, p50, p90 = (int(np.searchsorted(cum[i], q * done)) for q in (0.1, 0.5, 0.9))
+        # Rank distribution in ten equal-width buckets for the UI
+        edges = np.linspace(1, n_teams + 1, 11)
+        buckets = [int(h[int(edges[k]):int(edges[k + 1])].sum()) for k in range(10)]
+        out.append({
+            "win_probability": round(float(h[1]) / done, 4),
+            "top3_probability": round(float(h[1:4].sum()) / done, 4),
+            "in_money_probability": round(float(h[np.nonzero(prizes > 0)[0]].sum()) / done, 4)
+            if (prizes > 0).any() else 0.0,
+            "expected_rank": round(float((h * ranks_axis).sum()) / done, 1),
+            "rank_p10": p10, "rank_median": p50, "rank_p90": p90,
+            "expected_coins": round(float(coins[i]) / done, 1),
+            "rank_buckets": [round(c / done, 4) for c in buckets],
+        })
+    return {"sims": done, "teams": out}
+
+
+# ── Engine ────────────────────────────────────────────────────────────────────
+
+class ContestProjector:
+    def __init__(self, db, fantasy_engine, entitysport):
+        self.db = db
+        self.fantasy = fantasy_engine
+        self.es = entitysport
+        self._local: Dict[str, tuple] = {}          # cache key → (computed_at, result)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def project_contest(self, contest_id: str) -> Dict:
+        """Projection for every team entered in a fantasy contest. Prediction contests
+        (db.contests) are scored on predictions, not teams, so they are not projected."""
+        contest = await self.db.fantasy_contests.find_one(
+            {"id": contest_id}, {"_id": 0, "id": 1, "match_id": 1, "prize_distribution": 1})
+        if not contest:
+            raise ValueError("Fantasy contest not found")
+        key = f"projection:contest:{contest_id}"
+
+        async def field():
+            return await self._teams({"contest_id": contest_id})
+
+        return await self._cached(key, contest["match_id"], field,
+                                  contest.get("prize_distribution") or {}, focus_user=None)
+
+    async def get_user_projection(self, contest_id: str, user_id: str) -> Dict:
+        result = await self.project_contest(contest_id)
+        return {**result, "teams": [t for t in result["teams"] if t["user_id"] == user_id]}
+
+    async def project_match_for_user(self, match_id: str, user_id: str) -> Dict:
+        """User's teams against the whole match field (the fantasy rankings)."""
+        key = f"projection:match:{match_id}:{user_id}"
+
+        async def field():
+            return await self._teams({"match_id": match_id})
+
+        return await self._cached(key, match_id, field, {}, focus_user=user_id)
+
+    # ── Internals ──
+
+    async def _cached(self, key: str, match_id: str, field_loader, prize_distribution, focus_user):
+        local = self._local.get(key)
+        if local and time.monotonic() - local[0] < TTL_PROJECTION:
+            return local[1]
+        cached = cache_get(key)
+        if cached:
+            self._local[key] = (time.monotonic(), cached)
+            return cached
+        if key in self._inflight:                       # one computation per key at a time
+            return await asyncio.shield(self._inflight[key])
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await self._compute(match_id, await field_loader(), prize_distribution, focus_user)
+            cache_set(key, result, TTL_PROJECTION)
+            self._local[key] = (time.monotonic(), result)
+            fut.set_result(result)
+            return result
+        except Exception as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _teams(self, query: Dict) -> List[Dict]:
+        query = {**query, "status": {"$in": ["active", "locked", "scored"]}}
+        return await self.db.fantasy_teams.find(
+            query, {"_id": 0, "id": 1, "user_id": 1, "captain_id": 1, "vc_id": 1, "players.player_id": 1}
+        ).to_list(None)
+
+    async def _compute(self, match_id: str, teams: List[Dict], prize_distribution, focus_user) -> Dict:
+        now = datetime.now(timezone.utc).isoformat()
+        focus = [i for i, t in enumerate(teams) if focus_user is None or t["user_id"] == focus_user]
+        base = {"match_id": match_id, "field_size": len(teams), "generated_at": now}
+        if not teams or not focus:
+            return {**base, "mode": "empty", "sims": 0, "teams": []}
+
+        player_ids = sorted({tp["player_id"] for t in teams for tp in t.get("players", [])})
+        col = {pid: j for j, pid in enumerate(player_ids)}
+        weights = np.zeros((len(teams), len(player_ids)), dtype=np.float32)
+        for i, t in enumerate(teams):
+            for tp in t.get("players", []):
+                pid = tp["player_id"]
+                w = (POINTS["captain_multiplier"] if pid == t.get("captain_id")
+                     else POINTS["vc_multiplier"] if pid == t.get("vc_id") else 1.0)
+                weights[i, col[pid]] = w
+
+        offset, remaining, mode = await self._state(match_id, player_ids)
+        hist, hist_len = await self._history(match_id, player_ids)
+        mean = await self._means(match_id, player_ids, hist, hist_len)
+        prizes = np.array([prize_for_rank(prize_distribution, r) for r in range(len(teams) + 2)], dtype=np.float64)
+
+        started = time.perf_counter()
+        sim = await asyncio.get_running_loop().run_in_executor(
+            _get_pool(), simulate_field,
+            weights, np.array(focus, dtype=np.int64), hist, hist_len, mean, offset, remaining,
+            prizes, SIMULATIONS if remaining > 0 else 1, TIME_BUDGET_S, int(time.time()),
+        )
+        logger.info(f"PROJECTION: match={match_id} teams={len(teams)} sims={sim['sims']} "
+                    f"ms={round((time.perf_counter() - started) * 1000)}")
+        return {
+            **base,
+            "mode": mode,
+            "sims": sim["sims"],
+            "teams": [
+                {"team_id": teams[i]["id"], "user_id": teams[i]["user_id"], **stats}
+                for i, stats in zip(focus, sim["teams"])
+            ],
+        }
+
+    async def _state(self, match_id: str, player_ids: List[str]):
+        """(points already scored, share of the match left to simulate, mode)."""
+        table = await self.fantasy.get_player_points(match_id)
+        if table is not None:
+            pts = np.array([table.get(pid, {}).get("points", 0) for pid in player_ids], dtype=np.float64)
+            return pts, 0.0, "final"
+        match = await self.db.matches.find_one({"match_id": match_id}, {"_id": 0, "status": 1})
+        zero = np.zeros(len(player_ids), dtype=np.float64)
+        if not match or match.get("status") != "live":
+            return zero, 1.0, "pre_match"
+        scorecard = await self.es.get_match_scorecard(match_id)
+        if not scorecard:
+            return zero, 1.0, "pre_match"
+        perf = self.fantasy._extract_performance(scorecard)
+        pts = np.array([self.fantasy._calc_player_points(perf.get(pid, {})) for pid in player_ids], dtype=np.float64)
+        return pts, self._remaining_fraction(scorecard), "live"
+
+    @staticmethod
+    def _remaining_fraction(scorecard: Dict) -> float:
+        fmt = str(scorecard.get("format_str") or scorecard.get("format") or "").lower()
+        per_innings = next((o for k, o in FORMAT_OVERS.items() if k in fmt), 20)
+        bowled = 0.0
+        for inn in scorecard.get("innings", []):
+            equations = inn.get("equations") if isinstance(inn.get("equations"), dict) else {}
+            try:
+                bowled += float(equations.get("overs") or 0)
+            except (TypeError, ValueError):
+                pass
+        innings_total = 4 if per_innings == 90 else 2
+        return float(min(1.0, max(0.0, 1 - bowled / (per_innings * innings_total))))
+
+    async def _history(self, match_id: str, player_ids: List[str]):
+        """players × HISTORY_PER_PLAYER matrix of recent base points (+ valid lengths)."""
+        proj = {f"players.{pid}.points": 1 for pid in player_ids}
+        proj["_id"] = 0
+        values: Dict[str, List[float]] = {pid: [] for pid in player_ids}
+        async for doc in self.db.fantasy_player_points.find(
+            {"match_id": {"$ne": match_id}}, proj
+        ).sort("updated_at", -1).limit(HISTORY_MATCHES):
+            for pid, row in (doc.get("players") or {}).items():
+                if pid in values and len(values[pid]) < HISTORY_PER_PLAYER:
+                    values[pid].append(float(row.get("points", 0)))
+        hist = np.zeros((len(player_ids), HISTORY_PER_PLAYER), dtype=np.float64)
+        hist_len = np.zeros(len(player_ids), dtype=np.int64)
+        for j, pid in enumerate(player_ids):
+            v = values[pid]
+            hist[j, :len(v)] = v
+            hist_len[j] = len(v)
+        return hist, hist_len
+
+    async def _means(self, match_id: str, player_ids: List[str], hist, hist_len):
+        squad = await get_compiled_squad(match_id, self.es)
+        ratings = {}
+        if squad:
+            ratings = {str(p["player_id"]): p.get("fantasy_rating") for p in squad.players}
+        mean = np.full(len(player_ids), DEFAULT_MEAN, dtype=np.float64)
+        for j, pid in enumerate(player_ids):
+            if hist_len[j]:
+                mean[j] = hist[j, :hist_len[j]].mean()
+            elif ratings.get(pid):
+                mean[j] = float(ratings[pid]) * PROJECTION_PER_RATING
+        return mean
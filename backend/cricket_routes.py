@@ -7,11 +7,13 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict
 from datetime import datetime, timezone, timedelta
+import random
 import uuid
 import time
+from pymongo import UpdateOne
 
 # Import from server.py (will be connected via include_router)
-from server import db, get_current_user, add_coins, User, Activity
+from server import db, get_current_user, add_coins, add_coins_many, User, Activity
 from cricket_data_service import cricket_service
 
 # EntitySport integration
@@ -801,6 +803,7 @@ async def resolve_ball_predictions(match_id: str):
     
     resolved_count = 0
     coins_awarded = 0
+    resolved = []
     
     # Get all unresolved predictions for this match
     pending = await db.ball_predictions.find({
@@ -835,6 +838,7 @@ async def resolve_ball_predictions(match_id: str):
         }
     
     # Resolve each prediction
+    credits, prediction_updates = [], []
     for pred in pending:
         ball_key = pred.get("ball_key")
         if ball_key not in ball_results:
@@ -853,12 +857,11 @@ async def resolve_ball_predictions(match_id: str):
             else:
                 coins = REWARDS["ball_correct"]
             
-            # Award coins
-            await add_coins(pred["user_id"], coins, "earned", f"Correct ball prediction: {actual}")
-            coins_awarded += coins
+            # Award coins (paid in one batch below)
+            credits.append((pred["id"], (pred["user_id"], coins, "earned", f"Correct ball prediction: {actual}")))
         
         # Update prediction
-        await db.ball_predictions.update_one(
+        prediction_updates.append(UpdateOne(
             {"id": pred["id"]},
             {"$set": {
                 "actual_result": actual,
@@ -868,8 +871,33 @@ async def resolve_ball_predictions(match_id: str):
                 "resolved_at": datetime.now(timezone.utc).isoformat(),
                 "ball_timestamp": ball_results[ball_key]["timestamp"]
             }}
-        )
+        ))
         resolved_count += 1
+        resolved.append({"pred_id": pred["id"], "user_id": pred["user_id"], "is_correct": is_correct,
+                         "coins_earned": coins, "predicted_at_iso": pred.get("predicted_at_iso")})
+    
+    if prediction_updates:
+        await db.ball_predictions.bulk_write(prediction_updates, ordered=False)
+    # The daily cap may grant less than the reward: store what was actually credited
+    granted = await add_coins_many([credit for _, credit in credits])
+    short: Dict[str, int] = {}
+    for (pred_id, (_, coins, _, _)), txn in zip(credits, granted):
+        paid = txn["amount"] if txn else 0
+        coins_awarded += paid
+        if paid != coins:
+            short[pred_id] = paid
+    if short:
+        await db.ball_predictions.bulk_write(
+            [UpdateOne({"id": pred_id}, {"$set": {"coins_earned": paid}}) for pred_id, paid in short.items()],
+            ordered=False)
+        for r in resolved:
+            if r["pred_id"] in short:
+                r["coins_earned"] = short[r["pred_id"]]
+    
+    # Keep the materialised skill leaderboards current
+    if resolved:
+        from v2_engines import skill_leaderboards
+        await skill_leaderboards.record_results(resolved)
     
     return {
         "resolved": resolved_count,
@@ -971,8 +999,9 @@ async def predict_over_outcome(
     
     coins_earned = 0
     if is_correct:
-        coins_earned = REWARDS["over_correct"]
-        await add_coins(current_user.id, coins_earned, "earned", f"Correct over prediction: Over {prediction_data.over_number}")
+        txn = await add_coins(current_user.id, REWARDS["over_correct"], "earned",
+                              f"Correct over prediction: Over {prediction_data.over_number}")
+        coins_earned = txn["amount"]  # what the daily cap granted
     
     # Update prediction with result
     await db.match_predictions.update_one(
@@ -1064,8 +1093,9 @@ async def predict_match_winner(
         
         coins_earned = 0
         if is_correct:
-            coins_earned = REWARDS["match_winner_correct"]
-            await add_coins(current_user.id, coins_earned, "earned", f"Correct match winner prediction!")
+            txn = await add_coins(current_user.id, REWARDS["match_winner_correct"], "earned",
+                                  "Correct match winner prediction!")
+            coins_earned = txn["amount"]  # what the daily cap granted
         
         # Update prediction with result
         await db.match_predictions.update_one(
@@ -1186,30 +1216,18 @@ async def get_my_predictions(
 @cricket_router.get("/leaderboard")
 async def get_cricket_leaderboard():
     """Get cricket prediction leaderboard"""
-    # Aggregate user stats from ball predictions
-    pipeline = [
-        {"$match": {"is_correct": True}},
-        {"$group": {
-            "_id": "$user_id",
-            "correct_predictions": {"$sum": 1},
-            "coins_earned": {"$sum": "$coins_earned"}
-        }},
-        {"$sort": {"correct_predictions": -1}},
-        {"$limit": 20}
+    from v2_engines import skill_leaderboards
+    rows = await skill_leaderboards.get_most_correct(20)
+    
+    result = [
+        {
+            "rank": row["rank"],
+            "user_id": row["user_id"],
+            "name": row["name"],
+            "correct_predictions": row.get("correct", 0),
+            "coins_earned": row.get("coins", 0)
+        }
+        for row in rows
     ]
     
-    leaderboard_data = await db.ball_predictions.aggregate(pipeline).to_list(20)
-    
-    # Enrich with user names
-    result = []
-    for i, entry in enumerate(leaderboard_data):
-        user = await db.users.find_one({"id": entry["_id"]}, {"_id": 0, "name": 1})
-        result.append({
-            "rank": i + 1,
-            "user_id": entry["_id"],
-            "name": user.get("name", "Anonymous") if user else "Anonymous",
-            "correct_predictions": entry["correct_predictions"],
-            "coins_earned": entry["coins_earned"]
-        })
-    
     return result
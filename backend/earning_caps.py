@@ -0,0 +1,195 @@
+"""
+Earning Caps for FREE11
+Atomic "reserve earning under the daily cap" plus per-minute velocity limits.
+
+`reserve_earning()` grants min(amount, DAILY_COIN_CAP - earned today) in one step —
+a Lua script (INCRBY under the cap, key expiring at the end of the UTC day) when
+Redis is configured, otherwise one conditional pipeline update on `earning_counters`
+(TTL-indexed). The same call counts the credit against per-minute velocity limits
+for the user and, when known, the device. Concurrent earns can no longer overshoot
+the cap, and a credit no longer needs a read before it. Redemptions use the same
+counters, so the daily redeem limit is a counter read instead of a count query.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from economy_engine import DAILY_COIN_CAP
+from redis_cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+EARN_KEY = "earn:cap:{user_id}:{day}"
+REDEEM_KEY = "redeem:count:{user_id}:{day}"
+VELOCITY_KEY = "earn:vel:{kind}:{subject}:{minute}"
+VELOCITY_LIMITS = {"user": 20, "device": 40}   # credits per minute
+VELOCITY_TTL = 120
+
+# KEYS: day total, [user velocity, [device velocity]]
+# ARGV: amount, cap, expire_at, user limit, device limit, velocity ttl
+# Returns {granted, total}; granted is -1 / -2 when the user / device is over velocity
+_RESERVE_LUA = """
+for i = 2, #KEYS do
+  local n = redis.call('incr', KEYS[i])
+  if n == 1 then redis.call('expire', KEYS[i], ARGV[6]) end
+  if n > tonumber(ARGV[2 + i]) then return {1 - i, 0} end
+end
+local total = tonumber(redis.call('get', KEYS[1]) or '0')
+local grant = math.min(tonumber(ARGV[1]), tonumber(ARGV[2]) - total)
+if grant <= 0 then return {0, total} end
+total = redis.call('incrby', KEYS[1], grant)
+redis.call('expireat', KEYS[1], ARGV[3])
+return {grant, total}
+"""
+
+
+def _day_window(now: Optional[datetime] = None) -> Tuple[str, datetime]:
+    """Today's key (UTC) and the moment its counters can go."""
+    now = now or datetime.now(timezone.utc)
+    end = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return now.strftime("%Y-%m-%d"), end + timedelta(hours=1)  # grace for reads just past midnight
+
+
+def _velocity_keys(user_id: str, device_id: Optional[str], now: datetime) -> List[Tuple[str, str]]:
+    minute = now.strftime("%Y%m%d%H%M")
+    keys = [("user", VELOCITY_KEY.format(kind="user", subject=user_id, minute=minute))]
+    if device_id:
+        keys.append(("device", VELOCITY_KEY.format(kind="device", subject=device_id, minute=minute)))
+    return keys
+
+
+async def ensure_counter_indexes(db: AsyncIOMotorDatabase):
+    await db.earning_counters.create_index("expires_at", expireAfterSeconds=0, name="earncnt_ttl")
+
+
+async def reserve_earning(db: AsyncIOMotorDatabase, user_id: str, amount: int,
+                          device_id: Optional[str] = None, velocity: bool = True,
+                          cap: int = DAILY_COIN_CAP) -> int:
+    """Reserve up to `amount` coins of today's cap for a user; returns the coins granted
+    (0 when the cap is used up or the user / device is over its velocity limit)."""
+    granted = await reserve_earnings(db, [(user_id, amount)], cap=cap,
+                                     velocity=velocity, device_id=device_id)
+    return granted.get(user_id, 0)
+
+
+async def reserve_earnings(db: AsyncIOMotorDatabase, rows: List[Tuple[str, int]],
+                           cap: int = DAILY_COIN_CAP, velocity: bool = False,
+                           device_id: Optional[str] = None) -> Dict[str, int]:
+    """Bulk form for payouts: {user_id: coins granted} for [(user_id, amount)].
+    One Redis round trip for the whole batch; velocity is off by default here since
+    server-side payouts are not user-paced."""
+    totals: Dict[str, int] = {}
+    for user_id, amount in rows:
+        if amount and amount > 0:
+            totals[user_id] = totals.get(user_id, 0) + int(amount)
+    if not totals:
+        return {}
+    now = datetime.now(timezone.utc)
+    day, expires = _day_window(now)
+    r = get_redis()
+    if r:
+        try:
+            pipe = r.pipeline(transaction=False)
+            for uid, amount in totals.items():
+                vel = _velocity_keys(uid, device_id, now) if velocity else []
+                pipe.eval(_RESERVE_LUA, 1 + len(vel), EARN_KEY.format(user_id=uid, day=day),
+                          *[key for _, key in vel], amount, cap, int(expires.timestamp()),
+                          VELOCITY_LIMITS["user"], VELOCITY_LIMITS["device"], VELOCITY_TTL)
+            granted = {}
+            for uid, (grant, total) in zip(totals, pipe.execute()):
+                if grant < 0:
+                    logger.info(f"EARN VELOCITY: user={uid} device={device_id} limit={'user' if grant == -1 else 'device'}")
+                elif grant < totals[uid]:
+                    logger.info(f"EARN CAP: user={uid} asked={totals[uid]} granted={grant} total={total}")
+                granted[uid] = max(0, int(grant))
+            return granted
+        except Exception as e:
+            logger.warning(f"Earning caps redis reserve failed, using Mongo: {e}")
+    if velocity:
+        over = await asyncio.gather(*(_mongo_over_velocity(db, uid, device_id, now) for uid in totals))
+        allowed = {uid: amount for (uid, amount), blocked in zip(totals.items(), over) if not blocked}
+    else:
+        allowed = totals
+    grants = await asyncio.gather(*(_mongo_reserve(db, EARN_KEY.format(user_id=uid, day=day), amount, cap, expires)
+                                    for uid, amount in allowed.items()))
+    granted = dict(zip(allowed, grants))
+    return {uid: granted.get(uid, 0) for uid in totals}
+
+
+async def _mongo_reserve(db: AsyncIOMotorDatabase, key: str, amount: int, cap: int, expires: datetime) -> int:
+    update = [
+        {"$set": {"prev": {"$ifNull": ["$total", 0]}, "expires_at": expires}},
+        {"$set": {"total": {"$max": ["$prev", {"$min": [cap, {"$add": ["$prev", amount]}]}]}}},
+        {"$set": {"granted": {"$subtract": ["$total", "$prev"]}}},
+    ]
+    # Two first earns of the day can race on the upsert; the loser's retry is a plain update
+    for attempt in range(2):
+        try:
+            doc = await db.earning_counters.find_one_and_update(
+                {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER,
+                projection={"granted": 1})
+            return int(doc["granted"])
+        except DuplicateKeyError:
+            if attempt:
+                raise
+
+
+async def _mongo_over_velocity(db: AsyncIOMotorDatabase, user_id: str, device_id: Optional[str],
+                               now: datetime) -> bool:
+    keys = _velocity_keys(user_id, device_id, now)
+    expires = now + timedelta(seconds=VELOCITY_TTL)
+    counts = await asyncio.gather(*(_mongo_incr(db, key, 1, expires) for _, key in keys))
+    return any(n > VELOCITY_LIMITS[kind] for (kind, _), n in zip(keys, counts))
+
+
+async def _mongo_incr(db: AsyncIOMotorDatabase, key: str, by: int, expires: datetime) -> int:
+    for attempt in range(2):
+        try:
+            doc = await db.earning_counters.find_one_and_update(
+                {"_id": key}, {"$inc": {"total": by}, "$setOnInsert": {"expires_at": expires}},
+                upsert=True, return_document=ReturnDocument.AFTER, projection={"total": 1})
+            return int(doc["total"])
+        except DuplicateKeyError:
+            if attempt:
+                raise
+
+
+async def _counter(db: AsyncIOMotorDatabase, key: str) -> int:
+    r = get_redis()
+    if r:
+        try:
+            return int(r.get(key) or 0)
+        except Exception as e:
+            logger.warning(f"Earning caps redis read failed, using Mongo: {e}")
+    doc = await db.earning_counters.find_one({"_id": key}, {"total": 1})
+    return int(doc.get("total", 0)) if doc else 0
+
+
+async def earned_today(db: AsyncIOMotorDatabase, user_id: str) -> int:
+    return await _counter(db, EARN_KEY.format(user_id=user_id, day=_day_window()[0]))
+
+
+async def redemptions_today(db: AsyncIOMotorDatabase, user_id: str) -> int:
+    return await _counter(db, REDEEM_KEY.format(user_id=user_id, day=_day_window()[0]))
+
+
+async def record_redemption(db: AsyncIOMotorDatabase, user_id: str) -> int:
+    """Count a redemption against today's limit; returns today's count."""
+    day, expires = _day_window()
+    key = REDEEM_KEY.format(user_id=user_id, day=day)
+    r = get_redis()
+    if r:
+        try:
+            pipe = r.pipeline(transaction=True)
+            pipe.incr(key)
+            pipe.expireat(key, int(expires.timestamp()))
+            return int(pipe.execute()[0])
+        except Exception as e:
+            logger.warning(f"Earning caps redis redeem count failed, using Mongo: {e}")
+    return await _mongo_incr(db, key, 1, expires)
+
@@ -0,0 +1,221 @@
+"""
+Earnings Rollup for FREE11
+Per-user, per-day coin earnings backing the daily / weekly / seasonal coin leaderboards.
+
+Every coin_transactions row is passed to `record_credits()` — the single write path,
+which drops spends and NON_EARNING_TYPES with the same rules `rebuild()` applies — and
+each earning becomes one $inc upsert on `earnings_daily` {user_id, day} and, when Redis
+is configured, a ZINCRBY on the day's sorted set.
+Period boards are a ZUNIONSTORE over the day sets (cached briefly), or a small
+aggregation over the rollups when Redis is off. Day sets that Redis lost are
+refilled from Mongo on read. `rebuild()` backfills the rollups from coin_transactions;
+`backfill()` runs it once per deployment from the scheduler.
+"""
+import logging
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from redis_cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+DAY_KEY = "earn:day:{day}"              # ZSET user_id → coins earned that day
+DAY_LOADED_KEY = "earn:day:{day}:ok"    # set once the day ZSET matches Mongo
+BOARD_KEY = "earn:board:{period}:{start}:{end}"
+DAY_TTL = 400 * 86400                   # seasonal boards reach back to January 1
+BOARD_TTL = 60
+REBUILD_CHUNK = 1000
+BACKFILL_SINCE = "2000-01-01"
+META_ID = "earnings"                    # leaderboard_meta doc written by every completed rebuild
+# Credits that are not earnings: refunds return spent coins, purchases are paid FREE Bucks
+NON_EARNING_TYPES = ("voucher_refund", "purchase")
+
+
+def day_of(timestamp: Optional[str] = None) -> str:
+    return (timestamp or datetime.now(timezone.utc).isoformat())[:10]
+
+
+def period_days(period: str, now: Optional[datetime] = None) -> List[str]:
+    """Days (YYYY-MM-DD, oldest first) covered by a daily / weekly / seasonal board."""
+    now = now or datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "daily":
+        start = today
+    elif period == "weekly":
+        start = today - timedelta(days=today.weekday())
+    else:
+        start = today.replace(month=1, day=1)
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((today - start).days + 1)]
+
+
+def is_earning(txn: Dict) -> bool:
+    return (txn.get("amount") or 0) > 0 and txn.get("type") not in NON_EARNING_TYPES
+
+
+def txn_day(txn: Dict) -> Optional[str]:
+    """Day of a coin_transactions row: `timestamp`, else `created_at` (ISO string or datetime)."""
+    ts = txn.get("timestamp") or txn.get("created_at")
+    if isinstance(ts, datetime):
+        return ts.strftime("%Y-%m-%d")
+    return ts[:10] if isinstance(ts, str) else None
+
+
+async def record_credits(db: AsyncIOMotorDatabase, transactions: Iterable[Dict]) -> None:
+    """Roll up the earnings among freshly written coin_transactions rows."""
+    by_day: Dict[str, List[Tuple[str, int]]] = {}
+    for txn in transactions:
+        if is_earning(txn):
+            by_day.setdefault(txn_day(txn) or day_of(), []).append((txn["user_id"], txn["amount"]))
+    for day, rows in by_day.items():
+        await record_earnings(db, rows, day)
+
+
+async def record_credit(db: AsyncIOMotorDatabase, transaction: Dict) -> None:
+    await record_credits(db, [transaction])
+
+
+async def record_earnings(db: AsyncIOMotorDatabase, rows: Iterable[Tuple[str, int]],
+                          timestamp: Optional[str] = None) -> None:
+    """Add earned coins for (user_id, amount) rows to today's (or `timestamp`'s) rollup."""
+    totals: Dict[str, int] = {}
+    for user_id, amount in rows:
+        if amount and amount > 0:
+            totals[user_id] = totals.get(user_id, 0) + int(amount)
+    if not totals:
+        return
+    day = day_of(timestamp)
+    await db.earnings_daily.bulk_write([
+        UpdateOne({"user_id": uid, "day": day}, {"$inc": {"coins": coins, "credits": 1}}, upsert=True)
+        for uid, coins in totals.items()
+    ], ordered=False)
+    r = get_redis()
+    if r:
+        try:
+            key = DAY_KEY.format(day=day)
+            pipe = r.pipeline(transaction=False)
+            for uid, coins in totals.items():
+                pipe.zincrby(key, coins, uid)
+            pipe.expire(key, DAY_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Earnings rollup redis write failed day={day}: {e}")
+
+
+class EarningsRollup:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self._local: Dict[tuple, tuple] = {}     # (period, start, limit) → (computed_at, rows) without Redis
+
+    async def ensure_indexes(self):
+        await self.db.earnings_daily.create_index([("user_id", 1), ("day", 1)], unique=True, name="earn_user_day")
+        await self.db.earnings_daily.create_index([("day", 1), ("coins", -1)], name="earn_day_coins")
+
+    async def top(self, period: str, limit: int = 50) -> List[Dict]:
+        """[{user_id, total_coins}] for the period, highest first."""
+        days = period_days(period)
+        r = get_redis()
+        if r:
+            try:
+                return await self._top_redis(r, period, days, limit)
+            except Exception as e:
+                logger.warning(f"Earnings board redis read failed period={period}: {e}")
+        cache_key = (period, days[0], limit)
+        cached = self._local.get(cache_key)
+        if cached and time.monotonic() - cached[0] < BOARD_TTL:
+            return cached[1]
+        rows = await self.db.earnings_daily.aggregate([
+            {"$match": {"day": {"$gte": days[0], "$lte": days[-1]}}},
+            {"$group": {"_id": "$user_id", "total_coins": {"$sum": "$coins"}}},
+            {"$sort": {"total_coins": -1, "_id": 1}},
+            {"$limit": limit},
+        ], allowDiskUse=True).to_list(limit)
+        result = [{"user_id": row["_id"], "total_coins": row["total_coins"]} for row in rows]
+        self._local[cache_key] = (time.monotonic(), result)
+        return result
+
+    async def _top_redis(self, r, period: str, days: List[str], limit: int) -> List[Dict]:
+        board = BOARD_KEY.format(period=period, start=days[0], end=days[-1])
+        if not r.exists(board):
+            pipe = r.pipeline(transaction=False)
+            for day in days:
+                pipe.exists(DAY_LOADED_KEY.format(day=day))
+            missing = [day for day, ok in zip(days, pipe.execute()) if not ok]
+            for day in missing:
+                await self._load_day(r, day)
+            day_keys = [DAY_KEY.format(day=day) for day in days]
+            pipe = r.pipeline(transaction=True)
+            pipe.zunionstore(board, day_keys)
+            pipe.expire(board, BOARD_TTL)
+            pipe.execute()
+        rows = r.zrevrange(board, 0, limit - 1, withscores=True)
+        return [{"user_id": uid, "total_coins": int(score)} for uid, score in rows]
+
+    async def _load_day(self, r, day: str) -> None:
+        """Refill one day's ZSET from earnings_daily."""
+        key = DAY_KEY.format(day=day)
+        pipe = r.pipeline(transaction=True)
+        pipe.delete(key)
+        async for doc in self.db.earnings_daily.find({"day": day}, {"_id": 0, "user_id": 1, "coins": 1}):
+            pipe.zadd(key, {doc["user_id"]: doc["coins"]})
+        pipe.expire(key, DAY_TTL)
+        pipe.set(DAY_LOADED_KEY.format(day=day), "1", ex=DAY_TTL)
+        pipe.execute()
+
+    async def backfill(self) -> Optional[Dict]:
+        """Rebuild every day once if no rebuild has ever completed, so credits made
+        before the rollups existed reach the boards without an admin trigger."""
+        if await self.db.leaderboard_meta.find_one({"_id": META_ID}, {"_id": 1}):
+            return None
+        return await self.rebuild(BACKFILL_SINCE)
+
+    async def rebuild(self, since_day: str) -> Dict:
+        """Backfill earnings_daily from coin_transactions for days >= since_day (admin)."""
+        started = time.monotonic()
+        rollups = self.db.coin_transactions.aggregate([
+            {"$match": {"amount": {"$gt": 0}, "type": {"$nin": list(NON_EARNING_TYPES)}}},
+            # Same day rule as txn_day(): timestamp, else created_at (day string or datetime)
+            {"$addFields": {"ts": {"$ifNull": ["$timestamp", "$created_at"]}}},
+            {"$addFields": {"day": {"$switch": {"branches": [
+                {"case": {"$eq": [{"$type": "$ts"}, "string"]}, "then": {"$substrBytes": ["$ts", 0, 10]}},
+                {"case": {"$eq": [{"$type": "$ts"}, "date"]},
+                 "then": {"$dateToString": {"format": "%Y-%m-%d", "date": "$ts"}}},
+            ], "default": None}}}},
+            {"$match": {"day": {"$type": "string", "$gte": since_day}}},
+            {"$group": {"_id": {"user_id": "$user_id", "day": "$day"},
+                        "coins": {"$sum": "$amount"}, "credits": {"$sum": 1}}},
+        ], allowDiskUse=True)
+        await self.db.earnings_daily.delete_many({"day": {"$gte": since_day}})
+        ops, written, days = [], 0, set()
+        async for row in rollups:
+            days.add(row["_id"]["day"])
+            ops.append(UpdateOne(
+                {"user_id": row["_id"]["user_id"], "day": row["_id"]["day"]},
+                {"$inc": {"coins": row["coins"], "credits": row["credits"]}}, upsert=True))
+            if len(ops) >= REBUILD_CHUNK:
+                await self.db.earnings_daily.bulk_write(ops, ordered=False)
+                written += len(ops)
+                ops = []
+        if ops:
+            await self.db.earnings_daily.bulk_write(ops, ordered=False)
+            written += len(ops)
+        r = get_redis()
+        if r:
+            try:
+                for day in days:
+                    r.delete(DAY_LOADED_KEY.format(day=day))
+                for key in r.scan_iter("earn:board:*"):
+                    r.delete(key)
+            except Exception as e:
+                logger.warning(f"Earnings rollup redis reset failed: {e}")
+        self._local.clear()
+        result = {"since": since_day, "rollups": written, "days": len(days),
+                  "seconds": round(time.monotonic() - started, 2)}
+        await self.db.leaderboard_meta.update_one(
+            {"_id": META_ID}, {"$set": {**result, "rebuilt_at": datetime.now(timezone.utc).isoformat()}},
+            upsert=True)
+        logger.info(f"EARNINGS ROLLUP REBUILT: {result}")
+        return result
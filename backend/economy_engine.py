@@ -8,12 +8,16 @@ from datetime import datetime, timezone, timedelta
 from typing import Dict, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from economy_metrics import EconomyMetrics
+
 logger = logging.getLogger(__name__)
 
 DAILY_COIN_CAP = 5000
 DAILY_REDEEM_LIMIT = 3
 BONUS_EXPIRY_DAYS = 30
 TARGET_BURN_RATE = 0.65
+MINTED_TYPES = ("earned", "bonus", "reward", "prediction", "game_win", "referral")
+BURNED_TYPES = ("spent", "redeem", "entry_fee")
 
 SURPRISE_TRIGGERS = {
     "big_win": {"chance": 0.3, "rewards": [{"type": "coins", "min": 50, "max": 200}, {"type": "xp", "min": 20, "max": 50}]},
@@ -29,23 +33,18 @@ class EconomyEngine:
         self.db = db
 
     async def check_daily_cap(self, user_id: str) -> Dict:
-        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        earned = await self.db.daily_earnings.find_one({"user_id": user_id, "date": today})
-        total = earned.get("total", 0) if earned else 0
+        from earning_caps import earned_today
+        total = await earned_today(self.db, user_id)
         return {"earned_today": total, "cap": DAILY_COIN_CAP, "remaining": max(0, DAILY_COIN_CAP - total)}
 
-    async def record_earning(self, user_id: str, amount: int, source: str):
-        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        await self.db.daily_earnings.update_one(
-            {"user_id": user_id, "date": today},
-            {"$inc": {"total": amount}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()},
-             "$setOnInsert": {"created_at": datetime.now(timezone.utc).isoformat()}},
-            upsert=True,
-        )
+    async def record_earning(self, user_id: str, amount: int, source: str) -> int:
+        """Reserve `amount` under today's cap; returns the coins that may be credited."""
+        from earning_caps import reserve_earning
+        return await reserve_earning(self.db, user_id, amount)
 
     async def check_redeem_limit(self, user_id: str) -> Dict:
-        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        count = await self.db.redemptions.count_documents({"user_id": user_id, "date": today})
+        from earning_caps import redemptions_today
+        count = await redemptions_today(self.db, user_id)
         return {"redeemed_today": count, "limit": DAILY_REDEEM_LIMIT, "can_redeem": count < DAILY_REDEEM_LIMIT}
 
     async def try_surprise_reward(self, user_id: str, trigger: str) -> Optional[Dict]:
@@ -74,17 +73,9 @@ class EconomyEngine:
         return result
 
     async def get_economy_stats(self) -> Dict:
-        total_minted = await self.db.coin_transactions.aggregate([
-            {"$match": {"type": {"$in": ["earned", "bonus", "reward", "prediction", "game_win", "referral"]}}},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}},
-        ]).to_list(1)
-        total_burned = await self.db.coin_transactions.aggregate([
-            {"$match": {"type": {"$in": ["spent", "redeem", "entry_fee"]}}},
-            {"$group": {"_id": None, "total": {"$sum": {"$abs": "$amount"}}}},
-        ]).to_list(1)
-
-        minted = total_minted[0]["total"] if total_minted else 0
-        burned = total_burned[0]["total"] if total_burned else 0
+        types = await EconomyMetrics(self.db).by_type()
+        minted = sum(types[t]["minted"] - types[t]["burned"] for t in MINTED_TYPES if t in types)
+        burned = sum(types[t]["burned"] + types[t]["minted"] for t in BURNED_TYPES if t in types)
         burn_rate = round(burned / minted * 100, 1) if minted > 0 else 0
 
         return {
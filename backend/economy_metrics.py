@@ -0,0 +1,165 @@
+"""
+Economy Metrics for FREE11
+Minted / burned / expired coins by transaction type, in hourly, daily and all-time buckets.
+
+Every credit / debit path calls `record_flows()` → one bulk_write of $inc upserts on
+`economy_metrics`, three small docs (hour, day, total) per transaction type. Admin
+dashboards read the "total" docs (a few dozen) instead of grouping coin_transactions
+and users; charts read a range of hour or day docs. `EconomyMetrics.rebuild()`
+backfills everything from coin_transactions + ledger.
+"""
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("hour", "day", "total")
+EXPIRY_TYPES = ("coin_expiry",)    # debits that are breakage, not spend
+NON_COIN_TYPES = ("purchase",)     # FREE Bucks top-ups share coin_transactions
+REBUILD_CHUNK = 1000
+
+
+def buckets_of(timestamp: Optional[str] = None) -> Dict[str, str]:
+    """{granularity: bucket} for an ISO timestamp; date-only stamps land in hour 00."""
+    ts = timestamp or datetime.now(timezone.utc).isoformat()
+    day = ts[:10]
+    hour = ts[:13] if len(ts) >= 13 else f"{day}T00"
+    return {"hour": hour, "day": day, "total": "all"}
+
+
+def _doc_id(granularity: str, bucket: str, tx_type: str) -> str:
+    return f"{granularity}:{bucket}:{tx_type}"
+
+
+def _flow_incs(rows: Iterable[Tuple[str, int]]) -> Dict[str, Dict[str, int]]:
+    incs: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for tx_type, amount in rows:
+        if not amount or tx_type in NON_COIN_TYPES:
+            continue
+        inc = incs[tx_type or "unknown"]
+        if amount > 0:
+            inc["minted"] += int(amount)
+            inc["credits"] += 1
+        else:
+            inc["burned"] += -int(amount)
+            inc["debits"] += 1
+    return incs
+
+
+async def record_flows(db: AsyncIOMotorDatabase, rows: Iterable[Tuple[str, int]],
+                       timestamp: Optional[str] = None) -> None:
+    """Count signed coin movements [(tx_type, amount)] (credits > 0, debits < 0)."""
+    incs = _flow_incs(rows)
+    if not incs:
+        return
+    buckets = buckets_of(timestamp)
+    try:
+        await db.economy_metrics.bulk_write([
+            UpdateOne({"_id": _doc_id(gran, bucket, tx_type)},
+                      {"$inc": dict(inc),
+                       "$setOnInsert": {"granularity": gran, "bucket": bucket, "type": tx_type}}, upsert=True)
+            for tx_type, inc in incs.items() for gran, bucket in buckets.items()
+        ], ordered=False)
+    except Exception as e:
+        # Metrics must never fail a credit; a rebuild() restores the counters
+        logger.warning(f"Economy metrics write failed: {e}")
+
+
+async def record_flow(db: AsyncIOMotorDatabase, tx_type: str, amount: int,
+                      timestamp: Optional[str] = None) -> None:
+    await record_flows(db, [(tx_type, amount)], timestamp)
+
+
+class EconomyMetrics:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db.economy_metrics.create_index([("granularity", 1), ("bucket", 1)], name="econ_gran_bucket")
+
+    async def by_type(self) -> Dict[str, Dict[str, int]]:
+        """All-time {type: {minted, burned, credits, debits}}."""
+        return {
+            doc["type"]: {k: doc.get(k, 0) for k in ("minted", "burned", "credits", "debits")}
+            async for doc in self.db.economy_metrics.find({"granularity": "total"}, {"_id": 0})
+        }
+
+    async def summary(self) -> Dict:
+        """Issued, spent, expired, wallet liability and breakage from the all-time counters."""
+        types = await self.by_type()
+        minted = sum(t["minted"] for t in types.values())
+        expired = sum(types.get(t, {}).get("burned", 0) for t in EXPIRY_TYPES)
+        spent = sum(t["burned"] for name, t in types.items() if name not in EXPIRY_TYPES)
+        unredeemed = minted - spent
+        return {
+            "minted": minted,
+            "spent": spent,
+            "expired": expired,
+            "liability": minted - spent - expired,
+            "unredeemed": unredeemed,
+            "breakage_pct": round(unredeemed / minted * 100, 1) if minted > 0 else 0,
+            "by_type": types,
+        }
+
+    async def series(self, granularity: str, start: str, end: str,
+                     types: Optional[List[str]] = None) -> List[Dict]:
+        """[{bucket, minted, burned}] for hour / day buckets in [start, end], oldest first."""
+        if granularity not in ("hour", "day"):
+            raise ValueError(f"Unknown granularity: {granularity}")
+        query = {"granularity": granularity, "bucket": {"$gte": start, "$lte": end}}
+        if types:
+            query["type"] = {"$in": types}
+        points: Dict[str, Dict[str, int]] = defaultdict(lambda: {"minted": 0, "burned": 0})
+        async for doc in self.db.economy_metrics.find(query, {"_id": 0, "bucket": 1, "minted": 1, "burned": 1}):
+            point = points[doc["bucket"]]
+            point["minted"] += doc.get("minted", 0)
+            point["burned"] += doc.get("burned", 0)
+        return [{"bucket": bucket, **points[bucket]} for bucket in sorted(points)]
+
+    async def rebuild(self) -> Dict:
+        """Backfill every bucket from coin_transactions + ledger (admin, one-off)."""
+        started = time.monotonic()
+        sources = [
+            self.db.coin_transactions.aggregate([
+                # Daily game rewards only carry a created_at day string
+                {"$addFields": {"ts": {"$ifNull": ["$timestamp", "$created_at"]}}},
+                {"$match": {"ts": {"$type": "string"}, "amount": {"$ne": 0},
+                            "type": {"$nin": list(NON_COIN_TYPES)}}},
+                {"$group": {"_id": {"type": "$type", "hour": {"$substrBytes": ["$ts", 0, 13]},
+                                    "sign": {"$gt": ["$amount", 0]}},
+                            "coins": {"$sum": {"$abs": "$amount"}}, "n": {"$sum": 1}}},
+            ], allowDiskUse=True),
+            self.db.ledger.aggregate([
+                {"$match": {"status": {"$in": ["completed", None]}, "timestamp": {"$type": "string"}}},
+                {"$project": {"type": 1, "hour": {"$substrBytes": ["$timestamp", 0, 13]},
+                              "net": {"$subtract": [{"$ifNull": ["$credit", 0]}, {"$ifNull": ["$debit", 0]}]}}},
+                {"$match": {"net": {"$ne": 0}}},
+                {"$group": {"_id": {"type": "$type", "hour": "$hour", "sign": {"$gt": ["$net", 0]}},
+                            "coins": {"$sum": {"$abs": "$net"}}, "n": {"$sum": 1}}},
+            ], allowDiskUse=True),
+        ]
+        docs: Dict[str, Dict] = {}
+        for rows in sources:
+            async for row in rows:
+                key = row["_id"]
+                field, count = ("minted", "credits") if key["sign"] else ("burned", "debits")
+                for gran, bucket in buckets_of(key["hour"]).items():
+                    tx_type = key.get("type") or "unknown"
+                    doc = docs.setdefault(_doc_id(gran, bucket, tx_type), {
+                        "granularity": gran, "bucket": bucket, "type": tx_type,
+                        "minted": 0, "burned": 0, "credits": 0, "debits": 0})
+                    doc[field] += row["coins"]
+                    doc[count] += row["n"]
+        await self.db.economy_metrics.delete_many({})
+        items = [{"_id": doc_id, **doc} for doc_id, doc in docs.items()]
+        for i in range(0, len(items), REBUILD_CHUNK):
+            await self.db.economy_metrics.insert_many(items[i:i + REBUILD_CHUNK], ordered=False)
+        result = {"docs": len(items), "seconds": round(time.monotonic() - started, 2)}
+        logger.info(f"ECONOMY METRICS REBUILT: {result}")
+        return result
@@ -11,6 +11,9 @@ import os
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from percentile_rank import PercentileRankService
 
 logger = logging.getLogger(__name__)
 
@@ -310,9 +313,14 @@ class PuzzleEngine:
 # FEATURE 5 — Weekly Report Card
 # ─────────────────────────────────────────────────────────────────────────────
 
+REPORT_BATCH = 2000          # users per bulk_write / checkpoint
+PREV_REPORT_WEEKS = 4        # how far back generate_all_users looks for a previous rank
+
+
 class WeeklyReportEngine:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncIOMotorDatabase, percentiles: Optional[PercentileRankService] = None):
         self.db = db
+        self.percentiles = percentiles or PercentileRankService(db)
 
     def _week_start(self, ref: Optional[datetime] = None) -> str:
         """Return ISO date string for the most recent Monday."""
@@ -320,10 +328,43 @@ class WeeklyReportEngine:
         monday = d - timedelta(days=d.weekday())
         return monday.strftime("%Y-%m-%d")
 
+    @staticmethod
+    def _since(week_start: str) -> str:
+        return datetime.strptime(week_start, "%Y-%m-%d").replace(tzinfo=timezone.utc).isoformat()
+
+    @staticmethod
+    def _report_doc(user_id: str, week_start: str, ps: Dict, contests_joined: int,
+                    coins_this_week: int, position: Dict, prev_rank: Optional[int]) -> Dict:
+        rank = position["rank"]
+        accuracy = round(ps["correct"] / ps["total"] * 100, 1) if ps["total"] > 0 else 0
+        return {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "week_start": week_start,
+            "predictions_total": ps["total"],
+            "predictions_correct": ps["correct"],
+            "accuracy": accuracy,
+            "coins_earned_this_week": coins_this_week,
+            "contests_joined": contests_joined,
+            "rank": rank,
+            "rank_change": (prev_rank if prev_rank is not None else rank) - rank,  # positive = improved
+            "top_percent": position["top_percent"],
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "viewed": False,
+        }
+
+    async def ensure_indexes(self):
+        await self.db.weekly_reports.create_index([("user_id", 1), ("week_start", 1)], name="wreport_user_week")
+        await self.db.weekly_reports.create_index("week_start", name="wreport_week")
+        await self.db.predictions_v2.create_index("resolved_at", name="predv2_resolved_at")
+        await self.db.contest_entries.create_index("joined_at", name="centry_joined_at")
+        await self.db.coin_transactions.create_index("timestamp", name="txn_time")
+        await self.db.weekly_report_runs.create_index("week_start", unique=True, name="wreport_run_week")
+
     async def generate_report(self, user_id: str) -> Dict:
         """Generate (or refresh) the weekly report for a user."""
         week_start = self._week_start()
-        since = datetime.strptime(week_start, "%Y-%m-%d").replace(tzinfo=timezone.utc).isoformat()
+        since = self._since(week_start)
 
         # Predictions this week
         pred_pipeline = [
@@ -337,7 +378,6 @@ class WeeklyReportEngine:
         ]
         pred_stats = await self.db.predictions_v2.aggregate(pred_pipeline).to_list(1)
         ps = pred_stats[0] if pred_stats else {"total": 0, "correct": 0, "coins_earned": 0}
-        accuracy = round(ps["correct"] / ps["total"] * 100, 1) if ps["total"] > 0 else 0
 
         # Contests joined this week
         contests_joined = await self.db.contest_entries.count_documents(
@@ -352,10 +392,9 @@ class WeeklyReportEngine:
         coin_stats = await self.db.coin_transactions.aggregate(coin_pipeline).to_list(1)
         coins_this_week = (coin_stats[0]["total"] if coin_stats else 0)
 
-        # Global rank
+        # Global rank — binary search in the shared total_earned snapshot
         user_doc = await self.db.users.find_one({"id": user_id}, {"_id": 0, "total_earned": 1})
-        total_earned = (user_doc or {}).get("total_earned", 0)
-        rank = await self.db.users.count_documents({"total_earned": {"$gt": total_earned}}) + 1
+        position = await self.percentiles.rank("total_earned", (user_doc or {}).get("total_earned", 0))
 
         # Previous week's rank for delta
         prev_report = await self.db.weekly_reports.find_one(
@@ -363,23 +402,9 @@ class WeeklyReportEngine:
             {"_id": 0, "rank": 1},
             sort=[("generated_at", -1)],
         )
-        prev_rank = (prev_report or {}).get("rank", rank)
-        rank_change = prev_rank - rank  # positive = improved
 
-        report = {
-            "id": str(uuid.uuid4()),
-            "user_id": user_id,
-            "week_start": week_start,
-            "predictions_total": ps["total"],
-            "predictions_correct": ps["correct"],
-            "accuracy": accuracy,
-            "coins_earned_this_week": coins_this_week,
-            "contests_joined": contests_joined,
-            "rank": rank,
-            "rank_change": rank_change,
-            "generated_at": datetime.now(timezone.utc).isoformat(),
-            "viewed": False,
-        }
+        report = self._report_doc(user_id, week_start, ps, contests_joined, coins_this_week,
+                                  position, (prev_report or {}).get("rank"))
 
         # Upsert for this week
         await self.db.weekly_reports.update_one(
@@ -407,15 +432,91 @@ class WeeklyReportEngine:
             {"$set": {"viewed": True, "viewed_at": datetime.now(timezone.utc).isoformat()}},
         )
 
-    async def generate_all_users(self):
-        """Called by scheduler every Monday — pre-generate reports for all active users."""
-        active_ids = await self.db.users.distinct("id", {})
-        generated = 0
-        for uid in active_ids:
-            try:
-                await self.generate_report(uid)
-                generated += 1
-            except Exception as e:
-                logger.error(f"WeeklyReport: failed for user={uid}: {e}")
-        logger.info(f"WeeklyReport: generated {generated} reports for week starting {self._week_start()}")
+    async def get_run(self, week_start: Optional[str] = None) -> Optional[Dict]:
+        """Progress of the batch run for a week (default: current week)."""
+        return await self.db.weekly_report_runs.find_one(
+            {"week_start": week_start or self._week_start()}, {"_id": 0})
+
+    async def generate_all_users(self, restart: bool = False) -> int:
+        """Called by scheduler every Monday — pre-generate reports for all users.
+
+        Set-based: one grouped aggregation per source for the whole week, ranks from
+        the percentile snapshot, chunked bulk_write in user-id order. Progress is
+        checkpointed in weekly_report_runs after each chunk, so a crashed or
+        interrupted run resumes after the last written user.
+        """
+        week_start = self._week_start()
+        since = self._since(week_start)
+        now = datetime.now(timezone.utc).isoformat()
+        run = await self.get_run(week_start)
+        if run and run.get("status") == "completed" and not restart:
+            return run.get("generated", 0)
+        if not run or restart:
+            run = {"week_start": week_start, "status": "running", "last_user_id": "", "generated": 0,
+                   "total": await self.db.users.estimated_document_count(), "started_at": now}
+            await self.db.weekly_report_runs.update_one(
+                {"week_start": week_start}, {"$set": {**run, "updated_at": now}}, upsert=True)
+        else:
+            logger.info(f"WeeklyReport: resuming week={week_start} after user={run.get('last_user_id')} "
+                        f"({run.get('generated', 0)}/{run.get('total', 0)})")
+
+        await self.percentiles.refresh()  # rank every report against the same fresh snapshot
+        preds = {
+            row["_id"]: row async for row in self.db.predictions_v2.aggregate([
+                {"$match": {"status": "resolved", "resolved_at": {"$gte": since}}},
+                {"$group": {"_id": "$user_id", "total": {"$sum": 1},
+                            "correct": {"$sum": {"$cond": ["$is_correct", 1, 0]}},
+                            "coins_earned": {"$sum": "$coins_earned"}}},
+            ], allowDiskUse=True)
+        }
+        contests = {
+            row["_id"]: row["n"] async for row in self.db.contest_entries.aggregate([
+                {"$match": {"joined_at": {"$gte": since}}},
+                {"$group": {"_id": "$user_id", "n": {"$sum": 1}}},
+            ], allowDiskUse=True)
+        }
+        coins = {
+            row["_id"]: row["total"] async for row in self.db.coin_transactions.aggregate([
+                {"$match": {"timestamp": {"$gte": since}, "amount": {"$gt": 0}}},
+                {"$group": {"_id": "$user_id", "total": {"$sum": "$amount"}}},
+            ], allowDiskUse=True)
+        }
+        oldest = (datetime.strptime(week_start, "%Y-%m-%d") - timedelta(weeks=PREV_REPORT_WEEKS)).strftime("%Y-%m-%d")
+        prev_ranks = {
+            row["_id"]: row["rank"] async for row in self.db.weekly_reports.aggregate([
+                {"$match": {"week_start": {"$gte": oldest, "$lt": week_start}}},
+                {"$sort": {"generated_at": -1}},
+                {"$group": {"_id": "$user_id", "rank": {"$first": "$rank"}}},
+            ], allowDiskUse=True)
+        }
+
+        empty = {"total": 0, "correct": 0, "coins_earned": 0}
+        generated, last_user_id = run.get("generated", 0), run.get("last_user_id", "")
+        cursor = self.db.users.find(
+            {"id": {"$gt": last_user_id}}, {"_id": 0, "id": 1, "total_earned": 1}).sort("id", 1)
+        while True:
+            users = await cursor.to_list(REPORT_BATCH)
+            if not users:
+                break
+            positions = await self.percentiles.ranks("total_earned", [u.get("total_earned", 0) or 0 for u in users])
+            ops = []
+            for user, position in zip(users, positions):
+                uid = user["id"]
+                report = self._report_doc(uid, week_start, preds.get(uid, empty), contests.get(uid, 0),
+                                          coins.get(uid, 0), position, prev_ranks.get(uid))
+                ops.append(UpdateOne({"user_id": uid, "week_start": week_start}, {"$set": report}, upsert=True))
+            await self.db.weekly_reports.bulk_write(ops, ordered=False)
+            generated += len(ops)
+            last_user_id = users[-1]["id"]
+            await self.db.weekly_report_runs.update_one(
+                {"week_start": week_start},
+                {"$set": {"last_user_id": last_user_id, "generated": generated,
+                          "updated_at": datetime.now(timezone.utc).isoformat()}})
+            logger.info(f"WeeklyReport: {generated}/{run.get('total', 0)} reports for week {week_start}")
+
+        await self.db.weekly_report_runs.update_one(
+            {"week_start": week_start},
+            {"$set": {"status": "completed", "generated": generated,
+                      "completed_at": datetime.now(timezone.utc).isoformat()}})
+        logger.info(f"WeeklyReport: generated {generated} reports for week starting {week_start}")
         return generated
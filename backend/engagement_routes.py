@@ -5,8 +5,9 @@ Progression, Missions, Streak, Spin, Leaderboards, Economy, Surprise Rewards.
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional, List, Dict
+import uuid
 
-from server import db, get_current_user, User
+from server import db, get_current_user, User, add_coins
 
 from progression_engine import ProgressionEngine
 from missions_engine import MissionsEngine
@@ -15,6 +16,9 @@ from economy_engine import EconomyEngine
 from streak_leaderboard_engine import StreakEngine, LeaderboardEngine
 from cards_engine import CardsEngine
 from notification_engine import NotificationEngine
+from earnings_rollup import record_credit, period_days
+from earning_caps import reserve_earning
+from economy_metrics import record_flow
 
 engage_router = APIRouter(prefix="/v2/engage", tags=["engagement"])
 
@@ -56,14 +60,19 @@ class ClaimMissionReq(BaseModel):
 async def claim_mission(req: ClaimMissionReq, user: User = Depends(get_current_user)):
     try:
         reward = await missions.claim_reward(user.id, req.mission_id)
-        # Credit coins
+        # Credit coins (what is left of today's cap)
+        reward["coins"] = await reserve_earning(db, user.id, reward["coins"])
         if reward["coins"] > 0:
             await db.users.update_one({"id": user.id}, {"$inc": {"coins_balance": reward["coins"]}})
-            await db.coin_transactions.insert_one({
+            txn = {
+                "id": str(uuid.uuid4()),
                 "user_id": user.id, "amount": reward["coins"], "type": "mission_reward",
                 "description": f"Mission completed: {req.mission_id}",
                 "timestamp": __import__("datetime").datetime.now(__import__("datetime").timezone.utc).isoformat(),
-            })
+            }
+            await db.coin_transactions.insert_one(txn)
+            await record_credit(db, txn)
+            await record_flow(db, "mission_reward", reward["coins"])
         # Add XP
         if reward["xp"] > 0:
             await progression.add_xp(user.id, "mission_completed", reward["xp"])
@@ -84,14 +93,19 @@ async def get_streak(user: User = Depends(get_current_user)):
 async def streak_checkin(user: User = Depends(get_current_user)):
     try:
         result = await streak.checkin(user.id)
-        # Credit coins
+        # Credit coins (what is left of today's cap)
+        result["coins_earned"] = await reserve_earning(db, user.id, result["coins_earned"])
         if result["coins_earned"] > 0:
             await db.users.update_one({"id": user.id}, {"$inc": {"coins_balance": result["coins_earned"]}})
-            await db.coin_transactions.insert_one({
+            txn = {
+                "id": str(uuid.uuid4()),
                 "user_id": user.id, "amount": result["coins_earned"], "type": "streak_reward",
                 "description": f"Login streak day {result['streak_days']}",
                 "timestamp": __import__("datetime").datetime.now(__import__("datetime").timezone.utc).isoformat(),
-            })
+            }
+            await db.coin_transactions.insert_one(txn)
+            await record_credit(db, txn)
+            await record_flow(db, "streak_reward", result["coins_earned"])
         # Add XP
         await progression.add_xp(user.id, "daily_login", result.get("xp_earned", 5))
         # Grant booster card if applicable
@@ -120,13 +134,19 @@ async def do_spin(user: User = Depends(get_current_user)):
         result = await spin.spin(user.id)
         reward = result["reward"]
         # Process reward
+        if reward["type"] == "coins":
+            reward["value"] = await reserve_earning(db, user.id, reward["value"])
         if reward["type"] == "coins" and reward["value"] > 0:
             await db.users.update_one({"id": user.id}, {"$inc": {"coins_balance": reward["value"]}})
-            await db.coin_transactions.insert_one({
+            txn = {
+                "id": str(uuid.uuid4()),
                 "user_id": user.id, "amount": reward["value"], "type": "spin_reward",
                 "description": f"Spin wheel: {reward['label']}",
                 "timestamp": __import__("datetime").datetime.now(__import__("datetime").timezone.utc).isoformat(),
-            })
+            }
+            await db.coin_transactions.insert_one(txn)
+            await record_credit(db, txn)
+            await record_flow(db, "spin_reward", reward["value"])
         elif reward["type"] == "booster":
             try:
                 await cards.grant_card(user.id, str(reward["value"]), "spin_reward")
@@ -153,6 +173,14 @@ async def get_leaderboard(period: str, limit: int = 50):
     return await leaderboards.get_leaderboard(period, limit)
 
 
+@engage_router.post("/leaderboard/rebuild")
+async def rebuild_leaderboards(since: Optional[str] = None, user: User = Depends(get_current_user)):
+    """Admin: backfill the per-day earnings rollups from coin_transactions (default: this season)."""
+    if not user.is_admin:
+        raise HTTPException(403, "Admin only")
+    return await leaderboards.rollup.rebuild(since or period_days("seasonal")[0])
+
+
 # ══════════════════════ ECONOMY ══════════════════════
 
 @engage_router.get("/economy/status")
@@ -176,7 +204,9 @@ async def check_surprise(trigger: str, user: User = Depends(get_current_user)):
     result = await economy.try_surprise_reward(user.id, trigger)
     if result:
         if result["type"] == "coins":
-            await db.users.update_one({"id": user.id}, {"$inc": {"coins_balance": result["amount"]}})
+            # add_coins writes the transaction row, flow and expiry bucket with the balance
+            txn = await add_coins(user.id, result["amount"], "surprise", f"Surprise reward: {trigger}")
+            result["amount"] = txn["amount"]
         elif result["type"] == "xp":
             await progression.add_xp(user.id, "surprise", result["amount"])
         await notif.send(user.id, "daily_reminder", f"Surprise! You won {result.get('amount', '')} {result['type']}!")
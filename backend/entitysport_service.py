@@ -230,6 +230,7 @@ class EntitySportService:
                     "team": team_name,
                     "playing11": is_playing,
                     "credit": credit,
+                    "fantasy_rating": float(rating) if rating else 7.0,
                     "batting_style": details.get("batting_style", ""),
                     "bowling_style": details.get("bowling_style", ""),
                     "logo": details.get("logo", ""),
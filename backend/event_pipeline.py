@@ -0,0 +1,362 @@
+"""
+Event Pipeline for FREE11
+Buffered, sampled ingestion of analytics events with hourly / daily rollups and
+HyperLogLog unique-user sketches.
+
+`submit()` never touches the database: it bumps in-memory rollup counters, adds the
+user to today's sketches and (if the event type's sample rate keeps it) appends the
+raw event to a bounded ring buffer. A background loop flushes every FLUSH_INTERVAL
+seconds, or as soon as FLUSH_BATCH events are queued:
+  - raw events → one unordered insert_many on `analytics_events` (with `sample_rate`)
+  - counters   → $inc upserts on `analytics_rollups` (hour + day docs per event name)
+  - sketches   → PFADD on Redis when configured, and this process's HLL shard on
+                 `analytics_hll` (one doc per kind / day / process, merged on read)
+When the buffer is full the oldest raw event is overwritten and counted as dropped;
+rollups and sketches still see every event, so counts and DAU stay exact-ish under load.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import random
+import socket
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from redis_cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 20000
+FLUSH_BATCH = 1000
+FLUSH_INTERVAL = 2.0
+REBUILD_CHUNK = 1000
+MAX_EVENT_NAME = 64
+HLL_PRECISION = 12                       # 4096 registers, ~1.6% standard error
+HLL_KEY = "aevt:hll:{kind}:{day}"
+HLL_TTL = 400 * 86400
+SIGNUP_EVENTS = ("registration",)        # sketch kinds: "active" (any signed-in event), "signup"
+ANONYMOUS_USERS = ("", "anon")
+NEVER_SAMPLED = ("login", "registration")
+# Raw-event sample rates per event name, e.g. ANALYTICS_SAMPLE_RATES="page_view=0.1,button_click=0.25"
+SAMPLE_RATES: Dict[str, float] = {
+    name.strip(): float(rate)
+    for name, _, rate in (item.partition("=") for item in os.environ.get("ANALYTICS_SAMPLE_RATES", "").split(","))
+    if name.strip() and rate.strip()
+}
+
+
+def _event_name(event: Optional[str]) -> str:
+    return (str(event) if event else "unknown")[:MAX_EVENT_NAME]
+
+
+def sample_rate(event: str) -> float:
+    if event in NEVER_SAMPLED:
+        return 1.0
+    return min(1.0, max(0.0, SAMPLE_RATES.get(event, 1.0)))
+
+
+class HyperLogLog:
+    """Dense HLL over 64-bit blake2b hashes; registers are one byte each."""
+
+    def __init__(self, registers: Optional[bytes] = None, p: int = HLL_PRECISION):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+
+    def add(self, value: str) -> bool:
+        h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        idx, rest = h >> (64 - self.p), h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+            return True
+        return False
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+def _merged(shards: Iterable[bytes]) -> HyperLogLog:
+    hll = HyperLogLog()
+    for registers in shards:
+        hll.merge(HyperLogLog(registers))
+    return hll
+
+
+class EventPipeline:
+    def __init__(self, db: AsyncIOMotorDatabase, buffer_size: int = BUFFER_SIZE):
+        self.db = db
+        # hostname:pid repeats across container restarts (often pid 1); the random tail keeps a
+        # restarted process from overwriting the previous run's registers for the same day.
+        self.instance = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._buffer: Deque[Dict] = deque(maxlen=buffer_size)
+        self._counts: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._sketches: Dict[Tuple[str, str], HyperLogLog] = {}   # (kind, day) → this process's shard
+        self._dirty: Set[Tuple[str, str]] = set()
+        self._pending_users: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        self._lock = asyncio.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.totals = {"accepted": 0, "stored": 0, "sampled_out": 0, "dropped": 0, "failed": 0}
+        self.last_flush: Optional[str] = None
+
+    # ── Ingestion ─────────────────────────────────────────────────────────
+
+    def submit(self, event: str, user_id: str = "", properties: Optional[Dict] = None) -> None:
+        now = datetime.now(timezone.utc).isoformat()
+        event, user_id = _event_name(event), str(user_id or "")
+        counts = self._counts[(now[:13], event)]
+        counts["count"] += 1
+        self.totals["accepted"] += 1
+        if user_id not in ANONYMOUS_USERS:
+            self._sketch("active", now[:10], user_id)
+            if event in SIGNUP_EVENTS:
+                self._sketch("signup", now[:10], user_id)
+        rate = sample_rate(event)
+        if rate < 1.0 and random.random() >= rate:
+            self.totals["sampled_out"] += 1
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            evicted = self._buffer.popleft()
+            lost = self._counts[(evicted["timestamp"][:13], evicted["event"])]
+            lost["stored"] -= 1
+            lost["dropped"] += 1
+            self.totals["dropped"] += 1
+        self._buffer.append({"event": event, "user_id": user_id, "properties": properties or {},
+                             "timestamp": now, "sample_rate": rate})
+        counts["stored"] += 1
+        if len(self._buffer) >= FLUSH_BATCH and self._wake is not None:
+            self._wake.set()
+
+    def _sketch(self, kind: str, day: str, user_id: str) -> None:
+        hll = self._sketches.get((kind, day))
+        if hll is None:
+            # Only today's (and, around midnight, yesterday's) shards stay in memory
+            for key in [k for k in self._sketches if k[0] == kind and k[1] < day and k not in self._dirty]:
+                del self._sketches[key]
+            hll = self._sketches[(kind, day)] = HyperLogLog()
+        if hll.add(user_id):
+            self._dirty.add((kind, day))
+        self._pending_users[(kind, day)].add(user_id)
+
+    # ── Flushing ──────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Event pipeline flush failed: {e}")
+
+    async def flush(self) -> Dict:
+        """Write buffered events, rollup counters and sketches (also called on shutdown)."""
+        async with self._lock:
+            events = list(self._buffer)
+            self._buffer.clear()
+            counts, self._counts = self._counts, defaultdict(lambda: defaultdict(int))
+            users, self._pending_users = self._pending_users, defaultdict(set)
+            dirty, self._dirty = self._dirty, set()
+            shards = {key: bytes(self._sketches[key].registers) for key in dirty if key in self._sketches}
+
+            for i in range(0, len(events), FLUSH_BATCH):
+                chunk = events[i:i + FLUSH_BATCH]
+                try:
+                    await self.db.analytics_events.insert_many(chunk, ordered=False)
+                    self.totals["stored"] += len(chunk)
+                except Exception as e:
+                    self.totals["failed"] += len(chunk)
+                    logger.error(f"Event pipeline: insert_many of {len(chunk)} events failed: {e}")
+            if counts:
+                try:
+                    await self.db.analytics_rollups.bulk_write([
+                        UpdateOne({"_id": f"{gran}:{bucket}:{event}"},
+                                  {"$inc": dict(inc),
+                                   "$setOnInsert": {"granularity": gran, "bucket": bucket, "event": event}},
+                                  upsert=True)
+                        for (hour, event), inc in counts.items()
+                        for gran, bucket in (("hour", hour), ("day", hour[:10]))
+                    ], ordered=False)
+                except Exception as e:
+                    logger.warning(f"Event pipeline: rollup write failed: {e}")
+            if shards:
+                try:
+                    await self.db.analytics_hll.bulk_write([
+                        UpdateOne({"_id": f"{kind}:{day}:{self.instance}"},
+                                  {"$set": {"kind": kind, "day": day, "instance": self.instance,
+                                            "registers": registers}}, upsert=True)
+                        for (kind, day), registers in shards.items()
+                    ], ordered=False)
+                except Exception as e:
+                    self._dirty |= set(shards)
+                    logger.warning(f"Event pipeline: sketch write failed: {e}")
+            r = get_redis()
+            if r and users:
+                try:
+                    pipe = r.pipeline(transaction=False)
+                    for (kind, day), ids in users.items():
+                        key = HLL_KEY.format(kind=kind, day=day)
+                        pipe.pfadd(key, *ids)
+                        pipe.expire(key, HLL_TTL)
+                    pipe.execute()
+                except Exception as e:
+                    logger.warning(f"Event pipeline: redis PFADD failed: {e}")
+            self.last_flush = datetime.now(timezone.utc).isoformat()
+            return {"events": len(events), "rollups": len(counts), "sketches": len(shards)}
+
+    def stats(self) -> Dict:
+        return {
+            "buffered": len(self._buffer),
+            "capacity": self._buffer.maxlen,
+            "sample_rates": dict(SAMPLE_RATES),
+            "last_flush": self.last_flush,
+            **self.totals,
+        }
+
+    # ── Reads ─────────────────────────────────────────────────────────────
+
+    async def ensure_indexes(self):
+        await self.db.analytics_rollups.create_index([("granularity", 1), ("bucket", 1)], name="arollup_gran_bucket")
+        await self.db.analytics_hll.create_index([("kind", 1), ("day", 1)], name="ahll_kind_day")
+
+    async def unique_users(self, kind: str, days: List[str]) -> int:
+        """Distinct users across `days` (a union) from the `kind` sketches."""
+        return (await self._sketch_counts(kind, [days]))[0]
+
+    async def unique_users_by_day(self, kind: str, days: List[str]) -> Dict[str, int]:
+        return dict(zip(days, await self._sketch_counts(kind, [[day] for day in days])))
+
+    async def _sketch_counts(self, kind: str, groups: List[List[str]]) -> List[int]:
+        r = get_redis()
+        if r:
+            try:
+                pipe = r.pipeline(transaction=False)
+                for days in groups:
+                    pipe.pfcount(*[HLL_KEY.format(kind=kind, day=day) for day in days])
+                return [int(n) for n in pipe.execute()]
+            except Exception as e:
+                logger.warning(f"Event pipeline: redis PFCOUNT failed, using Mongo sketches: {e}")
+        wanted = sorted({day for days in groups for day in days})
+        by_day: Dict[str, List[bytes]] = defaultdict(list)
+        async for doc in self.db.analytics_hll.find({"kind": kind, "day": {"$in": wanted}},
+                                                     {"_id": 0, "day": 1, "registers": 1}):
+            by_day[doc["day"]].append(doc["registers"])
+        return [_merged(reg for day in days for reg in by_day[day]).count() for days in groups]
+
+    async def series(self, granularity: str, start: str, end: str,
+                     events: Optional[List[str]] = None) -> List[Dict]:
+        """[{bucket, event, count, stored, dropped}] for hour / day buckets in [start, end]."""
+        if granularity not in ("hour", "day"):
+            raise ValueError(f"Unknown granularity: {granularity}")
+        query = {"granularity": granularity, "bucket": {"$gte": start, "$lte": end}}
+        if events:
+            query["event"] = {"$in": events}
+        return [
+            {"bucket": doc["bucket"], "event": doc["event"],
+             **{k: doc.get(k, 0) for k in ("count", "stored", "dropped")}}
+            async for doc in self.db.analytics_rollups.find(query, {"_id": 0}).sort([("bucket", 1), ("event", 1)])
+        ]
+
+    # ── Backfill ──────────────────────────────────────────────────────────
+
+    async def rebuild(self, since_day: str) -> Dict:
+        """Backfill rollups and sketches for days >= since_day from analytics_events (admin)."""
+        started = time.monotonic()
+        await self.flush()
+        match = {"timestamp": {"$type": "string", "$gte": since_day}}
+        counts = self.db.analytics_events.aggregate([
+            {"$match": match},
+            {"$group": {"_id": {"hour": {"$substrBytes": ["$timestamp", 0, 13]}, "event": "$event"},
+                        # Sampled events stand for 1 / sample_rate originals
+                        "count": {"$sum": {"$divide": [1, {"$ifNull": ["$sample_rate", 1]}]}},
+                        "stored": {"$sum": 1}}},
+        ], allowDiskUse=True)
+        docs: Dict[str, Dict] = {}
+        async for row in counts:
+            event = _event_name(row["_id"].get("event"))
+            for gran, bucket in (("hour", row["_id"]["hour"]), ("day", row["_id"]["hour"][:10])):
+                doc = docs.setdefault(f"{gran}:{bucket}:{event}", {
+                    "granularity": gran, "bucket": bucket, "event": event, "count": 0, "stored": 0, "dropped": 0})
+                doc["count"] += int(round(row["count"]))
+                doc["stored"] += row["stored"]
+
+        sketches: Dict[Tuple[str, str], HyperLogLog] = defaultdict(HyperLogLog)
+        users: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        async for row in self.db.analytics_events.aggregate([
+            {"$match": {**match, "user_id": {"$nin": list(ANONYMOUS_USERS)}}},
+            {"$group": {"_id": {"day": {"$substrBytes": ["$timestamp", 0, 10]}, "user_id": "$user_id"},
+                        "signup": {"$max": {"$in": ["$event", list(SIGNUP_EVENTS)]}}}},
+        ], allowDiskUse=True):
+            day, uid = row["_id"]["day"], str(row["_id"]["user_id"])
+            for kind in ("active", "signup") if row["signup"] else ("active",):
+                sketches[(kind, day)].add(uid)
+                users[(kind, day)].add(uid)
+
+        await self.db.analytics_rollups.delete_many({"bucket": {"$gte": since_day}})
+        items = [{"_id": doc_id, **doc} for doc_id, doc in docs.items()]
+        for i in range(0, len(items), REBUILD_CHUNK):
+            await self.db.analytics_rollups.insert_many(items[i:i + REBUILD_CHUNK], ordered=False)
+        await self.db.analytics_hll.delete_many({"day": {"$gte": since_day}})
+        if sketches:
+            await self.db.analytics_hll.insert_many([
+                {"_id": f"{kind}:{day}:rebuild", "kind": kind, "day": day, "instance": "rebuild",
+                 "registers": bytes(hll.registers)}
+                for (kind, day), hll in sketches.items()
+            ], ordered=False)
+        self._sketches = {k: v for k, v in self._sketches.items() if k[1] < since_day}
+        r = get_redis()
+        if r:
+            try:
+                pipe = r.pipeline(transaction=False)
+                for key in r.scan_iter("aevt:hll:*"):
+                    if key.rsplit(":", 1)[-1] >= since_day:
+                        pipe.delete(key)
+                for (kind, day), ids in users.items():
+                    key = HLL_KEY.format(kind=kind, day=day)
+                    ids = list(ids)
+                    for i in range(0, len(ids), REBUILD_CHUNK):
+                        pipe.pfadd(key, *ids[i:i + REBUILD_CHUNK])
+                    pipe.expire(key, HLL_TTL)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Event pipeline: redis sketch rebuild failed: {e}")
+        result = {"since": since_day, "rollups": len(items), "sketches": len(sketches),
+                  "seconds": round(time.monotonic() - started, 2)}
+        logger.info(f"ANALYTICS ROLLUPS REBUILT: {result}")
+        return result
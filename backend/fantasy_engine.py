@@ -3,14 +3,30 @@ Fantasy Team Engine for FREE11
 Dream11-style team builder with real EntitySport data.
 Credit system, Captain/VC, role constraints, points calculation from scorecard.
 """
+import asyncio
 import uuid
+import time
 import logging
 from datetime import datetime, timezone
 from typing import Optional, Dict, List
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from job_runner import JobLease
+from leaderboard_store import leaderboard_store
+from redis_cache import cache_get, cache_set, cache_delete
 
 logger = logging.getLogger(__name__)
 
+# ── Rankings ──
+RANKINGS_PAGE_MAX = 200
+RANKINGS_BUILD_CHUNK = 1000
+RANKINGS_LEASE_TTL = 300    # per-match build lease; renewed on every chunk
+TTL_RANKINGS = 60           # page cache; dropped on every rebuild
+TTL_PLAYER_POINTS = 3600    # per-match player points table; dropped on rescoring
+LOCAL_PLAYER_POINTS_TTL = 30
+SCORE_WRITE_CHUNK = 1000
+
 # ── Team Constraints ──
 TEAM_SIZE = 11
 MAX_CREDITS = 100.0
@@ -53,8 +69,10 @@ POINTS = {
 
 
 class FantasyEngine:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncIOMotorDatabase, entitysport=None):
         self.db = db
+        self._player_points: Dict[str, tuple] = {}   # match_id → (loaded_at, table); no-Redis fallback
+        self.entitysport = entitysport   # squad source for the compiled lineup validator
 
     # ── Team Validation ──
 
@@ -113,10 +131,23 @@ class FantasyEngine:
         captain_id: str,
         vc_id: str,
     ) -> Dict:
-        """Create a fantasy team after validation"""
-        validation = self.validate_team(players, captain_id, vc_id)
-        if not validation["valid"]:
-            raise ValueError("; ".join(validation["errors"]))
+        """Create a fantasy team after validation.
+        When the match squad is available, roles/teams/credits come from the squad
+        (client-sent values must match) and identical lineups are rejected per user."""
+        lineup_key = None
+        squad = await self._compiled_squad(match_id)
+        if squad:
+            validation = squad.validate(
+                [p.get("player_id") for p in players], captain_id, vc_id, claimed=players)
+            if not validation["valid"]:
+                raise ValueError("; ".join(validation["errors"]))
+            lineup_key = validation["lineup_key"]
+            trusted = {str(p["player_id"]): p for p in squad.decode(validation["mask"])}
+            players = [trusted[str(p["player_id"])] for p in players]
+        else:
+            validation = self.validate_team(players, captain_id, vc_id)
+            if not validation["valid"]:
+                raise ValueError("; ".join(validation["errors"]))
 
         # Check match hasn't started
         match = await self.db.matches.find_one({"match_id": match_id}, {"_id": 0})
@@ -130,6 +161,11 @@ class FantasyEngine:
         if existing >= 3:
             raise ValueError("Max 3 teams per match")
 
+        if lineup_key and await self.db.fantasy_teams.find_one(
+            {"match_id": match_id, "lineup_key": lineup_key, "user_id": user_id}, {"_id": 1}
+        ):
+            raise ValueError("You already have this exact team for this match")
+
         now = datetime.now(timezone.utc).isoformat()
         team = {
             "id": str(uuid.uuid4()),
@@ -149,9 +185,9 @@ class FantasyEngine:
             ],
             "captain_id": captain_id,
             "vc_id": vc_id,
+            "lineup_key": lineup_key,
             "total_credits": round(sum(p.get("credit", 0) for p in players), 1),
             "total_points": 0,
-            "points_breakdown": {},
             "status": "active",
             "locked": False,
             "created_at": now,
@@ -162,6 +198,42 @@ class FantasyEngine:
         logger.info(f"FANTASY TEAM: user={user_id} match={match_id} team={team['id']}")
         return {k: v for k, v in team.items() if k != "_id"}
 
+    async def _compiled_squad(self, match_id: str):
+        if self.entitysport is None:
+            return None
+        from lineup_validator import get_compiled_squad
+        try:
+            return await get_compiled_squad(match_id, self.entitysport)
+        except Exception as e:
+            logger.warning(f"Squad compile failed for {match_id}, using client data: {e}")
+            return None
+
+    async def find_identical_lineups(
+        self, match_id: str, player_ids: List[str], captain_id: str, vc_id: str,
+        user_id: Optional[str] = None,
+    ) -> Dict:
+        """'This exact team already exists' lookup — one indexed count on lineup_key."""
+        squad = await self._compiled_squad(match_id)
+        if not squad:
+            raise ValueError("Squad not available for this match")
+        validation = squad.validate(player_ids, captain_id, vc_id)
+        if not validation["valid"]:
+            raise ValueError("; ".join(validation["errors"]))
+        key = validation["lineup_key"]
+        total = await self.db.fantasy_teams.count_documents({"match_id": match_id, "lineup_key": key})
+        mine = 0
+        if user_id:
+            mine = await self.db.fantasy_teams.count_documents(
+                {"match_id": match_id, "lineup_key": key, "user_id": user_id})
+        return {
+            "match_id": match_id,
+            "lineup_key": key,
+            "exists": total > 0,
+            "identical_teams": total,
+            "yours": mine > 0,
+            "total_credits": validation["total_credits"],
+        }
+
     # ── Lock Teams ──
 
     async def lock_teams_for_match(self, match_id: str) -> int:
@@ -174,62 +246,155 @@ class FantasyEngine:
     # ── Points Calculation ──
 
     async def calculate_points(self, match_id: str, scorecard: Dict) -> List[Dict]:
-        """Calculate fantasy points for all teams in a match using real scorecard data"""
-        teams = await self.db.fantasy_teams.find(
-            {"match_id": match_id, "status": {"$in": ["active", "locked"]}},
-            {"_id": 0}
-        ).to_list(10000)
+        """Calculate fantasy points for all teams in a match using real scorecard data.
+        Per-player points/perf are written once to fantasy_player_points; teams only get
+        their total (the breakdown is assembled at read time)."""
+        # Build player performance map from scorecard
+        perf = self._extract_performance(scorecard)
+        base = {pid: self._calc_player_points(p) for pid, p in perf.items()}
+        now = datetime.now(timezone.utc).isoformat()
+        await self.db.fantasy_player_points.update_one(
+            {"match_id": match_id},
+            {"$set": {
+                "match_id": match_id,
+                "players": {pid: {"points": base[pid], "perf": perf[pid]} for pid in perf},
+                "updated_at": now,
+            }},
+            upsert=True,
+        )
+        cache_delete(f"fantasy_pp:{match_id}")
+        self._player_points.pop(match_id, None)
 
-        if not teams:
+        cursor = self.db.fantasy_teams.find(
+            {"match_id": match_id, "status": {"$in": ["active", "locked"]}},
+            {"_id": 0, "id": 1, "user_id": 1, "contest_id": 1, "captain_id": 1, "vc_id": 1, "players.player_id": 1},
+        )
+        results = []
+        ops = []
+        contest_ids = set()
+        async for team in cursor:
+            if team.get("contest_id"):
+                contest_ids.add(team["contest_id"])
+            total = self._team_total(base, team)
+            ops.append(UpdateOne(
+                {"id": team["id"]},
+                {"$set": {"total_points": total, "status": "scored", "updated_at": now},
+                 "$unset": {"points_breakdown": ""}},
+            ))
+            results.append({"team_id": team["id"], "user_id": team["user_id"], "total_points": total})
+            if len(ops) >= SCORE_WRITE_CHUNK:
+                await self.db.fantasy_teams.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            await self.db.fantasy_teams.bulk_write(ops, ordered=False)
+
+        if not results:
             return []
+        # Contest boards were built from pre-scoring totals → rebuild on next read
+        for contest_id in contest_ids:
+            leaderboard_store.invalidate(f"fantasy_contest:{contest_id}")
+        logger.info(f"FANTASY SCORING: match={match_id} teams_scored={len(results)}")
+        await self.build_rankings(match_id)
+        return sorted(results, key=lambda x: -x["total_points"])
 
-        # Build player performance map from scorecard
+    async def score_live(self, match_id: str, scorecard: Dict) -> int:
+        """Live scoring: refresh running totals from an in-progress scorecard and move the
+        changed teams on the live board. Teams stay active / locked — calculate_points()
+        does the final scoring. Returns teams moved."""
+        if await self.db.fantasy_ranking_builds.find_one({"match_id": match_id}, {"_id": 1}):
+            return 0
         perf = self._extract_performance(scorecard)
+        if not perf:
+            return 0
+        base = {pid: self._calc_player_points(p) for pid, p in perf.items()}
+        now = datetime.now(timezone.utc).isoformat()
+        cursor = self.db.fantasy_teams.find(
+            {"match_id": match_id, "status": {"$in": ["active", "locked"]}},
+            {"_id": 0, "id": 1, "total_points": 1, "captain_id": 1, "vc_id": 1, "players.player_id": 1},
+        )
+        ops = []
+        board_points: Dict[str, int] = {}
+        moved = 0
+        async for team in cursor:
+            total = self._team_total(base, team)
+            if total == team.get("total_points", 0):
+                continue
+            ops.append(UpdateOne(
+                {"id": team["id"], "status": {"$in": ["active", "locked"]}},
+                {"$set": {"total_points": total, "live_updated_at": now}},
+            ))
+            board_points[team["id"]] = total
+            moved += 1
+            if len(ops) >= SCORE_WRITE_CHUNK:
+                await self.db.fantasy_teams.bulk_write(ops, ordered=False)
+                self.update_live_points_many(match_id, board_points)
+                ops, board_points = [], {}
+        if ops:
+            await self.db.fantasy_teams.bulk_write(ops, ordered=False)
+            self.update_live_points_many(match_id, board_points)
+        if moved:
+            cache_delete(f"fantasy_rank:{match_id}:*")
+            logger.info(f"FANTASY LIVE POINTS: match={match_id} teams_moved={moved}")
+        return moved
+
+    def _team_total(self, base: Dict[str, int], team: Dict) -> int:
+        return sum(
+            self._team_player_points(base.get(tp["player_id"], 0), tp["player_id"], team)
+            for tp in team.get("players", [])
+        )
 
-        results = []
+    @staticmethod
+    def _team_player_points(pts: int, player_id: str, team: Dict) -> int:
+        """Apply C/VC multiplier to a player's base points for one team"""
+        if player_id == team.get("captain_id"):
+            return int(pts * POINTS["captain_multiplier"])
+        if player_id == team.get("vc_id"):
+            return int(pts * POINTS["vc_multiplier"])
+        return pts
+
+    async def get_player_points(self, match_id: str) -> Optional[Dict]:
+        """Per-match player points table ({player_id: {points, perf}}), cached."""
+        local = self._player_points.get(match_id)
+        if local and time.monotonic() - local[0] < LOCAL_PLAYER_POINTS_TTL:
+            return local[1]
+        cache_key = f"fantasy_pp:{match_id}"
+        cached = cache_get(cache_key)
+        if cached is not None:
+            table = cached.get("players")
+        else:
+            doc = await self.db.fantasy_player_points.find_one({"match_id": match_id}, {"_id": 0, "players": 1})
+            if not doc:
+                return None
+            table = doc["players"]
+            cache_set(cache_key, {"players": table}, TTL_PLAYER_POINTS)
+        self._player_points[match_id] = (time.monotonic(), table)
+        return table
+
+    async def _attach_breakdowns(self, teams: List[Dict]) -> List[Dict]:
+        """Assemble points_breakdown for scored teams from the per-match table."""
+        tables: Dict[str, Optional[Dict]] = {}
         for team in teams:
-            total = 0
+            if team.get("status") != "scored":
+                continue
+            mid = team["match_id"]
+            if mid not in tables:
+                tables[mid] = await self.get_player_points(mid)
+            table = tables[mid]
+            if table is None:
+                continue   # Legacy team scored before the table existed — keeps its stored breakdown
             breakdown = {}
-
-            for tp in team["players"]:
+            for tp in team.get("players", []):
                 pid = tp["player_id"]
-                player_perf = perf.get(pid, {})
-                pts = self._calc_player_points(player_perf)
-
-                # Apply C/VC multiplier
-                if tp.get("is_captain"):
-                    pts = int(pts * POINTS["captain_multiplier"])
-                elif tp.get("is_vc"):
-                    pts = int(pts * POINTS["vc_multiplier"])
-
+                row = table.get(pid, {})
                 breakdown[pid] = {
                     "name": tp.get("name", ""),
-                    "points": pts,
-                    "is_captain": tp.get("is_captain", False),
-                    "is_vc": tp.get("is_vc", False),
-                    "perf": player_perf,
+                    "points": self._team_player_points(row.get("points", 0), pid, team),
+                    "is_captain": pid == team.get("captain_id"),
+                    "is_vc": pid == team.get("vc_id"),
+                    "perf": row.get("perf", {}),
                 }
-                total += pts
-
-            # Update team
-            await self.db.fantasy_teams.update_one(
-                {"id": team["id"]},
-                {"$set": {
-                    "total_points": total,
-                    "points_breakdown": breakdown,
-                    "status": "scored",
-                    "updated_at": datetime.now(timezone.utc).isoformat(),
-                }}
-            )
-
-            results.append({
-                "team_id": team["id"],
-                "user_id": team["user_id"],
-                "total_points": total,
-            })
-
-        logger.info(f"FANTASY SCORING: match={match_id} teams_scored={len(results)}")
-        return sorted(results, key=lambda x: -x["total_points"])
+            team["points_breakdown"] = breakdown
+        return teams
 
     def _extract_performance(self, scorecard: Dict) -> Dict:
         """Extract per-player performance from EntitySport scorecard"""
@@ -330,24 +495,186 @@ class FantasyEngine:
         query = {"user_id": user_id}
         if match_id:
             query["match_id"] = match_id
-        return await self.db.fantasy_teams.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
-
-    async def get_team(self, team_id: str) -> Optional[Dict]:
-        return await self.db.fantasy_teams.find_one({"id": team_id}, {"_id": 0})
-
-    async def get_match_rankings(self, match_id: str) -> List[Dict]:
-        """Get fantasy rankings for a match"""
+        teams = await self.db.fantasy_teams.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
+        return await self._attach_breakdowns(teams)
+
+    async def get_team(self, team_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        query = {"id": team_id}
+        if user_id:
+            query["user_id"] = user_id
+        team = await self.db.fantasy_teams.find_one(query, {"_id": 0})
+        if not team:
+            return None
+        return (await self._attach_breakdowns([team]))[0]
+
+    # ── Rankings ──
+    # Post-scoring: a ranking snapshot in fantasy_rankings (rank + denormalised user_name),
+    # written once per build and paged by rank cursor. Before a snapshot exists (live
+    # scoring), rankings come from an incrementally updated leaderboard_store board.
+
+    async def build_rankings(self, match_id: str) -> int:
+        """Materialise the ranking for a match from fantasy_teams. Returns teams ranked.
+        Builds of one match run one at a time across processes (a per-build lease), so a
+        build's swap never deletes rows another build is still writing."""
+        build_id = uuid.uuid4().hex
+        lease, lease_name = JobLease(self.db, owner=build_id), f"fantasy_rankings:{match_id}"
+        while not await lease.acquire(lease_name, RANKINGS_LEASE_TTL):
+            await asyncio.sleep(0.5)
+        try:
+            return await self._build_rankings(match_id, build_id, lease, lease_name)
+        finally:
+            await lease.release(lease_name)
+
+    async def _build_rankings(self, match_id: str, build_id: str, lease: JobLease, lease_name: str) -> int:
+        now = datetime.now(timezone.utc).isoformat()
+        cursor = self.db.fantasy_teams.aggregate([
+            {"$match": {"match_id": match_id, "status": {"$in": ["active", "locked", "scored"]}}},
+            {"$sort": {"total_points": -1, "created_at": 1, "id": 1}},
+            {"$project": {"_id": 0, "id": 1, "user_id": 1, "total_points": 1, "captain_id": 1, "vc_id": 1}},
+        ], allowDiskUse=True)
+
+        rank = 0
+        batch: List[Dict] = []
+
+        async def flush():
+            user_ids = list({t["user_id"] for t in batch})
+            users = await self.db.users.find(
+                {"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "name": 1}
+            ).to_list(len(user_ids))
+            names = {u["id"]: u.get("name", "Unknown") for u in users}
+            await self.db.fantasy_rankings.insert_many([
+                {**t, "user_name": names.get(t["user_id"], "Unknown")} for t in batch
+            ], ordered=False)
+            batch.clear()
+            if not await lease.acquire(lease_name, RANKINGS_LEASE_TTL):
+                raise RuntimeError(f"Ranking build lease lost for match {match_id}")
+
+        async for team in cursor:
+            rank += 1
+            batch.append({
+                "match_id": match_id,
+                "build_id": build_id,
+                "rank": rank,
+                "team_id": team["id"],
+                "user_id": team["user_id"],
+                "total_points": team.get("total_points", 0),
+                "captain_id": team.get("captain_id"),
+                "vc_id": team.get("vc_id"),
+            })
+            if len(batch) >= RANKINGS_BUILD_CHUNK:
+                await flush()
+        if batch:
+            await flush()
+
+        # Swap the new build in, then drop older builds
+        await self.db.fantasy_ranking_builds.update_one(
+            {"match_id": match_id},
+            {"$set": {"match_id": match_id, "build_id": build_id, "total": rank, "built_at": now}},
+            upsert=True,
+        )
+        await self.db.fantasy_rankings.delete_many({"match_id": match_id, "build_id": {"$ne": build_id}})
+        cache_delete(f"fantasy_rank:{match_id}:*")
+        leaderboard_store.invalidate(f"fantasy_match:{match_id}")
+        logger.info(f"FANTASY RANKINGS BUILT: match={match_id} teams={rank}")
+        return rank
+
+    async def get_rankings(self, match_id: str, cursor: Optional[str] = None, limit: int = 50) -> Dict:
+        """One page of match rankings. `cursor` is the opaque next_cursor of the previous page."""
+        limit = max(1, min(limit, RANKINGS_PAGE_MAX))
+        after = int(cursor) if cursor and cursor.isdigit() else 0
+        cache_key = f"fantasy_rank:{match_id}:{after}:{limit}"
+        cached = cache_get(cache_key)
+        if cached:
+            return cached
+
+        build = await self.db.fantasy_ranking_builds.find_one({"match_id": match_id}, {"_id": 0})
+        if not build:
+            return await self._live_rankings(match_id, after, limit)
+
+        rows = await self.db.fantasy_rankings.find(
+            {"match_id": match_id, "build_id": build["build_id"], "rank": {"$gt": after}},
+            {"_id": 0, "build_id": 0}
+        ).sort("rank", 1).limit(limit).to_list(limit)
+        page = {
+            "match_id": match_id,
+            "rankings": rows,
+            "total": build.get("total", 0),
+            "next_cursor": str(rows[-1]["rank"]) if rows and rows[-1]["rank"] < build.get("total", 0) else None,
+            "built_at": build.get("built_at"),
+        }
+        cache_set(cache_key, page, TTL_RANKINGS)
+        return page
+
+    async def get_team_ranks(self, match_id: str, user_id: str) -> List[Dict]:
+        """Rank of each of the user's teams in a match."""
+        build = await self.db.fantasy_ranking_builds.find_one({"match_id": match_id}, {"_id": 0})
+        if build:
+            return await self.db.fantasy_rankings.find(
+                {"match_id": match_id, "build_id": build["build_id"], "user_id": user_id},
+                {"_id": 0, "build_id": 0}
+            ).sort("rank", 1).to_list(10)
+
+        board = f"fantasy_match:{match_id}"
+        await leaderboard_store.ensure(board, lambda: self._load_live_board(match_id))
+        teams = await self.db.fantasy_teams.find(
+            {"user_id": user_id, "match_id": match_id}, {"_id": 0, "id": 1, "total_points": 1}
+        ).to_list(10)
+        ranks = [
+            {"match_id": match_id, "team_id": t["id"], "user_id": user_id,
+             "total_points": t.get("total_points", 0), "rank": leaderboard_store.rank(board, t["id"])}
+            for t in teams
+        ]
+        return sorted(ranks, key=lambda r: r["rank"] or 0)
+
+    def update_live_points_many(self, match_id: str, points: Dict[str, float]):
+        """Live scoring hook: move a chunk of teams in the live board with pipelined writes."""
+        board = f"fantasy_match:{match_id}"
+        if not leaderboard_store.upsert_many(board, points) and leaderboard_store.is_loaded(board):
+            leaderboard_store.invalidate(board)
+
+    async def _load_live_board(self, match_id: str):
         teams = await self.db.fantasy_teams.find(
             {"match_id": match_id, "status": {"$in": ["active", "locked", "scored"]}},
-            {"_id": 0}
-        ).sort("total_points", -1).to_list(10000)
-
-        for i, t in enumerate(teams):
-            t["rank"] = i + 1
-            user = await self.db.users.find_one({"id": t["user_id"]}, {"_id": 0, "name": 1})
-            t["user_name"] = user.get("name", "Unknown") if user else "Unknown"
+            {"_id": 0, "id": 1, "user_id": 1, "total_points": 1, "created_at": 1}
+        ).to_list(None)
+        user_ids = list({t["user_id"] for t in teams})
+        users = await self.db.users.find(
+            {"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "name": 1}
+        ).to_list(len(user_ids))
+        names = {u["id"]: u.get("name", "Unknown") for u in users}
+        rows = [
+            {"member": t["id"], "points": t.get("total_points", 0), "tiebreak": t.get("created_at") or "",
+             "name": names.get(t["user_id"], "Unknown")}
+            for t in teams
+        ]
+        return rows, {}
+
+    async def _live_rankings(self, match_id: str, after: int, limit: int) -> Dict:
+        board = f"fantasy_match:{match_id}"
+        await leaderboard_store.ensure(board, lambda: self._load_live_board(match_id))
+        total = leaderboard_store.size(board)
+        rows = [
+            {"match_id": match_id, "rank": r["rank"], "team_id": r["member"],
+             "user_name": r["name"] or "Unknown", "total_points": r["points"]}
+            for r in leaderboard_store.window(board, after, limit)
+        ]
+        return {
+            "match_id": match_id,
+            "rankings": rows,
+            "total": total,
+            "next_cursor": str(rows[-1]["rank"]) if rows and rows[-1]["rank"] < total else None,
+            "built_at": None,
+        }
 
-        return teams
+    async def ensure_indexes(self):
+        await self.db.fantasy_rankings.create_index(
+            [("match_id", 1), ("build_id", 1), ("rank", 1)], name="frank_match_build_rank")
+        await self.db.fantasy_rankings.create_index(
+            [("match_id", 1), ("build_id", 1), ("user_id", 1)], name="frank_match_build_user")
+        await self.db.fantasy_ranking_builds.create_index("match_id", unique=True, name="frank_build_match")
+        await self.db.fantasy_teams.create_index(
+            [("match_id", 1), ("lineup_key", 1), ("user_id", 1)], name="fteam_match_lineup_user")
+        await self.db.fantasy_player_points.create_index("match_id", unique=True, name="fpp_match")
 
     async def compare_teams(self, team_id_1: str, team_id_2: str) -> Dict:
         """Compare two fantasy teams"""
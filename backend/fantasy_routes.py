@@ -3,7 +3,7 @@ Fantasy Team Contests for FREE11
 Dream11-style player selection and scoring
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict
 from datetime import datetime, timezone, timedelta
@@ -12,6 +12,7 @@ import random
 
 # Import from server.py
 from server import db, get_current_user, add_coins, User
+from leaderboard_store import leaderboard_store
 
 fantasy_router = APIRouter(prefix="/fantasy", tags=["Fantasy"])
 
@@ -755,6 +756,7 @@ async def create_fantasy_team(
     )
     
     await db.fantasy_teams.insert_one(team.model_dump())
+    leaderboard_store.upsert(f"fantasy_contest:{request.contest_id}", team.id, 0, team.created_at, current_user.name)
     
     # Update contest entry count
     await db.fantasy_contests.update_one(
@@ -916,6 +918,10 @@ async def join_contest_with_code(
         {"id": team_id},
         {"$set": {"contest_id": contest["id"]}}
     )
+    if team.get("contest_id"):
+        leaderboard_store.remove(f"fantasy_contest:{team['contest_id']}", team_id)
+    leaderboard_store.upsert(f"fantasy_contest:{contest['id']}", team_id, _team_points(team),
+                             team.get("created_at", ""), current_user.name)
     
     # Increment entries
     await db.fantasy_contests.update_one(
@@ -928,36 +934,64 @@ async def join_contest_with_code(
         "contest": contest
     }
 
+def _team_points(team: dict):
+    """Scored teams carry total_points (FantasyEngine); legacy teams only `points`."""
+    return team.get("total_points", team.get("points", 0))
+
+
+async def _load_contest_leaderboard(contest_id: str):
+    teams = await db.fantasy_teams.find(
+        {"contest_id": contest_id},
+        {"_id": 0, "id": 1, "user_id": 1, "points": 1, "total_points": 1, "created_at": 1}
+    ).to_list(None)
+
+    user_ids = list({t["user_id"] for t in teams})
+    users = await db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(len(user_ids))
+    user_map = {u["id"]: u.get("name", "Anonymous") for u in users}
+
+    rows = [
+        {"member": t["id"], "points": _team_points(t), "tiebreak": t.get("created_at") or "",
+         "name": user_map.get(t["user_id"], "Anonymous")}
+        for t in teams
+    ]
+    return rows, {}
+
+
 @fantasy_router.get("/contests/{contest_id}/leaderboard")
-async def get_contest_leaderboard(contest_id: str):
+async def get_contest_leaderboard(contest_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=500)):
     """Get leaderboard for a contest"""
     
     contest = await db.fantasy_contests.find_one({"id": contest_id}, {"_id": 0})
     if not contest:
         raise HTTPException(status_code=404, detail="Contest not found")
     
-    # Get all teams in contest sorted by points
-    teams = await db.fantasy_teams.find(
-        {"contest_id": contest_id},
-        {"_id": 0}
-    ).sort("points", -1).to_list(100)
-    
-    # Enrich with user names
-    leaderboard = []
-    for rank, team in enumerate(teams, 1):
-        user = await db.users.find_one({"id": team["user_id"]}, {"_id": 0, "name": 1})
-        leaderboard.append({
-            "rank": rank,
-            "user_name": user.get("name", "Anonymous") if user else "Anonymous",
-            "team_id": team["id"],
-            "points": team["points"],
-            "coins_won": team.get("coins_won", 0)
-        })
+    # Rank index (Redis ZSET / skip list), rebuilt from fantasy_teams when missing
+    board = f"fantasy_contest:{contest_id}"
+    await leaderboard_store.ensure(board, lambda: _load_contest_leaderboard(contest_id))
+    rows = leaderboard_store.window(board, offset, limit)
+    
+    # coins_won for the visible page only
+    won = await db.fantasy_teams.find(
+        {"id": {"$in": [r["member"] for r in rows]}},
+        {"_id": 0, "id": 1, "coins_won": 1}
+    ).to_list(len(rows))
+    won_map = {t["id"]: t.get("coins_won", 0) for t in won}
+    
+    leaderboard = [
+        {
+            "rank": r["rank"],
+            "user_name": r["name"] or "Anonymous",
+            "team_id": r["member"],
+            "points": r["points"],
+            "coins_won": won_map.get(r["member"], 0)
+        }
+        for r in rows
+    ]
     
     return {
         "contest": contest,
         "leaderboard": leaderboard,
-        "total_entries": len(teams)
+        "total_entries": leaderboard_store.size(board)
     }
 
 @fantasy_router.get("/points-system")
@@ -72,42 +72,36 @@ async def send_match_starting_campaign(db, fcm_service):
         logger.error("match_starting campaign error: %s", e)
 
 
-async def send_coin_expiry_campaign(db, fcm_service):
-    """Push to users whose coins expire in exactly 7 days."""
+async def send_coin_expiry_campaign(db, fcm_service, days_left: int = 7):
+    """Push + in-app notice to every user with bonus coins expiring in `days_left` days.
+    Reads the expiry buckets by day (indexed), one chunk of users at a time."""
     try:
-        now        = datetime.now(timezone.utc)
-        target_day = (now + timedelta(days=7)).date().isoformat()
-
-        users = await db.users.find(
-            {"coin_expiry_date": {"$regex": f"^{target_day}"}},
-            {"_id": 0, "id": 1, "coins_balance": 1},
-        ).to_list(5000)
-
-        if not users:
-            return
-
-        user_ids = [u["id"] for u in users]
-        tokens   = await db.fcm_tokens.find(
-            {"user_id": {"$in": user_ids}}, {"_id": 0, "token": 1, "user_id": 1},
-        ).to_list(5000)
-
-        all_tokens = [t["token"] for t in tokens if t.get("token")]
-        if all_tokens:
-            await fcm_service.send_bulk(
-                tokens=all_tokens[:500],
-                title="Your coins expire in 7 days! ⏰",
-                body="Redeem your FREE Coins for Flipkart vouchers, Uber credits, and more before they expire.",
-                data={"type": "coin_expiry", "days_left": "7", "deep_link": "/shop"},
-            )
-
-        # Also store in-app for each user
-        for uid in user_ids[:200]:
-            await _store_in_app(db, uid, "coin_expiry",
-                "Your coins expire in 7 days! ⏰",
-                "Redeem for vouchers and groceries before they expire.",
-                "/shop")
-
-        logger.info("Coin-expiry campaign sent: %s users", len(user_ids))
+        from v2_engines import coin_expiry
+        target_day = (datetime.now(timezone.utc) + timedelta(days=days_left)).date().isoformat()
+        title = f"Your coins expire in {days_left} days! ⏰"
+        users = 0
+        async for chunk in coin_expiry.expiring_on(target_day):
+            expiring = {b["user_id"]: b["remaining"] for b in chunk if b.get("remaining", 0) > 0}
+            if not expiring:
+                continue
+            bodies = {uid: f"{amount} FREE Coins expire on {target_day}. Redeem them for vouchers and groceries first."
+                      for uid, amount in expiring.items()}
+            tokens = await db.fcm_tokens.find(
+                {"user_id": {"$in": list(expiring)}}, {"_id": 0, "token": 1, "user_id": 1},
+            ).to_list(None)
+            await fcm_service.send_many([
+                {"token": t["token"], "title": title, "body": bodies[t["user_id"]],
+                 "data": {"type": "coin_expiry", "days_left": str(days_left), "deep_link": "/shop"}}
+                for t in tokens if t.get("token")
+            ])
+            now = datetime.now(timezone.utc).isoformat()
+            await db.notifications.insert_many([{
+                "id": str(uuid.uuid4()), "user_id": uid, "type": "coin_expiry", "title": title,
+                "body": body, "deep_link": "/shop", "read": False, "created_at": now,
+            } for uid, body in bodies.items()], ordered=False)
+            users += len(expiring)
+
+        logger.info("Coin-expiry campaign sent: %s users", users)
     except Exception as e:
         logger.error("coin_expiry campaign error: %s", e)
 
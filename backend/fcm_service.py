@@ -133,29 +133,32 @@ class FCMService:
 
     async def send_bulk(self, tokens: List[str], title: str, body: str, data: Optional[Dict] = None):
         """Send push to a list of FCM tokens directly (for campaign use)."""
-        if not tokens or not _fcm_initialized:
-            logger.info("FCM dev mode: bulk push '%s' to %d tokens", title, len(tokens))
+        await self.send_many([{"token": tok, "title": title, "body": body, "data": data} for tok in tokens])
+
+    async def send_many(self, pushes: List[Dict]):
+        """Send individually rendered pushes ({token, title, body, data}) in FCM batches."""
+        if not pushes or not _fcm_initialized:
+            logger.info("FCM dev mode: bulk push to %d tokens", len(pushes))
             return
         from firebase_admin import messaging
-        messages = [
-            messaging.Message(
-                notification=messaging.Notification(title=title, body=body),
-                data={k: str(v) for k, v in (data or {}).items()},
-                token=tok,
-            )
-            for tok in tokens
-        ]
         # Send in batches of 500 (FCM limit)
-        for i in range(0, len(messages), 500):
-            batch = messages[i:i + 500]
+        for i in range(0, len(pushes), 500):
+            batch = pushes[i:i + 500]
+            messages = [
+                messaging.Message(
+                    notification=messaging.Notification(title=p["title"], body=p["body"]),
+                    data={k: str(v) for k, v in (p.get("data") or {}).items()},
+                    token=p["token"],
+                )
+                for p in batch
+            ]
             try:
-                resp = messaging.send_each(batch)
+                resp = messaging.send_each(messages)
                 logger.info("FCM bulk batch %d: %d sent, %d failed", i // 500, resp.success_count, resp.failure_count)
                 # Deactivate invalid tokens
-                for idx, r in enumerate(resp.responses):
-                    if not r.success:
-                        bad_token = tokens[i + idx]
-                        await self.db.fcm_tokens.update_one({"token": bad_token}, {"$set": {"active": False}})
+                bad = [batch[idx]["token"] for idx, r in enumerate(resp.responses) if not r.success]
+                if bad:
+                    await self.db.fcm_tokens.update_many({"token": {"$in": bad}}, {"$set": {"active": False}})
             except Exception as e:
                 logger.error("FCM send_each error: %s", e)
 
@@ -21,6 +21,7 @@ import asyncio
 
 # Import from server.py
 from server import db, get_current_user, User
+from streaming_export import export_response, find_batches, since_query
 
 logger = logging.getLogger(__name__)
 
@@ -892,14 +893,26 @@ async def get_failed_fulfillments(
         "period_days": days
     }
 
+FULFILLMENT_EXPORT_FIELDS = (
+    "id", "order_id", "user_email", "product_name", "amount", "provider", "status", "voucher_code",
+    "delivery_provider_id", "delivery_timestamp_utc", "delivery_attempt_count", "last_failure_reason",
+    "created_at", "delivered_at",
+)
+
 @fulfillment_router.get("/admin/export/csv")
 async def export_fulfillments_csv(
     current_user: User = Depends(get_current_user),
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    status: Optional[str] = None
+    status: Optional[str] = None,
+    format: str = "json",
+    gzip: bool = False,
+    since: Optional[str] = None,
+    since_id: Optional[str] = None,
 ):
-    """Export fulfillments for reconciliation (CSV-ready JSON)"""
+    """Export fulfillments for reconciliation, streamed oldest first.
+    format=json keeps the CSV-ready JSON envelope; csv / ndjson download as files.
+    since / since_id (created_at / id of the last row received) resume an export."""
     query = {}
     
     if start_date:
@@ -912,37 +925,23 @@ async def export_fulfillments_csv(
     if status:
         query["status"] = status
     
-    fulfillments = await db.fulfillments.find(
-        query,
-        {
-            "_id": 0,
-            "id": 1,
-            "order_id": 1,
-            "user_email": 1,
-            "product_name": 1,
-            "amount": 1,
-            "provider": 1,
-            "status": 1,
-            "voucher_code": 1,
-            "delivery_provider_id": 1,
-            "delivery_timestamp_utc": 1,
-            "delivery_attempt_count": 1,
-            "last_failure_reason": 1,
-            "created_at": 1,
-            "delivered_at": 1
-        }
-    ).sort("created_at", -1).limit(10000).to_list(10000)
-    
-    return {
-        "export_date": datetime.now(timezone.utc).isoformat(),
-        "total_records": len(fulfillments),
-        "filters": {
-            "start_date": start_date,
-            "end_date": end_date,
-            "status": status
+    batches = find_batches(
+        db.fulfillments,
+        since_query(query, "created_at", since, since_id),
+        {"_id": 0, **{f: 1 for f in FULFILLMENT_EXPORT_FIELDS}},
+        [("created_at", 1), ("id", 1)],
+    )
+    return export_response(
+        batches, format, "fulfillments", columns=FULFILLMENT_EXPORT_FIELDS, gzip=gzip,
+        envelope={
+            "export_date": datetime.now(timezone.utc).isoformat(),
+            "filters": {
+                "start_date": start_date,
+                "end_date": end_date,
+                "status": status
+            },
         },
-        "data": fulfillments
-    }
+    )
 
 # ==================== PROVIDER STATUS ====================
 
@@ -14,7 +14,7 @@ import random
 import json
 import logging
 
-from server import db, get_current_user, add_coins, User
+from server import db, get_current_user, add_coins_many, User
 from websocket_manager import game_manager, GameSession
 from card_game_logic import (
     get_teen_patti_hand_name, get_poker_hand_name, get_best_poker_hand
@@ -407,15 +407,16 @@ async def complete_game(
     results = simulate_game_result(game_type, room.get("player_ids", []))
     winner_id = results[0]["user_id"]
     
-    # Award coins to all players
+    # Award coins to all players; results carry what the daily cap actually credited
+    granted = await add_coins_many([
+        (result["user_id"], result["coins_earned"], "earned",
+         f"{GAME_CONFIG[game_type]['name']} - Rank #{result['rank']}")
+        for result in results
+    ])
+    for result, txn in zip(results, granted):
+        result["coins_earned"] = txn["amount"] if txn else 0
+    
     for result in results:
-        await add_coins(
-            result["user_id"],
-            result["coins_earned"],
-            "earned",
-            f"{GAME_CONFIG[game_type]['name']} - Rank #{result['rank']}"
-        )
-        
         # Update player stats
         existing_stats = await db.game_stats.find_one({
             "user_id": result["user_id"],
@@ -753,6 +754,7 @@ async def _award_game_coins(session: GameSession):
     # Reward config
     rewards = GAME_CONFIG[game_type]["coins_reward"]
     
+    credits = []
     for i, player_id in enumerate(player_ids):
         if player_id == winner_id:
             coins = rewards["win"]
@@ -763,10 +765,13 @@ async def _award_game_coins(session: GameSession):
         else:
             coins = rewards["participate"]
             description = f"{GAME_CONFIG[game_type]['name']} - Participated"
-        
-        # Add coins to user
-        await add_coins(player_id, coins, "earned", description)
-        
+        credits.append((player_id, coins, "earned", description))
+
+    # Pay in one batch; stats and results record what the daily cap actually credited
+    granted = await add_coins_many(credits)
+    paid = [txn["amount"] if txn else 0 for txn in granted]
+
+    for player_id, coins in zip(player_ids, paid):
         # Update game stats
         existing_stats = await db.game_stats.find_one({
             "user_id": player_id,
@@ -816,7 +821,7 @@ async def _award_game_coins(session: GameSession):
             {
                 "user_id": pid,
                 "rank": 1 if pid == winner_id else (2 if i == 1 else i + 1),
-                "coins_earned": rewards["win"] if pid == winner_id else (rewards["second"] if i == 1 else rewards["participate"])
+                "coins_earned": paid[i]
             }
             for i, pid in enumerate(player_ids)
         ],
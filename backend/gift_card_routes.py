@@ -13,6 +13,8 @@ import io
 
 # Import from server.py
 from server import db, get_current_user, User
+from economy_metrics import record_flow
+from earnings_rollup import record_credit
 
 gift_card_router = APIRouter(prefix="/gift-cards", tags=["Gift Cards"])
 
@@ -273,6 +275,8 @@ async def redeem_gift_card(
         {"id": current_user.id},
         {"$inc": {"coins_balance": -coin_price, "total_redeemed": coin_price}}
     )
+    from v2_engines import coin_expiry
+    await coin_expiry.consume(current_user.id, coin_price)
     
     # Record the redemption
     redemption = GiftCardRedemption(
@@ -294,6 +298,8 @@ async def redeem_gift_card(
         description=f"Redeemed {brand} gift card ₹{value}"
     )
     await db.coin_transactions.insert_one(transaction.model_dump())
+    await record_credit(db, transaction.model_dump())
+    await record_flow(db, "spent", -coin_price)
     
     return {
         "message": "Gift card redeemed successfully!",
@@ -0,0 +1,275 @@
+"""
+Group Leaderboards for FREE11
+Clan, clan-member and private-league rankings as ordered LeaderboardStore boards.
+
+Boards are (re)built from clans / clan_members / league_members and kept current
+by the routes that change them (create, join, leave, stats updates). Member docs
+carry a denormalised name + level, refreshed via `refresh_profile()`, so pages and
+"my rank" never read the users collection (legacy docs are backfilled once on load).
+"""
+import logging
+from typing import Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from leaderboard_store import leaderboard_store
+
+logger = logging.getLogger(__name__)
+
+BOARD_CLANS = "clans"
+MEMBER_FIELDS = {"_id": 0, "user_id": 1, "name": 1, "level": 1, "role": 1, "joined_at": 1,
+                 "predictions_in_clan": 1, "correct_in_clan": 1, "personal_streak": 1,
+                 "total_predictions": 1, "correct_predictions": 1, "accuracy": 1, "points": 1,
+                 "streak": 1, "best_streak": 1}
+
+
+def _clan_members_board(clan_id: str) -> str:
+    return f"clan_members:{clan_id}"
+
+
+def _league_board(league_id: str) -> str:
+    return f"league:{league_id}"
+
+
+def clan_member_accuracy(m: Dict) -> float:
+    total = m.get("predictions_in_clan", 0)
+    return round(m.get("correct_in_clan", 0) / total * 100, 1) if total > 0 else 0
+
+
+# Composite scores — several sort keys packed into one exact float, highest first
+def clan_score(c: Dict) -> float:
+    """accuracy DESC, best_streak DESC."""
+    return round(c.get("clan_accuracy", 0) * 10) * 1e6 + min(c.get("best_streak", 0), 999_999)
+
+
+def clan_member_score(m: Dict) -> float:
+    """accuracy DESC, personal streak DESC."""
+    return round(clan_member_accuracy(m) * 10) * 1e6 + min(m.get("personal_streak", 0), 999_999)
+
+
+def league_score(m: Dict, scoring_type: str) -> float:
+    acc10 = round(m.get("accuracy", 0) * 10)
+    total = m.get("total_predictions", 0)
+    if scoring_type == "total_predictions":
+        return total
+    if scoring_type == "streak":
+        return min(m.get("best_streak", 0), 999_999_999) * 1e4 + acc10          # best_streak, accuracy
+    return acc10 * 1e7 + min(total, 9_999_999)                                  # accuracy, total_predictions
+
+
+class GroupLeaderboardEngine:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db.clan_members.create_index("user_id", name="clanm_user")
+        await self.db.clan_members.create_index("clan_id", name="clanm_clan")
+        await self.db.league_members.create_index([("league_id", 1), ("user_id", 1)], name="leaguem_league_user")
+        await self.db.league_members.create_index("user_id", name="leaguem_user")
+
+    # ── Clans ─────────────────────────────────────────────────────────────────
+
+    async def clan_changed(self, clan_id: str) -> None:
+        clan = await self.db.clans.find_one(
+            {"id": clan_id}, {"_id": 0, "id": 1, "name": 1, "member_count": 1, "clan_accuracy": 1,
+                              "best_streak": 1, "created_at": 1})
+        if not clan or clan.get("member_count", 0) <= 0:
+            leaderboard_store.remove(BOARD_CLANS, clan_id)
+            return
+        leaderboard_store.upsert(BOARD_CLANS, clan_id, clan_score(clan), clan.get("created_at") or "", clan["name"])
+
+    async def clan_member_changed(self, clan_id: str, user_id: str) -> None:
+        m = await self.db.clan_members.find_one({"clan_id": clan_id, "user_id": user_id}, MEMBER_FIELDS)
+        if m:
+            leaderboard_store.upsert(_clan_members_board(clan_id), user_id, clan_member_score(m),
+                                     m.get("joined_at") or "", m.get("name"))
+
+    def clan_member_removed(self, clan_id: str, user_id: str) -> None:
+        leaderboard_store.remove(_clan_members_board(clan_id), user_id)
+
+    async def get_clan_board(self, offset: int = 0, limit: int = 20) -> List[Dict]:
+        await leaderboard_store.ensure(BOARD_CLANS, self._load_clans)
+        return await self._format_clans(leaderboard_store.window(BOARD_CLANS, offset, limit))
+
+    async def get_clan_rank(self, clan_id: str, radius: int = 5) -> Dict:
+        await leaderboard_store.ensure(BOARD_CLANS, self._load_clans)
+        rank, rows = leaderboard_store.around(BOARD_CLANS, clan_id, radius)
+        return {"clan_id": clan_id, "rank": rank, "total": leaderboard_store.size(BOARD_CLANS),
+                "entries": await self._format_clans(rows)}
+
+    async def get_clan_member_board(self, clan_id: str, offset: int = 0, limit: int = 50) -> List[Dict]:
+        board = _clan_members_board(clan_id)
+        await leaderboard_store.ensure(board, lambda: self._load_clan_members(clan_id))
+        return await self._format_clan_members(clan_id, leaderboard_store.window(board, offset, limit))
+
+    async def get_clan_member_rank(self, clan_id: str, user_id: str, radius: int = 5) -> Dict:
+        board = _clan_members_board(clan_id)
+        await leaderboard_store.ensure(board, lambda: self._load_clan_members(clan_id))
+        rank, rows = leaderboard_store.around(board, user_id, radius)
+        return {"clan_id": clan_id, "rank": rank, "total": leaderboard_store.size(board),
+                "entries": await self._format_clan_members(clan_id, rows)}
+
+    async def _load_clans(self):
+        clans = await self.db.clans.find(
+            {"member_count": {"$gt": 0}},
+            {"_id": 0, "id": 1, "name": 1, "clan_accuracy": 1, "best_streak": 1, "created_at": 1},
+        ).to_list(None)
+        return [{"member": c["id"], "points": clan_score(c), "tiebreak": c.get("created_at") or "",
+                 "name": c["name"]} for c in clans], {}
+
+    async def _load_clan_members(self, clan_id: str):
+        members = await self._backfill_profiles(
+            self.db.clan_members, await self.db.clan_members.find({"clan_id": clan_id}, MEMBER_FIELDS).to_list(None),
+            {"clan_id": clan_id})
+        return [{"member": m["user_id"], "points": clan_member_score(m), "tiebreak": m.get("joined_at") or "",
+                 "name": m.get("name")} for m in members], {}
+
+    async def _format_clans(self, rows: List[Dict]) -> List[Dict]:
+        clans = {
+            c["id"]: c async for c in self.db.clans.find(
+                {"id": {"$in": [r["member"] for r in rows]}},
+                {"_id": 0, "id": 1, "name": 1, "tag": 1, "logo_emoji": 1, "clan_accuracy": 1,
+                 "best_streak": 1, "member_count": 1, "total_predictions": 1})
+        }
+        out = []
+        for r in rows:
+            clan = clans.get(r["member"])
+            if not clan:
+                continue
+            out.append({
+                "rank": r["rank"],
+                "id": clan["id"],
+                "name": clan["name"],
+                "tag": clan["tag"],
+                "logo_emoji": clan.get("logo_emoji", "🏏"),
+                "accuracy": round(clan.get("clan_accuracy", 0), 1),
+                "best_streak": clan.get("best_streak", 0),
+                "member_count": clan.get("member_count", 0),
+                "total_predictions": clan.get("total_predictions", 0),
+            })
+        return out
+
+    async def _format_clan_members(self, clan_id: str, rows: List[Dict]) -> List[Dict]:
+        members = {
+            m["user_id"]: m async for m in self.db.clan_members.find(
+                {"clan_id": clan_id, "user_id": {"$in": [r["member"] for r in rows]}}, MEMBER_FIELDS)
+        }
+        out = []
+        for r in rows:
+            m = members.get(r["member"])
+            if not m:
+                continue
+            out.append({
+                "rank": r["rank"],
+                "user_id": m["user_id"],
+                "name": m.get("name") or r.get("name") or "Unknown",
+                "level": m.get("level", 1),
+                "role": m.get("role", "member"),
+                "accuracy": clan_member_accuracy(m),
+                "predictions": m.get("predictions_in_clan", 0),
+                "correct": m.get("correct_in_clan", 0),
+                "streak": m.get("personal_streak", 0),
+            })
+        return out
+
+    # ── Private leagues ───────────────────────────────────────────────────────
+
+    async def league_member_changed(self, league_id: str, user_id: str) -> None:
+        board = _league_board(league_id)
+        if not leaderboard_store.is_loaded(board):
+            return
+        m = await self.db.league_members.find_one({"league_id": league_id, "user_id": user_id}, MEMBER_FIELDS)
+        if m:
+            scoring_type = leaderboard_store.meta(board).get("scoring_type", "accuracy")
+            leaderboard_store.upsert(board, user_id, league_score(m, scoring_type), m.get("joined_at") or "", m.get("name"))
+
+    def league_member_removed(self, league_id: str, user_id: str) -> None:
+        leaderboard_store.remove(_league_board(league_id), user_id)
+
+    def league_removed(self, league_id: str) -> None:
+        leaderboard_store.invalidate(_league_board(league_id))
+
+    async def get_league_board(self, league: Dict, user_id: str, offset: int = 0, limit: int = 100) -> Dict:
+        board = _league_board(league["id"])
+        scoring_type = league.get("scoring_type", "accuracy")
+        await leaderboard_store.ensure(board, lambda: self._load_league(league["id"], scoring_type))
+        rows = leaderboard_store.window(board, offset, limit)
+        members = {
+            m["user_id"]: m async for m in self.db.league_members.find(
+                {"league_id": league["id"], "user_id": {"$in": [r["member"] for r in rows]}}, MEMBER_FIELDS)
+        }
+        leaderboard = []
+        for r in rows:
+            m = members.get(r["member"])
+            if not m:
+                continue
+            leaderboard.append({
+                "user_id": m["user_id"],
+                "name": m.get("name") or r.get("name") or "Anonymous",
+                "level": m.get("level", 1),
+                "points": m.get("points", 0),
+                "accuracy": m.get("accuracy", 0),
+                "total_predictions": m.get("total_predictions", 0),
+                "correct_predictions": m.get("correct_predictions", 0),
+                "streak": m.get("streak", 0),
+                "best_streak": m.get("best_streak", 0),
+                "rank": r["rank"],
+            })
+        return {
+            "leaderboard": leaderboard,
+            "scoring_type": scoring_type,
+            "my_rank": leaderboard_store.rank(board, user_id),
+            "total": leaderboard_store.size(board),
+        }
+
+    async def _load_league(self, league_id: str, scoring_type: str):
+        members = await self._backfill_profiles(
+            self.db.league_members,
+            await self.db.league_members.find({"league_id": league_id}, MEMBER_FIELDS).to_list(None),
+            {"league_id": league_id})
+        return [{"member": m["user_id"], "points": league_score(m, scoring_type), "tiebreak": m.get("joined_at") or "",
+                 "name": m.get("name")} for m in members], {"scoring_type": scoring_type}
+
+    # ── Denormalised profiles ─────────────────────────────────────────────────
+
+    async def refresh_profile(self, user_id: str, name: Optional[str] = None, level: Optional[int] = None) -> None:
+        """Push a user's current name / level into every clan and league membership and board."""
+        fields = {k: v for k, v in (("name", name), ("level", level)) if v is not None}
+        if not fields:
+            return
+        await self.db.clan_members.update_many({"user_id": user_id}, {"$set": fields})
+        await self.db.league_members.update_many({"user_id": user_id}, {"$set": fields})
+        if name is None:
+            return
+        async for m in self.db.clan_members.find({"user_id": user_id}, {"_id": 0, "clan_id": 1}):
+            await self.clan_member_changed(m["clan_id"], user_id)
+        async for m in self.db.league_members.find({"user_id": user_id}, {"_id": 0, "league_id": 1}):
+            await self.league_member_changed(m["league_id"], user_id)
+
+    async def with_profiles(self, members: List[Dict], scope: Dict) -> List[Dict]:
+        """Membership docs for one clan ({"clan_id"}) or league ({"league_id"}) with names filled in."""
+        coll = self.db.clan_members if "clan_id" in scope else self.db.league_members
+        return await self._backfill_profiles(coll, members, scope)
+
+    async def _backfill_profiles(self, coll, members: List[Dict], scope: Optional[Dict] = None) -> List[Dict]:
+        """Memberships created before denormalisation get name / level copied in once."""
+        missing = [m["user_id"] for m in members if not m.get("name")]
+        if not missing:
+            return members
+        users = {
+            u["id"]: u async for u in self.db.users.find(
+                {"id": {"$in": missing}}, {"_id": 0, "id": 1, "name": 1, "level": 1})
+        }
+        if users:
+            await coll.bulk_write([
+                UpdateOne({**(scope or {}), "user_id": uid},
+                          {"$set": {"name": u.get("name", "Unknown"), "level": u.get("level", 1)}})
+                for uid, u in users.items()
+            ], ordered=False)
+        for m in members:
+            if not m.get("name") and m["user_id"] in users:
+                m["name"] = users[m["user_id"]].get("name", "Unknown")
+                m["level"] = users[m["user_id"]].get("level", 1)
+        logger.info(f"GROUP LEADERBOARD: backfilled {len(users)} member profiles")
+        return members
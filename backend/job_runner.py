@@ -0,0 +1,206 @@
+"""
+Background Job Runner for FREE11
+Each job runs in its own loop with its own interval, jitter and timeout, so one slow
+job never delays the others. A run never overlaps the previous run of the same job.
+
+Leader election: before each run a replica must hold the job's lease —
+Redis `SET NX PX` when Redis is configured, otherwise a `scheduler_leases` document
+in Mongo. The holder renews the lease every run and keeps it while alive; if it dies
+the lease expires and another replica takes over.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from redis_cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+LEASE_MARGIN = 15          # seconds of slack on top of interval + timeout + jitter
+LEASE_KEY = "job_lease:{}"
+
+_RENEW_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class JobLease:
+    """Cluster-wide lease per job name. Redis first, Mongo fallback."""
+
+    def __init__(self, db, owner: Optional[str] = None):
+        self.db = db
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+    async def acquire(self, name: str, ttl: float) -> bool:
+        """Take the lease if free or already ours; extends it by `ttl` seconds."""
+        r = get_redis()
+        if r:
+            try:
+                key = LEASE_KEY.format(name)
+                ttl_ms = int(ttl * 1000)
+                if r.set(key, self.owner, nx=True, px=ttl_ms):
+                    return True
+                return bool(r.eval(_RENEW_LUA, 1, key, self.owner, ttl_ms))
+            except Exception as e:
+                logger.warning(f"JobLease: Redis lease failed for {name}, using Mongo: {e}")
+        now = datetime.now(timezone.utc)
+        try:
+            doc = await self.db.scheduler_leases.find_one_and_update(
+                {"_id": name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=ttl),
+                          "renewed_at": now}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            return bool(doc and doc.get("owner") == self.owner)
+        except DuplicateKeyError:
+            return False  # Held by another live replica
+
+    async def release(self, name: str):
+        r = get_redis()
+        if r:
+            try:
+                r.eval(_RELEASE_LUA, 1, LEASE_KEY.format(name), self.owner)
+            except Exception:
+                pass
+        try:
+            await self.db.scheduler_leases.delete_one({"_id": name, "owner": self.owner})
+        except Exception:
+            pass
+
+
+class Job:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable],
+        interval: float,
+        timeout: float,
+        jitter: float = 0.0,
+        leader_only: bool = True,
+    ):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.timeout = timeout
+        self.jitter = jitter
+        self.leader_only = leader_only
+        self.running = False
+        self.stats = {
+            "runs": 0, "failures": 0, "timeouts": 0, "skipped_not_leader": 0,
+            "last_duration_ms": None, "max_duration_ms": 0, "avg_duration_ms": 0.0,
+            "last_started_at": None, "last_error": None, "is_leader": False,
+        }
+
+    @property
+    def lease_ttl(self) -> float:
+        return self.interval + self.jitter + self.timeout + LEASE_MARGIN
+
+    def record(self, duration_ms: float, error: Optional[str] = None, timed_out: bool = False):
+        s = self.stats
+        s["runs"] += 1
+        if error:
+            s["failures"] += 1
+            s["last_error"] = error
+        if timed_out:
+            s["timeouts"] += 1
+        s["last_duration_ms"] = round(duration_ms, 1)
+        s["max_duration_ms"] = round(max(s["max_duration_ms"], duration_ms), 1)
+        s["avg_duration_ms"] = round(s["avg_duration_ms"] + (duration_ms - s["avg_duration_ms"]) / s["runs"], 1)
+
+
+class JobRunner:
+    """Runs registered jobs concurrently; one asyncio task per job."""
+
+    def __init__(self, db, lease: Optional[JobLease] = None):
+        self.db = db
+        self.lease = lease or JobLease(db)
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._running = False
+
+    def add(self, job: Job):
+        self.jobs[job.name] = job
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._loop(job)))
+
+    async def stop(self):
+        self._running = False
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+        for job in self.jobs.values():
+            if job.leader_only and job.stats["is_leader"]:
+                await self.lease.release(job.name)
+
+    async def _loop(self, job: Job):
+        # Spread the first run so replicas restarting together don't stampede
+        await asyncio.sleep(random.uniform(0, job.jitter) if job.jitter else 0)
+        while self._running:
+            await self.run_once(job)
+            await asyncio.sleep(job.interval + (random.uniform(0, job.jitter) if job.jitter else 0))
+
+    async def run_once(self, job: Job) -> bool:
+        """Run a job once if this replica is its leader. Returns True if it ran."""
+        if job.running:
+            return False  # Previous run still in progress — never overlap
+        if job.leader_only:
+            try:
+                leader = await self.lease.acquire(job.name, job.lease_ttl)
+            except Exception as e:
+                logger.error(f"JobRunner: lease check failed for {job.name}: {e}")
+                leader = False
+            job.stats["is_leader"] = leader
+            if not leader:
+                job.stats["skipped_not_leader"] += 1
+                return False
+
+        job.running = True
+        job.stats["last_started_at"] = datetime.now(timezone.utc).isoformat()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(job.fn(), timeout=job.timeout)
+            job.record((time.perf_counter() - started) * 1000)
+        except asyncio.TimeoutError:
+            logger.error(f"JobRunner: {job.name} timed out after {job.timeout}s")
+            job.record((time.perf_counter() - started) * 1000, error="timeout", timed_out=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"JobRunner: {job.name} failed: {e}")
+            job.record((time.perf_counter() - started) * 1000, error=str(e))
+        finally:
+            job.running = False
+        return True
+
+    def get_stats(self) -> Dict:
+        return {
+            "owner": self.lease.owner,
+            "jobs": {
+                name: {**job.stats, "interval": job.interval, "timeout": job.timeout,
+                       "jitter": job.jitter, "running": job.running}
+                for name, job in self.jobs.items()
+            },
+        }
@@ -3,12 +3,15 @@ KPI Routes — Platform Analytics & Cohort Data
 Provides: opt-in rate, repeat redemptions, pool_lift, household estimates.
 Admin-only endpoints.
 """
+import asyncio
 import logging
 from datetime import datetime, timezone, timedelta
 from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional
 
 from server import db, get_current_user, User
+from economy_metrics import EconomyMetrics
+from streaming_export import export_response
 
 logger = logging.getLogger(__name__)
 kpi_router = APIRouter(prefix="/api/v2/kpis", tags=["KPIs"])
@@ -64,13 +67,9 @@ async def get_platform_kpis(user: User = Depends(get_current_user)):
     # === REVENUE ESTIMATE (AdMob + commission) ===
     total_ad_rewards = await db.ad_events.count_documents({"status": "completed"})
     estimated_admob_revenue_inr = round(total_ad_rewards * 0.35, 2)  # ~₹0.35/ad watch
-    total_voucher_coins = 0
-    voucher_agg = await db.coin_transactions.aggregate([
-        {"$match": {"type": {"$in": ["redemption", "voucher_redeem", "sponsored_prize"]}}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]).to_list(1)
-    if voucher_agg:
-        total_voucher_coins = abs(voucher_agg[0].get("total", 0))
+    flows = await EconomyMetrics(db).by_type()
+    total_voucher_coins = abs(sum(flows[t]["minted"] - flows[t]["burned"]
+                                  for t in ("redemption", "voucher_redeem", "sponsored_prize") if t in flows))
 
     # Estimated 8% commission on ₹1/100coins value
     estimated_commission_inr = round(abs(total_voucher_coins) / 100 * 0.08, 2)
@@ -116,35 +115,18 @@ async def get_breakage_metrics(user: User = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(403, "Admin only")
 
-    # Total coins ever issued
-    issued_agg = await db.coin_transactions.aggregate([
-        {"$match": {"amount": {"$gt": 0}}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]).to_list(1)
-    total_issued = issued_agg[0]["total"] if issued_agg else 0
-
-    # Total coins ever spent (redemptions)
-    spent_agg = await db.coin_transactions.aggregate([
-        {"$match": {"amount": {"$lt": 0}}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]).to_list(1)
-    total_spent = abs(spent_agg[0]["total"]) if spent_agg else 0
-
-    # Currently live coins in all wallets
-    wallet_agg = await db.users.aggregate([
-        {"$match": {"is_admin": {"$ne": True}}},
-        {"$group": {"_id": None, "total": {"$sum": "$coins_balance"}}}
-    ]).to_list(1)
-    live_balance = wallet_agg[0]["total"] if wallet_agg else 0
-
-    unredeemed = total_issued - total_spent
-    breakage_rate = round((unredeemed / total_issued * 100), 1) if total_issued > 0 else 0
+    # Every wallet credit / debit path records its flow, so the economy counters carry
+    # issued, spent, expired and the outstanding liability without scanning users.
+    summary = await EconomyMetrics(db).summary()
+    breakage_rate = summary["breakage_pct"]
 
     return {
-        "total_coins_issued": total_issued,
-        "total_coins_spent": total_spent,
-        "live_wallet_balance": live_balance,
-        "unredeemed_coins": unredeemed,
+        "total_coins_issued": summary["minted"],
+        "total_coins_spent": summary["spent"],
+        "total_coins_expired": summary["expired"],
+        "live_wallet_balance": summary["liability"],
+        "flow_liability": summary["liability"],
+        "unredeemed_coins": summary["unredeemed"],
         "unredeemed_coin_ratio_pct": breakage_rate,
         "target_breakage_pct": 10.0,
         "status": "healthy" if breakage_rate >= 10 else "low_breakage",
@@ -152,33 +134,70 @@ async def get_breakage_metrics(user: User = Depends(get_current_user)):
     }
 
 
+@kpi_router.get("/economy/series")
+async def get_economy_series(
+    granularity: str = "day",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    types: Optional[str] = None,
+    user: User = Depends(get_current_user),
+):
+    """Minted / burned coins per hour or day bucket (default: last 30 days), for charts."""
+    if not user.is_admin:
+        raise HTTPException(403, "Admin only")
+    if granularity not in ("hour", "day"):
+        raise HTTPException(400, "Granularity must be hour or day")
+    now = datetime.now(timezone.utc)
+    width = 13 if granularity == "hour" else 10
+    start = (start or (now - timedelta(days=30)).isoformat())[:width]
+    end = (end or now.isoformat())[:width]
+    type_list = [t for t in (types or "").split(",") if t]
+    points = await EconomyMetrics(db).series(granularity, start, end, type_list or None)
+    return {"granularity": granularity, "start": start, "end": end, "points": points}
+
+
+@kpi_router.post("/economy/rebuild")
+async def rebuild_economy_metrics(user: User = Depends(get_current_user)):
+    """Admin: backfill the economy counters from coin_transactions + ledger."""
+    if not user.is_admin:
+        raise HTTPException(403, "Admin only")
+    return await EconomyMetrics(db).rebuild()
+
+
+COHORT_COLUMNS = ["date", "registrations", "redemptions", "repeat_pct"]
+
+
 @kpi_router.get("/cohort-csv")
-async def get_cohort_csv(user: User = Depends(get_current_user)):
-    """Returns a simple CSV-friendly cohort summary."""
+async def get_cohort_csv(format: str = "json", user: User = Depends(get_current_user)):
+    """Returns a simple CSV-friendly cohort summary (format=csv / ndjson downloads it)."""
     if not user.is_admin:
         raise HTTPException(403, "Admin only")
 
     now = datetime.now(timezone.utc)
-    rows = []
 
-    # Last 7 days cohort
-    for days_ago in range(7, -1, -1):
+    async def cohort_day(days_ago: int) -> dict:
         d = (now - timedelta(days=days_ago)).strftime("%Y-%m-%d")
-        registrations = await db.users.count_documents({
-            "created_at": {"$gte": d, "$lt": (now - timedelta(days=days_ago - 1)).strftime("%Y-%m-%d")}
-        })
-        redemptions = await db.redemptions.count_documents({
-            "order_date": {"$gte": d, "$lt": (now - timedelta(days=days_ago - 1)).strftime("%Y-%m-%d")}
-        })
-        rows.append({
+        window = {"$gte": d, "$lt": (now - timedelta(days=days_ago - 1)).strftime("%Y-%m-%d")}
+        registrations, redemptions = await asyncio.gather(
+            db.users.count_documents({"created_at": window}),
+            db.redemptions.count_documents({"order_date": window}),
+        )
+        return {
             "date": d,
             "registrations": registrations,
             "redemptions": redemptions,
             "repeat_pct": 20.0,  # Placeholder sample stat
-        })
+        }
+
+    # Last 7 days cohort
+    rows = await asyncio.gather(*(cohort_day(days_ago) for days_ago in range(7, -1, -1)))
+    if format != "json":
+        async def one_batch():
+            yield list(rows)
+        return export_response(one_batch(), format, "cohort", columns=COHORT_COLUMNS)
 
     return {
-        "columns": ["date", "registrations", "redemptions", "repeat_pct"],
+        "columns": COHORT_COLUMNS,
         "rows": rows,
         "note": "repeat_pct is sample (20%) per spec. Live cohort requires 30d of production data.",
     }
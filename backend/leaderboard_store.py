@@ -0,0 +1,419 @@
+"""
+Leaderboard Store for FREE11
+Ordered rank index for contest / pool leaderboards.
+
+Redis ZSETs when REDIS_URL is configured, in-memory indexable skip list otherwise.
+Ordering: points DESC, then tie-break ASC (submitted_at / joined_at), then member id.
+Rank lookup, windows and "my rank + neighbours" are O(log n).
+
+Mongo stays the system of record — a board is (re)built from Mongo by its owner
+via `ensure()` / `load()` and kept current with `upsert()` on every points change.
+"""
+import json
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from redis_cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "lb"
+REDIS_TTL = 7 * 86400       # Boards for finished contests age out after a week
+MEMORY_TTL = 30             # In-memory boards are per-process → rebuild from Mongo every 30s
+LOAD_CHUNK = 1000           # ZADD batch size on rebuild
+
+# Row shape used by load(): {"member", "points", "tiebreak", "name"}
+Loader = Callable[[], Awaitable[Tuple[List[Dict], Dict]]]
+
+
+def prize_for_rank(distribution: Any, rank: int) -> int:
+    """Rank → prize coins. Supports {"1": 500, ...} and [{"rank"|"rank_start"/"rank_end", "coins"}]."""
+    if not distribution or rank <= 0:
+        return 0
+    if isinstance(distribution, dict):
+        return int(distribution.get(str(rank), 0) or 0)
+    for tier in distribution:
+        if tier.get("rank") == rank:
+            return int(tier.get("coins", 0))
+        if tier.get("rank_start", 0) <= rank <= tier.get("rank_end", -1):
+            return int(tier.get("coins", 0))
+    return 0
+
+
+# ── In-memory fallback: indexable skip list ───────────────────────────────────
+
+class _Node:
+    __slots__ = ("key", "member", "next", "span")
+
+    def __init__(self, key, member, level: int):
+        self.key = key
+        self.member = member
+        self.next: List[Optional["_Node"]] = [None] * level
+        self.span: List[int] = [0] * level
+
+
+class SkipList:
+    """Skip list with per-link spans (same layout as Redis zskiplist).
+    Entries are ordered by (key, member); rank is 1-based."""
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self._head = _Node(None, None, self.MAX_LEVEL)
+        self._level = 1
+        self._keys: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, member: str) -> bool:
+        return member in self._keys
+
+    def _random_level(self) -> int:
+        lvl = 1
+        while lvl < self.MAX_LEVEL and random.random() < self.P:
+            lvl += 1
+        return lvl
+
+    def _find_update(self, key, member):
+        update = [self._head] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        x = self._head
+        target = (key, member)
+        for i in range(self._level - 1, -1, -1):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while x.next[i] is not None and (x.next[i].key, x.next[i].member) < target:
+                rank[i] += x.span[i]
+                x = x.next[i]
+            update[i] = x
+        return update, rank
+
+    def insert(self, member: str, key) -> None:
+        if member in self._keys:
+            self.remove(member)
+        update, rank = self._find_update(key, member)
+        lvl = self._random_level()
+        if lvl > self._level:
+            for i in range(self._level, lvl):
+                rank[i] = 0
+                update[i] = self._head
+                self._head.span[i] = len(self._keys)
+            self._level = lvl
+        node = _Node(key, member, lvl)
+        for i in range(lvl):
+            node.next[i] = update[i].next[i]
+            update[i].next[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = (rank[0] - rank[i]) + 1
+        for i in range(lvl, self._level):
+            update[i].span[i] += 1
+        self._keys[member] = key
+
+    def remove(self, member: str) -> bool:
+        key = self._keys.get(member)
+        if member not in self._keys:
+            return False
+        update, _ = self._find_update(key, member)
+        x = update[0].next[0]
+        if x is None or x.member != member:
+            return False
+        for i in range(self._level):
+            if update[i].next[i] is x:
+                update[i].span[i] += x.span[i] - 1
+                update[i].next[i] = x.next[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        del self._keys[member]
+        return True
+
+    def key_of(self, member: str):
+        return self._keys.get(member)
+
+    def rank(self, member: str) -> Optional[int]:
+        if member not in self._keys:
+            return None
+        target = (self._keys[member], member)
+        traversed = 0
+        x = self._head
+        for i in range(self._level - 1, -1, -1):
+            while x.next[i] is not None and (x.next[i].key, x.next[i].member) <= target:
+                traversed += x.span[i]
+                x = x.next[i]
+            if x.member == member:
+                return traversed
+        return None
+
+    def slice(self, start: int, count: int) -> List[Tuple[str, Any]]:
+        """Entries at 0-based positions [start, start + count)."""
+        if count <= 0 or start >= len(self._keys):
+            return []
+        start = max(0, start)
+        traversed = 0
+        x = self._head
+        for i in range(self._level - 1, -1, -1):
+            while x.next[i] is not None and traversed + x.span[i] <= start + 1:
+                traversed += x.span[i]
+                x = x.next[i]
+        out = []
+        while x is not None and len(out) < count:
+            out.append((x.member, x.key))
+            x = x.next[0]
+        return out
+
+
+class _MemoryBoard:
+    __slots__ = ("index", "names", "meta", "built_at")
+
+    def __init__(self, meta: Dict):
+        self.index = SkipList()
+        self.names: Dict[str, str] = {}
+        self.meta = meta
+        self.built_at = time.monotonic()
+
+
+# ── Store ─────────────────────────────────────────────────────────────────────
+
+class LeaderboardStore:
+    """One store per process; boards are addressed by a string id, e.g. "contest:<id>"."""
+
+    def __init__(self):
+        self._mem: Dict[str, _MemoryBoard] = {}
+
+    # Redis layout per board:
+    #   lb:<board>        ZSET  score=-points, member="<tiebreak>|<member>"  (equal scores → lex order = tie-break)
+    #   lb:<board>:idx    HASH  member → zset member
+    #   lb:<board>:names  HASH  member → display name
+    #   lb:<board>:meta   STRING json (prize distribution etc.) — presence marks the board as loaded
+    @staticmethod
+    def _keys(board: str) -> Tuple[str, str, str, str]:
+        base = f"{KEY_PREFIX}:{board}"
+        return base, f"{base}:idx", f"{base}:names", f"{base}:meta"
+
+    @staticmethod
+    def _mem_key(points: float, tiebreak: str):
+        return (-float(points), tiebreak or "")
+
+    # ── Build ─────────────────────────────────────────────────────────────────
+
+    def load(self, board: str, rows: List[Dict], meta: Optional[Dict] = None) -> None:
+        """Replace a board's contents with `rows` (full rebuild)."""
+        meta = meta or {}
+        r = get_redis()
+        if r:
+            try:
+                zkey, idx, names, mkey = self._keys(board)
+                pipe = r.pipeline(transaction=True)
+                pipe.delete(zkey, idx, names, mkey)
+                for i in range(0, len(rows), LOAD_CHUNK):
+                    chunk = rows[i:i + LOAD_CHUNK]
+                    zmembers = {f"{row.get('tiebreak') or ''}|{row['member']}": -float(row.get("points", 0)) for row in chunk}
+                    pipe.zadd(zkey, zmembers)
+                    pipe.hset(idx, mapping={row["member"]: f"{row.get('tiebreak') or ''}|{row['member']}" for row in chunk})
+                    name_map = {row["member"]: row["name"] for row in chunk if row.get("name")}
+                    if name_map:
+                        pipe.hset(names, mapping=name_map)
+                pipe.set(mkey, json.dumps(meta, default=str))
+                for k in (zkey, idx, names, mkey):
+                    pipe.expire(k, REDIS_TTL)
+                pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"Leaderboard redis load failed board={board}: {e}")
+        mb = _MemoryBoard(meta)
+        for row in rows:
+            mb.index.insert(row["member"], self._mem_key(row.get("points", 0), row.get("tiebreak")))
+            if row.get("name"):
+                mb.names[row["member"]] = row["name"]
+        self._mem[board] = mb
+
+    def is_loaded(self, board: str) -> bool:
+        r = get_redis()
+        if r:
+            try:
+                return bool(r.exists(self._keys(board)[3]))
+            except Exception:
+                pass
+        mb = self._mem.get(board)
+        return mb is not None and time.monotonic() - mb.built_at < MEMORY_TTL
+
+    async def ensure(self, board: str, loader: Loader) -> None:
+        """Build the board from Mongo if it is not loaded (or the in-memory copy is stale)."""
+        if self.is_loaded(board):
+            return
+        rows, meta = await loader()
+        self.load(board, rows, meta)
+        logger.info(f"LEADERBOARD REBUILT: board={board} entries={len(rows)}")
+
+    def invalidate(self, board: str) -> None:
+        r = get_redis()
+        if r:
+            try:
+                r.delete(*self._keys(board))
+            except Exception as e:
+                logger.warning(f"Leaderboard redis invalidate failed board={board}: {e}")
+        self._mem.pop(board, None)
+
+    # ── Writes ────────────────────────────────────────────────────────────────
+
+    def upsert(self, board: str, member: str, points: float,
+               tiebreak: Optional[str] = None, name: Optional[str] = None) -> bool:
+        """Set a member's points. Returns False when the board isn't loaded, or when the member
+        is new and no tiebreak was given — callers then invalidate and let the next read rebuild."""
+        r = get_redis()
+        if r:
+            try:
+                zkey, idx, names, mkey = self._keys(board)
+                if not r.exists(mkey):
+                    return False
+                zmember = r.hget(idx, member)
+                if zmember is None:
+                    if tiebreak is None:
+                        return False
+                    zmember = f"{tiebreak}|{member}"
+                    r.hset(idx, member, zmember)
+                if name:
+                    r.hset(names, member, name)
+                r.zadd(zkey, {zmember: -float(points)})
+                return True
+            except Exception as e:
+                logger.warning(f"Leaderboard redis upsert failed board={board}: {e}")
+        mb = self._mem.get(board)
+        if mb is None:
+            return False
+        current = mb.index.key_of(member)
+        if current is None and tiebreak is None:
+            return False
+        mb.index.insert(member, self._mem_key(points, tiebreak if current is None else current[1]))
+        if name:
+            mb.names[member] = name
+        return True
+
+    def upsert_many(self, board: str, points: Dict[str, float]) -> bool:
+        """Set points for many existing members in one Redis round trip per step (exists,
+        index lookup, ZADD). Returns False when the board isn't loaded or a member is new."""
+        if not points:
+            return True
+        r = get_redis()
+        if r:
+            try:
+                zkey, idx, _, mkey = self._keys(board)
+                members = list(points)
+                pipe = r.pipeline(transaction=False)
+                pipe.exists(mkey)
+                pipe.hmget(idx, members)
+                loaded, zmembers = pipe.execute()
+                if not loaded or any(z is None for z in zmembers):
+                    return False
+                r.zadd(zkey, {z: -float(points[m]) for m, z in zip(members, zmembers)})
+                return True
+            except Exception as e:
+                logger.warning(f"Leaderboard redis upsert_many failed board={board}: {e}")
+        mb = self._mem.get(board)
+        if mb is None:
+            return False
+        for member, value in points.items():
+            current = mb.index.key_of(member)
+            if current is None:
+                return False
+            mb.index.insert(member, self._mem_key(value, current[1]))
+        return True
+
+    def remove(self, board: str, member: str) -> None:
+        r = get_redis()
+        if r:
+            try:
+                zkey, idx, names, _ = self._keys(board)
+                zmember = r.hget(idx, member)
+                if zmember is not None:
+                    r.zrem(zkey, zmember)
+                    r.hdel(idx, member)
+                    r.hdel(names, member)
+                return
+            except Exception as e:
+                logger.warning(f"Leaderboard redis remove failed board={board}: {e}")
+        mb = self._mem.get(board)
+        if mb:
+            mb.index.remove(member)
+            mb.names.pop(member, None)
+
+    # ── Reads (board must be ensure()d first) ─────────────────────────────────
+
+    def meta(self, board: str) -> Dict:
+        r = get_redis()
+        if r:
+            try:
+                raw = r.get(self._keys(board)[3])
+                return json.loads(raw) if raw else {}
+            except Exception:
+                pass
+        mb = self._mem.get(board)
+        return mb.meta if mb else {}
+
+    def size(self, board: str) -> int:
+        r = get_redis()
+        if r:
+            try:
+                return int(r.zcard(self._keys(board)[0]))
+            except Exception:
+                pass
+        mb = self._mem.get(board)
+        return len(mb.index) if mb else 0
+
+    def rank(self, board: str, member: str) -> Optional[int]:
+        """1-based rank, or None if the member has no entry."""
+        r = get_redis()
+        if r:
+            try:
+                zkey, idx, _, _ = self._keys(board)
+                zmember = r.hget(idx, member)
+                if zmember is None:
+                    return None
+                pos = r.zrank(zkey, zmember)
+                return None if pos is None else pos + 1
+            except Exception:
+                pass
+        mb = self._mem.get(board)
+        return mb.index.rank(member) if mb else None
+
+    def window(self, board: str, start: int, count: int) -> List[Dict]:
+        """Entries at 0-based positions [start, start + count) as {member, points, tiebreak, rank, name}."""
+        start = max(0, start)
+        if count <= 0:
+            return []
+        r = get_redis()
+        if r:
+            try:
+                zkey, _, names, _ = self._keys(board)
+                raw = r.zrange(zkey, start, start + count - 1, withscores=True)
+                members = [zm.split("|", 1) for zm, _ in raw]
+                name_vals = r.hmget(names, [m for _, m in members]) if members else []
+                return [
+                    {"member": m, "points": -score or 0.0, "tiebreak": tb, "rank": start + i + 1, "name": nm}
+                    for i, ((tb, m), (_, score), nm) in enumerate(zip(members, raw, name_vals))
+                ]
+            except Exception as e:
+                logger.warning(f"Leaderboard redis window failed board={board}: {e}")
+        mb = self._mem.get(board)
+        if not mb:
+            return []
+        return [
+            {"member": m, "points": -key[0] or 0.0, "tiebreak": key[1], "rank": start + i + 1, "name": mb.names.get(m)}
+            for i, (m, key) in enumerate(mb.index.slice(start, count))
+        ]
+
+    def around(self, board: str, member: str, radius: int = 5) -> Tuple[Optional[int], List[Dict]]:
+        """The member's rank plus up to `radius` neighbours on each side."""
+        rank = self.rank(board, member)
+        if rank is None:
+            return None, []
+        start = max(0, rank - 1 - radius)
+        return rank, self.window(board, start, (rank - 1 - start) + radius + 1)
+
+
+# Process-wide singleton — engines share it so in-memory boards are shared too
+leaderboard_store = LeaderboardStore()
@@ -12,6 +12,8 @@ import uuid
 
 # Import from server.py
 from server import db, get_current_user, User, USER_RANKS
+from skill_leaderboard import GLOBAL_MIN_PREDICTIONS, WEEKLY_MIN_PREDICTIONS, week_start
+from v2_engines import skill_leaderboards, percentiles
 
 leaderboards_router = APIRouter(prefix="/leaderboards", tags=["Leaderboards"])
 
@@ -50,56 +52,30 @@ async def get_global_leaderboard(limit: int = 50):
     Global leaderboard ranked by SKILL (accuracy + streak)
     NO coin totals displayed
     """
-    # Get users with prediction data
-    pipeline = [
-        {"$match": {"total_predictions": {"$gte": 5}, "is_admin": {"$ne": True}, "is_seed": {"$ne": True}}},
-        {"$addFields": {
-            "accuracy": {
-                "$cond": {
-                    "if": {"$gt": ["$total_predictions", 0]},
-                    "then": {"$multiply": [{"$divide": ["$correct_predictions", "$total_predictions"]}, 100]},
-                    "else": 0
-                }
-            }
-        }},
-        {"$sort": {"accuracy": -1, "prediction_streak": -1, "correct_predictions": -1}},
-        {"$limit": limit},
-        {"$project": {
-            "_id": 0,
-            "id": 1,
-            "name": 1,
-            "level": 1,
-            "accuracy": 1,
-            "total_predictions": 1,
-            "correct_predictions": 1,
-            "prediction_streak": 1
-            # NO coins_balance exposed
-        }}
-    ]
-    
-    users = await db.users.aggregate(pipeline).to_list(limit)
+    rows = await skill_leaderboards.get_global(limit)
     
     result = []
-    for i, user in enumerate(users):
-        level = user.get("level", 1)
+    for row in rows:
+        level = row.get("level", 1)
         rank_info = USER_RANKS.get(level, USER_RANKS[1])
+        total, correct = row.get("total", 0), row.get("correct", 0)
         result.append({
-            "rank": i + 1,
-            "id": user["id"],
-            "name": user.get("name", "Anonymous"),
+            "rank": row["rank"],
+            "id": row["user_id"],
+            "name": row["name"],
             "level": level,
             "rank_name": rank_info["name"],
             "rank_color": rank_info["color"],
-            "accuracy": round(user.get("accuracy", 0), 1),
-            "total_predictions": user.get("total_predictions", 0),
-            "correct_predictions": user.get("correct_predictions", 0),
-            "streak": user.get("prediction_streak", 0)
+            "accuracy": round(correct / total * 100, 1) if total else 0,
+            "total_predictions": total,
+            "correct_predictions": correct,
+            "streak": row.get("streak", 0)
         })
     
     return {
         "leaderboard": result,
         "metric": "Skill (Accuracy + Streak)",
-        "min_predictions": 5
+        "min_predictions": GLOBAL_MIN_PREDICTIONS
     }
 
 @leaderboards_router.get("/weekly")
@@ -108,55 +84,30 @@ async def get_weekly_leaderboard(limit: int = 50):
     Weekly leaderboard - resets every Monday
     Tracks predictions made in the current week only
     """
-    # Calculate start of current week (Monday)
-    now = datetime.now(timezone.utc)
-    days_since_monday = now.weekday()
-    week_start = (now - timedelta(days=days_since_monday)).replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start_iso = week_start.isoformat()
-    
-    # Aggregate ball predictions from this week
-    pipeline = [
-        {"$match": {"predicted_at": {"$gte": week_start_iso}}},
-        {"$group": {
-            "_id": "$user_id",
-            "total_predictions": {"$sum": 1},
-            "correct_predictions": {"$sum": {"$cond": ["$is_correct", 1, 0]}}
-        }},
-        {"$match": {"total_predictions": {"$gte": 3}}},  # Min 3 predictions this week
-        {"$addFields": {
-            "accuracy": {"$multiply": [{"$divide": ["$correct_predictions", "$total_predictions"]}, 100]}
-        }},
-        {"$sort": {"accuracy": -1, "correct_predictions": -1}},
-        {"$limit": limit}
-    ]
-    
-    weekly_data = await db.ball_predictions.aggregate(pipeline).to_list(limit)
+    week = week_start()
+    rows = await skill_leaderboards.get_weekly(limit, week)
     
     result = []
-    for i, entry in enumerate(weekly_data):
-        user = await db.users.find_one(
-            {"id": entry["_id"], "is_admin": {"$ne": True}, "is_seed": {"$ne": True}},
-            {"_id": 0, "name": 1, "level": 1}
-        )
-        if user:
-            level = user.get("level", 1)
-            rank_info = USER_RANKS.get(level, USER_RANKS[1])
-            result.append({
-                "rank": i + 1,
-                "id": entry["_id"],
-                "name": user.get("name", "Anonymous"),
-                "level": level,
-                "rank_name": rank_info["name"],
-                "accuracy": round(entry.get("accuracy", 0), 1),
-                "predictions_this_week": entry.get("total_predictions", 0),
-                "correct_this_week": entry.get("correct_predictions", 0)
-            })
+    for row in rows:
+        level = row.get("level", 1)
+        rank_info = USER_RANKS.get(level, USER_RANKS[1])
+        total, correct = row.get("total", 0), row.get("correct", 0)
+        result.append({
+            "rank": row["rank"],
+            "id": row["user_id"],
+            "name": row["name"],
+            "level": level,
+            "rank_name": rank_info["name"],
+            "accuracy": round(correct / total * 100, 1) if total else 0,
+            "predictions_this_week": total,
+            "correct_this_week": correct
+        })
     
     return {
         "leaderboard": result,
-        "week_start": week_start_iso,
+        "week_start": datetime.strptime(week, "%Y-%m-%d").replace(tzinfo=timezone.utc).isoformat(),
         "metric": "Weekly Accuracy",
-        "min_predictions": 3
+        "min_predictions": WEEKLY_MIN_PREDICTIONS
     }
 
 @leaderboards_router.get("/streak")
@@ -164,22 +115,19 @@ async def get_streak_leaderboard(limit: int = 50):
     """
     Streak leaderboard - who has the longest prediction streak
     """
-    users = await db.users.find(
-        {"prediction_streak": {"$gt": 0}, "is_admin": {"$ne": True}, "is_seed": {"$ne": True}},
-        {"_id": 0, "id": 1, "name": 1, "level": 1, "prediction_streak": 1}
-    ).sort("prediction_streak", -1).limit(limit).to_list(limit)
+    rows = await skill_leaderboards.get_streak(limit)
     
     result = []
-    for i, user in enumerate(users):
-        level = user.get("level", 1)
+    for row in rows:
+        level = row.get("level", 1)
         rank_info = USER_RANKS.get(level, USER_RANKS[1])
         result.append({
-            "rank": i + 1,
-            "id": user["id"],
-            "name": user.get("name", "Anonymous"),
+            "rank": row["rank"],
+            "id": row["user_id"],
+            "name": row["name"],
             "level": level,
             "rank_name": rank_info["name"],
-            "streak": user.get("prediction_streak", 0)
+            "streak": row.get("streak", 0)
         })
     
     return {
@@ -187,6 +135,21 @@ async def get_streak_leaderboard(limit: int = 50):
         "metric": "Prediction Streak"
     }
 
+@leaderboards_router.post("/rebuild")
+async def rebuild_skill_leaderboards(current_user: User = Depends(get_current_user)):
+    """Admin: recompute materialised skill stats from ball_predictions"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin only")
+    return await skill_leaderboards.rebuild()
+
+@leaderboards_router.get("/percentiles/me")
+async def get_my_percentiles(current_user: User = Depends(get_current_user)):
+    """Where the current user stands: rank and "top X%" for earnings, accuracy and streak"""
+    return {
+        "percentiles": await percentiles.user_percentiles(current_user.id),
+        "min_predictions": GLOBAL_MIN_PREDICTIONS
+    }
+
 # ==================== USER PUBLIC PROFILE ====================
 
 @leaderboards_router.get("/profile/{user_id}")
@@ -227,6 +190,9 @@ async def get_public_profile(user_id: str):
     # Get badges
     badges = user.get("badges", [])
     
+    # Skill percentiles only — the earnings position is not public
+    standing = await percentiles.user_percentiles(user_id, metrics=("accuracy", "streak"), user=user)
+    
     # Get duel stats
     duels_won = await db.duels.count_documents({"winner_id": user_id})
     duels_played = await db.duels.count_documents({
@@ -246,7 +212,9 @@ async def get_public_profile(user_id: str):
             "accuracy": accuracy,
             "total_predictions": total_predictions,
             "correct_predictions": correct_predictions,
-            "current_streak": user.get("prediction_streak", 0)
+            "current_streak": user.get("prediction_streak", 0),
+            "accuracy_top_percent": (standing["accuracy"] or {}).get("top_percent"),
+            "streak_top_percent": standing["streak"]["top_percent"]
         },
         "badges": badges,
         "clan": {
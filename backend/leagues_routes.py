@@ -12,6 +12,7 @@ import random
 import string
 
 from server import db, get_current_user, User
+from v2_engines import group_leaderboards
 
 leagues_router = APIRouter(prefix="/leagues", tags=["Private Leagues"])
 
@@ -45,6 +46,8 @@ class LeagueMember(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     league_id: str
     user_id: str
+    name: Optional[str] = None  # Denormalised from users, refreshed on profile change
+    level: int = 1
     joined_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     # Stats within this league
     total_predictions: int = 0
@@ -129,7 +132,9 @@ async def create_league(
     # Add creator as first member
     member = LeagueMember(
         league_id=league.id,
-        user_id=current_user.id
+        user_id=current_user.id,
+        name=current_user.name,
+        level=current_user.level
     )
     await db.league_members.insert_one(member.model_dump())
     
@@ -174,9 +179,12 @@ async def join_league(
     # Create member record
     member = LeagueMember(
         league_id=league["id"],
-        user_id=current_user.id
+        user_id=current_user.id,
+        name=current_user.name,
+        level=current_user.level
     )
     await db.league_members.insert_one(member.model_dump())
+    await group_leaderboards.league_member_changed(league["id"], current_user.id)
     
     return {
         "message": f"Welcome to {league['name']}!",
@@ -235,6 +243,8 @@ async def get_league_details(
 @leagues_router.get("/{league_id}/leaderboard")
 async def get_league_leaderboard(
     league_id: str,
+    offset: int = 0,
+    limit: int = MAX_LEAGUE_MEMBERS,
     current_user: User = Depends(get_current_user)
 ):
     """Get leaderboard for a private league"""
@@ -247,54 +257,11 @@ async def get_league_leaderboard(
     if not league:
         raise HTTPException(status_code=404, detail="League not found")
     
-    # Get all members with stats
-    members = await db.league_members.find(
-        {"league_id": league_id},
-        {"_id": 0}
-    ).to_list(MAX_LEAGUE_MEMBERS)
+    # Ranked from the league's board; names are denormalised onto memberships
+    board = await group_leaderboards.get_league_board(
+        league, current_user.id, max(offset, 0), min(max(limit, 1), MAX_LEAGUE_MEMBERS))
     
-    # Enrich with user data
-    leaderboard = []
-    for member in members:
-        user = await db.users.find_one(
-            {"id": member["user_id"]},
-            {"_id": 0, "name": 1, "level": 1}
-        )
-        if user:
-            leaderboard.append({
-                "user_id": member["user_id"],
-                "name": user.get("name", "Anonymous"),
-                "level": user.get("level", 1),
-                "points": member.get("points", 0),
-                "accuracy": member.get("accuracy", 0),
-                "total_predictions": member.get("total_predictions", 0),
-                "correct_predictions": member.get("correct_predictions", 0),
-                "streak": member.get("streak", 0),
-                "best_streak": member.get("best_streak", 0)
-            })
-    
-    # Sort by scoring type
-    scoring_type = league.get("scoring_type", "accuracy")
-    if scoring_type == "accuracy":
-        leaderboard.sort(key=lambda x: (-x["accuracy"], -x["total_predictions"]))
-    elif scoring_type == "total_predictions":
-        leaderboard.sort(key=lambda x: -x["total_predictions"])
-    elif scoring_type == "streak":
-        leaderboard.sort(key=lambda x: (-x["best_streak"], -x["accuracy"]))
-    
-    # Add ranks
-    for i, entry in enumerate(leaderboard, 1):
-        entry["rank"] = i
-    
-    return {
-        "league": league,
-        "leaderboard": leaderboard,
-        "scoring_type": scoring_type,
-        "my_rank": next(
-            (e["rank"] for e in leaderboard if e["user_id"] == current_user.id),
-            None
-        )
-    }
+    return {"league": league, **board}
 
 @leagues_router.get("/{league_id}/members")
 async def get_league_members(
@@ -314,18 +281,23 @@ async def get_league_members(
     if current_user.id not in league.get("member_ids", []):
         raise HTTPException(status_code=403, detail="You're not a member of this league")
     
-    # Get member details
+    # Get member details (names / levels are denormalised onto memberships)
+    memberships = await db.league_members.find(
+        {"league_id": league_id},
+        {"_id": 0, "user_id": 1, "name": 1, "level": 1}
+    ).to_list(MAX_LEAGUE_MEMBERS)
+    by_user = {
+        m["user_id"]: m
+        for m in await group_leaderboards.with_profiles(memberships, {"league_id": league_id})
+    }
     members = []
     for user_id in league.get("member_ids", []):
-        user = await db.users.find_one(
-            {"id": user_id},
-            {"_id": 0, "id": 1, "name": 1, "level": 1}
-        )
-        if user:
+        member = by_user.get(user_id)
+        if member:
             members.append({
-                "user_id": user["id"],
-                "name": user.get("name", "Anonymous"),
-                "level": user.get("level", 1),
+                "user_id": user_id,
+                "name": member.get("name") or "Anonymous",
+                "level": member.get("level", 1),
                 "is_admin": user_id in league.get("admin_ids", []),
                 "is_creator": user_id == league.get("created_by")
             })
@@ -377,6 +349,7 @@ async def leave_league(
         "league_id": league_id,
         "user_id": current_user.id
     })
+    group_leaderboards.league_member_removed(league_id, current_user.id)
     
     return {"message": f"Left {league['name']}"}
 
@@ -403,6 +376,7 @@ async def delete_league(
         {"id": league_id},
         {"$set": {"is_active": False}}
     )
+    group_leaderboards.league_removed(league_id)
     
     return {"message": f"League '{league['name']}' deleted"}
 
@@ -481,3 +455,4 @@ async def update_league_member_stats(user_id: str, is_correct: bool):
                     }
                 }
             )
+            await group_leaderboards.league_member_changed(league["id"], user_id)
@@ -2,14 +2,98 @@
 Double-Entry Ledger Engine for FREE11
 Every balance change is a pair of debit/credit entries. Balance is DERIVED, never stored directly.
 """
+import asyncio
+import base64
+import heapq
+import json
+import os
 import uuid
-from datetime import datetime, timezone
-from typing import Optional, Dict, List
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional, Dict, List, Tuple
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
 import logging
 
+from economy_metrics import record_flow, record_flows
+
 logger = logging.getLogger(__name__)
 
+RECONCILE_BATCH = 2000
+# Entries are timestamped just before they are written; a run's checkpoints stop this
+# far behind its start so no in-flight write can still land before the cut-off.
+CHECKPOINT_LAG_S = 300
+
+
+def history_key(row: Dict) -> Tuple[str, str]:
+    return (row.get("timestamp") or "", row.get("id") or "")
+
+
+def encode_cursor(key: Tuple[str, str]) -> str:
+    """Opaque keyset cursor for (timestamp, id)."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        ts, id_ = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(ts), str(id_)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_after(key: Optional[Tuple[str, str]]) -> Dict:
+    """Filter for rows strictly after `key` in (timestamp DESC, id DESC) order.
+    Rows without a timestamp sort last, as they do in the index."""
+    if key is None:
+        return {}
+    ts, id_ = key
+    if not ts:
+        return {"timestamp": {"$in": [None, ""]}, "id": {"$lt": id_}}
+    return {"$or": [
+        {"timestamp": {"$lt": ts}},
+        {"timestamp": ts, "id": {"$lt": id_}},
+        {"timestamp": {"$in": [None, ""]}},
+    ]}
+
+
+def net_pipeline(match: Dict, as_of: str) -> List[Dict]:
+    """Per-user net movement over ledger + coin_transactions, sorted by user id.
+
+    Applies the history de-dup rule (a coin_transactions row is dropped when the user
+    has a ledger row with the same non-empty reference_id) and also returns the part
+    of the net dated before `as_of`, so one pass can both compare and checkpoint.
+    """
+    match = {"user_id": {"$gt": ""}, **match}
+
+    def stream(src: str, amount) -> Dict:
+        return {"$project": {"_id": 0, "user_id": 1, "src": src, "amount": amount,
+                             "ref": {"$ifNull": ["$reference_id", ""]},
+                             "before": {"$lt": [{"$ifNull": ["$timestamp", ""]}, as_of]}}}
+
+    def by_src(src: str, value) -> Dict:
+        return {"$sum": {"$cond": [{"$eq": ["$src", src]}, value, 0]}}
+
+    txn_counts = {"$or": [{"$eq": ["$_id.r", ""]}, {"$eq": ["$ledger_rows", 0]}]}
+    return [
+        {"$match": {**match, "status": {"$in": ["completed", None]}}},
+        stream("ledger", {"$subtract": [{"$ifNull": ["$credit", 0]}, {"$ifNull": ["$debit", 0]}]}),
+        {"$unionWith": {"coll": "coin_transactions", "pipeline": [
+            {"$match": match}, stream("txn", {"$ifNull": ["$amount", 0]})]}},
+        {"$group": {"_id": {"u": "$user_id", "r": "$ref"},
+                    "ledger": by_src("ledger", "$amount"),
+                    "ledger_before": by_src("ledger", {"$cond": ["$before", "$amount", 0]}),
+                    "txn": by_src("txn", "$amount"),
+                    "txn_before": by_src("txn", {"$cond": ["$before", "$amount", 0]}),
+                    "ledger_rows": by_src("ledger", 1)}},
+        {"$group": {"_id": "$_id.u",
+                    "ledger_net": {"$sum": "$ledger"},
+                    "txn_net": {"$sum": {"$cond": [txn_counts, "$txn", 0]}},
+                    "net_before": {"$sum": {"$add": [
+                        "$ledger_before", {"$cond": [txn_counts, "$txn_before", 0]}]}}}},
+        {"$sort": {"_id": 1}},
+    ]
+
 
 class LedgerEngine:
     """
@@ -18,11 +102,14 @@ class LedgerEngine:
     Balance = SUM(credits) - SUM(debits) for a given account.
     """
 
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncIOMotorDatabase, use_transactions: Optional[bool] = None):
         self.db = db
+        # Multi-document transactions need a replica set; off by default
+        self.use_transactions = (os.environ.get("LEDGER_TRANSACTIONS", "").lower() in ("1", "true", "yes")
+                                 if use_transactions is None else use_transactions)
 
-    async def _create_entry(
-        self,
+    @staticmethod
+    def _entry(
         user_id: str,
         tx_type: str,
         credit: int,
@@ -31,7 +118,7 @@ class LedgerEngine:
         description: str,
         status: str = "completed",
     ) -> Dict:
-        entry = {
+        return {
             "id": str(uuid.uuid4()),
             "user_id": user_id,
             "type": tx_type,
@@ -42,7 +129,30 @@ class LedgerEngine:
             "status": status,
             "timestamp": datetime.now(timezone.utc).isoformat(),
         }
-        await self.db.ledger.insert_one(entry)
+
+    async def _atomic(self, fn: Callable[[Any], Awaitable]):
+        """Run fn(session) inside a transaction when enabled, else fn(None)."""
+        if not self.use_transactions:
+            return await fn(None)
+        async with await self.db.client.start_session() as session:
+            async with session.start_transaction():
+                return await fn(session)
+
+    async def _create_entry(
+        self,
+        user_id: str,
+        tx_type: str,
+        credit: int,
+        debit: int,
+        reference_id: str,
+        description: str,
+        status: str = "completed",
+        session=None,
+    ) -> Dict:
+        entry = self._entry(user_id, tx_type, credit, debit, reference_id, description, status)
+        await self.db.ledger.insert_one(entry, session=session)
+        if status == "completed":
+            await record_flow(self.db, tx_type, credit - debit, entry["timestamp"])
         logger.info(f"LEDGER: user={user_id} type={tx_type} credit={credit} debit={debit} ref={reference_id}")
         return {k: v for k, v in entry.items() if k != "_id"}
 
@@ -57,13 +167,22 @@ class LedgerEngine:
         """Add coins to user account"""
         if amount <= 0:
             raise ValueError("Credit amount must be positive")
-        entry = await self._create_entry(user_id, tx_type, credit=amount, debit=0, reference_id=reference_id, description=description)
         # Also update the cached balance on user doc for fast reads
-        await self.db.users.update_one(
-            {"id": user_id},
-            {"$inc": {"coins_balance": amount, "total_earned": amount, "xp": amount}}
-        )
-        return entry
+        inc = {"$inc": {"coins_balance": amount, "total_earned": amount, "xp": amount}}
+
+        async def apply(session):
+            if session is None:
+                # Independent writes → one round trip of latency instead of two
+                entry, _ = await asyncio.gather(
+                    self._create_entry(user_id, tx_type, amount, 0, reference_id, description),
+                    self.db.users.update_one({"id": user_id}, inc),
+                )
+                return entry
+            entry = await self._create_entry(user_id, tx_type, amount, 0, reference_id, description, session=session)
+            await self.db.users.update_one({"id": user_id}, inc, session=session)
+            return entry
+
+        return await self._atomic(apply)
 
     async def debit(
         self,
@@ -73,99 +192,331 @@ class LedgerEngine:
         reference_id: str,
         description: str,
     ) -> Dict:
-        """Remove coins from user account. Fails if insufficient balance."""
+        """Remove coins from user account. Fails if insufficient balance.
+        The balance check and decrement are one conditional update, so concurrent
+        debits can never take the balance below zero."""
         if amount <= 0:
             raise ValueError("Debit amount must be positive")
-        balance = await self.get_balance(user_id)
-        if balance < amount:
-            raise ValueError(f"Insufficient balance: have {balance}, need {amount}")
-        entry = await self._create_entry(user_id, tx_type, credit=0, debit=amount, reference_id=reference_id, description=description)
-        await self.db.users.update_one(
-            {"id": user_id},
-            {"$inc": {"coins_balance": -amount, "total_redeemed": amount}}
-        )
+
+        async def apply(session):
+            user = await self.db.users.find_one_and_update(
+                {"id": user_id, "coins_balance": {"$gte": amount}},
+                {"$inc": {"coins_balance": -amount, "total_redeemed": amount}},
+                projection={"_id": 0, "coins_balance": 1},
+                session=session,
+            )
+            if user is None:
+                balance = await self.get_balance(user_id)
+                raise ValueError(f"Insufficient balance: have {balance}, need {amount}")
+            return await self._create_entry(user_id, tx_type, 0, amount, reference_id, description, session=session)
+
+        entry = await self._atomic(apply)
+        await self._consume_bonus([(user_id, amount)])
         return entry
 
+    @staticmethod
+    async def _consume_bonus(debits: List[Tuple[str, int]]) -> None:
+        """Spent coins come out of expiring bonus buckets first (coin_expiry.py)."""
+        from v2_engines import coin_expiry
+        await coin_expiry.consume_many(debits)
+
+    async def credit_many(self, movements: List[Dict]) -> List[Dict]:
+        """Credit many accounts at once: one bulk_write on users + one insert_many on ledger.
+
+        movements: [{user_id, amount, tx_type, reference_id, description}]
+        """
+        if any(m["amount"] <= 0 for m in movements):
+            raise ValueError("Credit amount must be positive")
+        if not movements:
+            return []
+        entries = [self._entry(m["user_id"], m["tx_type"], m["amount"], 0, m["reference_id"], m["description"])
+                   for m in movements]
+        totals: Dict[str, int] = defaultdict(int)
+        for m in movements:
+            totals[m["user_id"]] += m["amount"]
+        ops = [UpdateOne({"id": uid}, {"$inc": {"coins_balance": amt, "total_earned": amt, "xp": amt}})
+               for uid, amt in totals.items()]
+
+        async def apply(session):
+            await self.db.ledger.insert_many(entries, ordered=False, session=session)
+            await self.db.users.bulk_write(ops, ordered=False, session=session)
+
+        await self._atomic(apply)
+        await record_flows(self.db, [(e["type"], e["credit"]) for e in entries], entries[0]["timestamp"])
+        logger.info(f"LEDGER: credit_many users={len(totals)} entries={len(entries)} total={sum(totals.values())}")
+        return [{k: v for k, v in e.items() if k != "_id"} for e in entries]
+
+    async def debit_many(self, movements: List[Dict]) -> Dict:
+        """Debit many accounts at once with the same no-overdraft guarantee as debit().
+
+        Each user's movements are summed and applied as one conditional $inc; users
+        without enough balance are rejected as a whole and get no ledger rows.
+        Returns {"entries": [...applied...], "rejected": [user_id, ...]}.
+        """
+        if any(m["amount"] <= 0 for m in movements):
+            raise ValueError("Debit amount must be positive")
+        if not movements:
+            return {"entries": [], "rejected": []}
+        batch_id = str(uuid.uuid4())
+        totals: Dict[str, int] = defaultdict(int)
+        for m in movements:
+            totals[m["user_id"]] += m["amount"]
+        ops = [UpdateOne({"id": uid, "coins_balance": {"$gte": amt}},
+                         {"$inc": {"coins_balance": -amt, "total_redeemed": amt},
+                          "$set": {"ledger_batch": batch_id}})
+               for uid, amt in totals.items()]
+
+        async def apply(session):
+            result = await self.db.users.bulk_write(ops, ordered=False, session=session)
+            if result.modified_count == len(ops):
+                applied = set(totals)
+            else:
+                applied = set(await self.db.users.distinct(
+                    "id", {"id": {"$in": list(totals)}, "ledger_batch": batch_id}, session=session))
+            entries = [self._entry(m["user_id"], m["tx_type"], 0, m["amount"], m["reference_id"], m["description"])
+                       for m in movements if m["user_id"] in applied]
+            if entries:
+                await self.db.ledger.insert_many(entries, ordered=False, session=session)
+            return entries, applied
+
+        entries, applied = await self._atomic(apply)
+        rejected = [uid for uid in totals if uid not in applied]
+        if entries:
+            await record_flows(self.db, [(e["type"], -e["debit"]) for e in entries], entries[0]["timestamp"])
+            await self._consume_bonus([(e["user_id"], e["debit"]) for e in entries])
+        logger.info(f"LEDGER: debit_many users={len(applied)} entries={len(entries)} rejected={len(rejected)}")
+        return {"entries": [{k: v for k, v in e.items() if k != "_id"} for e in entries], "rejected": rejected}
+
     async def get_balance(self, user_id: str) -> int:
         """Read balance from users collection (source of truth).
         The ledger is an audit trail; coins_balance is the live authoritative value."""
         user = await self.db.users.find_one({"id": user_id}, {"_id": 0, "coins_balance": 1})
         return int(user.get("coins_balance") or 0) if user else 0
 
-    async def get_history(self, user_id: str, limit: int = 50, offset: int = 0) -> List[Dict]:
-        """Get unified transaction history from both ledger and coin_transactions collections."""
-        # Fetch from double-entry ledger (redemptions, ad rewards, etc.)
-        ledger_entries = await self.db.ledger.find(
-            {"user_id": user_id},
-            {"_id": 0}
-        ).sort("timestamp", -1).to_list(limit + offset)
-
-        # Fetch from coin_transactions (checkins, missions, spins, etc.)
-        raw_txns = await self.db.coin_transactions.find(
-            {"user_id": user_id},
-            {"_id": 0}
-        ).sort("timestamp", -1).to_list(limit + offset)
-
-        # Normalise coin_transactions into ledger format
-        normalised = []
-        for t in raw_txns:
-            amount = int(t.get("amount") or 0)
-            normalised.append({
-                "id": t.get("id") or str(uuid.uuid4()),
-                "user_id": user_id,
-                "type": t.get("type", "reward"),
-                "reference_id": t.get("reference_id", ""),
-                "credit": amount if amount > 0 else 0,
-                "debit": abs(amount) if amount < 0 else 0,
-                "description": t.get("description", ""),
-                "status": "completed",
-                "timestamp": t.get("timestamp", ""),
-            })
-
-        # Merge + deduplicate (prefer ledger entry if same reference_id)
-        seen_refs = {e.get("reference_id") for e in ledger_entries if e.get("reference_id")}
-        for n in normalised:
-            if n.get("reference_id") and n["reference_id"] in seen_refs:
-                continue
-            ledger_entries.append(n)
+    async def ensure_indexes(self):
+        # Keyset history: (timestamp, id) DESC within a user, on both streams
+        await self.db.ledger.create_index([("user_id", 1), ("timestamp", -1), ("id", -1)], name="ledger_user_time_id")
+        await self.db.coin_transactions.create_index(
+            [("user_id", 1), ("timestamp", -1), ("id", -1)], name="txn_user_time_id")
+        # Reconciliation: incremental scans by time, per-user checkpoints, mismatch report
+        await self.db.ledger.create_index("timestamp", name="ledger_time")
+        await self.db.ledger_checkpoints.create_index("user_id", unique=True, name="ledger_cp_user")
+        await self.db.ledger_reconcile_runs.create_index([("status", 1), ("started_at", -1)], name="ledger_run_status")
+        await self.db.ledger_mismatches.create_index([("run_id", 1), ("user_id", 1)], name="ledger_mismatch_run")
 
-        # Sort by timestamp descending and paginate
-        ledger_entries.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-        return ledger_entries[offset: offset + limit]
+    async def backfill_txn_ids(self) -> int:
+        """Give id-less coin_transactions rows id = str(_id), the key _normalise_txn already
+        shows, so keyset paging on (timestamp, id) can't skip them (idempotent)."""
+        result = await self.db.coin_transactions.update_many(
+            {"id": {"$in": [None, ""]}}, [{"$set": {"id": {"$toString": "$_id"}}}])
+        if result.modified_count:
+            logger.info(f"LEDGER: backfilled ids on {result.modified_count} coin_transactions rows")
+        return result.modified_count
 
-    async def reconcile(self, user_id: str) -> Dict:
-        """Audit check: compare user balance against known ledger entries.
-        NEVER overwrites coins_balance — users.coins_balance is the authoritative source."""
-        user = await self.db.users.find_one({"id": user_id}, {"_id": 0, "coins_balance": 1})
-        cached = int(user.get("coins_balance") or 0) if user else 0
-        # Count known ledger credits vs debits for informational purposes only
-        pipeline = [
-            {"$match": {"user_id": user_id, "status": "completed"}},
-            {"$group": {
-                "_id": None,
-                "total_credit": {"$sum": "$credit"},
-                "total_debit": {"$sum": "$debit"},
-            }}
-        ]
-        result = await self.db.ledger.aggregate(pipeline).to_list(1)
-        ledger_net = (result[0]["total_credit"] - result[0]["total_debit"]) if result else 0
-        # The gap is explained by direct credit operations (checkins, spins, etc.)
-        # that bypass the ledger but correctly update coins_balance
-        untracked_credits = cached - ledger_net
+    async def history_page(self, user_id: str, limit: int = 50,
+                           cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of unified history (ledger + coin_transactions), newest first.
+
+        Order is (timestamp DESC, id DESC) over both collections; each page reads at
+        most `limit` rows per side after the cursor and k-way merges them.
+        De-dup rule: a coin_transactions row is hidden when the user has a ledger
+        entry with the same non-empty reference_id — the ledger entry is the one
+        shown. The rule depends only on stored data, never on page boundaries.
+        Returns (entries, next_cursor); next_cursor is None on the last page.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        entries: List[Dict] = []
+        while True:
+            ledger_rows = await self.db.ledger.find(
+                {"user_id": user_id, **keyset_after(after)}, {"_id": 0}
+            ).sort([("timestamp", -1), ("id", -1)]).to_list(limit)
+            txns = [self._normalise_txn(user_id, t) for t in await self.db.coin_transactions.find(
+                {"user_id": user_id, **keyset_after(after)}
+            ).sort([("timestamp", -1), ("id", -1)]).to_list(limit)]
+            refs = [t["reference_id"] for t in txns if t["reference_id"]]
+            shadowed = set(await self.db.ledger.distinct(
+                "reference_id", {"user_id": user_id, "reference_id": {"$in": refs}})) if refs else set()
+            # A full batch may have more rows right after its last key, so rows from the
+            # other side are only safe down to that key
+            horizon = max((history_key(rows[-1]) for rows in (ledger_rows, txns) if len(rows) == limit),
+                          default=None)
+            drained = True
+            for key, from_txns, row in heapq.merge(
+                [(history_key(r), False, r) for r in ledger_rows],
+                [(history_key(t), True, t) for t in txns],
+                key=lambda item: item[0], reverse=True,
+            ):
+                if len(entries) == limit or (horizon is not None and key < horizon):
+                    drained = False
+                    break
+                after = key
+                if from_txns and row["reference_id"] in shadowed:
+                    continue  # shadowed rows still advance the cursor
+                entries.append(row)
+            if drained and horizon is None:
+                return entries, None
+            if len(entries) == limit:
+                return entries, encode_cursor(after)
+
+    @staticmethod
+    def _normalise_txn(user_id: str, t: Dict) -> Dict:
+        """coin_transactions row in ledger format."""
+        amount = int(t.get("amount") or 0)
         return {
+            "id": t.get("id") or str(t.get("_id")),
             "user_id": user_id,
-            "balance": cached,
+            "type": t.get("type", "reward"),
+            "reference_id": t.get("reference_id", ""),
+            "credit": amount if amount > 0 else 0,
+            "debit": abs(amount) if amount < 0 else 0,
+            "description": t.get("description", ""),
+            "status": "completed",
+            "timestamp": t.get("timestamp", ""),
+        }
+
+    async def get_history(self, user_id: str, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """Offset form of history_page, kept for legacy clients (walks pages to `offset`)."""
+        cursor = None
+        while offset > 0:
+            skipped, cursor = await self.history_page(user_id, min(offset, 200), cursor)
+            offset -= len(skipped)
+            if cursor is None:
+                return []
+        entries, _ = await self.history_page(user_id, limit, cursor)
+        return entries
+
+    @staticmethod
+    def _compare(user_id: str, balance: int, net: Dict, base: int = 0) -> Dict:
+        ledger_net, txn_net = net.get("ledger_net", 0), net.get("txn_net", 0)
+        expected = base + ledger_net + txn_net
+        return {
+            "user_id": user_id,
+            "balance": balance,
             "ledger_net": ledger_net,
-            "untracked_credits": untracked_credits,
-            "mismatch": False,  # Not a mismatch — it's expected given the two-path credit system
+            # Direct credit operations (checkins, spins, etc.) bypass the ledger and
+            # are recorded in coin_transactions instead
+            "untracked_credits": balance - ledger_net,
+            "txn_net": txn_net,
+            "expected": expected,
+            "drift": balance - expected,
+            "mismatch": balance != expected,
         }
 
-    async def reconcile_all(self) -> List[Dict]:
-        """Reconcile all users"""
-        users = await self.db.users.find({}, {"_id": 0, "id": 1}).to_list(10000)
-        results = []
-        for u in users:
-            r = await self.reconcile(u["id"])
-            if r.get("mismatch"):
-                results.append(r)
-        return results
+    async def reconcile(self, user_id: str, as_of: str = "") -> Dict:
+        """Audit check: users.coins_balance against ledger + coin_transactions for one user.
+        NEVER overwrites coins_balance — users.coins_balance is the authoritative source."""
+        user = await self.db.users.find_one({"id": user_id}, {"_id": 0, "coins_balance": 1})
+        cached = int(user.get("coins_balance") or 0) if user else 0
+        rows = await self.db.ledger.aggregate(net_pipeline({"user_id": user_id}, as_of)).to_list(1)
+        net = rows[0] if rows else {}
+        return {**self._compare(user_id, cached, net), "net_before": net.get("net_before", 0)}
+
+    async def last_reconcile_run(self, status: Optional[str] = None) -> Optional[Dict]:
+        query = {"status": status} if status else {}
+        runs = await self.db.ledger_reconcile_runs.find(query, {"_id": 0}).sort("started_at", -1).to_list(1)
+        return runs[0] if runs else None
+
+    async def get_mismatches(self, run_id: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Mismatch report of a run (default: the latest completed one)."""
+        if run_id is None:
+            run = await self.last_reconcile_run("completed")
+            if not run:
+                return []
+            run_id = run["id"]
+        return await self.db.ledger_mismatches.find(
+            {"run_id": run_id}, {"_id": 0}).sort("user_id", 1).to_list(limit)
+
+    async def reconcile_all(self, full: bool = False) -> Dict:
+        """Reconcile every wallet; mismatches are written to ledger_mismatches.
+
+        One grouped aggregation over ledger + coin_transactions (net_pipeline), streamed
+        in user-id order and compared to users.coins_balance in RECONCILE_BATCH chunks.
+        Each run leaves per-user checkpoints (net of everything before its as_of), so
+        by default only entries after the last completed run's cut-off are scanned and
+        only the users who moved since are checked; `full` rescans everything.
+        Returns the run summary.
+        """
+        now = datetime.now(timezone.utc)
+        last = None if full else await self.last_reconcile_run("completed")
+        since = last["as_of"] if last else None
+        run = {"id": str(uuid.uuid4()), "mode": "incremental" if since else "full", "status": "running",
+               "since": since, "as_of": (now - timedelta(seconds=CHECKPOINT_LAG_S)).isoformat(),
+               "checked": 0, "mismatches": 0, "started_at": now.isoformat()}
+        await self.db.ledger_reconcile_runs.insert_one(dict(run))
+        match = {"timestamp": {"$gte": since}} if since else {}
+        nets = self.db.ledger.aggregate(net_pipeline(match, run["as_of"]), allowDiskUse=True)
+        fields = {"_id": 0, "id": 1, "coins_balance": 1}
+
+        if since:
+            # Only users with entries after the cut-off can have moved
+            while True:
+                rows = await nets.to_list(RECONCILE_BATCH)
+                if not rows:
+                    break
+                ids = [r["_id"] for r in rows]
+                users = await self.db.users.find({"id": {"$in": ids}}, fields).to_list(None)
+                checkpoints = {c["user_id"]: c async for c in self.db.ledger_checkpoints.find(
+                    {"user_id": {"$in": ids}}, {"_id": 0})}
+                await self._reconcile_chunk(run, users, {r["_id"]: r for r in rows}, checkpoints)
+        else:
+            # Merge-join two id-ordered streams; users without entries must hold 0
+            users_cursor = self.db.users.find({}, fields).sort("id", 1)
+            pending: List[Dict] = []
+            nets_done = False
+            while True:
+                users = await users_cursor.to_list(RECONCILE_BATCH)
+                if not users:
+                    break
+                last_id = users[-1]["id"]
+                while not nets_done and (not pending or pending[-1]["_id"] <= last_id):
+                    more = await nets.to_list(RECONCILE_BATCH)
+                    nets_done = not more
+                    pending.extend(more)
+                split = next((i for i, r in enumerate(pending) if r["_id"] > last_id), len(pending))
+                chunk, pending = pending[:split], pending[split:]
+                await self._reconcile_chunk(run, users, {r["_id"]: r for r in chunk}, None)
+
+        run.update(status="completed", completed_at=datetime.now(timezone.utc).isoformat(),
+                   seconds=round((datetime.now(timezone.utc) - now).total_seconds(), 2))
+        await self.db.ledger_reconcile_runs.update_one(
+            {"id": run["id"]}, {"$set": {k: run[k] for k in ("status", "completed_at", "seconds")}})
+        logger.info(f"LEDGER RECONCILE: {run['mode']} checked={run['checked']} "
+                    f"mismatches={run['mismatches']} in {run['seconds']}s")
+        return run
+
+    async def _reconcile_chunk(self, run: Dict, users: List[Dict], nets: Dict[str, Dict],
+                               checkpoints: Optional[Dict[str, Dict]]) -> None:
+        """Compare one chunk, confirm suspects exactly, then advance checkpoints.
+        checkpoints is None on a full run (every net starts from zero)."""
+        suspects, new_checkpoints = [], {}
+        for user in users:
+            uid, net = user["id"], nets.get(user["id"])
+            cp = checkpoints.get(uid) if checkpoints else None
+            if cp and cp["as_of"] > run["since"]:
+                suspects.append(uid)  # left by a later run that never completed
+                continue
+            base = cp["net"] if cp else 0
+            if self._compare(uid, int(user.get("coins_balance") or 0), net or {}, base)["mismatch"]:
+                suspects.append(uid)
+            elif net:
+                new_checkpoints[uid] = base + net["net_before"]
+        # Writes racing the scan show up as drift; a per-user recheck rules them out
+        detected_at = datetime.now(timezone.utc).isoformat()
+        mismatches = []
+        for uid in suspects:
+            exact = await self.reconcile(uid, run["as_of"])
+            new_checkpoints[uid] = exact.pop("net_before")
+            if exact["mismatch"]:
+                mismatches.append({**exact, "run_id": run["id"], "detected_at": detected_at})
+        if mismatches:
+            await self.db.ledger_mismatches.insert_many(mismatches, ordered=False)
+        if new_checkpoints:
+            await self.db.ledger_checkpoints.bulk_write([
+                UpdateOne({"user_id": uid}, {"$set": {"user_id": uid, "net": value, "as_of": run["as_of"],
+                                                      "updated_at": detected_at}}, upsert=True)
+                for uid, value in new_checkpoints.items()], ordered=False)
+        run["checked"] += len(users)
+        run["mismatches"] += len(mismatches)
+        await self.db.ledger_reconcile_runs.update_one(
+            {"id": run["id"]}, {"$set": {"checked": run["checked"], "mismatches": run["mismatches"],
+                                         "last_user_id": users[-1]["id"], "updated_at": detected_at}})
@@ -0,0 +1,337 @@
+"""
+Lineup Optimizer for FREE11
+Best possible XI / auto-pick on top of the compiled squad (lineup_validator).
+
+Exact dynamic programme over per-role blocks. Players are processed role by role;
+inside a block the state is (players before the block, team-A count, C used, VC used,
+picked in this role, credits used above the cheapest price) and every cell holds the
+best value. Closing a block keeps only role counts inside ROLE_CONSTRAINTS — the role's
+frontier — so role limits, MAX_PER_TEAM and MAX_CREDITS are all exact. Captain (2x)
+and Vice-Captain (1.5x) are picked together with the XI. Each step is one vectorised
+numpy max over a state slice, and the XI is rebuilt by walking the per-player
+snapshots backwards. Credits are counted in the squad's common price step, and players
+that `keep` cheaper-or-equal, better-or-equal teammates of the same role make redundant
+are dropped before solving — both exact.
+
+Top-k diverse: every further XI must bring at least `min_diff` players not used by
+the XIs found before it (an extra "fresh" count in the state), so any two returned
+XIs differ by at least min_diff players.
+
+Modes:
+  projected — pre-match, from squad fantasy ratings (auto-pick / advanced stats)
+  perfect   — post-match, from actual fantasy points ("perfect XI")
+Solved sequences are memoised (process + Redis) per (match, mode, value version,
+min_diff) and grown on demand; the scheduler pre-solves upcoming matches so auto-pick
+requests are served from the cache rather than the solver.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from fantasy_engine import TEAM_SIZE, MAX_CREDITS, ROLE_CONSTRAINTS, MAX_PER_TEAM
+from lineup_validator import get_compiled_squad
+from redis_cache import cache_get, cache_set
+
+logger = logging.getLogger(__name__)
+
+ROLES = list(ROLE_CONSTRAINTS)                 # wk, bat, all, bowl
+ROLE_MIN = [ROLE_CONSTRAINTS[r]["min"] for r in ROLES]
+ROLE_MAX = [ROLE_CONSTRAINTS[r]["max"] for r in ROLES]
+PROJECTION_PER_RATING = 6.0    # projected points per EntitySport fantasy rating point
+MAX_K = 5
+DEFAULT_MIN_DIFF = 2
+MEMO_SIZE = 256
+CACHE_TTL = 6 * 3600           # Redis copy of solved sequences (the key carries the input version)
+NEG = np.float32(-1e9)
+TOL = 1e-3
+
+_memo: "OrderedDict[tuple, Dict]" = OrderedDict()
+
+
+def _solve_one(blocks, budget_ex: int, fresh_need: int) -> Optional[Dict]:
+    """One exact solve. blocks: [(role_idx, [(cand_idx, value, extra_cost, is_team_a, is_fresh)])].
+    Returns {"value", "picks": [(cand_idx, "c"|"vc"|"")]} or None if infeasible."""
+    E = budget_ex + 1
+    F = fresh_need + 1
+    A = MAX_PER_TEAM + 1
+
+    # Totals allowed before each block, and after the last
+    mins = [ROLE_MIN[r] for r, _ in blocks]
+    maxs = [ROLE_MAX[r] for r, _ in blocks]
+    ranges = []
+    for b in range(len(blocks) + 1):
+        lo = sum(mins[:b])
+        hi = min(sum(maxs[:b]), TEAM_SIZE - sum(mins[b:]))
+        if lo > hi:
+            return None
+        ranges.append((lo, hi))
+
+    # layer[p, a, c, v, f, e]: best value with lo+p players before the block
+    layer = np.full((1, A, 2, 2, F, E), NEG, dtype=np.float32)
+    layer[0, 0, 0, 0, 0, 0] = 0.0
+    history = []   # per block: (layer_in, [snapshots before each player], W_end)
+
+    for b, (r, plist) in enumerate(blocks):
+        lo, hi = ranges[b]
+        C = maxs[b] + 1
+        W = np.full((hi - lo + 1, A, 2, 2, F, C, E), NEG, dtype=np.float32)
+        W[..., 0, :] = layer
+        snaps = []
+        for j, (_, v, ex, team_a, fresh) in enumerate(plist):
+            snaps.append(W.copy())
+            if ex >= E:
+                continue
+            S = snaps[-1]
+            top = min(j, C - 2)          # at most j picked so far in this role
+            src_r, dst_r = slice(0, top + 1), slice(1, top + 2)
+            t = 1 if team_a else 0
+            dst_a = slice(t, A)
+            src_a = slice(0, A - t)
+            for w, cs, cd, vs, vd in ((1.0, slice(None), slice(None), slice(None), slice(None)),
+                                      (2.0, 0, 1, slice(None), slice(None)),
+                                      (1.5, slice(None), slice(None), 0, 1)):
+                moves = [(slice(None), slice(None))] if not fresh or F == 1 else \
+                    [(slice(0, F - 1), slice(1, F)), (F - 1, F - 1)]
+                for fs, fd in moves:
+                    src = S[:, src_a, cs, vs, fs, src_r, :E - ex]
+                    dst = W[:, dst_a, cd, vd, fd, dst_r, ex:]
+                    np.maximum(dst, src + np.float32(w * v), out=dst)
+        history.append((layer, snaps, W))
+
+        # Close the block: keep role counts within limits → next layer
+        nlo, nhi = ranges[b + 1]
+        nxt = np.full((nhi - nlo + 1, A, 2, 2, F, E), NEG, dtype=np.float32)
+        for p in range(hi - lo + 1):
+            for cr in range(mins[b], maxs[b] + 1):
+                tot = lo + p + cr
+                if nlo <= tot <= nhi:
+                    np.maximum(nxt[tot - nlo], W[p, ..., cr, :], out=nxt[tot - nlo])
+        layer = nxt
+
+    # Final: exactly TEAM_SIZE, both teams within MAX_PER_TEAM, fresh requirement met
+    final = layer[TEAM_SIZE - ranges[-1][0]].copy()
+    for a in range(A):
+        if TEAM_SIZE - a > MAX_PER_TEAM:
+            final[a] = NEG
+    final = final[:, :, :, F - 1, :]
+    idx = np.unravel_index(int(np.argmax(final)), final.shape)
+    best = float(final[idx])
+    if best <= NEG / 2:
+        return None
+    a, c, v, e = (int(x) for x in idx)
+    f = F - 1
+
+    # Walk back through the blocks
+    picks = []
+    total = TEAM_SIZE
+    cur = best
+    for b in range(len(blocks) - 1, -1, -1):
+        r, plist = blocks[b]
+        lo, _ = ranges[b]
+        layer_in, snaps, W = history[b]
+        target = cur
+        found = None
+        for cr in range(mins[b], maxs[b] + 1):
+            p = total - cr - lo
+            if 0 <= p < W.shape[0] and abs(float(W[p, a, c, v, f, cr, e]) - target) < TOL:
+                found = (p, cr)
+                break
+        if found is None:
+            logger.error(f"LINEUP OPT: walk-back lost the optimum in block {b}")
+            return None
+        p, cr = found
+        cur = float(W[p, a, c, v, f, cr, e])
+        for j in range(len(plist) - 1, -1, -1):
+            S = snaps[j]
+            if abs(float(S[p, a, c, v, f, cr, e]) - cur) < TOL:
+                continue   # not taken
+            cand, val, ex, team_a, fresh = plist[j]
+            t = 1 if team_a else 0
+            pa, pcr, pe = a - t, cr - 1, e - ex
+            pfs = [f] if not fresh or F == 1 else ([f - 1, f] if f == F - 1 else [f - 1])
+            options = [(1.0, c, v, "")]
+            if c == 1:
+                options.append((2.0, 0, v, "c"))
+            if v == 1:
+                options.append((1.5, c, 0, "vc"))
+            moved = False
+            for w, pc, pv, tag in options:
+                for pf in pfs:
+                    if pa < 0 or pcr < 0 or pe < 0 or pf < 0:
+                        continue
+                    if abs(float(S[p, pa, pc, pv, pf, pcr, pe]) + w * val - cur) < TOL:
+                        picks.append((cand, tag))
+                        a, c, v, f, cr, e = pa, pc, pv, pf, pcr, pe
+                        cur = float(S[p, a, c, v, f, cr, e])
+                        moved = True
+                        break
+                if moved:
+                    break
+        total = lo + p
+    return {"value": best, "picks": picks}
+
+
+def _undominated(plist, keep: int):
+    """Drop players that can never be needed: `keep` others of the same role and team,
+    each at most as expensive and at least as valuable (and fresh if the player is),
+    can't all be in one XI alongside them, so one of those could always be swapped in."""
+    out = []
+    for entry in plist:
+        i, v, ex, team_a, fresh = entry
+        better = sum(
+            1 for j, v2, ex2, team_a2, fresh2 in plist
+            if j != i and team_a2 == team_a and ex2 <= ex and v2 >= v and (fresh2 or not fresh)
+            and (ex2, -v2, j) < (ex, -v, i)
+        )
+        if better < keep:
+            out.append(entry)
+    return out
+
+
+def solve_lineups(players: List[Dict], values: Dict[str, float], k: int = 1,
+                  min_diff: int = DEFAULT_MIN_DIFF, budget_x10: Optional[int] = None,
+                  prefix: Optional[List[Dict]] = None) -> List[Dict]:
+    """Top-k XIs by value. Each player dict needs player_id, role, team, credit.
+    Each XI after the first has at least `min_diff` players not in any earlier XI.
+    `prefix` (XIs already returned for the same inputs) resumes the sequence after them."""
+    budget = budget_x10 if budget_x10 is not None else int(round(MAX_CREDITS * 10))
+    cands = [p for p in players if str(p["player_id"]) in values and p.get("role") in ROLES]
+    if len(cands) < TEAM_SIZE:
+        return []
+    cost = [int(round(float(p.get("credit", 0)) * 10)) for p in cands]
+    floor = min(cost)
+    budget_ex = budget - TEAM_SIZE * floor
+    if budget_ex < 0:
+        return []
+    # Credits come in 0.5 steps → solve in units of the common step (exact, ~5x smaller state)
+    step = math.gcd(*(c - floor for c in cost)) or 1
+    budget_ex //= step
+    team_a_name = sorted({p.get("team", "") for p in cands})[0]
+
+    results = list(prefix or [])
+    prefix_ids = {str(p["player_id"]) for xi in results for p in xi["players"]}
+    used = {i for i, p in enumerate(cands) if str(p["player_id"]) in prefix_ids}
+    for n in range(len(results), max(1, min(k, MAX_K))):
+        fresh_need = 0 if n == 0 else max(1, min_diff)
+        blocks = []
+        for r, role in enumerate(ROLES):
+            plist = [(i, float(values[str(p["player_id"])]), (cost[i] - floor) // step,
+                      p.get("team", "") == team_a_name, i not in used)
+                     for i, p in enumerate(cands) if p["role"] == role]
+            blocks.append((r, _undominated(plist, min(ROLE_MAX[r], MAX_PER_TEAM))))
+        sol = _solve_one(blocks, budget_ex, fresh_need)
+        if not sol:
+            break
+        picked = sorted(sol["picks"], key=lambda x: (x[1] != "c", x[1] != "vc",
+                                                     -float(values[str(cands[x[0]]["player_id"])])))
+        used.update(i for i, _ in picked)
+        xi = [{
+            "player_id": cands[i]["player_id"],
+            "name": cands[i].get("name", ""),
+            "role": cands[i].get("role", ""),
+            "team": cands[i].get("team", ""),
+            "credit": cands[i].get("credit", 0),
+            "points": round(float(values[str(cands[i]["player_id"])]), 1),
+            "is_captain": tag == "c",
+            "is_vc": tag == "vc",
+        } for i, tag in picked]
+        results.append({
+            "players": xi,
+            "captain_id": next((p["player_id"] for p in xi if p["is_captain"]), None),
+            "vc_id": next((p["player_id"] for p in xi if p["is_vc"]), None),
+            "total_points": round(sol["value"], 1),
+            "total_credits": sum(cost[i] for i, _ in picked) / 10,
+        })
+    return results
+
+
+class LineupOptimizer:
+    def __init__(self, db, entitysport, fantasy_engine):
+        self.db = db
+        self.es = entitysport
+        self.fantasy = fantasy_engine
+
+    async def best_lineups(self, match_id: str, k: int = 1, min_diff: int = DEFAULT_MIN_DIFF) -> Dict:
+        """Pre-match: top-k projected XIs."""
+        squad = await get_compiled_squad(match_id, self.es)
+        if not squad:
+            raise ValueError("Squad not available for this match")
+        announced = any(p.get("playing11") for p in squad.players)
+        values = {
+            str(p["player_id"]): round(float(p.get("fantasy_rating") or 7) * PROJECTION_PER_RATING, 1)
+            for p in squad.players
+            if not announced or p.get("playing11")
+        }
+        return await self._solve(match_id, "projected", squad, values, max(1, min(k, MAX_K)), min_diff)
+
+    async def perfect_lineup(self, match_id: str) -> Dict:
+        """Post-match: the highest-scoring XI that could have been picked."""
+        squad = await get_compiled_squad(match_id, self.es)
+        if not squad:
+            raise ValueError("Squad not available for this match")
+        points = await self._actual_points(match_id)
+        if points is None:
+            raise ValueError("Match has not been scored yet")
+        values = {str(p["player_id"]): float(points.get(str(p["player_id"]), 0)) for p in squad.players}
+        return await self._solve(match_id, "perfect", squad, values, 1, 1)
+
+    async def _actual_points(self, match_id: str) -> Optional[Dict[str, int]]:
+        table = await self.fantasy.get_player_points(match_id)
+        if table is not None:
+            return {pid: row.get("points", 0) for pid, row in table.items()}
+        scorecard = await self.es.get_match_scorecard(match_id)
+        if not scorecard:
+            return None
+        perf = self.fantasy._extract_performance(scorecard)
+        return {pid: self.fantasy._calc_player_points(p) for pid, p in perf.items()}
+
+    async def _solve(self, match_id: str, mode: str, squad, values: Dict[str, float], k: int, min_diff: int) -> Dict:
+        digest = hashlib.sha1(repr(sorted(values.items())).encode()).hexdigest()[:10]
+        version = f"{squad.version}:{digest}"
+        # One growing sequence per input: XI n+1 only depends on XIs 1..n, so a request for k
+        # is a prefix of any longer sequence, and a longer request resumes a shorter one
+        key = (match_id, mode, version, min_diff)
+        cache_key = f"lineup_opt:{match_id}:{mode}:{version}:{min_diff}"
+        seq = _memo.get(key) or cache_get(cache_key)
+        if seq:
+            _memo[key] = seq
+            _memo.move_to_end(key)
+        started = time.perf_counter()
+        cached = bool(seq) and (len(seq["lineups"]) >= k or seq["exhausted"])
+        if not cached:
+            prefix = seq["lineups"] if seq else []
+            # numpy-heavy — keep it off the event loop
+            lineups = await asyncio.to_thread(solve_lineups, squad.players, values, k, min_diff, None, prefix)
+            seq = {"lineups": lineups, "exhausted": len(lineups) < k}
+            _memo[key] = seq
+            if len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+            cache_set(cache_key, seq, CACHE_TTL)
+        result = {
+            "match_id": match_id,
+            "mode": mode,
+            "projection_version": version,
+            "lineups": seq["lineups"][:k],
+            "solve_ms": round((time.perf_counter() - started) * 1000, 1),
+            "cached": cached,
+        }
+        if not cached:
+            logger.info(f"LINEUP OPT: match={match_id} mode={mode} k={k} ms={result['solve_ms']}")
+        return result
+
+    async def warm(self, match_ids: List[str]) -> int:
+        """Solve the full projected top-k ahead of requests (scheduler). Returns matches solved."""
+        solved = 0
+        for match_id in match_ids:
+            try:
+                await self.best_lineups(match_id, k=MAX_K, min_diff=DEFAULT_MIN_DIFF)
+                solved += 1
+            except ValueError:
+                continue   # squad not published yet
+        return solved
@@ -0,0 +1,175 @@
+"""
+Compiled Lineup Validator for FREE11
+Maps a match squad to integer indexes once; a lineup is then a bitmask + C/VC pair.
+
+Role counts and team caps are popcounts against precomputed per-role / per-team masks,
+credits are summed with per-byte lookup tables, and identical lineups share a
+`lineup_key` (squad version + mask + C/VC) for "this exact team already exists" lookups.
+Roles, teams and credits always come from the squad — client-sent values are only
+compared, never trusted.
+"""
+import hashlib
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fantasy_engine import TEAM_SIZE, MAX_CREDITS, ROLE_CONSTRAINTS, MAX_PER_TEAM
+
+logger = logging.getLogger(__name__)
+
+COMPILED_TTL = 600   # Recompile from (Redis-cached) squads every 10 min
+_compiled: Dict[str, Tuple[float, "CompiledSquad"]] = {}
+
+
+class CompiledSquad:
+    """Immutable, index-based view of a match squad."""
+
+    def __init__(self, match_id: str, squads: Dict):
+        players = []
+        for side in ("team_a", "team_b"):
+            for p in (squads.get(side) or {}).get("squad", []):
+                if p.get("player_id"):
+                    players.append(p)
+        # Deterministic index order so the same squad always yields the same masks
+        players.sort(key=lambda p: (p.get("team", ""), str(p["player_id"])))
+
+        self.match_id = match_id
+        self.players: List[Dict] = players
+        self.index: Dict[str, int] = {str(p["player_id"]): i for i, p in enumerate(players)}
+        self.version = hashlib.sha1(",".join(self.index).encode()).hexdigest()[:8]
+
+        self.role_masks: Dict[str, int] = {r: 0 for r in ROLE_CONSTRAINTS}
+        self.team_masks: Dict[str, int] = {}
+        self.credits_x10: List[int] = []
+        for i, p in enumerate(players):
+            bit = 1 << i
+            role = p.get("role", "bat")
+            self.role_masks[role] = self.role_masks.get(role, 0) | bit
+            self.team_masks[p.get("team", "")] = self.team_masks.get(p.get("team", ""), 0) | bit
+            self.credits_x10.append(int(round(float(p.get("credit", 0)) * 10)))
+
+        # credit_tables[k][b] = credits (x10) of the players selected by byte b of mask chunk k
+        self.credit_tables: List[List[int]] = []
+        for k in range((len(players) + 7) // 8):
+            base = k * 8
+            width = min(8, len(players) - base)
+            table = [0] * 256
+            for b in range(1, 256):
+                low = b & -b
+                j = low.bit_length() - 1
+                table[b] = table[b ^ low] + (self.credits_x10[base + j] if j < width else 0)
+            self.credit_tables.append(table)
+        self.max_credits_x10 = int(round(MAX_CREDITS * 10))
+
+    # ── Encoding ──────────────────────────────────────────────────────────────
+
+    def encode(self, player_ids: List[str]) -> Tuple[int, List[str]]:
+        """player_ids → mask. Returns (mask, unknown_ids)."""
+        mask = 0
+        unknown = []
+        for pid in player_ids:
+            i = self.index.get(str(pid))
+            if i is None:
+                unknown.append(str(pid))
+            else:
+                mask |= 1 << i
+        return mask, unknown
+
+    def decode(self, mask: int) -> List[Dict]:
+        out = []
+        while mask:
+            low = mask & -mask
+            out.append(self.players[low.bit_length() - 1])
+            mask ^= low
+        return out
+
+    def credits_of(self, mask: int) -> int:
+        total = 0
+        k = 0
+        while mask:
+            total += self.credit_tables[k][mask & 0xFF]
+            mask >>= 8
+            k += 1
+        return total
+
+    def lineup_key(self, mask: int, captain_id: str, vc_id: str) -> str:
+        return f"{self.version}:{mask:x}:{self.index.get(str(captain_id), -1)}:{self.index.get(str(vc_id), -1)}"
+
+    # ── Validation ────────────────────────────────────────────────────────────
+
+    def validate(self, player_ids: List[str], captain_id: str, vc_id: str,
+                 claimed: Optional[List[Dict]] = None) -> Dict:
+        """Validate a lineup by ids. `claimed` (optional) are the client's player dicts —
+        any credit/role that disagrees with the squad is reported as forged."""
+        errors = []
+        mask, unknown = self.encode(player_ids)
+        if unknown:
+            errors.append(f"Unknown players for this match: {', '.join(unknown[:5])}")
+        count = mask.bit_count()
+        if count != len(player_ids) and not unknown:
+            errors.append("Duplicate players in team")
+        if count != TEAM_SIZE:
+            errors.append(f"Team must have exactly {TEAM_SIZE} players, got {count}")
+
+        credits_x10 = self.credits_of(mask)
+        if credits_x10 > self.max_credits_x10:
+            errors.append(f"Total credits {credits_x10 / 10} exceeds max {MAX_CREDITS}")
+
+        for role, c in ROLE_CONSTRAINTS.items():
+            n = (mask & self.role_masks.get(role, 0)).bit_count()
+            if n < c["min"]:
+                errors.append(f"Need at least {c['min']} {c['label']}, got {n}")
+            if n > c["max"]:
+                errors.append(f"Max {c['max']} {c['label']}, got {n}")
+
+        for team, tmask in self.team_masks.items():
+            n = (mask & tmask).bit_count()
+            if n > MAX_PER_TEAM:
+                errors.append(f"Max {MAX_PER_TEAM} from {team}, got {n}")
+
+        c_idx = self.index.get(str(captain_id))
+        vc_idx = self.index.get(str(vc_id))
+        if c_idx is None or not (mask >> c_idx) & 1:
+            errors.append("Captain must be in your team")
+        if vc_idx is None or not (mask >> vc_idx) & 1:
+            errors.append("Vice-Captain must be in your team")
+        if captain_id == vc_id:
+            errors.append("Captain and Vice-Captain must be different")
+
+        for p in claimed or []:
+            i = self.index.get(str(p.get("player_id")))
+            if i is None:
+                continue
+            if "credit" in p and int(round(float(p["credit"] or 0) * 10)) != self.credits_x10[i]:
+                errors.append(f"Credit mismatch for player {p.get('player_id')}")
+            if "role" in p and p["role"] != self.players[i].get("role"):
+                errors.append(f"Role mismatch for player {p.get('player_id')}")
+
+        return {
+            "valid": not errors,
+            "errors": errors,
+            "mask": mask,
+            "total_credits": credits_x10 / 10,
+            "lineup_key": self.lineup_key(mask, captain_id, vc_id) if not errors else None,
+        }
+
+
+def compile_squad(match_id: str, squads: Dict) -> CompiledSquad:
+    return CompiledSquad(match_id, squads)
+
+
+async def get_compiled_squad(match_id: str, entitysport) -> Optional[CompiledSquad]:
+    """Compiled squad for a match, memoised per process; None when squads are unavailable."""
+    hit = _compiled.get(match_id)
+    if hit and time.monotonic() - hit[0] < COMPILED_TTL:
+        return hit[1]
+    if entitysport is None:
+        return None
+    squads = await entitysport.get_match_squads(match_id)
+    if not squads:
+        return None
+    compiled = CompiledSquad(match_id, squads)
+    if not compiled.players:
+        return None
+    _compiled[match_id] = (time.monotonic(), compiled)
+    return compiled
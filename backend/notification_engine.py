@@ -11,6 +11,8 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 
 logger = logging.getLogger(__name__)
 
+BULK_CHUNK = 1000   # notifications per insert_many
+
 NOTIFICATION_TYPES = {
     "match_starting": {"title": "Match Starting Soon!", "priority": "high"},
     "contest_closing": {"title": "Contest Closing!", "priority": "high"},
@@ -47,9 +49,62 @@ class NotificationEngine:
         logger.info(f"NOTIFICATION: user={user_id} type={ntype}")
         return notif_id
 
-    async def send_bulk(self, user_ids: List[str], ntype: str, body: str, data: Optional[Dict] = None):
-        for uid in user_ids:
-            await self.send(uid, ntype, body, data)
+    async def send_bulk(
+        self,
+        user_ids: List[str],
+        ntype: str,
+        body: str,
+        data: Optional[Dict] = None,
+        contexts: Optional[List[Dict]] = None,
+        fcm_service=None,
+    ) -> int:
+        """Send one notification per entry in user_ids with chunked insert_many.
+        contexts (aligned with user_ids) renders per-user bodies via body.format_map(ctx)
+        and is merged into that user's data. With fcm_service, each chunk is also pushed
+        in FCM batches. Returns the number of notifications stored."""
+        template = NOTIFICATION_TYPES.get(ntype, {"title": "FREE11", "priority": "medium"})
+        base = data or {}
+        sent = 0
+        for i in range(0, len(user_ids), BULK_CHUNK):
+            now = datetime.now(timezone.utc).isoformat()
+            docs = []
+            for j, uid in enumerate(user_ids[i:i + BULK_CHUNK]):
+                ctx = contexts[i + j] if contexts else None
+                docs.append({
+                    "id": str(uuid.uuid4()),
+                    "user_id": uid,
+                    "type": ntype,
+                    "title": template["title"],
+                    "body": body.format_map(ctx) if ctx else body,
+                    "data": {**base, **ctx} if ctx else dict(base),
+                    "priority": template["priority"],
+                    "read": False,
+                    "created_at": now,
+                })
+            await self.db.notifications.insert_many(docs, ordered=False)
+            sent += len(docs)
+            if fcm_service:
+                try:
+                    await self._push_chunk(fcm_service, ntype, docs)
+                except Exception as e:
+                    logger.error(f"NOTIFICATION: bulk push failed for {ntype}: {e}")
+        logger.info(f"NOTIFICATION BULK: type={ntype} count={sent}")
+        return sent
+
+    async def _push_chunk(self, fcm_service, ntype: str, docs: List[Dict]):
+        by_user: Dict[str, List[Dict]] = {}
+        for d in docs:
+            by_user.setdefault(d["user_id"], []).append(d)
+        tokens = await self.db.fcm_tokens.find(
+            {"user_id": {"$in": list(by_user)}, "active": True}, {"_id": 0, "user_id": 1, "token": 1}
+        ).to_list(None)
+        pushes = [
+            {"token": t["token"], "title": d["title"], "body": d["body"],
+             "data": {**d["data"], "type": ntype, "notification_id": d["id"]}}
+            for t in tokens if t.get("token")
+            for d in by_user.get(t["user_id"], [])
+        ]
+        await fcm_service.send_many(pushes)
 
     async def get_notifications(self, user_id: str, limit: int = 50, unread_only: bool = False) -> List[Dict]:
         query = {"user_id": user_id}
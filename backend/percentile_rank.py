@@ -0,0 +1,119 @@
+"""
+Percentile Rank Service for FREE11
+"You are in the top X%" and rank lookups for total_earned, accuracy and streak.
+
+One projection scan over users builds a sorted NumPy array per metric. Every
+process refreshes its snapshot from the scheduler (`percentiles` job, every
+REBUILD_TTL seconds); requests only build it when none exists yet and otherwise
+never wait on the scan — a snapshot the job let go stale is refreshed in a
+background task while the old one keeps serving. Lookups are
+a `searchsorted` — O(log n) each, vectorised for batches (weekly reports).
+Ranks are competition ranks: 1 + number of users strictly ahead.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from skill_leaderboard import GLOBAL_MIN_PREDICTIONS
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("total_earned", "accuracy", "streak")
+REBUILD_TTL = 300
+STALE_AFTER = 2 * REBUILD_TTL      # request path starts a background refresh past this
+USER_FIELDS = {"_id": 0, "id": 1, "total_earned": 1, "total_predictions": 1,
+               "correct_predictions": 1, "prediction_streak": 1}
+
+
+def metric_values(user: Dict) -> Dict[str, Optional[float]]:
+    """A user's value per metric; accuracy is None below the leaderboard minimum."""
+    total = user.get("total_predictions", 0) or 0
+    return {
+        "total_earned": float(user.get("total_earned", 0) or 0),
+        "accuracy": round(user.get("correct_predictions", 0) / total * 100, 1)
+        if total >= GLOBAL_MIN_PREDICTIONS else None,
+        "streak": float(user.get("prediction_streak", 0) or 0),
+    }
+
+
+def _position(values: np.ndarray, points: np.ndarray) -> List[Dict]:
+    n = len(values)
+    ahead = n - np.searchsorted(values, points, side="right")
+    below = np.searchsorted(values, points, side="left")
+    out = []
+    for value, a, b in zip(points.tolist(), ahead.tolist(), below.tolist()):
+        rank = a + 1
+        out.append({
+            "value": value,
+            "rank": rank,
+            "total": n,
+            "percentile": round(b / n * 100, 1) if n else 0,
+            # Rounded up so the very top still reads "top 0.1%"
+            "top_percent": math.ceil(min(rank, n) / n * 1000) / 10 if n else 100,
+        })
+    return out
+
+
+class PercentileRankService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self._values: Dict[str, np.ndarray] = {}
+        self._built_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refreshing: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> Dict:
+        """Rebuild every metric's sorted array from one scan of users."""
+        started = time.monotonic()
+        columns: Dict[str, List[float]] = {m: [] for m in METRICS}
+        async for user in self.db.users.find({}, USER_FIELDS):
+            for metric, value in metric_values(user).items():
+                if value is not None:
+                    columns[metric].append(value)
+        self._values = {m: np.sort(np.asarray(v, dtype=np.float64)) for m, v in columns.items()}
+        self._built_at = time.monotonic()
+        result = {"sizes": {m: len(v) for m, v in self._values.items()},
+                  "seconds": round(self._built_at - started, 2)}
+        logger.info(f"PERCENTILES REBUILT: {result}")
+        return result
+
+    async def _snapshot(self) -> Dict[str, np.ndarray]:
+        if not self._values:
+            async with self._lock:
+                if not self._values:
+                    await self.refresh()
+        elif (time.monotonic() - self._built_at >= STALE_AFTER
+              and (self._refreshing is None or self._refreshing.done())):
+            self._refreshing = asyncio.create_task(self._refresh_quietly())
+        return self._values
+
+    async def _refresh_quietly(self) -> None:
+        try:
+            async with self._lock:
+                await self.refresh()
+        except Exception as e:
+            logger.warning(f"Percentile refresh failed: {e}")
+
+    async def rank(self, metric: str, value: float) -> Dict:
+        """{value, rank, total, percentile, top_percent} of `value` within `metric`."""
+        return (await self.ranks(metric, [value]))[0]
+
+    async def ranks(self, metric: str, values: List[float]) -> List[Dict]:
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        snapshot = await self._snapshot()
+        return _position(snapshot[metric], np.asarray(values, dtype=np.float64))
+
+    async def user_percentiles(self, user_id: str, metrics=METRICS,
+                               user: Optional[Dict] = None) -> Dict[str, Optional[Dict]]:
+        """Position of one user on each metric (None where they are not eligible).
+        Pass `user` when the caller already holds the user doc."""
+        if user is None:
+            user = await self.db.users.find_one({"id": user_id}, USER_FIELDS) or {}
+        values = metric_values(user)
+        return {m: await self.rank(m, values[m]) if values[m] is not None else None for m in metrics}
@@ -10,6 +10,10 @@ from datetime import datetime, timezone, date
 from typing import Optional, Dict
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from earnings_rollup import record_credit
+from earning_caps import reserve_earning
+from economy_metrics import record_flow
+
 logger = logging.getLogger(__name__)
 
 QUEST_AD_REWARD_COINS = 20
@@ -93,22 +97,28 @@ class QuestEngine:
             }}
         )
 
-        # Credit coins
-        await self.db.users.update_one(
-            {"id": user_id},
-            {"$inc": {"coins_balance": QUEST_AD_REWARD_COINS, "total_earned": QUEST_AD_REWARD_COINS}}
-        )
-        await self.db.coin_transactions.insert_one({
-            "user_id": user_id,
-            "amount": QUEST_AD_REWARD_COINS,
-            "type": "quest_ad",
-            "description": "Rebound Quest: watched ad",
-            "reference": quest_id,
-            "timestamp": now,
-        })
-
-        logger.info(f"QUEST AD CLAIMED: user={user_id} quest={quest_id} coins={QUEST_AD_REWARD_COINS}")
-        return {"success": True, "coins_earned": QUEST_AD_REWARD_COINS, "quest_id": quest_id}
+        # Credit coins (what is left of today's cap)
+        coins = await reserve_earning(self.db, user_id, QUEST_AD_REWARD_COINS)
+        if coins > 0:
+            await self.db.users.update_one(
+                {"id": user_id},
+                {"$inc": {"coins_balance": coins, "total_earned": coins}}
+            )
+            txn = {
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "amount": coins,
+                "type": "quest_ad",
+                "description": "Rebound Quest: watched ad",
+                "reference": quest_id,
+                "timestamp": now,
+            }
+            await self.db.coin_transactions.insert_one(txn)
+            await record_credit(self.db, txn)
+            await record_flow(self.db, "quest_ad", coins, now)
+
+        logger.info(f"QUEST AD CLAIMED: user={user_id} quest={quest_id} coins={coins}")
+        return {"success": True, "coins_earned": coins, "quest_id": quest_id}
 
     async def mark_ration_viewed(self, user_id: str, quest_id: str) -> Dict:
         """Path B: User saw the ration tease. Mark as viewed (no lock, they just browse)."""
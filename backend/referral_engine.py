@@ -8,6 +8,9 @@ from datetime import datetime, timezone
 from typing import Optional, Dict, List
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from earnings_rollup import record_credits
+from economy_metrics import record_flows
+
 logger = logging.getLogger(__name__)
 
 REFERRAL_REWARD_REFERRER = 50  # coins for referrer
@@ -114,7 +117,7 @@ class ReferralEngine:
 
         # Check activity gate
         predictions_count = await self.db.predictions_v2.count_documents({"user_id": referee_id})
-        contests_joined = await self.db.contests.count_documents({"participants": referee_id})
+        contests_joined = await self.db.contest_members.count_documents({"user_id": referee_id})
 
         qualifies = (predictions_count >= MIN_PREDICTIONS_FOR_REFERRAL) or (contests_joined >= MIN_CONTESTS_FOR_REFERRAL)
         if not qualifies:
@@ -131,17 +134,24 @@ class ReferralEngine:
 
         # Award referee
         await self.db.users.update_one({"id": referee_id}, {"$inc": {"coins_balance": REFERRAL_REWARD_REFEREE, "total_earned": REFERRAL_REWARD_REFEREE}})
-        await self.db.coin_transactions.insert_one({
+        referee_txn = {
+            "id": str(uuid.uuid4()),
             "user_id": referee_id, "amount": REFERRAL_REWARD_REFEREE, "type": "referral_bonus",
             "description": "Referral reward: completed activity gate", "timestamp": now,
-        })
+        }
+        await self.db.coin_transactions.insert_one(referee_txn)
 
         # Award referrer
         await self.db.users.update_one({"id": referrer_id}, {"$inc": {"coins_balance": REFERRAL_REWARD_REFERRER, "total_earned": REFERRAL_REWARD_REFERRER}})
-        await self.db.coin_transactions.insert_one({
+        referrer_txn = {
+            "id": str(uuid.uuid4()),
             "user_id": referrer_id, "amount": REFERRAL_REWARD_REFERRER, "type": "referral_bonus",
             "description": f"Referral reward: your invitee completed activity", "timestamp": now,
-        })
+        }
+        await self.db.coin_transactions.insert_one(referrer_txn)
+        await record_credits(self.db, [referee_txn, referrer_txn])
+        await record_flows(self.db, [("referral_bonus", REFERRAL_REWARD_REFEREE),
+                                     ("referral_bonus", REFERRAL_REWARD_REFERRER)], now)
 
         logger.info(f"REFERRAL COMPLETED: referrer={referrer_id} referee={referee_id}")
         return {"referrer_id": referrer_id, "referee_id": referee_id,
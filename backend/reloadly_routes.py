@@ -17,6 +17,8 @@ import uuid
 
 from server import db, get_current_user, User
 from reloadly_provider import reloadly, RELOADLY_ENABLED, RELOADLY_ENV
+from economy_metrics import record_flow
+from earnings_rollup import record_credit
 
 reloadly_router = APIRouter(prefix="/reloadly", tags=["Reloadly Gift Cards"])
 
@@ -111,6 +113,8 @@ async def place_order(
     )
     if not updated:
         raise HTTPException(status_code=400, detail="Insufficient coins.")
+    from v2_engines import coin_expiry
+    await coin_expiry.consume(current_user.id, coin_cost)
 
     custom_id = f"free11-{current_user.id[:8]}-{uuid.uuid4().hex[:6]}"
 
@@ -151,14 +155,17 @@ async def place_order(
     await db.reloadly_orders.insert_one(order_doc)
 
     # Coin ledger entry
-    await db.coin_transactions.insert_one({
+    spend = {
         "id":          str(uuid.uuid4()),
         "user_id":     current_user.id,
         "amount":      -coin_cost,
         "type":        "spent",
         "description": f"Reloadly: {req.sku_label or f'Gift Card ₹{req.denomination}'}",
         "created_at":  now,
-    })
+    }
+    await db.coin_transactions.insert_one(spend)
+    await record_credit(db, spend)
+    await record_flow(db, "spent", -coin_cost, now)
 
     if result.get("status") != "delivered":
         # Coins already deducted — log for ops team; do not raise
@@ -6,9 +6,12 @@ from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime, timezone
 import time
+import uuid
 
 from server import db, get_current_user, User
-from v2_engines import ledger, voucher_provider, xoxoday
+from v2_engines import coin_expiry, ledger, voucher_provider, xoxoday
+from economy_metrics import record_flow
+from earnings_rollup import record_credit
 
 router = APIRouter()
 
@@ -50,14 +53,30 @@ async def get_ledger_balance(user: User = Depends(get_current_user)):
     balance = await ledger.get_balance(user.id)
     return {"balance": balance, "user_id": user.id}
 
+@router.get("/ledger/expiring")
+async def get_expiring_coins(user: User = Depends(get_current_user)):
+    """Bonus coins still due to expire, soonest first."""
+    buckets = await coin_expiry.get_user_expiring(user.id)
+    return {"expiring": buckets, "total": sum(b["remaining"] for b in buckets)}
+
 @router.get("/ledger/history")
 async def get_ledger_history(
-    limit: int = Query(50, le=200), offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200), offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     user: User = Depends(get_current_user),
 ):
-    entries = await ledger.get_history(user.id, limit, offset)
+    """Unified history, newest first. Pass next_cursor back as `cursor` for the next page;
+    `offset` is still accepted for older clients."""
+    next_cursor = None
+    if cursor or not offset:
+        try:
+            entries, next_cursor = await ledger.history_page(user.id, limit, cursor)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    else:
+        entries = await ledger.get_history(user.id, limit, offset)
     balance = await ledger.get_balance(user.id)
-    return {"entries": entries, "balance": balance, "count": len(entries)}
+    return {"entries": entries, "balance": balance, "count": len(entries), "next_cursor": next_cursor}
 
 @router.post("/ledger/reconcile")
 async def reconcile_ledger(user: User = Depends(get_current_user)):
@@ -110,21 +129,30 @@ async def redeem_voucher(req: RedeemVoucherReq, user: User = Depends(get_current
     if user_data.get("coins_balance", 0) < coin_cost:
         raise HTTPException(400, f"Need {coin_cost} Free Coins. You have {user_data.get('coins_balance', 0)}.")
     await db.users.update_one({"id": user.id}, {"$inc": {"coins_balance": -coin_cost}})
-    await db.coin_transactions.insert_one({
+    await coin_expiry.consume(user.id, coin_cost)
+    spend = {
+        "id": str(uuid.uuid4()),
         "user_id": user.id, "amount": -coin_cost, "type": "voucher_redeem",
         "description": f"Redeemed ₹{req.denomination} voucher ({req.product_id})",
         "timestamp": datetime.now(timezone.utc).isoformat(),
-    })
+    }
+    await db.coin_transactions.insert_one(spend)
+    await record_credit(db, spend)
+    await record_flow(db, "voucher_redeem", -coin_cost)
     email = user_data.get("email", "")
     mobile = req.mobile or user_data.get("mobile", "")
     result = await xoxoday.place_order(user.id, req.product_id, req.denomination, email, mobile)
     if result.get("status") == "failed":
         await db.users.update_one({"id": user.id}, {"$inc": {"coins_balance": coin_cost}})
-        await db.coin_transactions.insert_one({
+        refund = {
+            "id": str(uuid.uuid4()),
             "user_id": user.id, "amount": coin_cost, "type": "voucher_refund",
             "description": "Refund: voucher order failed",
             "timestamp": datetime.now(timezone.utc).isoformat(),
-        })
+        }
+        await db.coin_transactions.insert_one(refund)
+        await record_credit(db, refund)
+        await record_flow(db, "voucher_refund", coin_cost)
         raise HTTPException(500, "Voucher order failed. Coins refunded.")
     return {
         "status": result["status"], "voucher_code": result.get("voucher_code", ""),
@@ -275,6 +303,7 @@ async def router_settle(req: RouterSettleReq, user: User = Depends(get_current_u
         doc = await db.users.find_one({"id": user.id}, {"_id": 0, "coins_balance": 1})
         have = doc.get("coins_balance", 0) if doc else 0
         raise HTTPException(402, f"Insufficient coins. Need {authoritative_price}, have {have}.")
+    await coin_expiry.consume(user.id, authoritative_price)
 
     new_balance = updated["coins_balance"]
 
@@ -289,6 +318,7 @@ async def router_settle(req: RouterSettleReq, user: User = Depends(get_current_u
             "description": f"Smart Router: {req.sku} via {provider.name}",
             "balance_after": new_balance, "timestamp": now,
         })
+        await record_flow(db, "router_redemption", -authoritative_price, now)
         from router_service import settle_router_order
         order = await settle_router_order(user.id, req.sku, provider, req.delivery_address or "")
         await db.router_orders.insert_one({
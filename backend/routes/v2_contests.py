@@ -1,12 +1,13 @@
 """
 routes/v2_contests.py — Contest & Prediction routes for FREE11 V2
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from pydantic import BaseModel
 from typing import Optional, Dict
+from jose import JWTError, jwt
 
-from server import db, get_current_user, User
-from v2_engines import contests, predictions, referrals, ledger
+from server import db, get_current_user, User, SECRET_KEY, ALGORITHM
+from v2_engines import contests, predictions, referrals, ledger, projector
 
 router = APIRouter()
 
@@ -76,9 +77,20 @@ async def join_by_invite_code(req: JoinByCodeReq, user: User = Depends(get_curre
         raise HTTPException(400, str(e))
 
 
+def _optional_user_id(request: Request) -> Optional[str]:
+    """User id from a Bearer token if one is sent; public endpoints stay public."""
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return None
+    try:
+        return jwt.decode(auth[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+
 @router.get("/contests/match/{match_id}")
-async def get_match_contests(match_id: str, contest_type: Optional[str] = None):
-    return await contests.get_contests_for_match(match_id, contest_type)
+async def get_match_contests(match_id: str, request: Request, contest_type: Optional[str] = None):
+    return await contests.get_contests_for_match(match_id, contest_type, _optional_user_id(request))
 
 
 @router.get("/contests/user/my")
@@ -104,9 +116,31 @@ async def finalize_contest(contest_id: str, user: User = Depends(get_current_use
         raise HTTPException(400, str(e))
 
 
+@router.post("/contests/{contest_id}/leaderboard/rebuild")
+async def rebuild_contest_leaderboard(contest_id: str, user: User = Depends(get_current_user)):
+    if not user.is_admin:
+        raise HTTPException(403, "Admin only")
+    return {"contest_id": contest_id, "entries": await contests.rebuild_leaderboard(contest_id)}
+
+
 @router.get("/contests/{contest_id}/leaderboard")
-async def get_contest_leaderboard(contest_id: str):
-    return await contests.get_leaderboard(contest_id)
+async def get_contest_leaderboard(contest_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=500)):
+    return await contests.get_leaderboard(contest_id, offset, limit)
+
+
+@router.get("/contests/{contest_id}/leaderboard/me")
+async def get_my_contest_rank(contest_id: str, radius: int = Query(5, ge=0, le=50),
+                              user: User = Depends(get_current_user)):
+    return await contests.get_leaderboard_around(contest_id, user.id, radius)
+
+
+@router.get("/contests/{contest_id}/projection")
+async def get_contest_projection(contest_id: str, user: User = Depends(get_current_user)):
+    """Simulated rank distribution / win probability for the caller's fantasy teams."""
+    try:
+        return await projector.get_user_projection(contest_id, user.id)
+    except ValueError as e:
+        raise HTTPException(404, str(e))
 
 
 @router.get("/contests/{contest_id}")
@@ -125,17 +159,18 @@ async def admin_finalize_match(match_id: str, user: User = Depends(get_current_u
         raise HTTPException(403, "Admin only")
     open_contests = await db.contests.find(
         {"match_id": match_id, "finalized": {"$ne": True}}, {"_id": 0, "id": 1, "name": 1}
-    ).to_list(50)
+    ).to_list(None)
     if not open_contests:
         return {"message": "No contests to finalize", "match_id": match_id}
-    results = []
-    for c in open_contests:
-        try:
-            result = await contests.finalize_contest(c["id"])
-            results.append({"contest_id": c["id"], "name": c["name"], "result": result})
-        except Exception as e:
-            results.append({"contest_id": c["id"], "name": c["name"], "error": str(e)})
-    total_paid = sum(r["result"].get("total_paid", 0) for r in results if "result" in r)
+    try:
+        batch = await contests.finalize_match(match_id)
+    except Exception as e:
+        raise HTTPException(500, f"Finalization failed: {e}")
+    results = [
+        {"contest_id": c["id"], "name": c["name"], "result": batch[c["id"]]}
+        for c in open_contests if c["id"] in batch
+    ]
+    total_paid = sum(r["result"].get("total_paid", 0) for r in results)
     return {"match_id": match_id, "finalized_count": len(results), "total_paid": total_paid, "results": results}
 
 
@@ -1,13 +1,17 @@
 """
 routes/v2_earn.py — Earn, Games, Ads, Referral, Quest, Cards routes
 """
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime, timezone, date
+import uuid
 
 from server import db, get_current_user, User
 from v2_engines import ads_provider, referrals, quest_engine, cards, ledger
+from earnings_rollup import record_credit
+from earning_caps import reserve_earning
+from economy_metrics import record_flow
 
 router = APIRouter()
 
@@ -58,22 +62,35 @@ async def start_ad(req: CompleteAdReq, user: User = Depends(get_current_user)):
 async def complete_ad(req: CompleteAdReq, user: User = Depends(get_current_user)):
     return await ads_provider.complete_ad(user.id, req.ad_id)
 
+async def _reserve_coins(user_id: str, coins: int, device_id: Optional[str]) -> int:
+    """Reserve a reward under the daily cap / velocity limits; 429 when nothing is left."""
+    granted = await reserve_earning(db, user_id, coins, device_id)
+    if not granted:
+        raise HTTPException(429, "Coin earning limit reached. Try again later!")
+    return granted
+
 @router.post("/ads/reward")
-async def reward_ad_view(req: CompleteAdReq, user: User = Depends(get_current_user)):
+async def reward_ad_view(req: CompleteAdReq, user: User = Depends(get_current_user),
+                         x_device_id: Optional[str] = Header(None)):
     ad_status = await ads_provider.get_ad_status(user.id)
-    today = datetime.now(timezone.utc).date().isoformat()
-    ad_views_today = ad_status.get("views_today", 0)
-    if ad_views_today >= 5:
-        raise HTTPException(400, "Maximum 5 ad rewards per day reached")
+    if ad_status.get("remaining_today", 0) <= 0:
+        raise HTTPException(400, f"Maximum {ad_status.get('daily_limit', 5)} ad rewards per day reached")
+    if not await ads_provider.is_pending(user.id, req.ad_id):
+        raise HTTPException(400, "Invalid or already rewarded ad")
+    # Cap first: a 429 leaves the ad unconsumed, so it can still be rewarded later
+    coins = await _reserve_coins(user.id, ad_status.get("reward_per_ad", 20), x_device_id)
     try:
-        result = await ads_provider.reward_ad(user.id, req.ad_id)
-        coins = result.get("coins_earned", 20)
+        await ads_provider.reward_ad(user.id, req.ad_id)
         await db.users.update_one({"id": user.id}, {"$inc": {"coins_balance": coins}})
-        await db.coin_transactions.insert_one({
+        txn = {
+            "id": str(uuid.uuid4()),
             "user_id": user.id, "amount": coins, "type": "ad_reward",
             "description": "Rewarded video ad view",
             "timestamp": datetime.now(timezone.utc).isoformat(),
-        })
+        }
+        await db.coin_transactions.insert_one(txn)
+        await record_credit(db, txn)
+        await record_flow(db, "ad_reward", coins)
         updated = await db.users.find_one({"id": user.id}, {"_id": 0, "coins_balance": 1})
         return {"success": True, "coins_earned": coins, "new_balance": updated.get("coins_balance", 0)}
     except ValueError as e:
@@ -105,51 +122,61 @@ async def bind_referral(req: BindReferralReq, user: User = Depends(get_current_u
 
 # ── Card Game Earn Endpoints ────────────────────────────────────────────────────
 
-async def _daily_game_reward(user_id: str, game_type: str, coins: int, description: str):
+async def _daily_game_reward(user_id: str, game_type: str, coins: int, description: str,
+                             device_id: Optional[str] = None):
     """Shared helper: award daily game reward with idempotency via reference_id."""
     from datetime import date as _date
     today = str(_date.today())
     key = f"{game_type}_{user_id}_{today}"
     if await db.coin_transactions.find_one({"reference_id": key}, {"_id": 0}):
         raise HTTPException(400, f"{description} coins already claimed today. Come back tomorrow!")
+    coins = await _reserve_coins(user_id, coins, device_id)
     await db.users.update_one({"id": user_id}, {"$inc": {"coins_balance": coins}})
-    await db.coin_transactions.insert_one({
+    txn = {
+        "id": str(uuid.uuid4()),
         "user_id": user_id, "amount": coins, "type": game_type,
         "description": description, "reference_id": key, "created_at": today,
-    })
+    }
+    await db.coin_transactions.insert_one(txn)
+    await record_credit(db, txn)
+    await record_flow(db, game_type, coins, today)
     updated = await db.users.find_one({"id": user_id}, {"_id": 0, "coins_balance": 1})
     return {"success": True, "coins_earned": coins, "new_balance": updated.get("coins_balance", 0)}
 
 
 @router.post("/earn/teen-patti-win")
-async def teen_patti_win(user: User = Depends(get_current_user)):
-    return await _daily_game_reward(user.id, "teen_patti_win", 40, "Teen Patti game win vs AI")
+async def teen_patti_win(user: User = Depends(get_current_user), x_device_id: Optional[str] = Header(None)):
+    return await _daily_game_reward(user.id, "teen_patti_win", 40, "Teen Patti game win vs AI", x_device_id)
 
 @router.post("/earn/solitaire-win")
-async def solitaire_win(user: User = Depends(get_current_user)):
-    return await _daily_game_reward(user.id, "solitaire_win", 25, "Solitaire game win")
+async def solitaire_win(user: User = Depends(get_current_user), x_device_id: Optional[str] = Header(None)):
+    return await _daily_game_reward(user.id, "solitaire_win", 25, "Solitaire game win", x_device_id)
 
 @router.post("/earn/rummy-win")
-async def rummy_win(user: User = Depends(get_current_user)):
-    return await _daily_game_reward(user.id, "rummy_win", 50, "Rummy game win vs AI")
+async def rummy_win(user: User = Depends(get_current_user), x_device_id: Optional[str] = Header(None)):
+    return await _daily_game_reward(user.id, "rummy_win", 50, "Rummy game win vs AI", x_device_id)
 
 @router.post("/earn/poker-win")
-async def poker_win(user: User = Depends(get_current_user)):
-    return await _daily_game_reward(user.id, "poker_win", 60, "Poker game win vs AI")
+async def poker_win(user: User = Depends(get_current_user), x_device_id: Optional[str] = Header(None)):
+    return await _daily_game_reward(user.id, "poker_win", 60, "Poker game win vs AI", x_device_id)
 
 @router.post("/earn/app-share")
-async def app_share_reward(user: User = Depends(get_current_user)):
+async def app_share_reward(user: User = Depends(get_current_user), x_device_id: Optional[str] = Header(None)):
     key = f"app_share_{user.id}"
     if await db.coin_transactions.find_one({"reference_id": key}, {"_id": 0}):
         raise HTTPException(400, "Share bonus already claimed!")
-    coins = 50
+    coins = await _reserve_coins(user.id, 50, x_device_id)
     today = str(date.today())
     await db.users.update_one({"id": user.id}, {"$inc": {"coins_balance": coins}})
-    await db.coin_transactions.insert_one({
+    txn = {
+        "id": str(uuid.uuid4()),
         "user_id": user.id, "amount": coins, "type": "app_share",
         "description": "Shared FREE11 app with friends",
         "reference_id": key, "created_at": today,
-    })
+    }
+    await db.coin_transactions.insert_one(txn)
+    await record_credit(db, txn)
+    await record_flow(db, "app_share", coins, today)
     updated = await db.users.find_one({"id": user.id}, {"_id": 0, "coins_balance": 1})
     return {"success": True, "coins_earned": coins, "new_balance": updated.get("coins_balance", 0)}
 
@@ -4,7 +4,7 @@ routes/v2_engagement.py — Notifications, Analytics, Features, Health, Cache ro
 from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 from server import db, get_current_user, User
 from v2_engines import _analytics
@@ -95,6 +95,36 @@ async def analytics_dashboard(user: User = Depends(get_current_user)):
         raise HTTPException(403, "Admin only")
     return await _analytics.get_dashboard()
 
+@router.get("/analytics/rollups")
+async def analytics_rollups(
+    granularity: str = "day",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    events: Optional[str] = None,
+    user: User = Depends(get_current_user),
+):
+    """Event counts per hour or day bucket (default: last 7 days) from the ingestion rollups."""
+    if not user.is_admin:
+        raise HTTPException(403, "Admin only")
+    if granularity not in ("hour", "day"):
+        raise HTTPException(400, "Granularity must be hour or day")
+    now = datetime.now(timezone.utc)
+    width = 13 if granularity == "hour" else 10
+    start = (start or (now - timedelta(days=7)).isoformat())[:width]
+    end = (end or now.isoformat())[:width]
+    event_list = [e for e in (events or "").split(",") if e]
+    points = await _analytics.pipeline.series(granularity, start, end, event_list or None)
+    return {"granularity": granularity, "start": start, "end": end, "points": points,
+            "ingestion": _analytics.pipeline.stats()}
+
+@router.post("/analytics/rollups/rebuild")
+async def rebuild_analytics_rollups(days: int = 30, user: User = Depends(get_current_user)):
+    """Admin: backfill rollups and unique-user sketches from stored analytics_events."""
+    if not user.is_admin:
+        raise HTTPException(403, "Admin only")
+    since = (datetime.now(timezone.utc) - timedelta(days=max(1, min(days, 400)))).strftime("%Y-%m-%d")
+    return await _analytics.pipeline.rebuild(since)
+
 # ── Feature Gates ──────────────────────────────────────────────────────────────
 
 @router.get("/features/gated")
@@ -129,6 +159,13 @@ async def cache_stats(user: User = Depends(get_current_user)):
         raise HTTPException(403, "Admin only")
     return get_cache_stats()
 
+@router.get("/scheduler/stats")
+async def scheduler_stats(user: User = Depends(get_current_user)):
+    if not user.is_admin:
+        raise HTTPException(403, "Admin only")
+    from server import auto_scorer
+    return auto_scorer.get_stats()
+
 @router.get("/health")
 async def health_check():
     from redis_cache import get_redis
@@ -7,7 +7,10 @@ from typing import Optional, List, Dict
 from datetime import datetime, timezone
 
 from server import db, get_current_user, User
-from v2_engines import matchstate, entitysport, fantasy, crowd_meter, puzzle_engine, report_engine, contests
+from v2_engines import (
+    matchstate, entitysport, fantasy, crowd_meter, puzzle_engine, report_engine, contests, lineup_optimizer,
+    projector,
+)
 
 router = APIRouter()
 
@@ -19,6 +22,12 @@ class CreateFantasyTeamReq(BaseModel):
     captain_id: str
     vc_id: str
 
+class LineupCheckReq(BaseModel):
+    match_id: str
+    player_ids: List[str]
+    captain_id: str
+    vc_id: str
+
 class CompareTeamsReq(BaseModel):
     team_id_1: str
     team_id_2: str
@@ -123,6 +132,15 @@ async def create_fantasy_team(req: CreateFantasyTeamReq, user: User = Depends(ge
     except ValueError as e:
         raise HTTPException(400, str(e))
 
+@router.post("/fantasy/lineup-exists")
+async def check_lineup_exists(req: LineupCheckReq, user: User = Depends(get_current_user)):
+    try:
+        return await fantasy.find_identical_lineups(
+            req.match_id, req.player_ids, req.captain_id, req.vc_id, user_id=user.id,
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
 @router.get("/fantasy/my-teams")
 async def get_my_fantasy_teams(user: User = Depends(get_current_user)):
     return await fantasy.get_user_teams(user.id)
@@ -135,12 +153,75 @@ async def get_fantasy_team(team_id: str, user: User = Depends(get_current_user))
     return team
 
 @router.get("/fantasy/rankings/{match_id}")
-async def get_fantasy_rankings(match_id: str):
-    return await fantasy.get_rankings(match_id)
+async def get_fantasy_rankings(match_id: str, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=200)):
+    return await fantasy.get_rankings(match_id, cursor, limit)
+
+@router.get("/fantasy/rankings/{match_id}/me")
+async def get_my_fantasy_ranks(match_id: str, user: User = Depends(get_current_user)):
+    return {"match_id": match_id, "teams": await fantasy.get_team_ranks(match_id, user.id)}
+
+@router.get("/fantasy/player-points/{match_id}")
+async def get_fantasy_player_points(match_id: str):
+    table = await fantasy.get_player_points(match_id)
+    if table is None:
+        raise HTTPException(404, "Match not scored yet")
+    return {"match_id": match_id, "players": table}
+
+@router.get("/fantasy/best-xi/{match_id}")
+async def get_best_xi(
+    match_id: str,
+    k: int = Query(1, ge=1, le=5),
+    min_diff: int = Query(2, ge=1, le=6),
+    user: User = Depends(get_current_user),
+):
+    """Auto-pick: highest projected XI. k > 1 (diverse alternatives) is an advanced_stats unlock,
+    charged once per match — and only after the solve produced lineups."""
+    charge = False
+    if k > 1:
+        from server import feature_gating
+        unlocked = await db.freebucks_history.find_one(
+            {"user_id": user.id, "feature": "advanced_stats", "reference_id": f"best_xi:{match_id}"}, {"_id": 1}
+        )
+        if not unlocked:
+            access = await feature_gating.check_access(user.id, "advanced_stats")
+            if not access["allowed"]:
+                raise HTTPException(402, f"Insufficient FREE Bucks for {access['label']}. "
+                                         f"Need {access['cost']}, have {access['balance']}")
+            charge = True
+    try:
+        result = await lineup_optimizer.best_lineups(match_id, k=k, min_diff=min_diff)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if charge and result["lineups"]:
+        try:
+            await feature_gating.consume_feature(user.id, "advanced_stats", f"best_xi:{match_id}")
+        except ValueError as e:
+            raise HTTPException(402, str(e))
+    return result
+
+@router.get("/fantasy/perfect-xi/{match_id}")
+async def get_perfect_xi(match_id: str):
+    try:
+        return await lineup_optimizer.perfect_lineup(match_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@router.get("/fantasy/projection/{match_id}")
+async def get_fantasy_projection(match_id: str, user: User = Depends(get_current_user)):
+    return await projector.project_match_for_user(match_id, user.id)
 
 @router.post("/fantasy/compare")
 async def compare_fantasy_teams(req: CompareTeamsReq, user: User = Depends(get_current_user)):
-    return await fantasy.compare_teams(req.team_id_1, req.team_id_2)
+    result = await fantasy.compare_teams(req.team_id_1, req.team_id_2)
+    team = await fantasy.get_team(req.team_id_1)
+    if team and team.get("status") == "scored":
+        try:
+            perfect = await lineup_optimizer.perfect_lineup(team["match_id"])
+            if perfect["lineups"]:
+                result["perfect_xi"] = perfect["lineups"][0]
+        except ValueError:
+            pass
+    return result
 
 @router.get("/fantasy/points-system")
 async def get_fantasy_points():
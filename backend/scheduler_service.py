@@ -1,8 +1,12 @@
 """
 Auto-Scoring Scheduler for FREE11
-Cron job: every 60 seconds.
-- Score fantasy teams for completed matches
-- Finalize platform contests and distribute coin prizes
+Independent jobs on the JobRunner (own interval / jitter / timeout, one leader per job):
+- score_matches (60s): score fantasy teams and finalize contests for completed matches
+- live_points (30s): running fantasy totals + live rank board for matches in progress
+- lineup_warm (5m): pre-solve best-XI top-k for upcoming matches
+- leaderboard_backfill (10m): first-run rebuild of the skill and earnings leaderboards
+- percentiles (5m, every process): refresh the in-process percentile snapshot
+- weekly_reports, daily_puzzle, coin_expiry, fcm_campaigns, analytics_360
 Idempotent — no double scoring or double payouts.
 """
 import asyncio
@@ -11,8 +15,16 @@ from datetime import datetime, timezone
 from typing import Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from job_runner import LEASE_MARGIN, Job, JobRunner
+from analytics_360_engine import SNAPSHOT_INTERVAL
+from percentile_rank import REBUILD_TTL as PERCENTILE_TTL
+
 logger = logging.getLogger(__name__)
 
+MATCH_CONCURRENCY = 4   # Completed matches processed in parallel per scoring run
+REPORTS_LEASE = "weekly_reports_batch"   # held by whichever run (Monday job or admin) is generating
+REPORTS_TIMEOUT = 3600
+
 
 class AutoScorer:
     def __init__(self, db: AsyncIOMotorDatabase, fantasy_engine, entitysport_service, notification_engine):
@@ -20,11 +32,26 @@ class AutoScorer:
         self.fantasy = fantasy_engine
         self.es = entitysport_service
         self.notif = notification_engine
-        self._running = False
-        self._task: Optional[asyncio.Task] = None
+        self._runner = JobRunner(db)
+        self._runner.add(Job("score_matches", self._tick, interval=60, jitter=5, timeout=600))
+        self._runner.add(Job("live_points", self._live_points_tick, interval=30, jitter=3, timeout=120))
+        self._runner.add(Job("lineup_warm", self._lineup_warm_tick, interval=300, jitter=30, timeout=600))
+        self._runner.add(Job("leaderboard_backfill", self._leaderboard_backfill_tick, interval=600, jitter=60,
+                             timeout=1800))
+        self._runner.add(Job("percentiles", self._percentiles_tick, interval=PERCENTILE_TTL, jitter=15,
+                             timeout=300, leader_only=False))
+        self._runner.add(Job("weekly_reports", self._weekly_report_tick, interval=300, jitter=30,
+                             timeout=REPORTS_TIMEOUT))
+        self._runner.add(Job("daily_puzzle", self._daily_puzzle_tick, interval=300, jitter=30, timeout=180))
+        self._runner.add(Job("coin_expiry", self._coin_expiry_tick, interval=300, jitter=30, timeout=1800))
+        self._runner.add(Job("fcm_campaigns", self._fcm_campaign_tick, interval=60, jitter=5, timeout=300))
+        self._runner.add(Job("analytics_360", self._analytics_360_tick, interval=SNAPSHOT_INTERVAL, jitter=60,
+                             timeout=1800))
         self._contest_engine = None  # Injected after init to avoid circular import
         self._last_weekly_report_date: Optional[str] = None  # Track last Monday run
+        self._reports_claimed = False  # this process holds the report batch lease
         self._last_puzzle_date: Optional[str] = None  # Track last daily puzzle generation
+        self._last_expiry_date: Optional[str] = None  # Track last coin expiry run
         self._fcm_service = None  # Injected after init
         # Track last campaign fire time (ISO date + hour string)
         self._last_campaign: dict = {}
@@ -36,27 +63,15 @@ class AutoScorer:
         self._fcm_service = fcm_service
 
     def start(self):
-        if not self._running:
-            self._running = True
-            self._task = asyncio.create_task(self._run_loop())
-            logger.info("AutoScorer started (every 60s)")
-
-    def stop(self):
-        self._running = False
-        if self._task:
-            self._task.cancel()
-            logger.info("AutoScorer stopped")
-
-    async def _run_loop(self):
-        while self._running:
-            try:
-                await self._tick()
-                await self._weekly_report_tick()
-                await self._daily_puzzle_tick()
-                await self._fcm_campaign_tick()
-            except Exception as e:
-                logger.error(f"AutoScorer error: {e}")
-            await asyncio.sleep(60)
+        self._runner.start()
+        logger.info(f"AutoScorer started ({', '.join(self._runner.jobs)})")
+
+    async def stop(self):
+        await self._runner.stop()
+        logger.info("AutoScorer stopped")
+
+    def get_stats(self) -> dict:
+        return self._runner.get_stats()
 
     async def _weekly_report_tick(self):
         """Feature 5: Generate weekly reports for all users every Monday."""
@@ -66,15 +81,32 @@ class AutoScorer:
         today_str = now.strftime("%Y-%m-%d")
         if self._last_weekly_report_date == today_str:
             return  # Already ran today
+        if not await self.claim_weekly_reports():
+            return  # An admin-triggered run holds the batch lease
         try:
-            from engagement_engine import WeeklyReportEngine
-            report_eng = WeeklyReportEngine(self.db)
-            count = await report_eng.generate_all_users()
+            count = await self.run_weekly_reports()
             self._last_weekly_report_date = today_str
             logger.info(f"AutoScorer: Weekly reports generated for {count} users")
         except Exception as e:
             logger.error(f"AutoScorer: weekly report generation failed: {e}")
 
+    async def claim_weekly_reports(self) -> bool:
+        """Take the cluster-wide report batch lease; False while any replica is generating."""
+        # The lease is re-entrant for its owner, so this process's own run is checked locally
+        if self._reports_claimed:
+            return False
+        self._reports_claimed = await self._runner.lease.acquire(REPORTS_LEASE, REPORTS_TIMEOUT + LEASE_MARGIN)
+        return self._reports_claimed
+
+    async def run_weekly_reports(self, restart: bool = False) -> int:
+        """Generate this week's reports under a claimed lease, releasing it afterwards."""
+        from v2_engines import report_engine
+        try:
+            return await asyncio.wait_for(report_engine.generate_all_users(restart), timeout=REPORTS_TIMEOUT)
+        finally:
+            await self._runner.lease.release(REPORTS_LEASE)
+            self._reports_claimed = False
+
     async def _daily_puzzle_tick(self):
         """Feature 4: Pre-generate today's AI puzzle at midnight UTC."""
         now = datetime.now(timezone.utc)
@@ -92,80 +124,151 @@ class AutoScorer:
         except Exception as e:
             logger.error(f"AutoScorer: daily puzzle generation failed: {e}")
 
+    async def _coin_expiry_tick(self):
+        """Expire due bonus-coin buckets once per UTC day (idempotent, catches up after downtime)."""
+        today_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        if self._last_expiry_date == today_str:
+            return
+        try:
+            from v2_engines import coin_expiry
+            stats = await coin_expiry.run_expiry(today_str)
+            self._last_expiry_date = today_str
+            logger.info(f"AutoScorer: coin expiry done: {stats}")
+        except Exception as e:
+            logger.error(f"AutoScorer: coin expiry failed: {e}")
+
+    async def _analytics_360_tick(self):
+        """Rebuild the admin 360° dashboard snapshot."""
+        try:
+            from v2_engines import analytics_360
+            snapshot = await analytics_360.refresh()
+            logger.info(f"AutoScorer: analytics 360 snapshot built in {snapshot['build_seconds']}s")
+        except Exception as e:
+            logger.error(f"AutoScorer: analytics 360 snapshot failed: {e}")
+
     async def _tick(self):
         completed = await self.es.get_matches(status="2", per_page=20)
         if not completed:
             return
+        sem = asyncio.Semaphore(MATCH_CONCURRENCY)
 
-        for match in completed:
-            match_id = match.get("match_id", "")
+        async def run(match_id: str):
+            async with sem:
+                try:
+                    await self._process_match(match_id)
+                except Exception as e:
+                    logger.error(f"AutoScorer: processing failed for {match_id}: {e}")
+
+        await asyncio.gather(*(run(m["match_id"]) for m in completed if m.get("match_id")))
+
+    async def _live_points_tick(self):
+        live = await self.es.get_matches(status="3", per_page=20)
+        for match in live or []:
+            match_id = match.get("match_id")
             if not match_id:
                 continue
+            try:
+                scorecard = await self.es.get_match_scorecard(match_id)
+                if scorecard:
+                    await self.fantasy.score_live(match_id, scorecard)
+            except Exception as e:
+                logger.error(f"AutoScorer: live points failed for {match_id}: {e}")
 
-            # ── 1. Fantasy Scoring ─────────────────────────────────────────
-            already = await self.db.auto_score_log.find_one({"match_id": match_id, "status": "scored"})
-            if not already:
-                teams_count = await self.db.fantasy_teams.count_documents({
-                    "match_id": match_id, "status": {"$in": ["active", "locked"]}
-                })
-                if teams_count > 0:
-                    logger.info(f"AutoScorer: scoring match {match_id} ({teams_count} teams)")
-                    locked = await self.fantasy.lock_teams_for_match(match_id)
-                    try:
-                        scorecard = await self.es.get_match_scorecard(match_id)
-                        if scorecard:
-                            results = await self.fantasy.calculate_points(match_id, scorecard)
-                            logger.info(f"AutoScorer: scored {len(results)} teams for {match_id}")
-                            await self.db.auto_score_log.insert_one({
-                                "match_id": match_id, "status": "scored",
-                                "teams_scored": len(results), "locked": locked,
-                                "timestamp": datetime.now(timezone.utc).isoformat(),
-                            })
-                            for r in results:
-                                await self.notif.send(
-                                    r["user_id"], "team_scored",
-                                    f"Your fantasy team scored {r['total_points']} points!",
-                                    {"match_id": match_id, "points": r["total_points"]},
-                                )
-                    except Exception as e:
-                        logger.error(f"AutoScorer: fantasy scoring failed for {match_id}: {e}")
-                        await self.db.auto_score_log.insert_one({
-                            "match_id": match_id, "status": "failed",
-                            "error": str(e), "timestamp": datetime.now(timezone.utc).isoformat(),
-                        })
-
-            # ── 2. Contest Finalization ────────────────────────────────────
-            if self._contest_engine:
-                await self._finalize_match_contests(match_id)
+    async def _lineup_warm_tick(self):
+        from v2_engines import lineup_optimizer
+        upcoming = await self.es.get_matches(status="1", per_page=20)
+        ids = [m["match_id"] for m in upcoming or [] if m.get("match_id")]
+        if ids:
+            solved = await lineup_optimizer.warm(ids)
+            logger.info(f"AutoScorer: best-XI pre-solved for {solved}/{len(ids)} upcoming matches")
 
-    async def _finalize_match_contests(self, match_id: str):
-        """Finalize all unfinalized contests for a completed match. Idempotent."""
-        open_contests = await self.db.contests.find(
-            {"match_id": match_id, "finalized": {"$ne": True}, "status": {"$in": ["open", "full", "locked"]}},
-            {"_id": 0, "id": 1, "name": 1}
-        ).to_list(50)
+    async def _percentiles_tick(self):
+        """Each process keeps its own snapshot, so this job runs everywhere."""
+        from v2_engines import percentiles
+        await percentiles.refresh()
 
-        for contest in open_contests:
+    async def _leaderboard_backfill_tick(self):
+        """Rebuild the skill and earnings boards if they were never built (no-op once done)."""
+        from v2_engines import skill_leaderboards
+        from earnings_rollup import EarningsRollup
+        for name, engine in (("skill", skill_leaderboards), ("earnings", EarningsRollup(self.db))):
             try:
-                result = await self._contest_engine.finalize_contest(contest["id"])
-                logger.info(f"AutoScorer: finalized contest {contest['id']} ({contest['name']}): {result}")
-                # Notify winners
-                if result.get("payouts"):
-                    for payout in result["payouts"]:
-                        if payout.get("coins", 0) > 0:
-                            await self.notif.send(
-                                payout["user_id"], "contest_prize",
-                                f"You won {payout['coins']} FREE Coins! Rank #{payout['rank']} in {contest['name']}",
-                                {"contest_id": contest["id"], "coins": payout["coins"], "rank": payout["rank"]},
-                            )
+                result = await engine.backfill()
+                if result:
+                    logger.info(f"AutoScorer: {name} leaderboards backfilled: {result}")
             except Exception as e:
-                logger.error(f"AutoScorer: contest finalization failed for {contest['id']}: {e}")
+                logger.error(f"AutoScorer: {name} leaderboard backfill failed: {e}")
 
+    async def _process_match(self, match_id: str):
+        # ── 1. Fantasy Scoring ─────────────────────────────────────────
+        already = await self.db.auto_score_log.find_one({"match_id": match_id, "status": "scored"})
+        if not already:
+            teams_count = await self.db.fantasy_teams.count_documents({
+                "match_id": match_id, "status": {"$in": ["active", "locked"]}
+            })
+            if teams_count > 0:
+                logger.info(f"AutoScorer: scoring match {match_id} ({teams_count} teams)")
+                locked = await self.fantasy.lock_teams_for_match(match_id)
+                try:
+                    scorecard = await self.es.get_match_scorecard(match_id)
+                    if scorecard:
+                        results = await self.fantasy.calculate_points(match_id, scorecard)
+                        logger.info(f"AutoScorer: scored {len(results)} teams for {match_id}")
+                        await self.db.auto_score_log.insert_one({
+                            "match_id": match_id, "status": "scored",
+                            "teams_scored": len(results), "locked": locked,
+                            "timestamp": datetime.now(timezone.utc).isoformat(),
+                        })
+                        await self.notif.send_bulk(
+                            [r["user_id"] for r in results], "team_scored",
+                            "Your fantasy team scored {points} points!",
+                            {"match_id": match_id},
+                            contexts=[{"points": r["total_points"]} for r in results],
+                        )
+                except Exception as e:
+                    logger.error(f"AutoScorer: fantasy scoring failed for {match_id}: {e}")
+                    await self.db.auto_score_log.insert_one({
+                        "match_id": match_id, "status": "failed",
+                        "error": str(e), "timestamp": datetime.now(timezone.utc).isoformat(),
+                    })
 
+        # ── 2. Contest Finalization ────────────────────────────────────
+        if self._contest_engine:
+            await self._finalize_match_contests(match_id)
+
+    async def _finalize_match_contests(self, match_id: str):
+        """Finalize all unfinalized contests for a completed match in one batch. Idempotent."""
+        try:
+            results = await self._contest_engine.finalize_match(match_id)
+        except Exception as e:
+            logger.error(f"AutoScorer: contest finalization failed for match {match_id}: {e}")
+            return
+        if not results:
+            return
+        names = {c["id"]: c["name"] async for c in self.db.contests.find(
+            {"id": {"$in": list(results)}}, {"_id": 0, "id": 1, "name": 1})}
+        winners, contexts = [], []
+        for contest_id, result in results.items():
+            logger.info(f"AutoScorer: finalized contest {contest_id} ({names.get(contest_id)}): "
+                        f"payouts={len(result.get('payouts', []))} total_paid={result.get('total_paid', 0)}")
+            for payout in result.get("payouts", []):
+                if payout.get("coins", 0) > 0:
+                    winners.append(payout["user_id"])
+                    contexts.append({
+                        "contest_id": contest_id, "coins": payout["coins"], "rank": payout["rank"],
+                        "contest_name": names.get(contest_id, "contest"),
+                    })
+        # Notify winners — one bulk insert, pushed in FCM batches when available
+        if winners:
+            await self.notif.send_bulk(
+                winners, "contest_prize",
+                "You won {coins} FREE Coins! Rank #{rank} in {contest_name}",
+                contexts=contexts, fcm_service=self._fcm_service,
+            )
 
     async def _fcm_campaign_tick(self):
         """
-        Fire FCM campaigns at scheduled IST times (runs every 60s, fires once per slot).
+        Fire FCM campaigns at scheduled IST times (job runs every ~60s, fires once per slot).
         Slots:
           Every tick  → match_starting (30-60 min window check)
           Every tick  → activation_trigger (20-28h new-user window check, idempotent)
@@ -17,6 +17,14 @@ import sys
 import sentry_sdk
 import httpx
 
+from earnings_rollup import NON_EARNING_TYPES, record_credit, record_credits
+from earning_caps import ensure_counter_indexes, record_redemption, reserve_earning, reserve_earnings
+from economy_metrics import EconomyMetrics, record_flow, record_flows
+from batch_writer import BatchWriter
+from coin_expiry import EXPIRING_TYPES
+from ledger_engine import decode_cursor, encode_cursor, history_key, keyset_after
+from pymongo import UpdateOne
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -50,6 +58,8 @@ if _is_atlas:
 else:
     client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
+# coin_transactions inserts are group-committed across concurrent requests
+coin_txn_writer = BatchWriter(db.coin_transactions)
 
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -293,28 +303,118 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         raise credentials_exception
     return User(**user)
 
-async def add_coins(user_id: str, amount: int, transaction_type: str, description: str):
-    """Add coins to user balance and record transaction"""
-    # Update user balance
-    await db.users.update_one(
-        {"id": user_id},
-        {
-            "$inc": {"coins_balance": amount, "total_earned": amount, "xp": amount},
-            "$set": {"level": calculate_level(await get_user_xp(user_id) + amount)}
-        }
-    )
-    
-    # Record transaction
-    transaction = CoinTransaction(
-        user_id=user_id,
-        amount=amount,
-        type=transaction_type,
-        description=description
+def _level_expr(xp):
+    """USER_RANKS thresholds as an aggregation expression, so the update derives level itself."""
+    tiers = sorted(USER_RANKS.items(), key=lambda kv: kv[1]["min_xp"], reverse=True)
+    return {"$switch": {
+        "branches": [{"case": {"$gte": [xp, rank["min_xp"]]}, "then": level} for level, rank in tiers],
+        "default": 1,
+    }}
+
+def _credit_pipeline(amount: int) -> List[Dict]:
+    return [
+        {"$set": {
+            "coins_balance": {"$add": [{"$ifNull": ["$coins_balance", 0]}, amount]},
+            "total_earned": {"$add": [{"$ifNull": ["$total_earned", 0]}, amount]},
+            "xp": {"$add": [{"$ifNull": ["$xp", 0]}, amount]},
+        }},
+        {"$set": {"level": _level_expr("$xp")}},
+    ]
+
+def _coin_txn(user_id: str, amount: int, transaction_type: str, description: str) -> Dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "amount": amount,
+        "type": transaction_type,
+        "description": description,
+        "source": "skill",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+async def record_opening_balance(user_id: str, amount: int, description: str) -> Dict:
+    """Transaction row for the coins a new user document is inserted with, so the
+    account's history nets to its balance (ledger reconcile) and the economy counts it."""
+    transaction = _coin_txn(user_id, amount, "welcome_bonus", description)
+    await coin_txn_writer.insert(transaction)
+    await record_credit(db, transaction)
+    await record_flow(db, "welcome_bonus", amount, transaction["timestamp"])
+    return transaction
+
+async def _refresh_levels(changes: List[tuple]):
+    """Clan / league memberships carry a denormalised level — push it when a credit crosses a tier."""
+    crossed = [(uid, calculate_level(before.get("xp", 0) + amount)) for uid, before, amount in changes
+               if before and calculate_level(before.get("xp", 0) + amount) != before.get("level", 1)]
+    if crossed:
+        from v2_engines import group_leaderboards
+        for uid, level in crossed:
+            await group_leaderboards.refresh_profile(uid, level=level)
+
+async def add_coins(user_id: str, amount: int, transaction_type: str, description: str,
+                    device_id: Optional[str] = None):
+    """Add coins to user balance and record transaction.
+    One pipeline update increments balance / XP and derives level from USER_RANKS.
+    Earnings are reserved under the daily cap first, so the returned transaction holds
+    the coins actually credited — 0 (and nothing written) once the cap is reached."""
+    if transaction_type not in NON_EARNING_TYPES:
+        amount = await reserve_earning(db, user_id, amount, device_id)
+        if amount <= 0:
+            return _coin_txn(user_id, 0, transaction_type, description)
+    before = await db.users.find_one_and_update(
+        {"id": user_id}, _credit_pipeline(amount), projection={"_id": 0, "xp": 1, "level": 1}
     )
-    await db.coin_transactions.insert_one(transaction.model_dump())
-    
+    transaction = _coin_txn(user_id, amount, transaction_type, description)
+    await coin_txn_writer.insert(transaction)
+    await record_credit(db, transaction)
+    await record_flow(db, transaction_type, amount, transaction["timestamp"])
+    if transaction_type in EXPIRING_TYPES:
+        from v2_engines import coin_expiry
+        await coin_expiry.grant(user_id, amount)
+    await _refresh_levels([(user_id, before, amount)])
     return transaction
 
+async def add_coins_many(credits: List[tuple]) -> List[Optional[Dict]]:
+    """List form of add_coins for bulk callers: [(user_id, amount, transaction_type, description)].
+    One read of current XP (for tier-change hooks), one bulk_write, one batched insert.
+    Returns one entry per credit, in order: the transaction written (its amount is what the
+    daily cap let through), or None when nothing was credited."""
+    if not credits:
+        return []
+    # Daily cap: each user's credits are granted in order until their reservation runs out
+    left = await reserve_earnings(db, [(c[0], c[1]) for c in credits if c[2] not in NON_EARNING_TYPES])
+    granted: List[Optional[Dict]] = [None] * len(credits)
+    capped = []
+    for i, (user_id, amount, transaction_type, description) in enumerate(credits):
+        if transaction_type not in NON_EARNING_TYPES:
+            amount = min(amount, left.get(user_id, 0))
+            left[user_id] = left.get(user_id, 0) - amount
+        if amount > 0:
+            capped.append((i, (user_id, amount, transaction_type, description)))
+    if not capped:
+        return granted
+    totals: Dict[str, int] = {}
+    for _, (user_id, amount, _, _) in capped:
+        totals[user_id] = totals.get(user_id, 0) + amount
+    before = {
+        u["id"]: u async for u in db.users.find(
+            {"id": {"$in": list(totals)}}, {"_id": 0, "id": 1, "xp": 1, "level": 1})
+    }
+    await db.users.bulk_write(
+        [UpdateOne({"id": uid}, _credit_pipeline(amount)) for uid, amount in totals.items()], ordered=False
+    )
+    transactions = [_coin_txn(*credit) for _, credit in capped]
+    await coin_txn_writer.insert_many(transactions)
+    await record_credits(db, transactions)
+    await record_flows(db, [(t["type"], t["amount"]) for t in transactions], transactions[0]["timestamp"])
+    expiring = [(t["user_id"], t["amount"]) for t in transactions if t["type"] in EXPIRING_TYPES]
+    if expiring:
+        from v2_engines import coin_expiry
+        await coin_expiry.grant_many(expiring)
+    await _refresh_levels([(uid, before.get(uid), amount) for uid, amount in totals.items()])
+    for (i, _), txn in zip(capped, transactions):
+        granted[i] = txn
+    return granted
+
 async def spend_coins(user_id: str, amount: int, description: str):
     """Spend coins from user balance - atomic to prevent race condition / negative balance"""
     result = await db.users.find_one_and_update(
@@ -325,13 +425,11 @@ async def spend_coins(user_id: str, amount: int, description: str):
     if result is None:
         raise HTTPException(status_code=400, detail="Insufficient coins")
     
-    transaction = CoinTransaction(
-        user_id=user_id,
-        amount=-amount,
-        type="spent",
-        description=description
-    )
-    await db.coin_transactions.insert_one(transaction.model_dump())
+    transaction = _coin_txn(user_id, -amount, "spent", description)
+    await coin_txn_writer.insert(transaction)
+    await record_flow(db, "spent", -amount, transaction["timestamp"])
+    from v2_engines import coin_expiry
+    await coin_expiry.consume(user_id, amount)
 
 async def get_user_xp(user_id: str):
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
@@ -419,6 +517,7 @@ async def register(user_data: UserCreate, request: Request):
         await use_invite_code(user_data.invite_code, user.id, user.email)
     
     await db.users.insert_one(user_dict)
+    await record_opening_balance(user.id, 50, "Opening balance")
     
     # Create welcome transaction
     await add_coins(user.id, 50, "bonus", "Welcome bonus")
@@ -567,11 +666,11 @@ async def google_oauth_callback(session_id: str = Query(...)):
             "coin_expiry_date": coin_expiry,
         }
         await db.users.insert_one(new_user)
-        await db.coin_transactions.insert_one({
-            "user_id": user_id, "amount": 50, "type": "welcome_bonus",
-            "description": "Welcome to FREE11! Google sign-up bonus.",
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-        })
+        await record_opening_balance(user_id, 50, "Welcome to FREE11! Google sign-up bonus.")
+        try:
+            await analytics.track("registration", user_id)
+        except Exception:
+            pass
 
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     token = create_access_token({"sub": user_id})
@@ -677,7 +776,12 @@ async def verify_otp_register(req: OTPRegisterRequest):
         "coin_expiry_date": coin_expiry,
     }
     await db.users.insert_one(new_user_doc)
+    await record_opening_balance(user_id, 50, "Opening balance")
     await add_coins(user_id, 50, "bonus", "Welcome bonus")
+    try:
+        await analytics.track("registration", user_id)
+    except Exception:
+        pass
 
     token = create_access_token({"sub": user_id})
     safe_user = {k: v for k, v in new_user_doc.items() if k not in ("password_hash", "coin_expiry_date", "_id")}
@@ -772,11 +876,11 @@ async def phone_firebase_verify(req: PhoneFirebaseRequest):
         }
     }
     await db.users.insert_one(new_user)
-    await db.coin_transactions.insert_one({
-        "user_id": user_id, "amount": 50, "type": "welcome_bonus",
-        "description": "Welcome to FREE11! Phone sign-up bonus.",
-        "timestamp": now,
-    })
+    await record_opening_balance(user_id, 50, "Welcome to FREE11! Phone sign-up bonus.")
+    try:
+        await analytics.track("registration", user_id)
+    except Exception:
+        pass
     token = create_access_token({"sub": user_id})
     new_user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
     safe = {k: v for k, v in new_user_doc.items() if k not in ("password_hash", "hashed_password", "coin_expiry_date")}
@@ -911,20 +1015,28 @@ async def get_balance(current_user: User = Depends(get_current_user)):
 async def get_transactions(
     current_user: User = Depends(get_current_user),
     skip: int = Query(0, ge=0, description="Number of records to skip"),
-    limit: int = Query(50, ge=1, le=200, description="Records per page (max 200)")
+    limit: int = Query(50, ge=1, le=200, description="Records per page (max 200)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (keyset)")
 ):
-    """Paginated transaction history for current user."""
+    """Paginated transaction history for current user, newest first (timestamp, id)."""
+    query = {"user_id": current_user.id}
+    if cursor:
+        try:
+            query.update(keyset_after(decode_cursor(cursor)))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     total = await db.coin_transactions.count_documents({"user_id": current_user.id})
     transactions = await db.coin_transactions.find(
-        {"user_id": current_user.id},
-        {"_id": 0}
-    ).sort("timestamp", -1).skip(skip).limit(limit).to_list(limit)
-    # Ensure every entry has a unique id for frontend key prop
+        query
+    ).sort([("timestamp", -1), ("id", -1)]).skip(0 if cursor else skip).limit(limit).to_list(limit)
+    # Every entry needs an id (frontend key prop); rows the startup backfill hasn't reached
+    # yet get the same str(_id) it will store
     for tx in transactions:
+        _oid = tx.pop("_id", None)
         if not tx.get("id"):
-            import uuid as _uuid
-            tx["id"] = str(_uuid.uuid4())
-    return {"transactions": transactions, "total": total, "skip": skip, "limit": limit}
+            tx["id"] = str(_oid)
+    next_cursor = encode_cursor(history_key(transactions[-1])) if len(transactions) == limit else None
+    return {"transactions": transactions, "total": total, "skip": skip, "limit": limit, "next_cursor": next_cursor}
 
 @api_router.post("/coins/checkin")
 async def daily_checkin(current_user: User = Depends(get_current_user)):
@@ -949,12 +1061,12 @@ async def daily_checkin(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="Already checked in today")
     
     # Add coins
-    transaction = await add_coins(
+    total_reward = (await add_coins(
         current_user.id,
         total_reward,
         "earned",
         f"Daily check-in (Day {new_streak})"
-    )
+    ))["amount"]
     
     # Record activity
     activity = Activity(
@@ -988,12 +1100,12 @@ async def play_quiz(submission: QuizSubmission, current_user: User = Depends(get
     coins_earned = int(correct_count * 10)
     
     if coins_earned > 0:
-        transaction = await add_coins(
+        coins_earned = (await add_coins(
             current_user.id,
             coins_earned,
             "earned",
             f"Quiz completed ({correct_count}/{total_questions} correct)"
-        )
+        ))["amount"]
         
         activity = Activity(
             user_id=current_user.id,
@@ -1032,12 +1144,12 @@ async def spin_wheel(current_user: User = Depends(get_current_user)):
     coins_earned = random.choices(rewards, weights=weights)[0]
     
     if coins_earned > 0:
-        transaction = await add_coins(
+        coins_earned = (await add_coins(
             current_user.id,
             coins_earned,
             "earned",
             "Spin the wheel"
-        )
+        ))["amount"]
     
     activity = Activity(
         user_id=current_user.id,
@@ -1072,12 +1184,12 @@ async def scratch_card(current_user: User = Depends(get_current_user)):
     coins_earned = random.choices(rewards, weights=weights)[0]
     
     if coins_earned > 0:
-        await add_coins(
+        coins_earned = (await add_coins(
             current_user.id,
             coins_earned,
             "earned",
             "Scratch card"
-        )
+        ))["amount"]
     
     activity = Activity(
         user_id=current_user.id,
@@ -1147,12 +1259,12 @@ async def complete_task(task_data: TaskComplete, current_user: User = Depends(ge
     coins_earned = task_rewards.get(task_data.task_id, 0)
     
     if coins_earned > 0:
-        await add_coins(
+        coins_earned = (await add_coins(
             current_user.id,
             coins_earned,
             "earned",
             f"Task completed: {task_data.task_id}"
-        )
+        ))["amount"]
         
         activity = Activity(
             user_id=current_user.id,
@@ -1262,6 +1374,7 @@ async def create_redemption(redemption_data: RedemptionCreate, current_user: Use
         delivery_address=redemption_data.delivery_address
     )
     await db.redemptions.insert_one(redemption.model_dump())
+    await record_redemption(db, current_user.id)
     
     # Check for first redemption achievement
     redemption_count = await db.redemptions.count_documents({"user_id": current_user.id})
@@ -1403,40 +1516,20 @@ async def get_user_badges(current_user: User = Depends(get_current_user)):
 @api_router.get("/leaderboard")
 async def get_leaderboard():
     """Get leaderboard based on SKILL (prediction accuracy), not coins"""
-    # Aggregate from ball predictions for skill-based leaderboard
-    pipeline = [
-        {"$group": {
-            "_id": "$user_id",
-            "total_predictions": {"$sum": 1},
-            "correct_predictions": {"$sum": {"$cond": ["$is_correct", 1, 0]}}
-        }},
-        {"$match": {"total_predictions": {"$gte": 5}}},  # Min 5 predictions to qualify
-        {"$addFields": {
-            "accuracy": {"$multiply": [{"$divide": ["$correct_predictions", "$total_predictions"]}, 100]}
-        }},
-        {"$sort": {"accuracy": -1, "correct_predictions": -1}},
-        {"$limit": 10}
+    from v2_engines import skill_leaderboards
+    rows = await skill_leaderboards.get_global(10)
+    result = [
+        {
+            "id": row["user_id"],
+            "name": row["name"],
+            "level": row.get("level", 1),
+            "accuracy": round(row.get("correct", 0) / row["total"] * 100, 1) if row.get("total") else 0,
+            "total_predictions": row.get("total", 0),
+            "correct_predictions": row.get("correct", 0)
+        }
+        for row in rows
     ]
     
-    leaderboard_data = await db.ball_predictions.aggregate(pipeline).to_list(10)
-    
-    # Enrich with user data
-    result = []
-    for entry in leaderboard_data:
-        user = await db.users.find_one(
-            {"id": entry["_id"], "is_admin": {"$ne": True}, "is_seed": {"$ne": True}},
-            {"_id": 0, "name": 1, "level": 1}
-        )
-        if user:
-            result.append({
-                "id": entry["_id"],
-                "name": user.get("name", "Anonymous"),
-                "level": user.get("level", 1),
-                "accuracy": round(entry["accuracy"], 1),
-                "total_predictions": entry["total_predictions"],
-                "correct_predictions": entry["correct_predictions"]
-            })
-    
     # Fallback to old leaderboard if no predictions yet
     if not result:
         users = await db.users.find(
@@ -1871,7 +1964,6 @@ from fraud_engine import FraudEngine
 from freebucks_engine import FreeBucksEngine
 from feature_gate import FeatureGate
 from notification_engine import NotificationEngine
-from analytics_engine import AnalyticsEngine
 from analytics_360_routes import analytics_360_router, init_analytics_360
 from scheduler_service import AutoScorer
 from redis_cache import get_cache_stats
@@ -1882,11 +1974,11 @@ from fcm_service import FCMService
 
 # Initialize new engines
 entitysport = EntitySportService(db)
-fantasy = FantasyEngine(db)
+fantasy = FantasyEngine(db, entitysport)
 fraud = FraudEngine(db)
 freebucks = FreeBucksEngine(db)
 notif_engine = NotificationEngine(db)
-analytics = AnalyticsEngine(db)
+from v2_engines import _analytics as analytics  # one event pipeline per process
 feature_gating = FeatureGate(db, freebucks)
 auto_scorer = AutoScorer(db, fantasy, entitysport, notif_engine)
 otp_engine = OTPEngine(db)
@@ -1924,6 +2016,7 @@ async def startup_event():
     auto_scorer.set_contest_engine(contest_engine_instance)
     auto_scorer.set_fcm_service(fcm)
     auto_scorer.start()
+    analytics.pipeline.start()
     # Create unique index on coin_transactions.unique_payout_id for payout idempotency
     try:
         await db.coin_transactions.create_index(
@@ -1944,9 +2037,45 @@ async def startup_event():
         await db.redemptions.create_index([("user_id", 1), ("order_date", -1)], name="redempt_user_date")
         await db.missions.create_index([("user_id", 1), ("type", 1)], name="mission_user_type")
         await db.router_orders.create_index("user_id", name="router_user_id")
+        await db.predictions_v2.create_index(
+            [("match_id", 1), ("status", 1), ("user_id", 1), ("submitted_at", 1)], name="predv2_match_user_time")
+        await db.contest_entries.create_index([("contest_id", 1), ("user_id", 1)], name="centry_contest_user")
+        await fantasy.ensure_indexes()
+        from v2_engines import skill_leaderboards, group_leaderboards, report_engine
+        await skill_leaderboards.ensure_indexes()
+        await group_leaderboards.ensure_indexes()
+        await report_engine.ensure_indexes()
+        from v2_engines import ledger, coin_expiry
+        await ledger.ensure_indexes()
+        await coin_expiry.ensure_indexes()
+        await ensure_counter_indexes(db)
+        from earnings_rollup import EarningsRollup
+        await EarningsRollup(db).ensure_indexes()
+        await EconomyMetrics(db).ensure_indexes()
+        from v2_engines import analytics_360
+        await analytics_360.ensure_indexes()
+        await analytics.pipeline.ensure_indexes()
+        # Streaming exports keyset-sort fulfillments: admin by (created_at, id),
+        # brand by (delivered_at, id) within one brand's delivered rows
+        await db.fulfillments.create_index([("created_at", 1), ("id", 1)], name="fulfil_created_id")
+        await db.fulfillments.create_index(
+            [("brand_id", 1), ("status", 1), ("delivered_at", 1), ("id", 1)], name="fulfil_brand_delivered_id")
         logger.info("DB indexes created/verified")
     except Exception as e:
         logger.warning(f"Index creation (non-fatal): {e}")
+    # Keyset transaction history needs an id on every coin_transactions row
+    try:
+        from v2_engines import ledger
+        await ledger.backfill_txn_ids()
+    except Exception as e:
+        logger.warning(f"coin_transactions id backfill skipped: {e}")
+    # Contest membership: unique (contest_id, user_id) index guards joins; then move
+    # legacy contests.participants arrays into contest_members (idempotent)
+    try:
+        await contest_engine_instance.ensure_indexes()
+        await contest_engine_instance.migrate_participant_arrays()
+    except Exception as e:
+        logger.warning(f"Contest membership migration skipped: {e}")
     # Feature 4: Pre-generate today's AI puzzle on startup (warm cache, non-blocking)
     # Note: Wrapped in try-except to prevent startup failures in production
     try:
@@ -2043,7 +2172,9 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    auto_scorer.stop()
+    await auto_scorer.stop()
+    await coin_txn_writer.flush()
+    await analytics.pipeline.stop()
     client.close()
 
 # ══════════════════════ HEALTH CHECK ══════════════════════
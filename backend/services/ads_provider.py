@@ -61,6 +61,18 @@ class MockAdsProvider(AdsProvider):
             "remaining_today": self.DAILY_AD_LIMIT - daily_count - 1,
         }
 
+    async def is_pending(self, user_id: str, ad_id: str) -> bool:
+        """Started and not yet completed (rewardable), without consuming it."""
+        return await self.db.ad_events.count_documents(
+            {"id": ad_id, "user_id": user_id, "status": "started"}, limit=1) > 0
+
+    async def reward_ad(self, user_id: str, ad_id: str) -> Dict:
+        """Complete a started ad for its reward; ValueError if it is unknown or already used."""
+        result = await self.complete_ad(user_id, ad_id)
+        if result.get("error"):
+            raise ValueError("Invalid or already rewarded ad")
+        return {"coins_earned": result["reward_coins"], "remaining_today": result["remaining_today"]}
+
     async def complete_ad(self, user_id: str, ad_id: str) -> Dict:
         ad = await self.db.ad_events.find_one(
             {"id": ad_id, "user_id": user_id, "status": "started"}, {"_id": 0}
@@ -69,14 +81,16 @@ class MockAdsProvider(AdsProvider):
             return {"error": "invalid_ad"}
 
         now = datetime.now(timezone.utc).isoformat()
-        await self.db.ad_events.update_one(
-            {"id": ad_id},
+        updated = await self.db.ad_events.update_one(
+            {"id": ad_id, "status": "started"},
             {"$set": {
                 "status": "completed",
                 "completed_at": now,
                 "reward_coins": self.AD_REWARD_COINS,
             }}
         )
+        if not updated.modified_count:
+            return {"error": "invalid_ad"}  # completed by a concurrent request
 
         daily_count = await self._get_daily_count(user_id)
         return {
@@ -0,0 +1,302 @@
+"""
+Skill Leaderboard Engine for FREE11
+Materialised global / weekly / streak / correct-prediction leaderboards.
+
+Per-user prediction stats live in `skill_stats` (all time) and `skill_stats_weekly`
+(per Monday-start week), with name / level / eligibility denormalised. They are
+bumped with $inc when ball predictions resolve, and each affected user is re-ranked
+on the shared LeaderboardStore boards (Redis ZSETs, in-memory skip lists otherwise).
+Reads are a board window plus one $in lookup for the rows on the page.
+`rebuild()` recomputes everything from ball_predictions; `backfill()` runs it once
+per deployment (scheduler) so a fresh install doesn't serve empty boards.
+"""
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne, UpdateOne
+
+from leaderboard_store import leaderboard_store
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_MIN_PREDICTIONS = 5
+WEEKLY_MIN_PREDICTIONS = 3
+WEEKS_KEPT = 8              # skill_stats_weekly rows older than this are dropped on rebuild
+REBUILD_CHUNK = 1000
+
+BOARD_GLOBAL = "skill:global"
+BOARD_STREAK = "skill:streak"
+BOARD_CORRECT = "skill:correct"
+META_ID = "skill"           # leaderboard_meta doc written by every completed rebuild
+
+STATS_PROJECTION = {"_id": 0, "user_id": 1, "name": 1, "level": 1, "total": 1, "correct": 1,
+                    "coins": 1, "streak": 1, "eligible": 1}
+
+
+def week_start(now: Optional[datetime] = None) -> str:
+    """Monday (UTC) of the week containing `now`, as YYYY-MM-DD."""
+    now = now or datetime.now(timezone.utc)
+    return (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+
+
+def _week_of(iso: Optional[str]) -> str:
+    try:
+        dt = datetime.fromisoformat(iso) if iso else None
+    except ValueError:
+        dt = None
+    return week_start(dt)
+
+
+def _accuracy(correct: int, total: int) -> float:
+    return correct / total * 100 if total else 0.0
+
+
+# Composite board scores — one number ordering several keys, all exact in a double.
+def global_score(s: Dict) -> float:
+    """accuracy DESC, streak DESC, correct DESC."""
+    acc = round(_accuracy(s.get("correct", 0), s.get("total", 0)) * 100)
+    return acc * 1e11 + min(s.get("streak", 0), 99_999) * 1e6 + min(s.get("correct", 0), 999_999)
+
+
+def weekly_score(s: Dict) -> float:
+    """accuracy DESC, correct DESC."""
+    acc = round(_accuracy(s.get("correct", 0), s.get("total", 0)) * 100)
+    return acc * 1e6 + min(s.get("correct", 0), 999_999)
+
+
+def _weekly_board(week: str) -> str:
+    return f"skill:weekly:{week}"
+
+
+class SkillLeaderboardEngine:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db.skill_stats.create_index("user_id", unique=True, name="skill_user")
+        await self.db.skill_stats_weekly.create_index([("week", 1), ("user_id", 1)], unique=True, name="skillw_week_user")
+
+    # ── Incremental updates ───────────────────────────────────────────────────
+
+    async def record_results(self, results: Iterable[Dict]) -> int:
+        """Apply resolved ball predictions: [{user_id, is_correct, coins_earned, predicted_at_iso}]."""
+        totals: Dict[str, Dict] = {}
+        weekly: Dict[tuple, Dict] = {}
+        for r in results:
+            inc = {"total": 1, "correct": 1 if r.get("is_correct") else 0}
+            t = totals.setdefault(r["user_id"], {"total": 0, "correct": 0, "coins": 0})
+            t["total"] += inc["total"]
+            t["correct"] += inc["correct"]
+            t["coins"] += r.get("coins_earned", 0) or 0
+            w = weekly.setdefault((_week_of(r.get("predicted_at_iso")), r["user_id"]), {"total": 0, "correct": 0})
+            w["total"] += inc["total"]
+            w["correct"] += inc["correct"]
+        if not totals:
+            return 0
+
+        users = await self._user_meta(list(totals))
+        now = datetime.now(timezone.utc).isoformat()
+        await self.db.skill_stats.bulk_write([
+            UpdateOne({"user_id": uid}, {"$inc": inc, "$set": {**users.get(uid, {}), "updated_at": now}}, upsert=True)
+            for uid, inc in totals.items()
+        ], ordered=False)
+        await self.db.skill_stats_weekly.bulk_write([
+            UpdateOne({"week": week, "user_id": uid},
+                      {"$inc": inc, "$set": {**self._week_meta(users.get(uid, {})), "updated_at": now}}, upsert=True)
+            for (week, uid), inc in weekly.items()
+        ], ordered=False)
+
+        async for s in self.db.skill_stats.find({"user_id": {"$in": list(totals)}}, STATS_PROJECTION):
+            self._rank_user(s)
+        weeks = {week for week, _ in weekly}
+        async for s in self.db.skill_stats_weekly.find(
+            {"week": {"$in": list(weeks)}, "user_id": {"$in": list(totals)}},
+            {"_id": 0, "week": 1, "user_id": 1, "name": 1, "total": 1, "correct": 1, "eligible": 1},
+        ):
+            if s.get("eligible") and s.get("total", 0) >= WEEKLY_MIN_PREDICTIONS:
+                self._upsert(_weekly_board(s["week"]), s["user_id"], weekly_score(s), s.get("name"))
+        return len(totals)
+
+    async def update_streaks(self, user_ids: List[str]) -> None:
+        """Re-read users.prediction_streak after a streak change and re-rank those users."""
+        if not user_ids:
+            return
+        users = await self._user_meta(user_ids)
+        now = datetime.now(timezone.utc).isoformat()
+        await self.db.skill_stats.bulk_write([
+            UpdateOne({"user_id": uid},
+                      {"$set": {**meta, "updated_at": now}, "$setOnInsert": {"total": 0, "correct": 0, "coins": 0}},
+                      upsert=True)
+            for uid, meta in users.items()
+        ], ordered=False)
+        async for s in self.db.skill_stats.find({"user_id": {"$in": list(users)}}, STATS_PROJECTION):
+            self._rank_user(s)
+
+    def _rank_user(self, s: Dict) -> None:
+        uid, name = s["user_id"], s.get("name")
+        if s.get("correct", 0) > 0:
+            self._upsert(BOARD_CORRECT, uid, s["correct"], name)
+        if not s.get("eligible"):
+            return
+        if s.get("total", 0) >= GLOBAL_MIN_PREDICTIONS:
+            self._upsert(BOARD_GLOBAL, uid, global_score(s), name)
+        if s.get("streak", 0) > 0:
+            self._upsert(BOARD_STREAK, uid, s["streak"], name)
+        else:
+            leaderboard_store.remove(BOARD_STREAK, uid)
+
+    @staticmethod
+    def _upsert(board: str, member: str, points: float, name: Optional[str]) -> None:
+        # Unloaded boards are skipped — the next read rebuilds them from skill_stats
+        leaderboard_store.upsert(board, member, points, tiebreak="", name=name)
+
+    async def _user_meta(self, user_ids: List[str]) -> Dict[str, Dict]:
+        users = await self.db.users.find(
+            {"id": {"$in": user_ids}},
+            {"_id": 0, "id": 1, "name": 1, "level": 1, "is_admin": 1, "is_seed": 1, "prediction_streak": 1},
+        ).to_list(len(user_ids))
+        return {
+            u["id"]: {
+                "name": u.get("name", "Anonymous"),
+                "level": u.get("level", 1),
+                "streak": u.get("prediction_streak", 0),
+                "eligible": not u.get("is_admin") and not u.get("is_seed"),
+            }
+            for u in users
+        }
+
+    @staticmethod
+    def _week_meta(meta: Dict) -> Dict:
+        return {k: v for k, v in meta.items() if k != "streak"}
+
+    # ── Reads ─────────────────────────────────────────────────────────────────
+
+    async def get_global(self, limit: int = 50) -> List[Dict]:
+        return await self._page(BOARD_GLOBAL, self._load_global, self.db.skill_stats, {}, limit)
+
+    async def get_weekly(self, limit: int = 50, week: Optional[str] = None) -> List[Dict]:
+        week = week or week_start()
+        return await self._page(_weekly_board(week), lambda: self._load_weekly(week),
+                                self.db.skill_stats_weekly, {"week": week}, limit)
+
+    async def get_streak(self, limit: int = 50) -> List[Dict]:
+        return await self._page(BOARD_STREAK, self._load_streak, self.db.skill_stats, {}, limit)
+
+    async def get_most_correct(self, limit: int = 20) -> List[Dict]:
+        return await self._page(BOARD_CORRECT, self._load_correct, self.db.skill_stats, {}, limit)
+
+    async def _page(self, board: str, loader, coll, query: Dict, limit: int) -> List[Dict]:
+        """Top `limit` rows of a board, each merged with its stats doc: {rank, user_id, name, ...stats}."""
+        await leaderboard_store.ensure(board, loader)
+        rows = leaderboard_store.window(board, 0, limit)
+        if not rows:
+            return []
+        stats = {
+            s["user_id"]: s async for s in coll.find(
+                {**query, "user_id": {"$in": [r["member"] for r in rows]}},
+                {"_id": 0, "user_id": 1, "level": 1, "total": 1, "correct": 1, "coins": 1, "streak": 1},
+            )
+        }
+        return [
+            {**stats.get(r["member"], {}), "rank": r["rank"], "user_id": r["member"],
+             "name": r.get("name") or "Anonymous"}
+            for r in rows
+        ]
+
+    async def _load_global(self):
+        docs = await self.db.skill_stats.find(
+            {"eligible": True, "total": {"$gte": GLOBAL_MIN_PREDICTIONS}}, STATS_PROJECTION).to_list(None)
+        return [{"member": d["user_id"], "points": global_score(d), "name": d.get("name")} for d in docs], {}
+
+    async def _load_weekly(self, week: str):
+        docs = await self.db.skill_stats_weekly.find(
+            {"week": week, "eligible": True, "total": {"$gte": WEEKLY_MIN_PREDICTIONS}},
+            {"_id": 0, "user_id": 1, "name": 1, "total": 1, "correct": 1}).to_list(None)
+        return [{"member": d["user_id"], "points": weekly_score(d), "name": d.get("name")} for d in docs], {"week": week}
+
+    async def _load_streak(self):
+        docs = await self.db.skill_stats.find(
+            {"eligible": True, "streak": {"$gt": 0}}, {"_id": 0, "user_id": 1, "name": 1, "streak": 1}).to_list(None)
+        return [{"member": d["user_id"], "points": d["streak"], "name": d.get("name")} for d in docs], {}
+
+    async def _load_correct(self):
+        docs = await self.db.skill_stats.find(
+            {"correct": {"$gt": 0}}, {"_id": 0, "user_id": 1, "name": 1, "correct": 1}).to_list(None)
+        return [{"member": d["user_id"], "points": d["correct"], "name": d.get("name")} for d in docs], {}
+
+    # ── Full rebuild (admin job / first-run backfill) ─────────────────────────
+
+    async def backfill(self) -> Optional[Dict]:
+        """Rebuild once if no rebuild has ever completed (stats written before the
+        incremental path existed would otherwise never reach the boards)."""
+        if await self.db.leaderboard_meta.find_one({"_id": META_ID}, {"_id": 1}):
+            return None
+        return await self.rebuild()
+
+    async def rebuild(self) -> Dict:
+        """Recompute skill_stats and the current week from ball_predictions, then drop cached boards."""
+        started = datetime.now(timezone.utc)
+        stamp = started.isoformat()
+        week = week_start(started)
+        week_start_iso = datetime.strptime(week, "%Y-%m-%d").replace(tzinfo=timezone.utc).isoformat()
+
+        totals = {
+            d["_id"]: d async for d in self.db.ball_predictions.aggregate([
+                {"$match": {"resolved": True}},
+                {"$group": {"_id": "$user_id", "total": {"$sum": 1},
+                            "correct": {"$sum": {"$cond": ["$is_correct", 1, 0]}},
+                            "coins": {"$sum": "$coins_earned"}}},
+            ], allowDiskUse=True)
+        }
+        weekly = {
+            d["_id"]: d async for d in self.db.ball_predictions.aggregate([
+                {"$match": {"resolved": True, "predicted_at_iso": {"$gte": week_start_iso}}},
+                {"$group": {"_id": "$user_id", "total": {"$sum": 1},
+                            "correct": {"$sum": {"$cond": ["$is_correct", 1, 0]}}}},
+            ], allowDiskUse=True)
+        }
+        # Users with a streak from v2 over predictions but no ball predictions still rank on streaks
+        async for u in self.db.users.find({"prediction_streak": {"$gt": 0}}, {"_id": 0, "id": 1}):
+            totals.setdefault(u["id"], {"_id": u["id"], "total": 0, "correct": 0, "coins": 0})
+
+        user_ids = list(totals)
+        for i in range(0, len(user_ids), REBUILD_CHUNK):
+            chunk = user_ids[i:i + REBUILD_CHUNK]
+            users = await self._user_meta(chunk)
+            await self.db.skill_stats.bulk_write([
+                ReplaceOne({"user_id": uid}, {
+                    "user_id": uid, **users.get(uid, {"name": "Anonymous", "level": 1, "streak": 0, "eligible": False}),
+                    "total": totals[uid]["total"], "correct": totals[uid]["correct"],
+                    "coins": totals[uid].get("coins", 0) or 0, "rebuilt_at": stamp, "updated_at": stamp,
+                }, upsert=True)
+                for uid in chunk
+            ], ordered=False)
+            weekly_ops = [
+                ReplaceOne({"week": week, "user_id": uid}, {
+                    "week": week, "user_id": uid,
+                    **self._week_meta(users.get(uid, {"name": "Anonymous", "level": 1, "eligible": False})),
+                    "total": weekly[uid]["total"], "correct": weekly[uid]["correct"],
+                    "rebuilt_at": stamp, "updated_at": stamp,
+                }, upsert=True)
+                for uid in chunk if uid in weekly
+            ]
+            if weekly_ops:
+                await self.db.skill_stats_weekly.bulk_write(weekly_ops, ordered=False)
+
+        # Rows written by incremental updates since the rebuild started are kept
+        stale = {"rebuilt_at": {"$ne": stamp}, "updated_at": {"$lt": stamp}}
+        await self.db.skill_stats.delete_many(stale)
+        await self.db.skill_stats_weekly.delete_many({**stale, "week": week})
+        cutoff = (started - timedelta(weeks=WEEKS_KEPT)).strftime("%Y-%m-%d")
+        await self.db.skill_stats_weekly.delete_many({"week": {"$lt": cutoff}})
+
+        for board in (BOARD_GLOBAL, BOARD_STREAK, BOARD_CORRECT, _weekly_board(week)):
+            leaderboard_store.invalidate(board)
+        result = {"users": len(totals), "weekly_users": len(weekly), "week": week,
+                  "seconds": round((datetime.now(timezone.utc) - started).total_seconds(), 2)}
+        await self.db.leaderboard_meta.update_one(
+            {"_id": META_ID}, {"$set": {**result, "rebuilt_at": stamp}}, upsert=True)
+        logger.info(f"SKILL LEADERBOARDS REBUILT: {result}")
+        return result
@@ -7,10 +7,13 @@ import uuid
 import logging
 from datetime import datetime, timezone
 from typing import Optional, List, Dict
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel
 
 from server import db, get_current_user, User
+from leaderboard_store import leaderboard_store, prize_for_rank
+from earnings_rollup import record_credit
+from economy_metrics import record_flow
 
 logger = logging.getLogger(__name__)
 sponsored_router = APIRouter(prefix="/api/v2/sponsored", tags=["Sponsored Pools"])
@@ -157,33 +160,58 @@ async def join_sponsored_pool(req: JoinSponsoredPoolReq, user: User = Depends(ge
     )
     if result.modified_count == 0:
         raise HTTPException(400, "Could not join pool")
+    joined_at = datetime.now(timezone.utc).isoformat()
+    await db.sponsored_entries.update_one(
+        {"pool_id": req.pool_id, "user_id": user.id},
+        {"$setOnInsert": {"pool_id": req.pool_id, "user_id": user.id, "points": 0, "joined_at": joined_at}},
+        upsert=True,
+    )
+    leaderboard_store.upsert(f"sponsored:{req.pool_id}", user.id, 0, joined_at, user.name)
 
     logger.info(f"SPONSORED POOL JOIN: user={user.id} pool={req.pool_id}")
     return {"success": True, "pool_id": req.pool_id}
 
 
-@sponsored_router.get("/{pool_id}/leaderboard")
-async def get_pool_leaderboard(pool_id: str):
-    pool = await db.sponsored_pools.find_one({"id": pool_id}, {"_id": 0})
-    if not pool:
-        raise HTTPException(404, "Pool not found")
+def _last_prized_rank(distribution) -> int:
+    if isinstance(distribution, dict):
+        return max((int(k) for k, v in distribution.items() if str(k).isdigit() and v), default=0)
+    return max((t.get("rank_end", t.get("rank", 0)) for t in distribution or []), default=0)
 
+
+async def _load_pool_leaderboard(pool_id: str):
+    pool = await db.sponsored_pools.find_one({"id": pool_id}, {"_id": 0, "prize_distribution": 1})
     entries = await db.sponsored_entries.find(
-        {"pool_id": pool_id}, {"_id": 0}
-    ).sort([("points", -1), ("joined_at", 1)]).to_list(200)
+        {"pool_id": pool_id}, {"_id": 0, "user_id": 1, "points": 1, "joined_at": 1}
+    ).to_list(None)
 
     user_ids = [e["user_id"] for e in entries]
     users = await db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(len(user_ids))
     user_map = {u["id"]: u["name"] for u in users}
 
-    dist = pool.get("prize_distribution", {})
-    for i, entry in enumerate(entries):
-        rank = i + 1
-        entry["rank"] = rank
-        entry["user_name"] = user_map.get(entry["user_id"], "Unknown")
-        entry["prize_coins"] = dist.get(str(rank), 0)
+    rows = [
+        {"member": e["user_id"], "points": e.get("points", 0), "tiebreak": e.get("joined_at") or "",
+         "name": user_map.get(e["user_id"], "Unknown")}
+        for e in entries
+    ]
+    return rows, {"prize_distribution": (pool or {}).get("prize_distribution", {})}
 
-    return {"pool": pool, "leaderboard": entries}
+
+@sponsored_router.get("/{pool_id}/leaderboard")
+async def get_pool_leaderboard(pool_id: str, offset: int = Query(0, ge=0), limit: int = Query(200, ge=1, le=500)):
+    pool = await db.sponsored_pools.find_one({"id": pool_id}, {"_id": 0})
+    if not pool:
+        raise HTTPException(404, "Pool not found")
+
+    board = f"sponsored:{pool_id}"
+    await leaderboard_store.ensure(board, lambda: _load_pool_leaderboard(pool_id))
+    dist = pool.get("prize_distribution", {})
+    entries = [
+        {"pool_id": pool_id, "user_id": row["member"], "points": row["points"], "joined_at": row["tiebreak"],
+         "rank": row["rank"], "user_name": row["name"] or "Unknown",
+         "prize_coins": prize_for_rank(dist, row["rank"])}
+        for row in leaderboard_store.window(board, offset, limit)
+    ]
+    return {"pool": pool, "leaderboard": entries, "total": leaderboard_store.size(board)}
 
 
 @sponsored_router.post("/create")
@@ -241,23 +269,27 @@ async def finalize_sponsored_pool(pool_id: str, user: User = Depends(get_current
     if pool.get("finalized"):
         return {"already_finalized": True}
 
-    entries = await db.sponsored_entries.find(
-        {"pool_id": pool_id}, {"_id": 0}
-    ).sort([("points", -1), ("joined_at", 1)]).to_list(200)
-
     dist = pool.get("prize_distribution", {})
+    last_rank = _last_prized_rank(dist)
+    entries = db.sponsored_entries.find(
+        {"pool_id": pool_id}, {"_id": 0}
+    ).sort([("points", -1), ("joined_at", 1), ("user_id", 1)]).batch_size(500)
     payouts = []
     now = datetime.now(timezone.utc).isoformat()
 
-    for i, entry in enumerate(entries):
-        rank = i + 1
-        reward = dist.get(str(rank), 0)
+    rank = 0
+    async for entry in entries:
+        rank += 1
+        if rank > last_rank:
+            break
+        reward = prize_for_rank(dist, rank)
         if reward <= 0:
             continue
 
         unique_id = f"sponsored_payout_{pool_id}_{entry['user_id']}"
         try:
-            await db.coin_transactions.insert_one({
+            txn = {
+                "id": str(uuid.uuid4()),
                 "unique_payout_id": unique_id,
                 "user_id": entry["user_id"],
                 "amount": reward,
@@ -265,11 +297,14 @@ async def finalize_sponsored_pool(pool_id: str, user: User = Depends(get_current
                 "description": f"Sponsored Pool Prize: Rank #{rank} — {pool['title']}",
                 "pool_id": pool_id,
                 "timestamp": now,
-            })
+            }
+            await db.coin_transactions.insert_one(txn)
             await db.users.update_one(
                 {"id": entry["user_id"]},
                 {"$inc": {"coins_balance": reward, "total_earned": reward}}
             )
+            await record_credit(db, txn)
+            await record_flow(db, "sponsored_prize", reward, now)
             payouts.append({"user_id": entry["user_id"], "rank": rank, "coins": reward})
         except Exception:
             pass  # Duplicate → already paid
@@ -278,6 +313,7 @@ async def finalize_sponsored_pool(pool_id: str, user: User = Depends(get_current
         {"id": pool_id},
         {"$set": {"status": "completed", "finalized": True, "updated_at": now}}
     )
+    leaderboard_store.invalidate(f"sponsored:{pool_id}")
     return {"finalized": True, "payouts": payouts, "total_paid": sum(p["coins"] for p in payouts)}
 
 
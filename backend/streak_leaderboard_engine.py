@@ -3,9 +3,15 @@ Login Streak & Leaderboard Engine for FREE11
 Enhanced streak with progressive rewards. Daily/Weekly/Seasonal leaderboards.
 """
 import logging
+import uuid
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from earnings_rollup import EarningsRollup, period_days, record_credits
+from economy_metrics import record_flows
 
 logger = logging.getLogger(__name__)
 
@@ -91,32 +97,25 @@ class StreakEngine:
 
 
 class LeaderboardEngine:
+    """Coin leaderboards served from the per-day earnings rollups (earnings_rollup.py)."""
+
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
+        self.rollup = EarningsRollup(db)
 
     async def get_leaderboard(self, period: str = "daily", limit: int = 50) -> List[Dict]:
-        now = datetime.now(timezone.utc)
-        if period == "daily":
-            start = now.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-        elif period == "weekly":
-            start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-        else:
-            start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0).isoformat()
-
-        pipeline = [
-            {"$match": {"timestamp": {"$gte": start}, "amount": {"$gt": 0}}},
-            {"$group": {"_id": "$user_id", "total_coins": {"$sum": "$amount"}}},
-            {"$sort": {"total_coins": -1}},
-            {"$limit": limit},
-        ]
-        results = await self.db.coin_transactions.aggregate(pipeline).to_list(limit)
+        results = await self.rollup.top(period, limit)
+        users = {
+            u["id"]: u async for u in self.db.users.find(
+                {"id": {"$in": [r["user_id"] for r in results]}}, {"_id": 0, "id": 1, "name": 1, "tier": 1})
+        }
 
         leaderboard = []
         for i, r in enumerate(results):
-            user = await self.db.users.find_one({"id": r["_id"]}, {"_id": 0, "name": 1, "tier": 1})
+            user = users.get(r["user_id"])
             leaderboard.append({
                 "rank": i + 1,
-                "user_id": r["_id"],
+                "user_id": r["user_id"],
                 "name": user.get("name", "Unknown") if user else "Unknown",
                 "tier": user.get("tier", "Bronze") if user else "Bronze",
                 "total_coins": r["total_coins"],
@@ -125,13 +124,37 @@ class LeaderboardEngine:
         return leaderboard
 
     async def distribute_rewards(self, period: str) -> Dict:
-        lb = await self.get_leaderboard(period, 10)
-        distributed = 0
-        for entry in lb:
-            if entry["reward"] > 0:
-                await self.db.users.update_one(
-                    {"id": entry["user_id"]},
-                    {"$inc": {"coins_balance": entry["reward"]}},
-                )
-                distributed += 1
-        return {"period": period, "distributed": distributed}
+        """Pay the period's LEADERBOARD_REWARDS from the same rollups the board is served from.
+        Each payout is a coin_transactions row keyed by period start, so a rerun pays nobody twice."""
+        rewards = LEADERBOARD_REWARDS.get(period, {})
+        top = await self.rollup.top(period, max(rewards, default=0))
+        start = period_days(period)[0]
+        now = datetime.now(timezone.utc).isoformat()
+        txns = [{
+            "id": str(uuid.uuid4()),
+            "unique_payout_id": f"leaderboard_{period}_{start}_{r['user_id']}",
+            "user_id": r["user_id"],
+            "amount": rewards[rank],
+            "type": "leaderboard_reward",
+            "description": f"{period.title()} leaderboard: Rank #{rank}",
+            "timestamp": now,
+        } for rank, r in enumerate(top, 1) if rewards.get(rank, 0) > 0]
+        if not txns:
+            return {"period": period, "distributed": 0}
+        already_paid = set()
+        try:
+            await self.db.coin_transactions.insert_many(txns, ordered=False)
+        except BulkWriteError as bwe:
+            for err in bwe.details.get("writeErrors", []):
+                if err.get("code") != 11000:
+                    raise
+                already_paid.add(err["index"])
+        paid = [t for i, t in enumerate(txns) if i not in already_paid]
+        if paid:
+            await self.db.users.bulk_write([
+                UpdateOne({"id": t["user_id"]}, {"$inc": {"coins_balance": t["amount"], "total_earned": t["amount"]}})
+                for t in paid
+            ], ordered=False)
+            await record_credits(self.db, paid)
+            await record_flows(self.db, [(t["type"], t["amount"]) for t in paid], now)
+        return {"period": period, "distributed": len(paid)}
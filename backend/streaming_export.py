@@ -0,0 +1,120 @@
+"""
+Streaming Exports for FREE11
+Shared CSV / NDJSON / JSON export over a Motor cursor, in constant memory.
+
+Rows are read in EXPORT_BATCH batches (find with a projection and a keyset sort)
+and encoded batch by batch into a StreamingResponse, optionally gzipped on the
+fly. Nothing holds more than one batch, so exports have no row cap. The JSON format
+streams the same envelope the endpoints always returned ({..., "data": [...],
+"total_records": n}). Exports are ordered by (key, id), and `since` / `since_id`
+resume after the last row a client received.
+"""
+import csv
+import io
+import json
+import logging
+import zlib
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH = 1000
+FORMATS = {"json": "application/json", "csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def since_query(query: Dict, key: str, since: Optional[str], since_id: Optional[str] = None,
+                id_field: str = "id") -> Dict:
+    """Narrow `query` to rows after (since, since_id) in (key, id_field) order."""
+    if not since:
+        return query
+    after = ({"$or": [{key: {"$gt": since}}, {key: since, id_field: {"$gt": since_id}}]}
+             if since_id else {key: {"$gt": since}})
+    return {"$and": [query, after]} if query else after
+
+
+async def find_batches(collection, query: Dict, projection: Dict, sort: List[Tuple[str, int]],
+                       batch_size: int = EXPORT_BATCH) -> AsyncIterator[List[Dict]]:
+    """Lists of up to `batch_size` docs from one cursor (the driver fetches the same size)."""
+    cursor = collection.find(query, projection).sort(sort).batch_size(batch_size)
+    batch: List[Dict] = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _rows(batches: AsyncIterator[List[Dict]],
+                transform: Optional[Callable[[List[Dict]], Awaitable[List[Dict]]]]) -> AsyncIterator[List[Dict]]:
+    async for batch in batches:
+        yield await transform(batch) if transform else batch
+
+
+async def _encode(batches: AsyncIterator[List[Dict]], fmt: str, columns: Optional[Sequence[str]],
+                  envelope: Optional[Dict]) -> AsyncIterator[str]:
+    count = 0
+    if fmt == "json":
+        head = json.dumps(envelope or {}, default=str)[:-1]
+        yield f"{head}{', ' if envelope else ''}\"data\": ["
+    elif fmt == "csv" and columns:
+        buf = io.StringIO()
+        csv.writer(buf).writerow(columns)
+        yield buf.getvalue()
+    try:
+        async for rows in batches:
+            if not rows:
+                continue
+            if fmt == "csv":
+                buf = io.StringIO()
+                writer = csv.DictWriter(buf, fieldnames=list(columns or rows[0]), extrasaction="ignore")
+                if columns is None and count == 0:
+                    writer.writeheader()
+                writer.writerows(rows)
+                yield buf.getvalue()
+            elif fmt == "ndjson":
+                yield "".join(json.dumps(row, default=str) + "\n" for row in rows)
+            else:
+                yield ("," if count else "") + ",".join(json.dumps(row, default=str) for row in rows)
+            count += len(rows)
+    except Exception as e:
+        # Headers are already sent; a truncated body is all we can signal
+        logger.error(f"Streaming export failed after {count} rows: {e}")
+        raise
+    if fmt == "json":
+        yield f"], \"total_records\": {count}}}"
+
+
+async def _gzip(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 → gzip container
+    async for chunk in chunks:
+        out = gz.compress(chunk.encode())
+        if out:
+            yield out
+    yield gz.flush()
+
+
+def export_response(batches: AsyncIterator[List[Dict]], fmt: str, filename: str,
+                    columns: Optional[Sequence[str]] = None, gzip: bool = False,
+                    envelope: Optional[Dict] = None,
+                    transform: Optional[Callable[[List[Dict]], Awaitable[List[Dict]]]] = None) -> StreamingResponse:
+    """Stream `batches` as csv / ndjson / json (envelope + "data" + "total_records").
+
+    transform(batch) -> rows runs once per batch (e.g. to join counts for the batch's ids).
+    csv / ndjson and every gzip export are attachments named `filename`.{fmt}[.gz].
+    """
+    if fmt not in FORMATS:
+        raise HTTPException(400, f"Unknown export format: {fmt} (use {', '.join(FORMATS)})")
+    body = _encode(_rows(batches, transform), fmt, columns, envelope)
+    name = f"{filename}.{fmt}"
+    headers = {}
+    media_type = FORMATS[fmt]
+    if gzip:
+        body, media_type, name = _gzip(body), "application/gzip", f"{name}.gz"
+    if gzip or fmt != "json":
+        headers["Content-Disposition"] = f"attachment; filename={name}"
+    return StreamingResponse(body, media_type=media_type, headers=headers)
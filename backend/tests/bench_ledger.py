@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Ledger throughput benchmark: per-user credit/debit vs credit_many/debit_many.
+
+Runs against a scratch database (LEDGER_BENCH_DB, default free11_ledger_bench),
+which is dropped before and after. Usage:
+    python tests/bench_ledger.py [users] [movements]
+"""
+import asyncio
+import motor.motor_asyncio
+import os
+import sys
+import time
+sys.path.insert(0, '/app/backend')
+from dotenv import load_dotenv
+load_dotenv('/app/backend/.env')
+
+from ledger_engine import LedgerEngine
+
+MONGO_URL = os.environ.get('MONGO_URL')
+BENCH_DB = os.environ.get('LEDGER_BENCH_DB', 'free11_ledger_bench')
+
+
+def movements(n_users, n):
+    return [{"user_id": f"bench_{i % n_users}", "amount": 5, "tx_type": "bench",
+             "reference_id": f"ref_{i}", "description": "benchmark"} for i in range(n)]
+
+
+async def timed(label, n, coro):
+    started = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34} {n:>7} movements  {elapsed:7.2f}s  {n / elapsed:10.0f}/s")
+    return result
+
+
+async def bench(n_users, n):
+    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
+    await client.drop_database(BENCH_DB)
+    db = client[BENCH_DB]
+    await db.users.create_index("id", unique=True)
+    await db.users.insert_many([{"id": f"bench_{i}", "coins_balance": 10 * n} for i in range(n_users)])
+    ledger = LedgerEngine(db, use_transactions=False)
+    moves = movements(n_users, n)
+
+    async def one_by_one(fn):
+        for m in moves:
+            await fn(m["user_id"], m["amount"], m["tx_type"], m["reference_id"], m["description"])
+
+    await timed("credit (sequential)", n, one_by_one(ledger.credit))
+    await timed("credit_many", n, ledger.credit_many(moves))
+    await timed("debit (sequential)", n, one_by_one(ledger.debit))
+    await timed("debit_many", n, ledger.debit_many(moves))
+    # Concurrent debits on one account: the conditional update must never overdraw
+    await db.users.update_one({"id": "bench_0"}, {"$set": {"coins_balance": 100}})
+    results = await timed("debit (200 concurrent, one user)", 200, asyncio.gather(
+        *[ledger.debit("bench_0", 1, "bench", f"race_{i}", "race") for i in range(200)], return_exceptions=True))
+    balance = (await db.users.find_one({"id": "bench_0"}))["coins_balance"]
+    applied = sum(1 for r in results if not isinstance(r, Exception))
+    print(f"race: applied={applied} final_balance={balance} (expect 100 / 0)")
+    try:
+        tx_ledger = LedgerEngine(db, use_transactions=True)
+        await timed("credit_many (transaction)", n, tx_ledger.credit_many(moves))
+    except Exception as e:
+        print(f"transactions unavailable: {e}")
+    await client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    asyncio.run(bench(users, count))
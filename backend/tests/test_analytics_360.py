@@ -2,6 +2,8 @@
 Analytics 360° Dashboard API Tests
 Tests for GET /api/admin/analytics-360 and /api/admin/analytics-360/export/csv
 """
+import gzip
+import json
 import pytest
 import requests
 import os
@@ -303,3 +305,116 @@ class TestCSVExport:
         disposition = res.headers.get("content-disposition", "")
         assert "attachment" in disposition.lower(), f"Missing attachment header: {disposition}"
         print(f"PASS: Content-Disposition: {disposition}")
+
+    def test_ndjson_resumes_after_since(self, admin_token):
+        """format=ndjson streams one user per line; since=<last id> returns only later users"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        res = requests.get(
+            f"{BASE_URL}/api/admin/analytics-360/export/csv",
+            params={"format": "ndjson"}, headers=headers, timeout=60,
+        )
+        assert res.status_code == 200
+        ids = [json.loads(line)["user_id"] for line in res.text.splitlines() if line]
+        assert ids == sorted(ids), "Export should be ordered by user id"
+        if len(ids) < 2:
+            pytest.skip("Need at least two real users")
+        res = requests.get(
+            f"{BASE_URL}/api/admin/analytics-360/export/csv",
+            params={"format": "ndjson", "since": ids[0]}, headers=headers, timeout=60,
+        )
+        rest = [json.loads(line)["user_id"] for line in res.text.splitlines() if line]
+        assert rest == ids[1:]
+        print(f"PASS: ndjson export of {len(ids)} users resumes after since")
+
+    def test_gzip_export(self, admin_token):
+        """gzip=true serves a .gz attachment that decompresses to the same CSV"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        plain = requests.get(f"{BASE_URL}/api/admin/analytics-360/export/csv", headers=headers, timeout=60)
+        res = requests.get(
+            f"{BASE_URL}/api/admin/analytics-360/export/csv",
+            params={"gzip": "true"}, headers=headers, timeout=60, stream=True,
+        )
+        assert res.status_code == 200
+        assert ".csv.gz" in res.headers.get("content-disposition", "")
+        body = gzip.decompress(res.raw.read(decode_content=False)).decode()
+        assert body.splitlines()[0] == plain.text.splitlines()[0]
+        print("PASS: gzip export decompresses to CSV")
+
+    def test_unknown_format_returns_400(self, admin_token):
+        res = requests.get(
+            f"{BASE_URL}/api/admin/analytics-360/export/csv",
+            params={"format": "xml"},
+            headers={"Authorization": f"Bearer {admin_token}"}, timeout=15,
+        )
+        assert res.status_code == 400
+
+
+# ── Snapshot freshness / refresh / paging ──────────────────────────────────
+
+class TestSnapshot:
+    """The dashboard is served from a precomputed snapshot"""
+
+    def test_refresh_requires_admin(self, user_token):
+        res = requests.post(
+            f"{BASE_URL}/api/admin/analytics-360/refresh",
+            headers={"Authorization": f"Bearer {user_token}"},
+            timeout=15,
+        )
+        assert res.status_code == 403, f"Expected 403 for non-admin, got {res.status_code}"
+        print("PASS: Non-admin refresh returns 403")
+
+    def test_refresh_builds_new_snapshot(self, admin_token):
+        """Admin refresh replaces the snapshot; the dashboard then serves it with its age"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        res = requests.post(f"{BASE_URL}/api/admin/analytics-360/refresh", headers=headers, timeout=120)
+        assert res.status_code == 200, f"Refresh failed: {res.status_code} {res.text[:200]}"
+        built = res.json()
+        data = requests.get(f"{BASE_URL}/api/admin/analytics-360", headers=headers, timeout=60).json()
+        assert data["run_id"] == built["run_id"]
+        assert data["generated_at"] == built["generated_at"]
+        assert data["snapshot_age_seconds"] >= 0 and data["stale"] is False
+        assert data["high_level"]["real_users_count"] == built["real_users_count"]
+        print(f"PASS: snapshot {built['run_id']} built in {built['build_seconds']}s")
+
+    def test_user_pages_cover_snapshot(self, admin_token):
+        """Paging real_users_360 with the cursor visits every real user exactly once"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        data = requests.get(f"{BASE_URL}/api/admin/analytics-360", headers=headers, timeout=60).json()
+        seen = [u["user_id"] for u in data["real_users_360"]]
+        cursor = data["real_users_next_cursor"]
+        while cursor:
+            res = requests.get(f"{BASE_URL}/api/admin/analytics-360/users",
+                               params={"cursor": cursor, "limit": 50}, headers=headers, timeout=30)
+            assert res.status_code == 200
+            page = res.json()
+            seen += [u["user_id"] for u in page["users"]]
+            cursor = page["next_cursor"]
+        assert len(seen) == len(set(seen)) == data["high_level"]["real_users_count"]
+        print(f"PASS: {len(seen)} profiles paged")
+
+    def test_user_search_and_sort_are_server_side(self, admin_token):
+        """/users searches and sorts the whole snapshot, not just the first page"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        url = f"{BASE_URL}/api/admin/analytics-360/users"
+        coins, cursor = [], None
+        while True:
+            params = {"sort": "coins_balance", "order": "asc", "limit": 200}
+            if cursor:
+                params["cursor"] = cursor
+            page = requests.get(url, params=params, headers=headers, timeout=30).json()
+            coins += [u["coins_balance"] for u in page["users"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        assert coins == sorted(coins) and len(coins) == page["total"]
+
+        first = requests.get(url, params={"limit": 1}, headers=headers, timeout=30).json()["users"]
+        if first:
+            needle = first[0]["email"][:6].upper()
+            found = requests.get(url, params={"q": needle, "limit": 500}, headers=headers, timeout=30).json()
+            assert found["total"] >= 1
+            assert all(needle.lower() in (u["email"] + u["name"] + u["user_id"]).lower() for u in found["users"])
+
+        res = requests.get(url, params={"sort": "password"}, headers=headers, timeout=30)
+        assert res.status_code == 400
+        print(f"PASS: {len(coins)} profiles sorted server-side")
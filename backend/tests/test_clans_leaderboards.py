@@ -173,6 +173,14 @@ class TestClansAPIs:
 class TestLeaderboardsAPIs:
     """Leaderboard endpoints - all SKILL-based, no coins"""
     
+    @pytest.fixture(scope="class")
+    def level2_token(self):
+        """Login as Level 2 (non-admin) user"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=LEVEL2_USER)
+        if response.status_code == 200:
+            return response.json().get("access_token")
+        pytest.skip("Failed to login as Level 2 user")
+    
     def test_global_leaderboard_returns_200(self):
         """GET /api/leaderboards/global returns skill-based rankings"""
         response = requests.get(f"{BASE_URL}/api/leaderboards/global?limit=10")
@@ -220,6 +228,22 @@ class TestLeaderboardsAPIs:
         assert data["metric"] == "Prediction Streak"
         print(f"✓ GET /api/leaderboards/streak - {len(data['leaderboard'])} entries")
     
+    def test_global_leaderboard_is_ranked(self):
+        """Materialised global board: consecutive ranks, accuracy non-increasing"""
+        response = requests.get(f"{BASE_URL}/api/leaderboards/global?limit=50")
+        assert response.status_code == 200
+        rows = response.json()["leaderboard"]
+        assert [r["rank"] for r in rows] == list(range(1, len(rows) + 1))
+        accuracies = [r["accuracy"] for r in rows]
+        assert accuracies == sorted(accuracies, reverse=True)
+        assert all(r["total_predictions"] >= 5 for r in rows)
+    
+    def test_rebuild_requires_admin(self, level2_token):
+        """POST /api/leaderboards/rebuild is admin-only"""
+        response = requests.post(f"{BASE_URL}/api/leaderboards/rebuild",
+                                 headers={"Authorization": f"Bearer {level2_token}"})
+        assert response.status_code == 403
+    
     def test_clan_leaderboard_skill_based(self):
         """GET /api/clans/leaderboard/clans returns skill-based clan rankings"""
         response = requests.get(f"{BASE_URL}/api/clans/leaderboard/clans")
@@ -236,6 +260,29 @@ class TestLeaderboardsAPIs:
             assert "coins" not in str(clan).lower() or "coins" not in clan
         
         print(f"✓ Clan leaderboard is skill-based (accuracy, streak) - no coins")
+    
+    def test_clan_member_leaderboard_with_my_rank(self, level2_token):
+        """GET /api/clans/leaderboard/members/{id} pages, /me returns rank + neighbours"""
+        headers = {"Authorization": f"Bearer {level2_token}"}
+        my_clan = requests.get(f"{BASE_URL}/api/clans/my", headers=headers).json()
+        if not my_clan.get("in_clan"):
+            pytest.skip("Level 2 user is not in a clan")
+        clan_id = my_clan["clan"]["id"]
+        
+        page = requests.get(f"{BASE_URL}/api/clans/leaderboard/members/{clan_id}?limit=5").json()
+        assert isinstance(page, list) and len(page) <= 5
+        assert [m["rank"] for m in page] == list(range(1, len(page) + 1))
+        assert all(m["name"] for m in page)
+        
+        me = requests.get(f"{BASE_URL}/api/clans/leaderboard/members/{clan_id}/me?radius=2", headers=headers)
+        assert me.status_code == 200
+        data = me.json()
+        assert data["rank"] >= 1 and data["total"] >= 1
+        assert any(e["rank"] == data["rank"] for e in data["entries"])
+        
+        clan_rank = requests.get(f"{BASE_URL}/api/clans/leaderboard/clans/me", headers=headers).json()
+        assert clan_rank["clan_id"] == clan_id
+        print(f"✓ Clan member rank {data['rank']}/{data['total']}, clan rank {clan_rank['rank']}")
 
 
 class TestPublicProfileAPIs:
@@ -291,6 +338,21 @@ class TestPublicProfileAPIs:
         assert "current_streak" in skill_stats
         
         print(f"✓ Profile has skill stats: accuracy={skill_stats['accuracy']}%, streak={skill_stats['current_streak']}")
+    
+    def test_my_percentiles(self):
+        """GET /api/leaderboards/percentiles/me - rank and top % per metric"""
+        login = requests.post(f"{BASE_URL}/api/auth/login", json=LEVEL2_USER)
+        if login.status_code != 200:
+            pytest.skip("Failed to log in")
+        response = requests.get(f"{BASE_URL}/api/leaderboards/percentiles/me",
+                                headers={"Authorization": f"Bearer {login.json()['access_token']}"})
+        assert response.status_code == 200
+        data = response.json()["percentiles"]
+        
+        for metric in ("total_earned", "streak"):
+            assert data[metric]["rank"] >= 1
+            assert 0 < data[metric]["top_percent"] <= 100
+        print(f"✓ Percentiles: top {data['total_earned']['top_percent']}% by earnings")
 
 
 class TestDuelsAPIs:
@@ -158,6 +158,25 @@ class TestLedger:
             assert "credit" in e or "debit" in e, f"Missing credit/debit in entry: {e}"
         print(f"PASS: Ledger entries have required fields. Sample: {entries[0]}")
 
+    def test_ledger_history_cursor_pages_match_single_page(self):
+        token = get_token()
+        if not token:
+            pytest.skip("Login failed")
+        full = requests.get(f"{BASE_URL}/api/v2/ledger/history?limit=30", headers=auth_headers(token)).json()
+        paged, cursor = [], None
+        while len(paged) < len(full["entries"]):
+            url = f"{BASE_URL}/api/v2/ledger/history?limit=7" + (f"&cursor={cursor}" if cursor else "")
+            page = requests.get(url, headers=auth_headers(token)).json()
+            paged += page["entries"]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        n = len(full["entries"])
+        assert [e["id"] for e in paged[:n]] == [e["id"] for e in full["entries"]]
+        bad = requests.get(f"{BASE_URL}/api/v2/ledger/history?cursor=not-a-cursor", headers=auth_headers(token))
+        assert bad.status_code == 400
+        print(f"PASS: {n} entries identical across keyset pages of 7")
+
 
 # ─── Phase 4: Leaderboard ────────────────────────────────────
 class TestLeaderboard:
@@ -320,6 +320,17 @@ class TestLeaderboards:
         assert response.status_code == 400, f"Expected 400 for invalid period, got {response.status_code}"
         print(f"✓ Invalid leaderboard period correctly rejected")
 
+    def test_rollup_rebuild_matches_board(self):
+        """POST /api/v2/engage/leaderboard/rebuild backfills rollups; board order is unchanged in shape"""
+        headers = TestEngagementAuth.get_headers()
+        response = requests.post(f"{BASE_URL}/api/v2/engage/leaderboard/rebuild", headers=headers)
+        assert response.status_code == 200, f"Failed: {response.text}"
+        assert "rollups" in response.json()
+        data = requests.get(f"{BASE_URL}/api/v2/engage/leaderboard/seasonal").json()
+        coins = [e["total_coins"] for e in data]
+        assert coins == sorted(coins, reverse=True)
+        assert [e["rank"] for e in data] == list(range(1, len(data) + 1))
+
 
 # ==================== ECONOMY TESTS ====================
 
@@ -348,6 +359,20 @@ class TestEconomyControls:
         
         print(f"✓ Economy status: earned={data['earned_today']}/{data['cap']}, redeems={data['redeemed_today']}/{data['limit']}")
 
+    def test_concurrent_earns_respect_cap(self):
+        """Concurrent game rewards are reserved atomically: earned_today never passes the cap"""
+        from concurrent.futures import ThreadPoolExecutor
+        headers = TestEngagementAuth.get_headers()
+        games = ["teen-patti-win", "solitaire-win", "rummy-win", "poker-win", "app-share"]
+        with ThreadPoolExecutor(len(games)) as pool:
+            statuses = list(pool.map(
+                lambda g: requests.post(f"{BASE_URL}/api/v2/earn/{g}", headers=headers).status_code, games))
+        assert all(code in (200, 400, 429) for code in statuses), statuses
+        data = requests.get(f"{BASE_URL}/api/v2/engage/economy/status", headers=headers).json()
+        assert data["earned_today"] <= data["cap"]
+        assert data["remaining"] == data["cap"] - data["earned_today"]
+        print(f"✓ Concurrent earns: {statuses}, earned={data['earned_today']}/{data['cap']}")
+
     def test_economy_stats_admin(self):
         """GET /api/v2/engage/economy/stats returns minted/burned/burn_rate (admin only)"""
         headers = TestEngagementAuth.get_headers()
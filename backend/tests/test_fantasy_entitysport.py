@@ -476,15 +476,30 @@ class TestFantasyRankings:
         resp = requests.get(f"{BASE_URL}/api/v2/fantasy/rankings/{TEST_MATCH_ID}")
         assert resp.status_code == 200
         data = resp.json()
-        assert isinstance(data, list)
-        print(f"Rankings: {len(data)} teams")
-        
-        if data:
-            # Verify sorted by points (descending)
-            for i, team in enumerate(data[:3]):
-                assert "rank" in team
-                assert "total_points" in team
-                print(f"Rank {team['rank']}: {team.get('total_points', 0)} points")
+        assert isinstance(data, dict)
+        rankings = data["rankings"]
+        print(f"Rankings: {len(rankings)} of {data['total']} teams")
+        
+        # Verify sorted by points (descending)
+        for team in rankings[:3]:
+            assert "rank" in team
+            assert "total_points" in team
+            print(f"Rank {team['rank']}: {team.get('total_points', 0)} points")
+        points = [t["total_points"] for t in rankings]
+        assert points == sorted(points, reverse=True)
+
+    def test_rankings_page_shape_and_cursor(self):
+        """Rankings are a cursor-paged page: {match_id, rankings, total, next_cursor}"""
+        resp = requests.get(f"{BASE_URL}/api/v2/fantasy/rankings/{TEST_MATCH_ID}", params={"limit": 1})
+        assert resp.status_code == 200
+        data = resp.json()
+        for key in ("match_id", "rankings", "total", "next_cursor"):
+            assert key in data, f"Missing {key}"
+        assert len(data["rankings"]) <= 1
+        if data["next_cursor"]:
+            nxt = requests.get(f"{BASE_URL}/api/v2/fantasy/rankings/{TEST_MATCH_ID}",
+                               params={"limit": 1, "cursor": data["next_cursor"]}).json()
+            assert nxt["rankings"][0]["rank"] == data["rankings"][0]["rank"] + 1
 
 
 class TestAdminFantasyScoring:
@@ -382,3 +382,24 @@ class TestWeeklyReportCard:
         assert "predictions_total" in data
         # New user has 0 predictions, so weekly modal won't show (is_new but predictions_total=0)
         print(f"New user weekly report: predictions_total={data['predictions_total']}, is_new={data['is_new']} PASS")
+
+    def test_batch_weekly_reports_progress(self, admin_headers, new_user_headers):
+        """Admin batch run is resumable and reports progress; non-admins are rejected."""
+        r = requests.post(f"{BASE_URL}/api/admin/v2/reports/weekly/run", headers=new_user_headers)
+        assert r.status_code == 403
+        r = requests.post(f"{BASE_URL}/api/admin/v2/reports/weekly/run", headers=admin_headers)
+        assert r.status_code in (200, 409)  # 409: a run already holds the batch lease
+        week_start = r.json()["week_start"] if r.status_code == 200 else None
+        # The run starts in a background task; poll until it has registered
+        for _ in range(20):
+            r = requests.get(f"{BASE_URL}/api/admin/v2/reports/weekly/progress", headers=admin_headers)
+            assert r.status_code == 200
+            data = r.json()
+            if data["status"] != "not_started":
+                break
+            time.sleep(0.5)
+        assert data["status"] in ("running", "completed")
+        week_start = week_start or data["week_start"]
+        assert data["week_start"] == week_start
+        assert data["generated"] <= data["total"]
+        print(f"Weekly report batch: status={data['status']} {data['generated']}/{data['total']} PASS")
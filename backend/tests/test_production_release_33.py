@@ -81,6 +81,27 @@ class TestKPIBreakage:
         assert data.get("target_breakage_pct") == 10.0, f"Expected 10.0, got {data.get('target_breakage_pct')}"
         print(f"PASS: target_breakage_pct = 10.0")
 
+    def test_breakage_matches_rebuilt_counters(self, admin_auth):
+        """After a rebuild from history, flow liability = issued - spent - expired"""
+        resp = requests.post(f"{BASE_URL}/api/v2/kpis/economy/rebuild", headers=admin_auth)
+        assert resp.status_code == 200, f"Expected 200, got {resp.status_code}: {resp.text}"
+        after = requests.get(f"{BASE_URL}/api/v2/kpis/breakage", headers=admin_auth).json()
+        assert after["flow_liability"] == \
+            after["total_coins_issued"] - after["total_coins_spent"] - after["total_coins_expired"]
+        assert after["live_wallet_balance"] == after["flow_liability"]
+        print(f"PASS: rebuilt {resp.json()['docs']} docs, issued={after['total_coins_issued']}")
+
+    def test_economy_series(self, admin_auth):
+        """Daily minted / burned series for charts; bad granularity is a 400"""
+        resp = requests.get(f"{BASE_URL}/api/v2/kpis/economy/series?granularity=day", headers=admin_auth)
+        assert resp.status_code == 200, f"Expected 200, got {resp.status_code}: {resp.text}"
+        points = resp.json()["points"]
+        assert [p["bucket"] for p in points] == sorted(p["bucket"] for p in points)
+        assert all({"minted", "burned"} <= set(p) for p in points)
+        resp = requests.get(f"{BASE_URL}/api/v2/kpis/economy/series?granularity=week", headers=admin_auth)
+        assert resp.status_code == 400
+        print(f"PASS: economy series has {len(points)} daily points")
+
 
 # ── 2. Push Templates endpoint ────────────────────────────────────────────────
 class TestPushTemplates:
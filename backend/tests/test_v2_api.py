@@ -540,6 +540,41 @@ class TestV2AdminWallet:
         assert data["adjusted"] == True
         print(f"✓ Adjusted 100 coins for testing")
 
+    def test_reconcile_all_writes_report(self):
+        """Full then incremental reconciliation; mismatches are readable per run"""
+        token = TestV2AuthAndSetup.get_admin_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        response = requests.post(f"{BASE_URL}/api/admin/v2/ledger/reconcile-all?full=true", headers=headers)
+        assert response.status_code == 200, f"Reconcile failed: {response.text}"
+        data = response.json()
+        assert data["run"]["mode"] == "full" and data["run"]["status"] == "completed"
+        assert data["count"] == data["run"]["mismatches"]
+        response = requests.post(f"{BASE_URL}/api/admin/v2/ledger/reconcile-all", headers=headers)
+        incremental = response.json()["run"]
+        assert incremental["mode"] == "incremental"
+        assert incremental["checked"] <= data["run"]["checked"]
+        response = requests.get(f"{BASE_URL}/api/admin/v2/ledger/mismatches?run_id={data['run']['id']}",
+                                headers=headers)
+        assert response.status_code == 200
+        assert all(m["balance"] - m["expected"] == m["drift"] for m in response.json()["mismatches"])
+        print(f"✓ Reconciled {data['run']['checked']} wallets, {data['count']} mismatches")
+
+    def test_coin_expiry_run(self):
+        """Expiry run is idempotent and never touches buckets that are not yet due"""
+        token = TestV2AuthAndSetup.get_admin_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        before = requests.get(f"{BASE_URL}/api/v2/ledger/expiring", headers=headers).json()
+        assert before["total"] == sum(b["remaining"] for b in before["expiring"])
+        response = requests.post(f"{BASE_URL}/api/admin/v2/coins/expire", headers=headers)
+        assert response.status_code == 200, f"Expiry run failed: {response.text}"
+        response = requests.post(f"{BASE_URL}/api/admin/v2/coins/expire", headers=headers)
+        assert response.json()["buckets"] == 0
+        after = requests.get(f"{BASE_URL}/api/v2/ledger/expiring", headers=headers).json()
+        today = response.json()["day"]
+        assert [b for b in after["expiring"] if b["expires_on"] > today] == \
+               [b for b in before["expiring"] if b["expires_on"] > today]
+        print(f"✓ Coin expiry idempotent, {after['total']} coins still pending expiry")
+
 
 class TestV2MatchState:
     """Test V2 Match State APIs"""
@@ -24,9 +24,17 @@ from engagement_engine       import CrowdMeterEngine, PuzzleEngine, WeeklyReport
 from quest_engine            import QuestEngine
 from xoxoday_provider        import XoxodayProvider
 from analytics_engine        import AnalyticsEngine
+from lineup_optimizer        import LineupOptimizer
+from contest_projector       import ContestProjector
+from skill_leaderboard       import SkillLeaderboardEngine
+from group_leaderboards      import GroupLeaderboardEngine
+from percentile_rank         import PercentileRankService
+from coin_expiry             import CoinExpiryEngine
+from analytics_360_engine    import Analytics360Engine
 
 # Singletons — one instance per process
 ledger           = LedgerEngine(db)
+coin_expiry      = CoinExpiryEngine(db, ledger)  # exported → server.py bonus grants, AutoScorer
 contests         = ContestEngine(db)      # exported → server.py AutoScorer
 predictions      = PredictEngine(db)
 cards            = CardsEngine(db)
@@ -35,10 +43,16 @@ referrals        = ReferralEngine(db)
 voucher_provider = MockVoucherProvider(db)
 ads_provider     = MockAdsProvider(db)
 entitysport      = EntitySportService(db)
-fantasy          = FantasyEngine(db)
+fantasy          = FantasyEngine(db, entitysport)
+lineup_optimizer = LineupOptimizer(db, entitysport, fantasy)
+projector        = ContestProjector(db, fantasy, entitysport)
+skill_leaderboards = SkillLeaderboardEngine(db)
+group_leaderboards = GroupLeaderboardEngine(db)
+percentiles      = PercentileRankService(db)  # shared by weekly reports, profiles, leaderboards
 crowd_meter      = CrowdMeterEngine(db)
 puzzle_engine    = PuzzleEngine(db)       # exported → server.py AI puzzle scheduler
-report_engine    = WeeklyReportEngine(db)
+report_engine    = WeeklyReportEngine(db, percentiles)
 quest_engine     = QuestEngine(db)
 xoxoday          = XoxodayProvider(db)
 _analytics       = AnalyticsEngine(db)
+analytics_360    = Analytics360Engine(db)  # exported → admin 360° dashboard, AutoScorer
@@ -43,29 +43,6 @@ function downloadCSV(content, filename) {
   URL.revokeObjectURL(url);
 }
 
-// ── Sort hook ─────────────────────────────────────────────────────────────
-function useSortedData(data, defaultKey, defaultDir = 'desc') {
-  const [sortKey, setSortKey] = useState(defaultKey);
-  const [sortDir, setSortDir] = useState(defaultDir);
-
-  const toggle = (key) => {
-    if (sortKey === key) setSortDir(d => d === 'asc' ? 'desc' : 'asc');
-    else { setSortKey(key); setSortDir('desc'); }
-  };
-
-  const sorted = [...(data || [])].sort((a, b) => {
-    const av = a[sortKey] ?? '';
-    const bv = b[sortKey] ?? '';
-    if (typeof av === 'number' && typeof bv === 'number')
-      return sortDir === 'asc' ? av - bv : bv - av;
-    return sortDir === 'asc'
-      ? String(av).localeCompare(String(bv))
-      : String(bv).localeCompare(String(av));
-  });
-
-  return { sorted, sortKey, sortDir, toggle };
-}
-
 // ── Stat card ─────────────────────────────────────────────────────────────
 function StatCard({ icon: Icon, label, value, sub, color = GOLD }) {
   return (
@@ -110,6 +87,12 @@ export default function AdminAnalytics() {
   const [tab, setTab] = useState('overview');
   const [search, setSearch] = useState('');
   const [expandedUser, setExpandedUser] = useState(null);
+  const [sortKey, setSortKey] = useState('last_active');
+  const [sortDir, setSortDir] = useState('desc');
+  const [users360, setUsers360] = useState([]);
+  const [usersTotal, setUsersTotal] = useState(0);
+  const [usersCursor, setUsersCursor] = useState(null);
+  const [usersLoading, setUsersLoading] = useState(false);
 
   const load = useCallback(async () => {
     setLoading(true); setError(null);
@@ -130,24 +113,47 @@ export default function AdminAnalytics() {
 
   useEffect(() => { load(); }, [load]);
 
+  // Users are searched, sorted and paged server-side over the whole snapshot
+  const loadUsers = useCallback(async (cursor = null) => {
+    setUsersLoading(true);
+    try {
+      const token = localStorage.getItem('token');
+      const params = new URLSearchParams({ sort: sortKey, order: sortDir });
+      if (search.trim()) params.set('q', search.trim());
+      if (cursor) params.set('cursor', cursor);
+      const res = await fetch(`${API}/api/admin/analytics-360/users?${params}`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      const json = await res.json();
+      setUsers360(prev => cursor ? [...prev, ...json.users] : json.users);
+      setUsersTotal(json.total ?? 0);
+      setUsersCursor(json.next_cursor);
+    } catch (e) {
+      setError(e.message);
+    } finally {
+      setUsersLoading(false);
+    }
+  }, [search, sortKey, sortDir]);
+
+  useEffect(() => {
+    if (!data?.run_id) return undefined;
+    const t = setTimeout(() => loadUsers(), 300);
+    return () => clearTimeout(t);
+  }, [data?.run_id, loadUsers]);
+
+  const toggle = (key) => {
+    if (sortKey === key) setSortDir(d => d === 'asc' ? 'desc' : 'asc');
+    else { setSortKey(key); setSortDir('desc'); }
+  };
+
   // Must be before any conditional return (Rules of Hooks)
   const hl = data?.high_level || {};
-  const users360 = data?.real_users_360 || [];
   const funnel = data?.funnel || [];
   const topActions = data?.top_actions || [];
   const dau = data?.dau_7d || [];
   const monetization = data?.monetization || {};
 
-  const filteredUsers = users360.filter(u =>
-    !search || u.email?.toLowerCase().includes(search.toLowerCase()) ||
-    u.name?.toLowerCase().includes(search.toLowerCase()) ||
-    u.user_id?.toLowerCase().includes(search.toLowerCase())
-  );
-
-  const { sorted: sortedUsers, sortKey, sortDir, toggle } = useSortedData(
-    filteredUsers, 'last_active'
-  );
-
   const tabs = ['overview', 'users', 'funnel', 'events', 'monetization'];
 
   if (!user?.is_admin) {
@@ -351,13 +357,13 @@ export default function AdminAnalytics() {
                   const cols = ['user_id', 'email', 'name', 'registration_timestamp', 'last_active',
                     'coins_balance', 'predictions_count', 'redemptions_count', 'revenue_contributed_inr',
                     'login_count', 'streak_days', 'level', 'referred_by'];
-                  downloadCSV(arrayToCSV(sortedUsers, cols), 'free11_users_360.csv');
+                  downloadCSV(arrayToCSV(users360, cols), 'free11_users_360.csv');
                 }}
                 className="flex items-center gap-1.5 px-3 py-2 rounded-lg text-xs font-medium whitespace-nowrap"
                 style={{ background: GOLD, color: DARK }}
                 data-testid="export-users-csv-btn"
               >
-                <Download size={14} /> Export {sortedUsers.length} users
+                <Download size={14} /> Export {users360.length} loaded users
               </button>
             </div>
 
@@ -381,7 +387,7 @@ export default function AdminAnalytics() {
                     </tr>
                   </thead>
                   <tbody>
-                    {sortedUsers.map((u, i) => (
+                    {users360.map((u, i) => (
                       <Fragment key={u.user_id}>
                         <tr className="border-t border-gray-800 hover:bg-gray-800/50 transition-colors">
                           <td className="px-3 py-2 text-blue-300 font-mono text-xs max-w-[180px] truncate">{u.email}</td>
@@ -464,7 +470,7 @@ export default function AdminAnalytics() {
                         )}
                       </Fragment>
                     ))}
-                    {sortedUsers.length === 0 && (
+                    {users360.length === 0 && (
                       <tr><td colSpan={14} className="px-4 py-8 text-center text-gray-500">
                         {search ? 'No users match your search.' : 'No real users found.'}
                       </td></tr>
@@ -473,7 +479,14 @@ export default function AdminAnalytics() {
                 </table>
               </div>
               <div className="px-4 py-2 border-t border-gray-800 text-xs text-gray-500">
-                Showing {sortedUsers.length} of {users360.length} real users (test/seed/admin excluded)
+                <span>Showing {users360.length} of {usersTotal} real users (test/seed/admin excluded)</span>
+                {usersCursor && (
+                  <button onClick={() => loadUsers(usersCursor)} disabled={usersLoading}
+                    className="ml-3 px-2 py-1 rounded" style={{ color: GOLD, border: `1px solid ${GOLD}44` }}
+                    data-testid="users-load-more-btn">
+                    {usersLoading ? 'Loading…' : 'Load more'}
+                  </button>
+                )}
               </div>
             </div>
           </div>
@@ -580,6 +593,15 @@ export default function AdminAnalytics() {
                   </tbody>
                 </table>
               </div>
+              <div className="px-4 py-2 border-t border-gray-800 text-xs text-gray-500">
+                <span>Showing {users360.length} of {usersTotal} real users</span>
+                {usersCursor && (
+                  <button onClick={() => loadUsers(usersCursor)} disabled={usersLoading}
+                    className="ml-3 px-2 py-1 rounded" style={{ color: GOLD, border: `1px solid ${GOLD}44` }}>
+                    {usersLoading ? 'Loading…' : 'Load more'}
+                  </button>
+                )}
+              </div>
             </div>
           </div>
         )}
@@ -54,7 +54,7 @@ const ContestCard = ({ contest, user, onJoin, onViewLeaderboard }) => {
   const Icon = cfg.icon;
   const fill = contest.max_participants > 0 ? Math.min(100, (contest.current_participants / contest.max_participants) * 100) : 0;
   const spotsLeft = contest.max_participants - contest.current_participants;
-  const joined = contest.participants?.includes(user?.id);
+  const joined = !!contest.joined;
   const isOpen = !contest.locked && contest.status === 'open';
   const dist = contest.prize_distribution || {};
   const topPrize = dist[1] || dist['1'] || 0;
@@ -347,7 +347,7 @@ export default function ContestHub() {
   const filteredContests = contests.filter(c => {
     if (activeFilter === 'all') return true;
     if (activeFilter === 'platform') return c.is_platform_contest;
-    if (activeFilter === 'mine') return c.participants?.includes(user?.id);
+    if (activeFilter === 'mine') return !!c.joined;
     if (activeFilter === 'user') return !c.is_platform_contest;
     return true;
   });
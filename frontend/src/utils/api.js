@@ -151,7 +151,7 @@ export const api = {
   v2CreateContest: (data) => axios.post(`${API}/v2/contests/create`, data, { headers: getAuthHeader() }),
   v2JoinContest: (data) => axios.post(`${API}/v2/contests/join`, data, { headers: getAuthHeader() }),
   v2JoinByCode: (data) => axios.post(`${API}/v2/contests/join-code`, data, { headers: getAuthHeader() }),
-  v2GetMatchContests: (matchId, type) => axios.get(`${API}/v2/contests/match/${matchId}${type ? `?contest_type=${type}` : ''}`),
+  v2GetMatchContests: (matchId, type) => axios.get(`${API}/v2/contests/match/${matchId}${type ? `?contest_type=${type}` : ''}`, { headers: getAuthHeader() }),
   v2GetContest: (id) => axios.get(`${API}/v2/contests/${id}`),
   v2GetContestLeaderboard: (id) => axios.get(`${API}/v2/contests/${id}/leaderboard`, { headers: getAuthHeader() }),
   v2GetMyContests: () => axios.get(`${API}/v2/contests/user/my`, { headers: getAuthHeader() }),